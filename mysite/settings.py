@@ -42,6 +42,32 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 EMAIL_TIMEOUT = 10  # Timeout de 10 segundos
 
+# Sesiones SMTP reutilizables para los emails de emergencia (ver rappiSafe/pool_smtp.py)
+EMAIL_POOL = {
+    'CONEXIONES': 4,  # Sesiones abiertas a la vez por proceso
+    'NOOP_TRAS_S': 5,  # Una sesión sin usar por más tiempo se comprueba con NOOP antes de reusarla
+    'INACTIVIDAD_MAXIMA_S': 60,  # Sesiones sin usar por más tiempo se cierran
+    'MENSAJES_POR_SESION': 100,  # Los servidores suelen limitar los mensajes por conexión
+}
+
+# API de SMS de Mocean (ver rappiSafe/cliente_sms.py); el token va en MOCEAN_API_TOKEN
+MOCEAN = {
+    'URL_API': os.environ.get('MOCEAN_API_URL', 'https://rest.moceanapi.com/rest/2'),
+    'REMITENTE': 'RAPPI SAFE',
+    'DESTINATARIOS_POR_PETICION': 50,  # Números por petición (mocean-to separado por comas)
+    'CONEXIONES': 4,  # Conexiones keep-alive abiertas a la vez
+    'TIMEOUT_S': 10,
+}
+
+# Cliente de la Bot API de Telegram (ver rappiSafe/cliente_telegram.py); el token va en TELEGRAM_BOT_TOKEN
+TELEGRAM = {
+    'URL_API': os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org'),
+    'CONEXIONES': 20,  # Conexiones keep-alive abiertas a la vez
+    'MENSAJES_POR_S': 25,  # Telegram acepta unos 30/s por bot; el margen cubre envíos que llegan juntos
+    'MENSAJES_POR_CHAT_POR_S': 1,  # Límite de Telegram para un mismo chat
+    'TIMEOUT_S': 10,
+}
+
 
 # Application definition
 
@@ -59,7 +85,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'rappiSafe.middleware.WhiteNoiseAsyncMiddleware',  # WhiteNoise sin bloquear las vistas async
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -95,6 +121,125 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Buffer de escritura diferida para trayectorias recibidas por WebSocket
+TRAYECTORIAS_BUFFER_TAMANO = 200  # Puntos acumulados antes de un bulk_create
+TRAYECTORIAS_BUFFER_INTERVALO = 2.0  # Segundos máximos que un punto espera en memoria
+
+# Filtro de posiciones GPS: se descartan las que no se movieron o llegan muy seguido
+FILTRO_UBICACION_DISTANCIA_M = 10.0  # Movimiento mínimo para aceptar una posición
+FILTRO_UBICACION_INTERVALO_MINIMO_S = 3.0  # Tiempo mínimo entre posiciones aceptadas
+FILTRO_UBICACION_INTERVALO_MAXIMO_S = 30.0  # Se acepta una posición al menos cada tanto aunque no haya movimiento
+
+# Segundos tras los que cada proceso reconstruye el índice de zonas de riesgo
+# (los cambios en el mismo proceso lo invalidan de inmediato por señales)
+INDICE_ZONAS_TTL = 300
+
+# Raster de riesgo para puntuar rutas (metros)
+RIESGO_CELDA_M = 100  # Lado de cada celda del raster
+RIESGO_RADIO_ZONA_M = 500  # Desviación estándar del núcleo gaussiano de cada zona
+RIESGO_PASO_MUESTREO_M = 25  # Separación de las muestras sobre la ruta
+# Rutas seguras con el grafo vial: segundos que vale una unidad de exposición
+# (riesgo x km) para la ruta rápida, la balanceada y la más segura
+RIESGO_LAMBDAS = (0, 5, 20)
+# Puntuación de muchas rutas a la vez (ver puntuacion_lote.py)
+RIESGO_LOTE = {
+    'PROCESOS': 0,  # Procesos para lotes muy grandes (0 = siempre en el proceso web)
+    'MIN_PUNTOS_POOL': 200_000,  # Coordenadas a partir de las cuales se reparte el lote
+    'MAX_RUTAS': 2000,  # Rutas por petición a /rutas/puntuar/
+}
+# Entregas con varias paradas (ver planificador.py)
+PLANIFICADOR = {
+    'MAX_PARADAS': 40,  # Paradas por petición a /repartidor/rutas/planificar/
+    'PERTURBACIONES': 10,  # Reinicios de la búsqueda local al ordenar las paradas
+    'HILOS_TRAMOS': 8,  # Tramos de la ruta final que se piden en paralelo
+}
+
+# Monitoreo del corredor de la ruta seleccionada mientras el repartidor navega
+CORREDOR_RUTA = {
+    'ANCHO_M': 60,  # Distancia máxima a la polilínea para seguir dentro del corredor
+    'TOLERANCIA_PRECISION_M': 40,  # Tope de la precisión del GPS que se suma al ancho
+    'UMBRAL_S': 45,  # Segundos fuera del corredor antes de avisar al monitoreo
+    'RADIO_LLEGADA_M': 80,  # Distancia al destino que da la navegación por terminada
+    'DURACION_MAXIMA_S': 4 * 3600,  # Navegaciones más viejas se dan por abandonadas
+    'REVISION_S': 60,  # Cada cuánto se vuelve a consultar la BD para quien no navega
+}
+
+# Bandeja de salida de notificaciones a contactos (ver rappiSafe/notificaciones.py)
+NOTIFICACIONES = {
+    'HILOS': 16,  # Envíos simultáneos por despachador (y tamaño de cada lote que toma)
+    'PLAZO_S': 8.0,  # Espera máxima por cada envío antes de darlo por fallido
+    'ARRENDAMIENTO_S': 120,  # Tras este tiempo sin terminar, otro despachador puede tomarla
+    'MAX_INTENTOS': 5,  # Intentos por contacto y canal (reintentos y tomas sin terminar) antes de darla por fallida
+    'INTERVALO_S': 1.0,  # Espera entre revisiones de la bandeja sin avisos
+    # Reintentos de envíos fallidos (ver rappiSafe/reintentos.py): espera base·2^n con jitter, hasta el máximo
+    'REINTENTO_BASE_S': 5,
+    'REINTENTO_MAXIMO_S': 300,
+    # Primer reintento de un envío sin respuesta en PLAZO_S: su hilo sigue hasta el timeout del proveedor y aún puede entregarlo
+    'ESPERA_SIN_RESPUESTA_S': 60,
+    'MAX_INTENTOS_ALERTA': 30,  # Intentos en total por alerta, contando los primeros envíos
+    # Despachar también dentro del proceso web (respaldo si no corre despachar_notificaciones)
+    'EN_PROCESO': os.environ.get('NOTIFICACIONES_EN_PROCESO', 'True') == 'True',
+}
+
+# Backends de ruteo; cada uno mantiene sus conexiones abiertas (keep-alive)
+# 'local' apunta a `python manage.py servidor_ruteo_local` para pruebas sin internet
+# 'grafo_local' calcula en el proceso sobre el grafo de `python manage.py preparar_grafo_vial`
+GRAFO_VIAL_DIR = Path(os.environ.get('GRAFO_VIAL_DIR', BASE_DIR / 'datos' / 'grafo_vial'))
+
+RUTEO = {
+    'BACKEND': os.environ.get('RUTEO_BACKEND', 'osrm_publico'),
+    'BACKENDS': {
+        'osrm_publico': {
+            'TIPO': 'osrm',
+            'URL_BASE': os.environ.get('OSRM_URL', 'https://router.project-osrm.org'),
+            'TIMEOUT': 10,  # Segundos de lectura
+            'TIMEOUT_CONEXION': 3,
+            'CONEXIONES': 10,  # Conexiones reutilizables por proceso
+        },
+        'local': {
+            'TIPO': 'osrm',
+            'URL_BASE': os.environ.get('OSRM_LOCAL_URL', 'http://127.0.0.1:5001'),
+            'TIMEOUT': 2,
+            'TIMEOUT_CONEXION': 1,
+            'CONEXIONES': 20,
+        },
+        'grafo_local': {
+            'TIPO': 'grafo',
+            'DIRECTORIO': GRAFO_VIAL_DIR,
+            'ALTERNATIVAS': 2,
+        },
+    },
+}
+
+# Caché de rutas de OSRM
+# BACKEND: 'memoria' (LRU por proceso) o 'cache' (caché de Django compartida)
+CACHE_RUTAS = {
+    'BACKEND': 'memoria',
+    'CELDA_M': 50,  # Origen y destino se cuantizan a esta rejilla
+    'TTL': 600,  # Segundos que se reutiliza una ruta
+    'TTL_NEGATIVO': 30,  # Segundos que se recuerda un error de OSRM
+    'OPCIONES': {'MAX_ENTRADAS': 5000},  # Para 'cache': {'ALIAS': 'default'}
+}
+
+# Precálculo de las rutas más pedidas antes de cada hora (ver precalculo_rutas.py)
+# ACTIVO arranca el programador en el proceso web; con CACHE_RUTAS en 'cache'
+# basta con `python manage.py precalentar_rutas` desde cron
+PRECALCULO_RUTAS = {
+    'ACTIVO': False,
+    'MINUTO': 50,  # Minuto de cada hora en que se precalcula la hora siguiente
+    'DIAS_HISTORIAL': 14,  # Días de RutaSegura que se analizan
+    'MINIMO_CONSULTAS': 2,  # Consultas mínimas de un par en esa hora para precalcularlo
+    'MAX_PARES': 200,  # Pares por hora como máximo
+}
+
+# Estado en caliente de los repartidores (posición, batería, estado)
+# BACKEND: 'memoria' (un solo proceso) o 'cache' (caché de Django compartida)
+ESTADO_VIVO = {
+    'BACKEND': 'memoria',
+    'INTERVALO_PERSISTENCIA': 5.0,  # Segundos entre cada UPDATE a RepartidorProfile
+    'OPCIONES': {},  # Para 'cache': {'ALIAS': 'default'}
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -1,8 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
-    User, RepartidorProfile, Alerta, Trayectoria, ContactoConfianza,
-    Incidente, Bitacora, EstadisticaRiesgo, SolicitudAyudaPsicologica, RutaSegura
+    User, RepartidorProfile, Alerta, Trayectoria, SegmentoTrayectoria, ContactoConfianza,
+    Incidente, Bitacora, EstadisticaRiesgo, SolicitudAyudaPsicologica, RutaSegura,
+    GeometriaRuta
 )
 
 
@@ -42,6 +43,14 @@ class TrayectoriaAdmin(admin.ModelAdmin):
     readonly_fields = ('timestamp',)
 
 
+@admin.register(SegmentoTrayectoria)
+class SegmentoTrayectoriaAdmin(admin.ModelAdmin):
+    list_display = ('alerta', 'secuencia', 'num_puntos', 'inicio', 'fin', 'creado_en')
+    search_fields = ('alerta__id', 'alerta__repartidor__username')
+    exclude = ('datos',)
+    readonly_fields = ('creado_en',)
+
+
 @admin.register(ContactoConfianza)
 class ContactoConfianzaAdmin(admin.ModelAdmin):
     list_display = ('nombre', 'telefono', 'repartidor', 'relacion', 'validado', 'creado_en')
@@ -89,3 +98,11 @@ class RutaSeguraAdmin(admin.ModelAdmin):
     list_filter = ('seleccionada', 'creado_en')
     search_fields = ('repartidor__username',)
     readonly_fields = ('creado_en',)
+
+
+@admin.register(GeometriaRuta)
+class GeometriaRutaAdmin(admin.ModelAdmin):
+    list_display = ('huella', 'num_puntos', 'creado_en')
+    search_fields = ('huella',)
+    exclude = ('datos',)
+    readonly_fields = ('huella', 'num_puntos', 'creado_en')
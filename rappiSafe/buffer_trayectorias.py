@@ -0,0 +1,187 @@
+"""
+Buffer de escritura diferida (write-behind) para puntos de trayectoria.
+
+Los puntos que llegan por WebSocket se acumulan en memoria y se guardan con un
+solo bulk_create cuando el buffer alcanza un tamaño máximo o cuando pasa el
+intervalo configurado. El buffer se vacía también al desconectarse cada
+consumer y al terminar el proceso, para no perder puntos.
+
+Si el bulk_create falla, el lote se guarda punto por punto: los puntos que
+no se pueden guardar se descartan y solo vuelven al buffer si lo que falló
+fue la conexión con la base de datos.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import OperationalError
+
+from .models import Alerta, Trayectoria
+
+logger = logging.getLogger(__name__)
+
+
+class BufferTrayectorias:
+    """
+    Acumula objetos Trayectoria (sin guardar) y los persiste por lotes
+    """
+
+    def __init__(self, tamano_maximo=200, intervalo=2.0):
+        self.tamano_maximo = tamano_maximo
+        self.intervalo = intervalo
+        self._puntos = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+        # Contadores para dimensionar el buffer bajo carga
+        self.total_vaciados = 0
+        self.total_puntos_guardados = 0
+        self.total_errores = 0
+        self.total_descartados = 0
+        self.profundidad_maxima = 0
+        self.ultima_latencia_ms = 0.0
+        self.latencia_maxima_ms = 0.0
+        self._latencia_acumulada_ms = 0.0
+
+    def __len__(self):
+        return len(self._puntos)
+
+    async def agregar(self, trayectoria):
+        """
+        Agregar un punto al buffer y vaciarlo si se alcanzó el tamaño máximo
+        """
+        with self._lock:
+            self._puntos.append(trayectoria)
+            profundidad = len(self._puntos)
+            self.profundidad_maxima = max(self.profundidad_maxima, profundidad)
+
+        if profundidad >= self.tamano_maximo:
+            await self.vaciar()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.intervalo, self._vaciar_por_tiempo)
+
+    def _vaciar_por_tiempo(self):
+        self._timer = None
+        asyncio.ensure_future(self.vaciar())
+
+    async def vaciar(self):
+        """
+        Guardar los puntos acumulados desde el event loop (sin bloquearlo)
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._puntos:
+            await database_sync_to_async(self.vaciar_sync)()
+
+    def vaciar_sync(self):
+        """
+        Guardar los puntos acumulados con un solo bulk_create
+        """
+        with self._lock:
+            puntos, self._puntos = self._puntos, []
+
+        if not puntos:
+            return 0
+
+        inicio = time.perf_counter()
+        try:
+            Trayectoria.objects.bulk_create(puntos)
+        except Exception:
+            logger.exception('Error al guardar %d puntos de trayectoria', len(puntos))
+            self.total_errores += 1
+            try:
+                puntos = self._descartar_huerfanos(puntos)
+            except OperationalError:
+                self._devolver(puntos)
+                return 0
+            # Un punto inválido no debe bloquear al resto del lote
+            puntos = self._guardar_uno_por_uno(puntos)
+            if not puntos:
+                return 0
+
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+
+        self.total_vaciados += 1
+        self.total_puntos_guardados += len(puntos)
+        self.ultima_latencia_ms = latencia_ms
+        self.latencia_maxima_ms = max(self.latencia_maxima_ms, latencia_ms)
+        self._latencia_acumulada_ms += latencia_ms
+        return len(puntos)
+
+    def _guardar_uno_por_uno(self, puntos):
+        """
+        Guardar los puntos de un lote que falló uno por uno: los que fallan por
+        sus datos se descartan y, si se cae la conexión con la base de datos,
+        los que falten vuelven al buffer para el siguiente vaciado
+
+        Returns:
+            list: los puntos que sí se guardaron
+        """
+        guardados = []
+        for indice, punto in enumerate(puntos):
+            try:
+                punto.save()
+            except OperationalError:
+                logger.exception('Base de datos no disponible; se reintentan %d puntos', len(puntos) - indice)
+                self._devolver(puntos[indice:])
+                break
+            except Exception:
+                logger.exception('Se descarta un punto de trayectoria inválido de la alerta %s', punto.alerta_id)
+                self.total_descartados += 1
+            else:
+                guardados.append(punto)
+        return guardados
+
+    def _devolver(self, puntos):
+        """
+        Regresar puntos al buffer para el siguiente vaciado, conservando el
+        orden: van antes de los que llegaron mientras tanto
+        """
+        with self._lock:
+            self._puntos[:0] = puntos
+
+    def _descartar_huerfanos(self, puntos):
+        """
+        Quitar puntos de alertas que ya no existen (no se podrán guardar nunca)
+        """
+        ids = {punto.alerta_id for punto in puntos}
+        existentes = set(Alerta.objects.filter(id__in=ids).values_list('id', flat=True))
+        validos = [punto for punto in puntos if punto.alerta_id in existentes]
+        self.total_descartados += len(puntos) - len(validos)
+        return validos
+
+    def estadisticas(self):
+        """
+        Contadores de profundidad y latencia de vaciado
+        """
+        return {
+            'profundidad': len(self._puntos),
+            'profundidad_maxima': self.profundidad_maxima,
+            'tamano_maximo': self.tamano_maximo,
+            'intervalo': self.intervalo,
+            'vaciados': self.total_vaciados,
+            'puntos_guardados': self.total_puntos_guardados,
+            'errores': self.total_errores,
+            'descartados': self.total_descartados,
+            'ultima_latencia_ms': round(self.ultima_latencia_ms, 2),
+            'latencia_maxima_ms': round(self.latencia_maxima_ms, 2),
+            'latencia_promedio_ms': round(
+                self._latencia_acumulada_ms / self.total_vaciados, 2
+            ) if self.total_vaciados else 0.0,
+        }
+
+
+# Buffer único por proceso
+buffer_trayectorias = BufferTrayectorias(
+    tamano_maximo=getattr(settings, 'TRAYECTORIAS_BUFFER_TAMANO', 200),
+    intervalo=getattr(settings, 'TRAYECTORIAS_BUFFER_INTERVALO', 2.0),
+)
+
+# Vaciar lo pendiente al apagar el proceso
+atexit.register(buffer_trayectorias.vaciar_sync)
@@ -0,0 +1,252 @@
+"""
+Caché de rutas de OSRM.
+
+Los repartidores cerca del mismo restaurante piden rutas casi idénticas; la
+clave de la caché cuantiza origen y destino a una rejilla de
+CACHE_RUTAS['CELDA_M'] metros, así que esas consultas comparten resultado y
+no pagan el viaje de red a OSRM.
+
+Se guarda solo la geometría, distancia y duración que devuelve OSRM; la
+puntuación de riesgo se calcula en cada consulta para reflejar los cambios en
+las zonas. Los errores se guardan también, con un TTL corto, para no insistir
+contra un servidor caído.
+
+aobtener_o_calcular() es la versión para vistas async: el cálculo se espera
+sin bloquear el event loop.
+
+Backends (CACHE_RUTAS['BACKEND']):
+
+- 'memoria': LRU con TTL por proceso
+- 'cache': caché de Django compartida (p. ej. Redis)
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .geo import METROS_POR_GRADO
+
+_AUSENTE = object()
+
+
+# ==================== BACKENDS ====================
+
+class BackendMemoriaLRU:
+    """
+    LRU con expiración por entrada, local al proceso
+    """
+
+    def __init__(self, max_entradas=5000, **opciones):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()  # clave -> (expira, valor)
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return _AUSENTE
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._entradas[clave]
+                return _AUSENTE
+            self._entradas.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, ttl):
+        with self._lock:
+            self._entradas[clave] = (time.monotonic() + ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    async def aobtener(self, clave):
+        return self.obtener(clave)  # Solo memoria local: no hay E/S que esperar
+
+    async def aguardar(self, clave, valor, ttl):
+        self.guardar(clave, valor, ttl)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+class BackendCacheDjango:
+    """
+    Caché de Django; la expulsión LRU la hace el propio backend (Redis, Memcached)
+    """
+
+    def __init__(self, alias='default', **opciones):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+
+    def obtener(self, clave):
+        return self.cache.get(clave, _AUSENTE)
+
+    def guardar(self, clave, valor, ttl):
+        self.cache.set(clave, valor, ttl)
+
+    async def aobtener(self, clave):
+        return await self.cache.aget(clave, _AUSENTE)
+
+    async def aguardar(self, clave, valor, ttl):
+        await self.cache.aset(clave, valor, ttl)
+
+    def limpiar(self):
+        pass  # No se borra una caché compartida con otros usos
+
+    def __len__(self):
+        return 0
+
+
+BACKENDS = {
+    'memoria': BackendMemoriaLRU,
+    'cache': BackendCacheDjango,
+}
+
+
+# ==================== CACHÉ DE RUTAS ====================
+
+class CacheRutas:
+    """
+    Caché de resultados de ruteo con métricas de aciertos
+    """
+
+    def __init__(self, backend, celda_m=50.0, ttl=600, ttl_negativo=30):
+        self.backend = backend
+        self.celda_m = celda_m
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+
+        self.aciertos = 0
+        self.aciertos_negativos = 0
+        self.fallos = 0
+        self.precalculadas = 0
+        self._tiempo_calculo = 0.0
+        self._tiempo_aciertos = 0.0
+
+    def _cuantizar(self, latitud, longitud):
+        paso_lat = self.celda_m / METROS_POR_GRADO
+        fila = math.floor(float(latitud) / paso_lat)
+        # El paso en longitud usa el coseno de la fila, no del punto, para que
+        # todos los puntos de una celda den la misma clave
+        coseno = max(math.cos(math.radians((fila + 0.5) * paso_lat)), 1e-6)
+        columna = math.floor(float(longitud) / (paso_lat / coseno))
+        return fila, columna
+
+    def celdas_par(self, origen_lat, origen_lon, destino_lat, destino_lon):
+        """
+        Celdas (fila, columna) de origen y destino: dos consultas comparten
+        resultado si y solo si sus celdas coinciden
+        """
+        return self._cuantizar(origen_lat, origen_lon) + self._cuantizar(destino_lat, destino_lon)
+
+    def clave(self, origen_lat, origen_lon, destino_lat, destino_lon, perfil='driving'):
+        celdas = self.celdas_par(origen_lat, origen_lon, destino_lat, destino_lon)
+        return f'rutas:{perfil}:{self.celda_m:g}:{celdas[0]}:{celdas[1]}:{celdas[2]}:{celdas[3]}'
+
+    def obtener_o_calcular(self, origen_lat, origen_lon, destino_lat, destino_lon, calcular, perfil='driving'):
+        """
+        Devolver el resultado en caché o llamar a calcular() y guardarlo.
+
+        calcular() debe devolver un dict con 'success'; los resultados sin
+        éxito se guardan solo ttl_negativo segundos. El valor devuelto se
+        comparte entre llamadas y no debe modificarse.
+        """
+        inicio = time.perf_counter()
+        clave = self.clave(origen_lat, origen_lon, destino_lat, destino_lon, perfil)
+        resultado = self.backend.obtener(clave)
+        if resultado is not _AUSENTE:
+            if resultado.get('success'):
+                self.aciertos += 1
+            else:
+                self.aciertos_negativos += 1
+            self._tiempo_aciertos += time.perf_counter() - inicio
+            return resultado
+
+        self.fallos += 1
+        inicio = time.perf_counter()
+        resultado = calcular()
+        self._tiempo_calculo += time.perf_counter() - inicio
+
+        self.backend.guardar(clave, resultado, self.ttl if resultado.get('success') else self.ttl_negativo)
+        return resultado
+
+    def precalentar(self, origen_lat, origen_lon, destino_lat, destino_lon, calcular, perfil='driving', ttl=None):
+        """
+        Calcular y guardar un resultado aunque ya esté en caché, con un TTL
+        propio (p. ej. hasta el final de la hora pico que se precalcula)
+
+        Returns:
+            bool: si el cálculo tuvo éxito (los errores no se guardan)
+        """
+        resultado = calcular()
+        if not resultado.get('success'):
+            return False
+        clave = self.clave(origen_lat, origen_lon, destino_lat, destino_lon, perfil)
+        self.backend.guardar(clave, resultado, ttl or self.ttl)
+        self.precalculadas += 1
+        return True
+
+    async def aobtener_o_calcular(self, origen_lat, origen_lon, destino_lat, destino_lon, acalcular, perfil='driving'):
+        """
+        Versión asíncrona de obtener_o_calcular(); acalcular() devuelve un awaitable
+        """
+        inicio = time.perf_counter()
+        clave = self.clave(origen_lat, origen_lon, destino_lat, destino_lon, perfil)
+        resultado = await self.backend.aobtener(clave)
+        if resultado is not _AUSENTE:
+            if resultado.get('success'):
+                self.aciertos += 1
+            else:
+                self.aciertos_negativos += 1
+            self._tiempo_aciertos += time.perf_counter() - inicio
+            return resultado
+
+        self.fallos += 1
+        inicio = time.perf_counter()
+        resultado = await acalcular()
+        self._tiempo_calculo += time.perf_counter() - inicio
+
+        await self.backend.aguardar(clave, resultado, self.ttl if resultado.get('success') else self.ttl_negativo)
+        return resultado
+
+    def estadisticas(self):
+        """
+        Tasa de aciertos y tiempos promedio de acierto y de cálculo
+        """
+        total_aciertos = self.aciertos + self.aciertos_negativos
+        total = total_aciertos + self.fallos
+        return {
+            'aciertos': self.aciertos,
+            'aciertos_negativos': self.aciertos_negativos,
+            'fallos': self.fallos,
+            'precalculadas': self.precalculadas,
+            'tasa_aciertos': round(total_aciertos / total, 3) if total else 0.0,
+            'entradas': len(self.backend),
+            'acierto_promedio_us': round(self._tiempo_aciertos / total_aciertos * 1e6, 1) if total_aciertos else 0.0,
+            'calculo_promedio_ms': round(self._tiempo_calculo / self.fallos * 1000, 1) if self.fallos else 0.0,
+            'celda_m': self.celda_m,
+            'ttl': self.ttl,
+        }
+
+
+def _crear_cache_rutas():
+    configuracion = getattr(settings, 'CACHE_RUTAS', {})
+    opciones = {clave.lower(): valor for clave, valor in configuracion.get('OPCIONES', {}).items()}
+    backend = BACKENDS[configuracion.get('BACKEND', 'memoria')](**opciones)
+    return CacheRutas(
+        backend,
+        celda_m=configuracion.get('CELDA_M', 50.0),
+        ttl=configuracion.get('TTL', 600),
+        ttl_negativo=configuracion.get('TTL_NEGATIVO', 30),
+    )
+
+
+# Caché única por proceso
+cache_rutas = _crear_cache_rutas()
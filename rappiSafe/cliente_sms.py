@@ -0,0 +1,183 @@
+"""
+Envío de SMS por la API REST de Mocean con un cliente reutilizable.
+
+Antes cada SMS creaba un Client(Basic(...)) del SDK y hacía su propia
+petición, contacto por contacto: una alerta con cinco contactos eran cinco
+viajes de ida y vuelta a Mocean, cada uno con su conexión HTTPS nueva.
+
+ClienteMocean mantiene por proceso un httpx.Client con conexiones keep-alive
+y manda en lote: mocean-to acepta varios números separados por coma, así
+que todos los destinatarios de un mismo mensaje (los contactos de una
+alerta) van en una sola petición, de hasta DESTINATARIOS_POR_PETICION
+números; si hay más, las peticiones siguientes reusan la misma conexión.
+
+Mocean responde con un resultado por número en 'messages' (status 0 =
+enviado, si no err_msg). enviar_lote() los reparte de vuelta en el orden de
+los teléfonos pedidos, para guardar cada uno en su NotificacionContacto.
+"""
+import atexit
+import os
+import threading
+
+import httpx
+from django.conf import settings
+
+
+def limpiar_telefono(telefono):
+    """Solo los dígitos, como los espera Mocean (sin +, espacios ni guiones)"""
+    return ''.join(filter(str.isdigit, str(telefono or '')))
+
+
+class ClienteMocean:
+    """
+    Cliente de la API de SMS de Mocean compartido por todo el proceso
+    """
+
+    def __init__(self, url_api='https://rest.moceanapi.com/rest/2', remitente='RAPPI SAFE',
+                 destinatarios_por_peticion=50, conexiones=4, timeout=10.0):
+        self.url_api = url_api.rstrip('/')
+        self.remitente = remitente
+        self.destinatarios_por_peticion = destinatarios_por_peticion
+        self.conexiones = conexiones
+        self.timeout = timeout
+        self._cliente = None
+        self._lock = threading.Lock()
+
+        self.total_peticiones = 0
+        self.total_enviados = 0
+        self.total_fallidos = 0
+
+    def _obtener_cliente(self):
+        if self._cliente is None:
+            with self._lock:
+                if self._cliente is None:
+                    self._cliente = httpx.Client(
+                        timeout=self.timeout,
+                        limits=httpx.Limits(max_connections=self.conexiones,
+                                            max_keepalive_connections=self.conexiones),
+                    )
+        return self._cliente
+
+    def enviar_lote(self, telefonos, mensaje, timeout=None):
+        """
+        Enviar el mismo mensaje a varios teléfonos con el mínimo de peticiones
+
+        Returns:
+            lista de dicts {'success': bool, 'respuesta': dict, 'error': str},
+            uno por teléfono y en el mismo orden
+        """
+        token = os.environ.get('MOCEAN_API_TOKEN')
+        if not token:
+            return [{'success': False, 'error': 'No hay token de MoceanAPI configurado (MOCEAN_API_TOKEN)'}
+                    for _ in telefonos]
+
+        limpios = [limpiar_telefono(telefono) for telefono in telefonos]
+        unicos = list(dict.fromkeys(numero for numero in limpios if numero))
+        por_numero = {}
+        for inicio in range(0, len(unicos), self.destinatarios_por_peticion):
+            numeros = unicos[inicio:inicio + self.destinatarios_por_peticion]
+            por_numero.update(self._enviar_peticion(token, numeros, mensaje, timeout or self.timeout))
+
+        resultados = []
+        for numero in limpios:
+            resultado = por_numero.get(numero) if numero else {'success': False, 'error': 'Error Mocean: número vacío'}
+            resultados.append(resultado)
+            if resultado['success']:
+                self.total_enviados += 1
+            else:
+                self.total_fallidos += 1
+        return resultados
+
+    def enviar(self, telefono, mensaje, timeout=None):
+        return self.enviar_lote([telefono], mensaje, timeout=timeout)[0]
+
+    def _enviar_peticion(self, token, numeros, mensaje, timeout):
+        """Una petición para varios números; devuelve {numero: resultado}"""
+        self.total_peticiones += 1
+        try:
+            respuesta = self._obtener_cliente().post(
+                f'{self.url_api}/sms',
+                data={
+                    'mocean-from': self.remitente,
+                    'mocean-to': ','.join(numeros),
+                    'mocean-text': mensaje,
+                    'mocean-resp-format': 'json',
+                },
+                headers={'Authorization': f'Bearer {token}'},
+                timeout=timeout,
+            )
+            datos = respuesta.json()
+        except (httpx.HTTPError, ValueError) as e:
+            error = {'success': False, 'error': f'Error Mocean: {str(e) or type(e).__name__}'}
+            return {numero: error for numero in numeros}
+
+        if not isinstance(datos, dict):
+            datos = {}
+        mensajes = datos.get('messages') or []
+        if not mensajes:
+            # Error de toda la petición (token inválido, saldo, etc.)
+            error = {'success': False, 'error': f'Error Mocean: {datos.get("err_msg") or "Respuesta inválida de MoceanAPI"}'}
+            return {numero: error for numero in numeros}
+
+        # Cada resultado trae su receptor; los que Mocean haya reescrito se
+        # emparejan en orden con los números que quedaron sin resultado
+        resultados = {}
+        sin_receptor = []
+        for resultado in mensajes:
+            receptor = limpiar_telefono(resultado.get('receiver'))
+            if receptor in numeros and receptor not in resultados:
+                resultados[receptor] = self._procesar(receptor, resultado)
+            else:
+                sin_receptor.append(resultado)
+        faltantes = [numero for numero in numeros if numero not in resultados]
+        for numero, resultado in zip(faltantes, sin_receptor):
+            resultados[numero] = self._procesar(numero, resultado)
+        for numero in faltantes[len(sin_receptor):]:
+            resultados[numero] = {'success': False, 'error': 'Error Mocean: sin resultado para este número'}
+        return resultados
+
+    @staticmethod
+    def _procesar(numero, resultado):
+        if str(resultado.get('status')) == '0':
+            return {
+                'success': True,
+                'respuesta': {
+                    'telefono': numero,
+                    'msgid': resultado.get('msgid'),
+                    'receiver': resultado.get('receiver'),
+                    'proveedor': 'mocean',
+                    'real': True
+                }
+            }
+        return {'success': False, 'error': f"Error Mocean: {resultado.get('err_msg', 'Error desconocido')}"}
+
+    def cerrar(self):
+        with self._lock:
+            cliente, self._cliente = self._cliente, None
+        if cliente is not None:
+            cliente.close()
+
+    def estadisticas(self):
+        return {
+            'peticiones': self.total_peticiones,
+            'enviados': self.total_enviados,
+            'fallidos': self.total_fallidos,
+        }
+
+
+def _crear_cliente():
+    configuracion = getattr(settings, 'MOCEAN', {})
+    return ClienteMocean(
+        url_api=configuracion.get('URL_API', 'https://rest.moceanapi.com/rest/2'),
+        remitente=configuracion.get('REMITENTE', 'RAPPI SAFE'),
+        destinatarios_por_peticion=configuracion.get('DESTINATARIOS_POR_PETICION', 50),
+        conexiones=configuracion.get('CONEXIONES', 4),
+        timeout=configuracion.get('TIMEOUT_S', 10.0),
+    )
+
+
+# Cliente único por proceso
+cliente_mocean = _crear_cliente()
+
+# Cerrar las conexiones al apagar el proceso
+atexit.register(cliente_mocean.cerrar)
@@ -0,0 +1,265 @@
+"""
+Envío de mensajes por la Bot API de Telegram con un cliente de larga vida.
+
+Antes cada mensaje creaba un telegram.Bot y un event loop nuevo con
+asyncio.run: una conexión HTTPS (TCP + TLS) por mensaje, y no se podía
+llamar desde el loop de Daphne (asyncio.run no corre dentro de otro loop).
+
+EnviadorTelegram mantiene por proceso un solo httpx.AsyncClient con hasta
+CONEXIONES conexiones keep-alive, en un event loop propio que corre en un
+hilo de fondo (se arranca con el primer envío):
+
+- desde código síncrono (vistas, hilos del despachador) enviar() y
+  enviar_varios() entregan el trabajo a ese loop y esperan el resultado
+- desde código async (consumers, vistas async en Daphne) aenviar() lo
+  espera sin bloquear el loop de quien llama
+- enviar_varios() manda a muchos chats a la vez por el mismo cliente
+
+Telegram limita cuántos mensajes acepta de un bot: unos 30 por segundo en
+total y alrededor de 1 por segundo a un mismo chat. Cada envío toma una
+ficha de un cubo de fichas (token bucket) global y otra del cubo de su chat,
+y espera lo necesario antes de salir; si aun así Telegram responde 429, se
+respeta su retry_after para todos los envíos y se reintenta una vez si cabe
+en el plazo.
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import os
+import threading
+import time
+
+import httpx
+from django.conf import settings
+
+
+class CuboFichas:
+    """
+    Token bucket: 'tasa' fichas por segundo, hasta 'capacidad' acumuladas.
+
+    tomar() reserva la ficha enseguida (las fichas pueden quedar en negativo)
+    y devuelve cuánto hay que esperar a que llegue, así los envíos salen en el
+    orden en que la pidieron. Solo se usa desde el loop del enviador, así que
+    no necesita lock.
+    """
+    __slots__ = ('tasa', 'capacidad', 'fichas', 'actualizado')
+
+    def __init__(self, tasa, capacidad=1):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.fichas = capacidad
+        self.actualizado = time.monotonic()
+
+    def tomar(self):
+        ahora = time.monotonic()
+        self.fichas = min(self.capacidad, self.fichas + (ahora - self.actualizado) * self.tasa)
+        self.actualizado = ahora
+        self.fichas -= 1
+        return 0.0 if self.fichas >= 0 else -self.fichas / self.tasa
+
+    def devolver(self):
+        self.fichas += 1
+
+
+class EnviadorTelegram:
+    """
+    Cliente de la Bot API compartido por todo el proceso
+    """
+    MAX_CUBOS_CHAT = 10000  # Al pasar de aquí se olvidan los chats sin envíos recientes
+
+    def __init__(self, url_api='https://api.telegram.org', conexiones=20, mensajes_por_s=25.0,
+                 mensajes_por_chat_por_s=1.0, timeout=10.0):
+        self.url_api = url_api.rstrip('/')
+        self.conexiones = conexiones
+        self.mensajes_por_s = mensajes_por_s
+        self.mensajes_por_chat_por_s = mensajes_por_chat_por_s
+        self.timeout = timeout
+        # Sin ráfaga: con capacidad 1 no salen más de mensajes_por_s (+1) en un segundo
+        self._cubo_global = CuboFichas(mensajes_por_s)
+        self._cubos_chat = {}
+        self._pausa_hasta = 0.0  # Tras un 429 nadie envía antes de esta hora (time.monotonic)
+        self._cliente = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+        self.total_enviados = 0
+        self.total_fallidos = 0
+        self.total_limitados = 0  # Respuestas 429
+        self.espera_total_s = 0.0  # Tiempo esperando fichas
+
+    def _obtener_loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='enviador-telegram', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def _obtener_cliente(self):
+        # Se crea dentro del loop del enviador: httpx no comparte clientes entre loops
+        if self._cliente is None:
+            self._cliente = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.conexiones, max_keepalive_connections=self.conexiones),
+            )
+        return self._cliente
+
+    def _cubo_chat(self, chat_id):
+        cubo = self._cubos_chat.get(chat_id)
+        if cubo is None:
+            if len(self._cubos_chat) >= self.MAX_CUBOS_CHAT:
+                limite = time.monotonic() - 60
+                self._cubos_chat = {chat: c for chat, c in self._cubos_chat.items() if c.actualizado > limite}
+            cubo = self._cubos_chat[chat_id] = CuboFichas(self.mensajes_por_chat_por_s)
+        return cubo
+
+    async def _esperar_turno(self, chat_id, limite):
+        """Esperar las fichas global y del chat; False si no llegan antes de 'limite'"""
+        cubo_chat = self._cubo_chat(chat_id)
+        espera = max(self._cubo_global.tomar(), cubo_chat.tomar(), self._pausa_hasta - time.monotonic())
+        if time.monotonic() + espera > limite:
+            self._cubo_global.devolver()
+            cubo_chat.devolver()
+            return False
+        if espera > 0:
+            self.espera_total_s += espera
+            await asyncio.sleep(espera)
+        return True
+
+    async def _enviar(self, chat_id, texto, timeout):
+        token = os.environ.get('TELEGRAM_BOT_TOKEN')
+        if not token:
+            return {'success': False, 'error': 'No hay token de Telegram configurado'}
+
+        limite = time.monotonic() + timeout
+        url = f'{self.url_api}/bot{token}/sendMessage'
+        datos = {'chat_id': chat_id, 'text': texto, 'parse_mode': 'HTML'}
+        try:
+            for intento in range(2):
+                if not await self._esperar_turno(chat_id, limite):
+                    return self._fallido(f'El límite de envío no deja salir el mensaje en {timeout:g} s')
+
+                respuesta = await asyncio.wait_for(
+                    self._obtener_cliente().post(url, json=datos), timeout=max(0.01, limite - time.monotonic())
+                )
+                resultado = respuesta.json()
+                if resultado.get('ok'):
+                    mensaje = resultado['result']
+                    self.total_enviados += 1
+                    return {
+                        'success': True,
+                        'respuesta': {
+                            'message_id': mensaje['message_id'],
+                            'chat_id': mensaje['chat']['id'],
+                            'proveedor': 'telegram',
+                            'real': True
+                        }
+                    }
+
+                if respuesta.status_code == 429 and intento == 0:
+                    # Control de flujo de Telegram: aplica a todo el bot, no solo a este chat
+                    self.total_limitados += 1
+                    reintentar_en = resultado.get('parameters', {}).get('retry_after', 1)
+                    self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + reintentar_en)
+                    continue
+                return self._fallido(resultado.get('description', f'HTTP {respuesta.status_code}'))
+        except asyncio.TimeoutError:
+            return self._fallido(f'Sin respuesta en {timeout:g} s')
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            return self._fallido(str(e) or type(e).__name__)
+
+    def _fallido(self, error):
+        self.total_fallidos += 1
+        return {'success': False, 'error': f'Error Telegram: {error}'}
+
+    async def _enviar_varios(self, envios, timeout):
+        return await asyncio.gather(*(self._enviar(chat_id, texto, timeout) for chat_id, texto in envios))
+
+    def _esperar(self, corrutina, timeout):
+        futuro = asyncio.run_coroutine_threadsafe(corrutina, self._obtener_loop())
+        try:
+            # Los envíos cumplen su propio plazo; el margen es por si el loop está ocupado
+            return futuro.result(timeout + 1)
+        except concurrent.futures.TimeoutError:
+            futuro.cancel()
+            raise
+
+    def enviar(self, chat_id, texto, timeout=None):
+        """
+        Enviar un mensaje desde código síncrono
+
+        Returns:
+            dict: {'success': bool, 'respuesta': dict, 'error': str}
+        """
+        timeout = timeout or self.timeout
+        try:
+            return self._esperar(self._enviar(chat_id, texto, timeout), timeout)
+        except concurrent.futures.TimeoutError:
+            return self._fallido(f'Sin respuesta en {timeout:g} s')
+
+    def enviar_varios(self, envios, timeout=None):
+        """
+        Enviar a muchos chats a la vez
+
+        Args:
+            envios: lista de (chat_id, texto)
+
+        Returns:
+            lista de dicts como enviar(), en el mismo orden
+        """
+        timeout = timeout or self.timeout
+        try:
+            return self._esperar(self._enviar_varios(envios, timeout), timeout)
+        except concurrent.futures.TimeoutError:
+            return [self._fallido(f'Sin respuesta en {timeout:g} s') for _ in envios]
+
+    async def aenviar(self, chat_id, texto, timeout=None):
+        """Versión async de enviar() para el loop de Daphne"""
+        timeout = timeout or self.timeout
+        loop = self._obtener_loop()
+        if asyncio.get_running_loop() is loop:
+            return await self._enviar(chat_id, texto, timeout)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._enviar(chat_id, texto, timeout), loop))
+
+    def cerrar(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._cliente is not None:
+            cliente, self._cliente = self._cliente, None
+            try:
+                asyncio.run_coroutine_threadsafe(cliente.aclose(), loop).result(5)
+            except Exception:
+                pass
+        loop.call_soon_threadsafe(loop.stop)
+
+    def estadisticas(self):
+        return {
+            'conexiones': self.conexiones,
+            'mensajes_por_s': self.mensajes_por_s,
+            'enviados': self.total_enviados,
+            'fallidos': self.total_fallidos,
+            'limitados': self.total_limitados,
+            'espera_total_s': round(self.espera_total_s, 3),
+            'chats': len(self._cubos_chat),
+        }
+
+
+def _crear_enviador():
+    configuracion = getattr(settings, 'TELEGRAM', {})
+    return EnviadorTelegram(
+        url_api=configuracion.get('URL_API', 'https://api.telegram.org'),
+        conexiones=configuracion.get('CONEXIONES', 20),
+        mensajes_por_s=configuracion.get('MENSAJES_POR_S', 25.0),
+        mensajes_por_chat_por_s=configuracion.get('MENSAJES_POR_CHAT_POR_S', 1.0),
+        timeout=configuracion.get('TIMEOUT_S', 10.0),
+    )
+
+
+# Enviador único por proceso
+enviador_telegram = _crear_enviador()
+
+# Cerrar las conexiones y el loop al apagar el proceso
+atexit.register(enviador_telegram.cerrar)
@@ -2,7 +2,14 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
+from django.utils import timezone
 from .models import Alerta, Trayectoria, User
+from .buffer_trayectorias import buffer_trayectorias
+from .estado_vivo import estado_vivo, coordenada
+from .filtro_ubicacion import filtro_ubicacion
+from .cache_rutas import cache_rutas
+from .corredor import monitor_corredor
+from .utils import enviar_evento_corredor, normalizar_ubicacion
 
 
 class AlertasConsumer(AsyncWebsocketConsumer):
@@ -73,6 +80,9 @@ class UbicacionConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
+        # Resolver la alerta una sola vez por conexión
+        self.alerta = await self.obtener_alerta(self.alerta_id)
+
         # Unirse al grupo de ubicación
         await self.channel_layer.group_add(
             self.group_name,
@@ -82,6 +92,9 @@ class UbicacionConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
+        # Guardar los puntos pendientes antes de cerrar
+        await buffer_trayectorias.vaciar()
+
         # Salir del grupo de ubicación
         await self.channel_layer.group_discard(
             self.group_name,
@@ -96,28 +109,41 @@ class UbicacionConsumer(AsyncWebsocketConsumer):
             data = json.loads(text_data)
 
             if data.get('tipo') == 'ubicacion':
-                # Guardar la trayectoria en la base de datos
-                await self.guardar_trayectoria(
-                    self.alerta_id,
+                # Validar antes de usarla: un valor inválido en el buffer haría
+                # fallar el guardado de todo el lote
+                punto = normalizar_ubicacion(
                     data.get('latitud'),
                     data.get('longitud'),
                     data.get('precision'),
                     data.get('velocidad')
                 )
 
+                # Descartar posiciones sin movimiento o demasiado seguidas
+                if not self.aceptar_ubicacion(punto['latitud'], punto['longitud']):
+                    return
+
+                # Acumular el punto en el buffer de escritura diferida
+                await self.guardar_trayectoria(
+                    punto['latitud'],
+                    punto['longitud'],
+                    punto['precision'],
+                    punto['velocidad']
+                )
+
                 # Transmitir a todos en el grupo
                 await self.channel_layer.group_send(
                     self.group_name,
                     {
                         'type': 'actualizar_ubicacion',
-                        'latitud': data.get('latitud'),
-                        'longitud': data.get('longitud'),
-                        'precision': data.get('precision'),
-                        'velocidad': data.get('velocidad'),
+                        'latitud': float(punto['latitud']),
+                        'longitud': float(punto['longitud']),
+                        'precision': punto['precision'],
+                        'velocidad': punto['velocidad'],
                         'timestamp': data.get('timestamp')
                     }
                 )
-        except json.JSONDecodeError:
+        except (ValueError, TypeError, AttributeError):
+            # JSON inválido, mensaje que no es un objeto o posición inválida
             pass
 
     async def actualizar_ubicacion(self, event):
@@ -133,22 +159,67 @@ class UbicacionConsumer(AsyncWebsocketConsumer):
             'timestamp': event.get('timestamp')
         }))
 
-    @database_sync_to_async
-    def guardar_trayectoria(self, alerta_id, latitud, longitud, precision, velocidad):
+    async def actualizar_ubicacion_lote(self, event):
         """
-        Guardar punto de trayectoria en la base de datos
+        Enviar un lote de posiciones en un solo mensaje
         """
-        try:
-            alerta = Alerta.objects.get(id=alerta_id)
-            Trayectoria.objects.create(
-                alerta=alerta,
-                latitud=latitud,
-                longitud=longitud,
-                precision=precision,
-                velocidad=velocidad
+        await self.send(text_data=json.dumps({
+            'tipo': 'ubicacion_lote',
+            'puntos': event['puntos']
+        }))
+
+    def aceptar_ubicacion(self, latitud, longitud):
+        """
+        Pasar la posición por el filtro del repartidor dueño de la alerta
+        """
+        if self.alerta is None:
+            return False
+        return filtro_ubicacion.aceptar(self.alerta.repartidor_id, latitud, longitud, self.alerta.pk)
+
+    async def guardar_trayectoria(self, latitud, longitud, precision, velocidad):
+        """
+        Agregar punto de trayectoria al buffer; se guarda por lotes
+        """
+        if self.alerta is None or latitud is None or longitud is None:
+            return
+
+        await buffer_trayectorias.agregar(Trayectoria(
+            alerta_id=self.alerta.pk,
+            latitud=latitud,
+            longitud=longitud,
+            precision=precision,
+            velocidad=velocidad
+        ))
+
+        # La posición del repartidor solo se actualiza en caliente
+        if self.scope['user'].id == self.alerta.repartidor_id:
+            estado_vivo.registrar(
+                self.alerta.repartidor_id,
+                ultima_latitud=coordenada(latitud, limite=90),
+                ultima_longitud=coordenada(longitud),
+                ultima_actualizacion_ubicacion=timezone.now(),
             )
-        except Alerta.DoesNotExist:
-            pass
+
+            # Vigilar el corredor de la ruta que esté navegando, igual que en las vistas
+            await self.verificar_corredor(latitud, longitud, precision)
+
+    @database_sync_to_async
+    def verificar_corredor(self, latitud, longitud, precision):
+        """
+        Comparar la posición con el corredor de la ruta y avisar al monitoreo
+        de desvíos, regresos y llegadas
+        """
+        for evento in monitor_corredor.verificar(
+            self.alerta.repartidor_id, latitud, longitud, precision=precision
+        ):
+            enviar_evento_corredor(evento)
+
+    @database_sync_to_async
+    def obtener_alerta(self, alerta_id):
+        """
+        Obtener la alerta asociada a la conexión (None si no existe)
+        """
+        return Alerta.objects.filter(id=alerta_id).first()
 
 
 class MonitoreoConsumer(AsyncWebsocketConsumer):
@@ -231,6 +302,15 @@ class MonitoreoConsumer(AsyncWebsocketConsumer):
             'longitud': event.get('longitud')
         }))
 
+    async def evento_corredor(self, event):
+        """
+        Avisar que un repartidor salió, volvió o llegó al final de su ruta
+        """
+        await self.send(text_data=json.dumps({
+            'tipo': 'corredor_ruta',
+            'evento': event['evento']
+        }))
+
     @database_sync_to_async
     def obtener_estado_sistema(self):
         """
@@ -240,7 +320,28 @@ class MonitoreoConsumer(AsyncWebsocketConsumer):
             estado__in=['pendiente', 'en_atencion']
         ).count()
 
+        # Estado en caliente de los repartidores, sin consultar RepartidorProfile
+        repartidores = [
+            {
+                'repartidor_id': usuario_id,
+                'estado': estado.get('estado'),
+                'latitud': str(estado['ultima_latitud']) if estado.get('ultima_latitud') is not None else None,
+                'longitud': str(estado['ultima_longitud']) if estado.get('ultima_longitud') is not None else None,
+                'nivel_bateria': estado.get('nivel_bateria'),
+                'ultima_actualizacion': (
+                    estado['ultima_actualizacion_ubicacion'].isoformat()
+                    if estado.get('ultima_actualizacion_ubicacion') else None
+                ),
+            }
+            for usuario_id, estado in estado_vivo.todos().items()
+        ]
+
         return {
             'alertas_activas': alertas_activas,
+            'repartidores': repartidores,
+            'buffer_trayectorias': buffer_trayectorias.estadisticas(),
+            'estado_vivo': estado_vivo.estadisticas(),
+            'filtro_ubicacion': filtro_ubicacion.estadisticas(),
+            'cache_rutas': cache_rutas.estadisticas(),
             'timestamp': None  # Se llenará en el cliente
         }
@@ -0,0 +1,315 @@
+"""
+Monitoreo del corredor de la ruta seleccionada.
+
+Cuando el repartidor inicia la navegación de una RutaSegura, cada posición
+que llega (actualizar_ubicacion y actualizar_ubicacion_lote) se compara con
+la polilínea elegida. Si el repartidor sale del corredor (ANCHO_M a cada
+lado, más la precisión del GPS hasta TOLERANCIA_PRECISION_M) durante más de
+UMBRAL_S segundos, se envía un evento 'desvio' al grupo 'monitoreo'; al
+volver se envía 'regreso' y al llegar al destino la navegación termina.
+
+Para que cada verificación no dependa del largo de la ruta, la polilínea se
+proyecta a un plano local en metros y sus segmentos se reparten en una
+rejilla (IndiceSegmentos) con celdas del ancho del corredor: un punto solo
+se compara con los segmentos de las 9 celdas que lo rodean.
+
+El estado vive en memoria de cada proceso, como el filtro de ubicaciones.
+Un proceso que recibe una posición de un repartidor que no conoce busca su
+navegación activa en la BD; si no tiene, no vuelve a consultar hasta
+REVISION_S segundos después. Como otro proceso pudo terminar o cambiar la
+navegación, antes de avisar un desvío se confirma en la BD que sigue activa.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .geo import METROS_POR_GRADO, distancia_a_polilinea_m
+
+MAX_REPARTIDORES_EN_MEMORIA = 10_000
+
+
+class IndiceSegmentos:
+    """
+    Rejilla de segmentos de una polilínea para medir distancias cortas a ella
+    """
+
+    def __init__(self, coordenadas, celda_m):
+        if not coordenadas:
+            raise ValueError('La ruta no tiene coordenadas')
+        self.celda_m = celda_m
+        self.coseno = math.cos(math.radians(sum(lat for lat, _ in coordenadas) / len(coordenadas)))
+
+        puntos = [self.proyectar(lat, lon) for lat, lon in coordenadas]
+        self.segmentos = list(zip(puntos, puntos[1:])) or [(puntos[0], puntos[0])]
+        self.destino = puntos[-1]
+        self.celdas = {}  # (fila, columna) -> índices de segmento
+
+        # Cada segmento se registra en las celdas que atraviesa (muestreado
+        # cada media celda); con la vecindad de 3x3 en la consulta basta
+        for indice, ((ax, ay), (bx, by)) in enumerate(self.segmentos):
+            pasos = max(1, math.ceil(math.hypot(bx - ax, by - ay) / (celda_m / 2)))
+            celdas = {
+                (math.floor((ay + (by - ay) * i / pasos) / celda_m), math.floor((ax + (bx - ax) * i / pasos) / celda_m))
+                for i in range(pasos + 1)
+            }
+            for celda in celdas:
+                self.celdas.setdefault(celda, []).append(indice)
+
+    def proyectar(self, latitud, longitud):
+        return longitud * self.coseno * METROS_POR_GRADO, latitud * METROS_POR_GRADO
+
+    def distancia_m(self, latitud, longitud):
+        """
+        Distancia en metros a la polilínea si es menor que una celda;
+        math.inf si es mayor (no hay segmentos en las celdas vecinas)
+
+        Returns:
+            (distancia, índice del segmento más cercano o None)
+        """
+        px, py = self.proyectar(latitud, longitud)
+        fila, columna = math.floor(py / self.celda_m), math.floor(px / self.celda_m)
+        candidatos = set()
+        for df in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                candidatos.update(self.celdas.get((fila + df, columna + dc), ()))
+
+        minima, cercano = math.inf, None
+        for indice in candidatos:
+            (ax, ay), (bx, by) = self.segmentos[indice]
+            dx, dy = bx - ax, by - ay
+            largo_cuadrado = dx * dx + dy * dy
+            t = 0.0 if largo_cuadrado == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / largo_cuadrado))
+            distancia = math.hypot(px - ax - t * dx, py - ay - t * dy)
+            if distancia < minima:
+                minima, cercano = distancia, indice
+        if minima > self.celda_m:
+            return math.inf, None
+        return minima, cercano
+
+    def distancia_destino_m(self, latitud, longitud):
+        px, py = self.proyectar(latitud, longitud)
+        return math.hypot(px - self.destino[0], py - self.destino[1])
+
+
+class NavegacionActiva:
+    """
+    Ruta que un repartidor está navegando y su situación respecto al corredor
+    """
+    __slots__ = (
+        'ruta_id', 'seleccionada', 'nombre', 'coordenadas', 'indice', 'iniciada',
+        'fuera_desde', 'desviado', 'ultimo_instante', 'ultimo_segmento',
+    )
+
+    def __init__(self, ruta_id, seleccionada, nombre, coordenadas, indice, iniciada):
+        self.ruta_id = ruta_id
+        self.seleccionada = seleccionada
+        self.nombre = nombre
+        self.coordenadas = coordenadas
+        self.indice = indice
+        self.iniciada = iniciada
+        self.fuera_desde = None
+        self.desviado = False
+        self.ultimo_instante = None
+        self.ultimo_segmento = 0
+
+
+class MonitorCorredor:
+    """
+    Navegaciones activas por repartidor y verificación de cada posición
+    """
+
+    def __init__(self, ancho_m=60.0, tolerancia_precision_m=40.0, umbral_s=45.0, radio_llegada_m=80.0,
+                 duracion_maxima_s=4 * 3600, revision_s=60.0):
+        self.ancho_m = ancho_m
+        self.tolerancia_precision_m = tolerancia_precision_m
+        self.umbral_s = umbral_s
+        self.radio_llegada_m = radio_llegada_m
+        self.duracion_maxima_s = duracion_maxima_s
+        self.revision_s = revision_s
+        self._navegaciones = OrderedDict()  # repartidor_id -> NavegacionActiva
+        self._sin_navegacion = {}  # repartidor_id -> instante monotónico de la próxima consulta a la BD
+        self._lock = threading.Lock()
+
+        self.total_verificaciones = 0
+        self.total_desvios = 0
+        self.total_regresos = 0
+        self.total_llegadas = 0
+
+    def activar(self, repartidor_id, ruta_id, coordenadas, seleccionada='rapida', nombre='', iniciada=None):
+        """
+        Empezar a vigilar una ruta (reemplaza la que hubiera)
+        """
+        navegacion = NavegacionActiva(
+            ruta_id, seleccionada, nombre, coordenadas,
+            IndiceSegmentos(coordenadas, self.ancho_m + self.tolerancia_precision_m),
+            time.time() if iniciada is None else iniciada,
+        )
+        with self._lock:
+            self._navegaciones[repartidor_id] = navegacion
+            self._navegaciones.move_to_end(repartidor_id)
+            self._sin_navegacion.pop(repartidor_id, None)
+            if len(self._navegaciones) > MAX_REPARTIDORES_EN_MEMORIA:
+                self._navegaciones.popitem(last=False)
+        return navegacion
+
+    def desactivar(self, repartidor_id):
+        with self._lock:
+            self._navegaciones.pop(repartidor_id, None)
+            self._sin_navegacion[repartidor_id] = time.monotonic() + self.revision_s
+
+    def activa(self, repartidor_id):
+        return self._navegaciones.get(repartidor_id)
+
+    def _navegacion(self, repartidor_id):
+        """
+        Navegación activa del repartidor, buscándola en la BD si este proceso
+        no la conoce (a lo sumo una consulta cada revision_s)
+        """
+        navegacion = self._navegaciones.get(repartidor_id)
+        if navegacion is not None:
+            return navegacion
+        if self._sin_navegacion.get(repartidor_id, 0) > time.monotonic():
+            return None
+
+        ruta = _ruta_en_navegacion(repartidor_id, self.duracion_maxima_s)
+        if ruta is None:
+            with self._lock:
+                self._sin_navegacion[repartidor_id] = time.monotonic() + self.revision_s
+                if len(self._sin_navegacion) > MAX_REPARTIDORES_EN_MEMORIA:
+                    self._sin_navegacion.pop(next(iter(self._sin_navegacion)))
+            return None
+        return self.activar(
+            repartidor_id, ruta.id, ruta.coordenadas_seleccionada(), ruta.seleccionada,
+            ruta.repartidor.get_full_name(), ruta.navegacion_iniciada_en.timestamp(),
+        )
+
+    def verificar(self, repartidor_id, latitud, longitud, instante=None, precision=None):
+        """
+        Comparar una posición con el corredor de la ruta en navegación.
+
+        Args:
+            instante: segundos epoch de la posición (por defecto ahora)
+            precision: radio de precisión del GPS en metros
+
+        Returns:
+            lista de eventos (dicts) para el grupo 'monitoreo'; vacía casi siempre
+        """
+        if latitud is None or longitud is None:
+            return []
+        navegacion = self._navegacion(repartidor_id)
+        if navegacion is None:
+            return []
+
+        latitud, longitud = float(latitud), float(longitud)
+        instante = time.time() if instante is None else instante
+        if navegacion.ultimo_instante is not None and instante < navegacion.ultimo_instante:
+            return []  # Posición atrasada de un lote anterior
+        navegacion.ultimo_instante = instante
+        self.total_verificaciones += 1
+
+        if instante - navegacion.iniciada > self.duracion_maxima_s:
+            self._finalizar(repartidor_id, navegacion)
+            return []
+
+        if navegacion.indice.distancia_destino_m(latitud, longitud) <= self.radio_llegada_m:
+            self.total_llegadas += 1
+            self._finalizar(repartidor_id, navegacion)
+            return [self._evento('llegada', repartidor_id, navegacion, latitud, longitud, instante)]
+
+        ancho = self.ancho_m + min(float(precision or 0.0), self.tolerancia_precision_m)
+        distancia, segmento = navegacion.indice.distancia_m(latitud, longitud)
+        if distancia <= ancho:
+            navegacion.ultimo_segmento = segmento
+            eventos = []
+            if navegacion.desviado:
+                navegacion.desviado = False
+                self.total_regresos += 1
+                eventos.append(self._evento('regreso', repartidor_id, navegacion, latitud, longitud, instante, distancia))
+            navegacion.fuera_desde = None
+            return eventos
+
+        if navegacion.fuera_desde is None:
+            navegacion.fuera_desde = instante
+        if not navegacion.desviado and instante - navegacion.fuera_desde >= self.umbral_s:
+            # Otro proceso pudo terminar o cambiar la navegación; antes de
+            # avisar se confirma en la BD (pasa una vez por desvío)
+            if not _sigue_en_navegacion(navegacion.ruta_id):
+                self.desactivar(repartidor_id)
+                self._sin_navegacion.pop(repartidor_id, None)
+                return []
+            navegacion.desviado = True
+            self.total_desvios += 1
+            # Fuera del corredor el índice no mide; la distancia exacta solo se calcula aquí
+            distancia = distancia_a_polilinea_m(latitud, longitud, navegacion.coordenadas)
+            return [self._evento('desvio', repartidor_id, navegacion, latitud, longitud, instante, distancia)]
+        return []
+
+    def _finalizar(self, repartidor_id, navegacion):
+        from .models import RutaSegura
+
+        self.desactivar(repartidor_id)
+        RutaSegura.objects.filter(id=navegacion.ruta_id, navegacion_finalizada_en__isnull=True).update(
+            navegacion_finalizada_en=timezone.now()
+        )
+
+    def _evento(self, evento, repartidor_id, navegacion, latitud, longitud, instante, distancia=None):
+        return {
+            'evento': evento,
+            'repartidor_id': repartidor_id,
+            'repartidor': navegacion.nombre,
+            'ruta_id': navegacion.ruta_id,
+            'seleccionada': navegacion.seleccionada,
+            'latitud': round(latitud, 6),
+            'longitud': round(longitud, 6),
+            'distancia_m': round(distancia, 1) if distancia is not None else None,
+            'segundos_fuera': round(instante - navegacion.fuera_desde, 1) if navegacion.fuera_desde else None,
+            'segmento': navegacion.ultimo_segmento,
+        }
+
+    def estadisticas(self):
+        return {
+            'navegaciones_activas': len(self._navegaciones),
+            'verificaciones': self.total_verificaciones,
+            'desvios': self.total_desvios,
+            'regresos': self.total_regresos,
+            'llegadas': self.total_llegadas,
+            'ancho_m': self.ancho_m,
+            'umbral_s': self.umbral_s,
+        }
+
+
+def _ruta_en_navegacion(repartidor_id, duracion_maxima_s):
+    from .models import RutaSegura
+
+    return RutaSegura.objects.select_related('repartidor').filter(
+        repartidor_id=repartidor_id,
+        navegacion_iniciada_en__gte=timezone.now() - timedelta(seconds=duracion_maxima_s),
+        navegacion_finalizada_en__isnull=True,
+    ).order_by('-navegacion_iniciada_en').first()
+
+
+def _sigue_en_navegacion(ruta_id):
+    from .models import RutaSegura
+
+    return RutaSegura.objects.filter(id=ruta_id, navegacion_finalizada_en__isnull=True).exists()
+
+
+def _crear_monitor():
+    configuracion = getattr(settings, 'CORREDOR_RUTA', {})
+    return MonitorCorredor(
+        ancho_m=configuracion.get('ANCHO_M', 60.0),
+        tolerancia_precision_m=configuracion.get('TOLERANCIA_PRECISION_M', 40.0),
+        umbral_s=configuracion.get('UMBRAL_S', 45.0),
+        radio_llegada_m=configuracion.get('RADIO_LLEGADA_M', 80.0),
+        duracion_maxima_s=configuracion.get('DURACION_MAXIMA_S', 4 * 3600),
+        revision_s=configuracion.get('REVISION_S', 60.0),
+    )
+
+
+# Monitor único por proceso
+monitor_corredor = _crear_monitor()
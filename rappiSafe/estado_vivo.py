@@ -0,0 +1,370 @@
+"""
+Estado "en caliente" de los repartidores (posición, batería y estado).
+
+La telemetría llega varias veces por minuto por repartidor; en lugar de
+reescribir la fila completa de RepartidorProfile en cada lectura, los valores
+se guardan en un backend rápido y un hilo persistidor los vuelca a la BD cada
+pocos segundos con un solo UPDATE para todos los perfiles con cambios.
+
+Backends disponibles (settings.ESTADO_VIVO['BACKEND']):
+
+- 'memoria': diccionario por proceso. Suficiente con un solo proceso de Daphne.
+- 'cache': caché de Django (p. ej. Redis) compartida entre procesos.
+
+Las vistas leen con aplicar()/aplicar_varios(), que sobreponen los valores en
+caliente sobre los perfiles leídos de la BD.
+"""
+import atexit
+import logging
+import threading
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections
+from django.db.models import Case, F, Value, When
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_VIVOS = (
+    'ultima_latitud',
+    'ultima_longitud',
+    'ultima_actualizacion_ubicacion',
+    'nivel_bateria',
+    'ultima_actualizacion_bateria',
+    'estado',
+)
+
+
+def coordenada(valor, limite=180):
+    """
+    Normalizar una coordenada a Decimal de 6 decimales (como el DecimalField)
+
+    Args:
+        limite: valor absoluto máximo; 90 para latitudes, 180 para longitudes
+    """
+    if valor is None or valor == '':
+        return None
+    valor = round(float(valor), 6)
+    if not -limite <= valor <= limite:  # También descarta NaN e infinito
+        raise ValueError('Coordenada fuera de rango')
+    return Decimal(str(valor))
+
+
+def nivel_bateria(valor):
+    """
+    Normalizar un nivel de batería a entero entre 0 y 100 (ValueError o
+    TypeError si no es un número)
+    """
+    return max(0, min(100, int(float(valor))))
+
+
+# ==================== BACKENDS ====================
+
+class BackendMemoria:
+    """
+    Estado en un diccionario del proceso actual
+    """
+
+    def __init__(self, **opciones):
+        self._estados = {}
+        self._sucios = {}
+        self._lock = threading.Lock()
+
+    def actualizar(self, usuario_id, campos, marcar_sucio=True):
+        with self._lock:
+            self._estados.setdefault(usuario_id, {}).update(campos)
+            if marcar_sucio:
+                self._sucios.setdefault(usuario_id, {}).update(campos)
+            else:
+                pendientes = self._sucios.get(usuario_id)
+                if pendientes:
+                    for campo in campos:
+                        pendientes.pop(campo, None)
+
+    def obtener_varios(self, usuario_ids):
+        with self._lock:
+            return {
+                usuario_id: dict(self._estados[usuario_id])
+                for usuario_id in usuario_ids
+                if usuario_id in self._estados
+            }
+
+    def todos(self):
+        with self._lock:
+            return {usuario_id: dict(estado) for usuario_id, estado in self._estados.items()}
+
+    def tomar_sucios(self):
+        with self._lock:
+            sucios = {usuario_id: campos for usuario_id, campos in self._sucios.items() if campos}
+            self._sucios = {}
+            return sucios
+
+    def devolver_sucios(self, sucios):
+        """Volver a marcar como pendientes campos que no se pudieron guardar"""
+        with self._lock:
+            for usuario_id, campos in sucios.items():
+                pendientes = self._sucios.setdefault(usuario_id, {})
+                for campo, valor in campos.items():
+                    pendientes.setdefault(campo, valor)
+
+
+class BackendCache:
+    """
+    Estado en la caché de Django, compartido entre procesos.
+
+    Cada repartidor tiene una clave con su estado y otra con los campos
+    pendientes de guardar; un índice lleva la lista de repartidores conocidos.
+    La lectura y el borrado de pendientes no son atómicos entre procesos: un
+    valor que llegue justo en medio queda en el estado y se guarda con el
+    siguiente cambio de ese repartidor.
+    """
+
+    PREFIJO = 'estado_vivo'
+
+    def __init__(self, alias='default', timeout=None, **opciones):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def _clave(self, usuario_id):
+        return f'{self.PREFIJO}:{usuario_id}'
+
+    def _clave_sucio(self, usuario_id):
+        return f'{self.PREFIJO}:sucio:{usuario_id}'
+
+    def _registrar_en_indice(self, usuario_id):
+        clave = f'{self.PREFIJO}:indice'
+        indice = self.cache.get(clave) or set()
+        if usuario_id not in indice:
+            indice.add(usuario_id)
+            self.cache.set(clave, indice, None)
+
+    def actualizar(self, usuario_id, campos, marcar_sucio=True):
+        with self._lock:
+            estado = self.cache.get(self._clave(usuario_id)) or {}
+            estado.update(campos)
+            self.cache.set(self._clave(usuario_id), estado, self.timeout)
+
+            pendientes = self.cache.get(self._clave_sucio(usuario_id)) or {}
+            if marcar_sucio:
+                pendientes.update(campos)
+            else:
+                for campo in campos:
+                    pendientes.pop(campo, None)
+            self.cache.set(self._clave_sucio(usuario_id), pendientes, None)
+            self._registrar_en_indice(usuario_id)
+
+    def obtener_varios(self, usuario_ids):
+        claves = {self._clave(usuario_id): usuario_id for usuario_id in usuario_ids}
+        return {claves[clave]: estado for clave, estado in self.cache.get_many(claves).items()}
+
+    def todos(self):
+        return self.obtener_varios(self.cache.get(f'{self.PREFIJO}:indice') or set())
+
+    def tomar_sucios(self):
+        indice = self.cache.get(f'{self.PREFIJO}:indice') or set()
+        claves = {self._clave_sucio(usuario_id): usuario_id for usuario_id in indice}
+        encontrados = self.cache.get_many(claves)
+        self.cache.delete_many(list(encontrados))
+        return {claves[clave]: campos for clave, campos in encontrados.items() if campos}
+
+    def devolver_sucios(self, sucios):
+        with self._lock:
+            for usuario_id, campos in sucios.items():
+                pendientes = self.cache.get(self._clave_sucio(usuario_id)) or {}
+                for campo, valor in campos.items():
+                    pendientes.setdefault(campo, valor)
+                self.cache.set(self._clave_sucio(usuario_id), pendientes, None)
+
+
+BACKENDS = {
+    'memoria': BackendMemoria,
+    'cache': BackendCache,
+}
+
+
+# ==================== ESTADO VIVO ====================
+
+class EstadoVivo:
+    """
+    Fachada sobre el backend con persistencia periódica a RepartidorProfile
+    """
+
+    def __init__(self, backend, intervalo=5.0):
+        self.backend = backend
+        self.intervalo = intervalo
+        self._hilo = None
+        self._detener = threading.Event()
+        self._lock_hilo = threading.Lock()
+        self._lock_persistir = threading.Lock()
+
+        self.total_persistencias = 0
+        self.total_perfiles_guardados = 0
+        self.total_errores = 0
+        self.total_descartados = 0
+
+    def registrar(self, usuario_id, persistir_ahora=False, **campos):
+        """
+        Registrar valores en caliente de un repartidor.
+
+        Con persistir_ahora=True (cambios de estado por alertas) se escribe a
+        la BD de inmediato solo con esos campos, sin esperar al persistidor.
+        """
+        campos = {campo: valor for campo, valor in campos.items() if campo in CAMPOS_VIVOS}
+        if not campos:
+            return
+
+        if persistir_ahora:
+            from .models import RepartidorProfile
+            RepartidorProfile.objects.filter(user_id=usuario_id).update(**campos)
+            self.backend.actualizar(usuario_id, campos, marcar_sucio=False)
+        else:
+            self.backend.actualizar(usuario_id, campos)
+            self._iniciar_persistidor()
+
+    def obtener(self, usuario_id):
+        return self.backend.obtener_varios([usuario_id]).get(usuario_id, {})
+
+    def obtener_varios(self, usuario_ids):
+        return self.backend.obtener_varios(usuario_ids)
+
+    def todos(self):
+        return self.backend.todos()
+
+    def aplicar(self, perfil):
+        """
+        Sobreponer los valores en caliente sobre un RepartidorProfile
+        """
+        for campo, valor in self.obtener(perfil.user_id).items():
+            setattr(perfil, campo, valor)
+        return perfil
+
+    def aplicar_varios(self, perfiles):
+        """
+        Igual que aplicar() pero con una sola lectura al backend
+        """
+        perfiles = list(perfiles)
+        estados = self.obtener_varios([perfil.user_id for perfil in perfiles])
+        for perfil in perfiles:
+            for campo, valor in estados.get(perfil.user_id, {}).items():
+                setattr(perfil, campo, valor)
+        return perfiles
+
+    def persistir(self):
+        """
+        Guardar los campos pendientes de todos los repartidores con un UPDATE
+
+        Returns:
+            int: número de perfiles actualizados
+        """
+        from .models import RepartidorProfile
+
+        with self._lock_persistir:
+            sucios = self.backend.tomar_sucios()
+            if not sucios:
+                return 0
+
+            # Un CASE por campo; los perfiles sin cambio en ese campo conservan su valor
+            cambios = {}
+            for campo in CAMPOS_VIVOS:
+                tipo = RepartidorProfile._meta.get_field(campo)
+                casos = [
+                    When(user_id=usuario_id, then=Value(campos[campo], output_field=tipo))
+                    for usuario_id, campos in sucios.items()
+                    if campo in campos
+                ]
+                if casos:
+                    cambios[campo] = Case(*casos, default=F(campo))
+
+            try:
+                actualizados = RepartidorProfile.objects.filter(user_id__in=list(sucios)).update(**cambios)
+            except Exception:
+                logger.exception('Error al persistir el estado de %d repartidores', len(sucios))
+                self.total_errores += 1
+                # Un valor inválido no debe bloquear a los demás repartidores
+                actualizados = self._persistir_uno_por_uno(sucios)
+
+            self.total_persistencias += 1
+            self.total_perfiles_guardados += actualizados
+            return actualizados
+
+    def _persistir_uno_por_uno(self, sucios):
+        """
+        Guardar cada repartidor por separado tras fallar el UPDATE conjunto:
+        los campos de un repartidor que fallan por sus datos se descartan y,
+        si se cae la conexión con la base de datos, los que falten vuelven a
+        quedar pendientes
+        """
+        from .models import RepartidorProfile
+
+        actualizados = 0
+        pendientes = list(sucios.items())
+        for indice, (usuario_id, campos) in enumerate(pendientes):
+            try:
+                actualizados += RepartidorProfile.objects.filter(user_id=usuario_id).update(**campos)
+            except OperationalError:
+                logger.exception('Base de datos no disponible; quedan pendientes %d repartidores',
+                                 len(pendientes) - indice)
+                self.backend.devolver_sucios(dict(pendientes[indice:]))
+                break
+            except Exception:
+                logger.exception('Se descartan los cambios inválidos del repartidor %s: %s', usuario_id, campos)
+                self.total_descartados += 1
+        return actualizados
+
+    def _iniciar_persistidor(self):
+        if self._hilo is not None:
+            return
+        with self._lock_hilo:
+            if self._hilo is None:
+                self._hilo = threading.Thread(
+                    target=self._ciclo_persistidor,
+                    name='estado-vivo-persistidor',
+                    daemon=True,
+                )
+                self._hilo.start()
+
+    def _ciclo_persistidor(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.persistir()
+            except Exception:
+                logger.exception('Error en el persistidor de estado vivo')
+            finally:
+                close_old_connections()
+
+    def detener(self):
+        """
+        Detener el persistidor y guardar lo pendiente
+        """
+        self._detener.set()
+        try:
+            self.persistir()
+        except Exception:
+            logger.exception('Error al persistir el estado vivo al cerrar')
+
+    def estadisticas(self):
+        return {
+            'repartidores': len(self.todos()),
+            'intervalo': self.intervalo,
+            'persistencias': self.total_persistencias,
+            'perfiles_guardados': self.total_perfiles_guardados,
+            'errores': self.total_errores,
+            'descartados': self.total_descartados,
+        }
+
+
+def _crear_estado_vivo():
+    configuracion = dict(getattr(settings, 'ESTADO_VIVO', {}))
+    nombre = configuracion.pop('BACKEND', 'memoria')
+    intervalo = configuracion.pop('INTERVALO_PERSISTENCIA', 5.0)
+    opciones = {clave.lower(): valor for clave, valor in configuracion.get('OPCIONES', {}).items()}
+    return EstadoVivo(BACKENDS[nombre](**opciones), intervalo=intervalo)
+
+
+# Estado único por proceso
+estado_vivo = _crear_estado_vivo()
+
+# Guardar lo pendiente al apagar el proceso
+atexit.register(estado_vivo.detener)
@@ -0,0 +1,115 @@
+"""
+Filtro de posiciones GPS en el servidor.
+
+Con watchPosition y maximumAge: 0 el teléfono envía posiciones aunque el
+repartidor esté detenido; cada una cuesta una escritura y un broadcast. El
+filtro recuerda la última posición aceptada por repartidor y descarta las que
+se movieron menos de FILTRO_UBICACION_DISTANCIA_M o llegan antes de
+FILTRO_UBICACION_INTERVALO_MINIMO_S. Siempre se acepta:
+
+- la primera posición de un repartidor o de una alerta distinta,
+- la primera posición después de un cambio de estado de la alerta
+  (reiniciar() desde la señal post_save de Alerta),
+- una posición cada FILTRO_UBICACION_INTERVALO_MAXIMO_S aunque no haya
+  movimiento, para que el operador sepa que el dispositivo sigue vivo.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .geo import distancia_equirectangular_m
+
+MAX_REPARTIDORES_EN_MEMORIA = 10_000
+
+
+class FiltroUbicacion:
+    """
+    Caché por repartidor de la última posición aceptada
+    """
+
+    def __init__(self, distancia_minima_m=10.0, intervalo_minimo_s=3.0, intervalo_maximo_s=30.0):
+        self.distancia_minima_m = distancia_minima_m
+        self.intervalo_minimo_s = intervalo_minimo_s
+        self.intervalo_maximo_s = intervalo_maximo_s
+        self._ultimas = OrderedDict()  # repartidor_id -> (lat, lon, instante, contexto)
+        self._lock = threading.Lock()
+
+        self.total_aceptados = 0
+        self.descartados_distancia = 0
+        self.descartados_intervalo = 0
+
+    def aceptar(self, repartidor_id, latitud, longitud, contexto=None, instante=None):
+        """
+        Decidir si una posición se procesa o se descarta.
+
+        Args:
+            repartidor_id: id del usuario repartidor
+            latitud, longitud: posición reportada
+            contexto: alerta a la que pertenece la posición (un cambio fuerza aceptar)
+            instante: segundos monotónicos; por defecto time.monotonic()
+
+        Returns:
+            bool: True si la posición debe guardarse y transmitirse
+        """
+        if latitud is None or longitud is None:
+            return False
+
+        latitud, longitud = float(latitud), float(longitud)
+        instante = time.monotonic() if instante is None else instante
+        contexto = str(contexto) if contexto is not None else None
+
+        with self._lock:
+            ultima = self._ultimas.get(repartidor_id)
+            if ultima is not None:
+                lat_anterior, lon_anterior, instante_anterior, contexto_anterior = ultima
+                transcurrido = instante - instante_anterior
+
+                if contexto == contexto_anterior and transcurrido < self.intervalo_maximo_s:
+                    if transcurrido < self.intervalo_minimo_s:
+                        self.descartados_intervalo += 1
+                        return False
+                    distancia = distancia_equirectangular_m(lat_anterior, lon_anterior, latitud, longitud)
+                    if distancia < self.distancia_minima_m:
+                        self.descartados_distancia += 1
+                        return False
+
+            self._ultimas[repartidor_id] = (latitud, longitud, instante, contexto)
+            self._ultimas.move_to_end(repartidor_id)
+            if len(self._ultimas) > MAX_REPARTIDORES_EN_MEMORIA:
+                self._ultimas.popitem(last=False)
+            self.total_aceptados += 1
+            return True
+
+    def reiniciar(self, repartidor_id):
+        """
+        Olvidar la última posición aceptada (la siguiente siempre se acepta)
+        """
+        with self._lock:
+            self._ultimas.pop(repartidor_id, None)
+
+    def estadisticas(self):
+        """
+        Contadores de posiciones aceptadas y descartadas
+        """
+        descartados = self.descartados_distancia + self.descartados_intervalo
+        total = self.total_aceptados + descartados
+        return {
+            'aceptados': self.total_aceptados,
+            'descartados': descartados,
+            'descartados_distancia': self.descartados_distancia,
+            'descartados_intervalo': self.descartados_intervalo,
+            'porcentaje_descartado': round(100 * descartados / total, 1) if total else 0.0,
+            'distancia_minima_m': self.distancia_minima_m,
+            'intervalo_minimo_s': self.intervalo_minimo_s,
+            'intervalo_maximo_s': self.intervalo_maximo_s,
+        }
+
+
+# Filtro único por proceso
+filtro_ubicacion = FiltroUbicacion(
+    distancia_minima_m=getattr(settings, 'FILTRO_UBICACION_DISTANCIA_M', 10.0),
+    intervalo_minimo_s=getattr(settings, 'FILTRO_UBICACION_INTERVALO_MINIMO_S', 3.0),
+    intervalo_maximo_s=getattr(settings, 'FILTRO_UBICACION_INTERVALO_MAXIMO_S', 30.0),
+)
@@ -0,0 +1,245 @@
+"""
+Funciones geodésicas compartidas (distancias, rumbos, cajas envolventes).
+
+Todas aceptan escalares o secuencias/arreglos de coordenadas en grados:
+
+- Con escalares se usa math directamente (más rápido que crear arreglos).
+- Con secuencias se usa NumPy vectorizado; si NumPy no está instalado, un
+  bucle en Python puro con el mismo resultado y se devuelven listas.
+
+Los escalares pueden venir como Decimal (DecimalField de los modelos).
+"""
+import math
+from decimal import Decimal
+from numbers import Number
+
+try:
+    import numpy as np
+except ImportError:  # Misma API en Python puro, solo más lenta
+    np = None
+
+RADIO_TIERRA_KM = 6371.0
+RADIO_TIERRA_M = RADIO_TIERRA_KM * 1000
+METROS_POR_GRADO = 111_320.0
+KM_POR_GRADO = METROS_POR_GRADO / 1000
+
+# Tamaño máximo de la matriz puntos x segmentos en distancia_a_polilinea_m
+_MAX_ELEMENTOS_BLOQUE = 1_000_000
+
+
+def _es_escalar(*valores):
+    return all(isinstance(valor, (Number, Decimal)) for valor in valores)
+
+
+def _como_listas(*valores):
+    """Convertir a listas de float del mismo largo (los escalares se repiten)"""
+    largo = max((len(valor) for valor in valores if not _es_escalar(valor)), default=1)
+    return [
+        [float(valor)] * largo if _es_escalar(valor) else [float(v) for v in valor]
+        for valor in valores
+    ]
+
+
+def _como_arreglos(*valores):
+    return [np.asarray(valor, dtype=np.float64) for valor in valores]
+
+
+# ==================== DISTANCIAS ====================
+
+def _haversine_escalar(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Distancia de gran círculo en km.
+
+    Returns:
+        float si todos los argumentos son escalares; ndarray (o lista sin
+        NumPy) con una distancia por par en otro caso
+    """
+    if _es_escalar(lat1, lon1, lat2, lon2):
+        return _haversine_escalar(lat1, lon1, lat2, lon2)
+
+    if np is None:
+        return [_haversine_escalar(*par) for par in zip(*_como_listas(lat1, lon1, lat2, lon2))]
+
+    lat1, lon1, lat2, lon2 = map(np.radians, _como_arreglos(lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Igual que haversine_km() pero en metros
+    """
+    distancia = haversine_km(lat1, lon1, lat2, lon2)
+    if isinstance(distancia, list):
+        return [d * 1000 for d in distancia]
+    return distancia * 1000
+
+
+def distancia_equirectangular_m(lat1, lon1, lat2, lon2):
+    """
+    Distancia aproximada en metros para puntos cercanos (unos pocos km).
+    Más barata que Haversine; el error es despreciable a escala de ciudad.
+    """
+    if _es_escalar(lat1, lon1, lat2, lon2):
+        lat1, lon1, lat2, lon2 = float(lat1), float(lon1), float(lat2), float(lon2)
+        x = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+        return math.hypot(x, lat2 - lat1) * METROS_POR_GRADO
+
+    if np is None:
+        return [distancia_equirectangular_m(*par) for par in zip(*_como_listas(lat1, lon1, lat2, lon2))]
+
+    lat1, lon1, lat2, lon2 = _como_arreglos(lat1, lon1, lat2, lon2)
+    x = (lon2 - lon1) * np.cos(np.radians((lat1 + lat2) / 2))
+    return np.hypot(x, lat2 - lat1) * METROS_POR_GRADO
+
+
+# ==================== RUMBO ====================
+
+def _rumbo_escalar(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    dlon = lon2 - lon1
+    x = math.sin(dlon) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
+    return math.degrees(math.atan2(x, y)) % 360
+
+
+def rumbo_grados(lat1, lon1, lat2, lon2):
+    """
+    Rumbo inicial de (lat1, lon1) hacia (lat2, lon2) en grados (0 = norte, 90 = este)
+    """
+    if _es_escalar(lat1, lon1, lat2, lon2):
+        return _rumbo_escalar(lat1, lon1, lat2, lon2)
+
+    if np is None:
+        return [_rumbo_escalar(*par) for par in zip(*_como_listas(lat1, lon1, lat2, lon2))]
+
+    lat1, lon1, lat2, lon2 = map(np.radians, _como_arreglos(lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y)) % 360
+
+
+# ==================== POLILÍNEAS ====================
+
+def distancia_a_polilinea_m(latitudes, longitudes, polilinea):
+    """
+    Distancia mínima en metros de uno o varios puntos a una polilínea.
+
+    Se proyecta todo a un plano equirectangular centrado en la polilínea, así
+    que es adecuada para rutas urbanas (error < 0.1% en decenas de km).
+
+    Args:
+        latitudes, longitudes: escalares o secuencias del mismo largo
+        polilinea: secuencia de (lat, lon)
+
+    Returns:
+        float para un punto escalar; ndarray (o lista sin NumPy) en otro caso
+    """
+    escalar = _es_escalar(latitudes, longitudes)
+    if len(polilinea) == 0:
+        raise ValueError('La polilínea no tiene puntos')
+
+    if np is None:
+        lats, lons = _como_listas(latitudes, longitudes)
+        resultado = _distancias_polilinea_python(lats, lons, [(float(a), float(b)) for a, b in polilinea])
+        return resultado[0] if escalar else resultado
+
+    vertices = np.asarray(polilinea, dtype=np.float64).reshape(-1, 2)
+    coseno = math.cos(math.radians(float(vertices[:, 0].mean())))
+    lats, lons = _como_arreglos(latitudes, longitudes)
+    lats, lons = np.atleast_1d(lats), np.atleast_1d(lons)
+
+    # Plano local en metros
+    px = lons * coseno * METROS_POR_GRADO
+    py = lats * METROS_POR_GRADO
+    vx = vertices[:, 1] * coseno * METROS_POR_GRADO
+    vy = vertices[:, 0] * METROS_POR_GRADO
+
+    if len(vertices) == 1:
+        distancias = np.hypot(px - vx[0], py - vy[0])
+        return float(distancias[0]) if escalar else distancias
+
+    ax, ay = vx[:-1], vy[:-1]
+    dx, dy = vx[1:] - ax, vy[1:] - ay
+    largo_cuadrado = dx * dx + dy * dy
+    largo_cuadrado[largo_cuadrado == 0] = 1.0  # Segmentos degenerados: t queda en 0
+
+    distancias = np.empty(len(px))
+    bloque = max(1, _MAX_ELEMENTOS_BLOQUE // len(ax))
+    for inicio in range(0, len(px), bloque):
+        bx = px[inicio:inicio + bloque, None]
+        by = py[inicio:inicio + bloque, None]
+        t = np.clip(((bx - ax) * dx + (by - ay) * dy) / largo_cuadrado, 0.0, 1.0)
+        distancias[inicio:inicio + bloque] = np.hypot(bx - ax - t * dx, by - ay - t * dy).min(axis=1)
+
+    return float(distancias[0]) if escalar else distancias
+
+
+def _distancias_polilinea_python(lats, lons, vertices):
+    coseno = math.cos(math.radians(sum(v[0] for v in vertices) / len(vertices)))
+    proyectados = [(lon * coseno * METROS_POR_GRADO, lat * METROS_POR_GRADO) for lat, lon in vertices]
+    segmentos = list(zip(proyectados, proyectados[1:])) or [(proyectados[0], proyectados[0])]
+
+    distancias = []
+    for lat, lon in zip(lats, lons):
+        px, py = lon * coseno * METROS_POR_GRADO, lat * METROS_POR_GRADO
+        minima = math.inf
+        for (ax, ay), (bx, by) in segmentos:
+            dx, dy = bx - ax, by - ay
+            largo_cuadrado = dx * dx + dy * dy
+            t = 0.0 if largo_cuadrado == 0 else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / largo_cuadrado))
+            minima = min(minima, math.hypot(px - ax - t * dx, py - ay - t * dy))
+        distancias.append(minima)
+    return distancias
+
+
+# ==================== CAJAS ENVOLVENTES ====================
+
+def caja_envolvente(latitudes, longitudes, margen_m=0.0):
+    """
+    Caja (sur, oeste, norte, este) que contiene los puntos, ampliada margen_m
+    """
+    if np is not None:
+        lats, lons = _como_arreglos(latitudes, longitudes)
+        sur, norte = float(lats.min()), float(lats.max())
+        oeste, este = float(lons.min()), float(lons.max())
+    else:
+        lats, lons = _como_listas(latitudes, longitudes)
+        sur, norte, oeste, este = min(lats), max(lats), min(lons), max(lons)
+
+    if margen_m:
+        delta_lat = margen_m / METROS_POR_GRADO
+        latitud_extrema = max(abs(sur), abs(norte))
+        delta_lon = margen_m / (METROS_POR_GRADO * max(math.cos(math.radians(latitud_extrema)), 1e-6))
+        sur, norte = sur - delta_lat, norte + delta_lat
+        oeste, este = oeste - delta_lon, este + delta_lon
+
+    return sur, oeste, norte, este
+
+
+def caja_alrededor(latitud, longitud, radio_m):
+    """
+    Caja (sur, oeste, norte, este) que contiene el círculo de radio_m
+    """
+    return caja_envolvente([latitud], [longitud], margen_m=radio_m)
+
+
+def en_caja(latitudes, longitudes, caja):
+    """
+    Máscara (o bool para escalares) de los puntos dentro de la caja
+    """
+    sur, oeste, norte, este = caja
+    if _es_escalar(latitudes, longitudes):
+        return sur <= float(latitudes) <= norte and oeste <= float(longitudes) <= este
+    if np is None:
+        return [sur <= lat <= norte and oeste <= lon <= este for lat, lon in zip(*_como_listas(latitudes, longitudes))]
+    lats, lons = _como_arreglos(latitudes, longitudes)
+    return (lats >= sur) & (lats <= norte) & (lons >= oeste) & (lons <= este)
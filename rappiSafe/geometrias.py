@@ -0,0 +1,244 @@
+"""
+Geometrías de rutas deduplicadas.
+
+Cada RutaSegura guardaba las coordenadas completas de sus rutas como JSON,
+aunque muchas consultas devuelven exactamente la misma geometría (aciertos
+de la caché de rutas, pares precalculados, la ruta rápida repetida entre las
+seguras). Ahora cada geometría se guarda una sola vez en GeometriaRuta:
+
+- Coordenadas en punto fijo (micro-grados) como deltas zigzag-varint, con el
+  mismo esquema que los segmentos de trayectorias.py.
+- La clave es la huella BLAKE2b del blob codificado: la misma geometría
+  siempre cae en la misma fila y volver a guardarla no inserta nada.
+
+ruta_rapida y ruta_segura de RutaSegura guardan la huella en 'geometria' en
+lugar de 'coordenadas'; las coordenadas solo se decodifican cuando alguien
+las pide (GeometriaRuta.coordenadas o RutaSegura.rutas_con_coordenadas()).
+"""
+import hashlib
+from itertools import accumulate
+
+from .trayectorias import (
+    DECIMALES_COORDENADAS, _deszigzag, _deszigzag_np, _escribir_varint, _leer_varints, _zigzag, np
+)
+
+MAGIC = b'RG'
+VERSION = 1
+ESCALA_COORDENADAS = 10 ** DECIMALES_COORDENADAS
+TAMANO_HUELLA = 16  # bytes de BLAKE2b -> 32 caracteres hex
+
+
+# ==================== CODIFICACIÓN ====================
+
+def codificar_geometria(coordenadas):
+    """
+    Codificar una lista de [lat, lon] en un blob
+    """
+    buffer = bytearray(MAGIC)
+    buffer.append(VERSION)
+    _escribir_varint(buffer, len(coordenadas))
+
+    lat_anterior = lon_anterior = 0
+    for lat, lon in coordenadas:
+        lat = round(lat * ESCALA_COORDENADAS)
+        lon = round(lon * ESCALA_COORDENADAS)
+        _escribir_varint(buffer, _zigzag(lat - lat_anterior))
+        _escribir_varint(buffer, _zigzag(lon - lon_anterior))
+        lat_anterior, lon_anterior = lat, lon
+
+    return bytes(buffer)
+
+
+def decodificar_geometria(datos):
+    """
+    Decodificar un blob generado por codificar_geometria()
+
+    Returns:
+        lista de [lat, lon] (float), igual que las rutas del backend de ruteo
+    """
+    datos = bytes(datos)
+    if datos[:2] != MAGIC or datos[2] != VERSION:
+        raise ValueError('Formato de geometría de ruta no reconocido')
+
+    valores = _leer_varints(datos[3:])
+    total = int(valores[0])
+    if len(valores) != 1 + total * 2:
+        raise ValueError('Geometría de ruta truncada o corrupta')
+
+    if np is not None:
+        puntos = np.cumsum(_deszigzag_np(valores[1:]).reshape(-1, 2), axis=0)
+        return (puntos / ESCALA_COORDENADAS).tolist()
+
+    lats = accumulate(map(_deszigzag, valores[1::2]))
+    lons = accumulate(map(_deszigzag, valores[2::2]))
+    return [[lat / ESCALA_COORDENADAS, lon / ESCALA_COORDENADAS] for lat, lon in zip(lats, lons)]
+
+
+def huella_geometria(datos):
+    """Clave de contenido de un blob de geometría"""
+    return hashlib.blake2b(datos, digest_size=TAMANO_HUELLA).hexdigest()
+
+
+# ==================== POLILÍNEAS CODIFICADAS ====================
+# Formato de Google (el de OSRM con geometries=polyline / polyline6), para
+# recibir muchas rutas en JSON sin mandar listas de coordenadas
+
+def codificar_polilinea(coordenadas, precision=5):
+    """
+    Codificar una lista de [lat, lon] como polilínea de Google
+    """
+    escala = 10 ** precision
+    caracteres = []
+    lat_anterior = lon_anterior = 0
+    for lat, lon in coordenadas:
+        lat, lon = round(lat * escala), round(lon * escala)
+        for delta in (lat - lat_anterior, lon - lon_anterior):
+            valor = _zigzag(delta)
+            while valor >= 0x20:
+                caracteres.append(chr((0x20 | (valor & 0x1F)) + 63))
+                valor >>= 5
+            caracteres.append(chr(valor + 63))
+        lat_anterior, lon_anterior = lat, lon
+    return ''.join(caracteres)
+
+
+def decodificar_polilineas(textos, precision=5):
+    """
+    Decodificar varias polilíneas de Google de una sola pasada
+
+    Returns:
+        (lats, lons, inicios): coordenadas de todas las polilíneas una tras
+        otra e índice del primer punto de cada una (ver riesgo.evaluar_lote)
+    """
+    escala = 10 ** precision
+    if np is None:
+        lats, lons, inicios = [], [], []
+        for texto in textos:
+            inicios.append(len(lats))
+            for lat, lon in _decodificar_polilinea_python(texto):
+                lats.append(lat / escala)
+                lons.append(lon / escala)
+        return lats, lons, inicios
+
+    if not textos:
+        return np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64)
+    try:
+        octetos = np.frombuffer(''.join(textos).encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    except UnicodeEncodeError:
+        raise ValueError('Polilínea con caracteres no válidos')
+    if ((octetos < 0) | (octetos > 0x3F)).any():
+        raise ValueError('Polilínea con caracteres no válidos')
+
+    # Los valores terminan en el primer carácter sin el bit de continuación
+    finales = np.flatnonzero(octetos < 0x20)
+    limites = np.cumsum([len(texto) for texto in textos])
+    if (octetos[limites[limites > 0] - 1] >= 0x20).any():
+        raise ValueError('Polilínea truncada')
+    valores_por_texto = np.diff(np.searchsorted(finales, limites, side='left'), prepend=0)
+    if (valores_por_texto == 0).any() or (valores_por_texto % 2).any():
+        raise ValueError('Polilínea vacía o truncada')
+
+    inicios_valor = np.concatenate(([0], finales[:-1] + 1))
+    posiciones = np.arange(len(octetos)) - np.repeat(inicios_valor, finales - inicios_valor + 1)
+    valores = np.add.reduceat((octetos & 0x1F) << (5 * posiciones), inicios_valor)
+
+    # Deltas acumulados por polilínea: se descuenta lo acumulado antes de cada una
+    deltas = _deszigzag_np(valores).reshape(-1, 2)
+    puntos_por_texto = valores_por_texto // 2
+    inicios = np.concatenate(([0], np.cumsum(puntos_por_texto)[:-1]))
+    acumulados = np.cumsum(deltas, axis=0)
+    previos = np.vstack(([0, 0], acumulados))[inicios]
+    puntos = (acumulados - np.repeat(previos, puntos_por_texto, axis=0)) / escala
+    return puntos[:, 0], puntos[:, 1], inicios
+
+
+def _decodificar_polilinea_python(texto):
+    valores = []
+    resultado = desplazamiento = 0
+    for caracter in texto:
+        byte = ord(caracter) - 63
+        if not 0 <= byte <= 0x3F:
+            raise ValueError('Polilínea con caracteres no válidos')
+        resultado |= (byte & 0x1F) << desplazamiento
+        if byte < 0x20:
+            valores.append(_deszigzag(resultado))
+            resultado = desplazamiento = 0
+        else:
+            desplazamiento += 5
+    if desplazamiento or not valores or len(valores) % 2:
+        raise ValueError('Polilínea vacía o truncada')
+    return zip(accumulate(valores[0::2]), accumulate(valores[1::2]))
+
+
+# ==================== ESCRITURA ====================
+
+def _preparar(lista_coordenadas):
+    """
+    Codificar varias geometrías.
+
+    Returns:
+        (huellas en el mismo orden, objetos GeometriaRuta sin repetir)
+    """
+    from .models import GeometriaRuta
+
+    huellas, nuevas = [], {}
+    for coordenadas in lista_coordenadas:
+        datos = codificar_geometria(coordenadas)
+        huella = huella_geometria(datos)
+        huellas.append(huella)
+        if huella not in nuevas:
+            nuevas[huella] = GeometriaRuta(huella=huella, num_puntos=len(coordenadas), datos=datos)
+    return huellas, list(nuevas.values())
+
+
+def guardar_geometrias(lista_coordenadas):
+    """
+    Guardar geometrías (las que ya existen se ignoran) con un solo INSERT
+
+    Returns:
+        lista de huellas en el mismo orden
+    """
+    from .models import GeometriaRuta
+
+    huellas, nuevas = _preparar(lista_coordenadas)
+    GeometriaRuta.objects.bulk_create(nuevas, ignore_conflicts=True)
+    return huellas
+
+
+async def aguardar_geometrias(lista_coordenadas):
+    """Versión async de guardar_geometrias()"""
+    from .models import GeometriaRuta
+
+    huellas, nuevas = _preparar(lista_coordenadas)
+    await GeometriaRuta.objects.abulk_create(nuevas, ignore_conflicts=True)
+    return huellas
+
+
+def ruta_con_huella(ruta, huella):
+    """Copia de una ruta sin 'coordenadas', con la huella de su geometría"""
+    datos = {clave: valor for clave, valor in ruta.items() if clave != 'coordenadas'}
+    datos['geometria'] = huella
+    return datos
+
+
+# ==================== LECTURA ====================
+
+def cargar_geometrias(huellas):
+    """
+    GeometriaRuta por huella en una sola consulta; las coordenadas no se
+    decodifican hasta que se leen
+    """
+    from .models import GeometriaRuta
+
+    return GeometriaRuta.objects.in_bulk(set(huellas))
+
+
+def coordenadas_ruta(ruta, geometrias):
+    """
+    Coordenadas de una ruta guardada, venga con huella o (registros
+    anteriores a GeometriaRuta) con las coordenadas en el JSON
+    """
+    if 'coordenadas' in ruta:
+        return ruta['coordenadas']
+    geometria = geometrias.get(ruta.get('geometria'))
+    return geometria.coordenadas if geometria is not None else []
@@ -0,0 +1,563 @@
+"""
+Motor de ruteo local sobre un grafo vial compacto.
+
+El grafo se guarda como arreglos NumPy (.npy) en un directorio generado por
+`python manage.py preparar_grafo_vial` y se abre con mmap, así que varios
+procesos comparten las mismas páginas en memoria:
+
+- lat.npy, lon.npy: coordenadas de los nodos (float64)
+- indptr.npy, destinos.npy: adyacencia CSR hacia adelante (int32)
+- longitudes.npy, tiempos.npy: metros y segundos de cada arista (float32)
+- rev_indptr.npy, rev_origenes.npy, rev_aristas.npy: CSR inversa; rev_aristas
+  apunta a la arista original para leer sus pesos sin duplicarlos
+
+Las consultas usan A* bidireccional con potenciales promedio (cota inferior:
+distancia en línea recta a la velocidad máxima del grafo). Las rutas
+alternativas se obtienen penalizando las aristas de las rutas ya encontradas.
+
+Las rutas seguras (rutas_pareto) minimizan tiempo + λ·exposición, donde la
+exposición de cada arista (riesgo x km) se lee del raster de riesgo. Como el
+costo nunca es menor que el tiempo, la misma cota inferior sirve para todos
+los λ y las búsquedas comparten potenciales y costos precalculados.
+"""
+import heapq
+import math
+import os
+import threading
+
+import numpy as np
+
+from .geo import METROS_POR_GRADO, haversine_m
+
+ARCHIVOS = (
+    'lat', 'lon', 'indptr', 'destinos', 'longitudes', 'tiempos',
+    'rev_indptr', 'rev_origenes', 'rev_aristas',
+)
+CELDA_GRADOS = 0.005  # Rejilla para buscar el nodo más cercano (~550 m)
+PENALIZACION_ALTERNATIVAS = 1.4
+MAX_SOLAPAMIENTO = 0.8  # Alternativas que comparten más del 80% se descartan
+FACTOR_SEGURIDAD_HEURISTICA = 0.98  # La proyección local no debe sobreestimar
+
+
+class SinRuta(Exception):
+    """No existe camino entre los nodos pedidos"""
+
+
+# ==================== CONSTRUCCIÓN ====================
+
+def construir_csr(lat, lon, origenes, destinos, longitudes, tiempos):
+    """
+    Armar los arreglos CSR a partir de una lista de aristas dirigidas.
+    Los nodos sin aristas se eliminan y se renumeran.
+
+    Returns:
+        dict nombre -> ndarray con las claves de ARCHIVOS
+    """
+    origenes = np.asarray(origenes, dtype=np.int64)
+    destinos = np.asarray(destinos, dtype=np.int64)
+
+    usados, inverso = np.unique(np.concatenate((origenes, destinos)), return_inverse=True)
+    origenes, destinos = inverso[:len(origenes)], inverso[len(origenes):]
+    num_nodos = len(usados)
+
+    orden = np.argsort(origenes, kind='stable')
+    origenes, destinos = origenes[orden], destinos[orden]
+    longitudes = np.asarray(longitudes, dtype=np.float32)[orden]
+    tiempos = np.asarray(tiempos, dtype=np.float32)[orden]
+
+    indptr = np.zeros(num_nodos + 1, dtype=np.int64)
+    np.cumsum(np.bincount(origenes, minlength=num_nodos), out=indptr[1:])
+
+    rev_aristas = np.argsort(destinos, kind='stable')
+    rev_indptr = np.zeros(num_nodos + 1, dtype=np.int64)
+    np.cumsum(np.bincount(destinos, minlength=num_nodos), out=rev_indptr[1:])
+
+    return {
+        'lat': np.asarray(lat, dtype=np.float64)[usados],
+        'lon': np.asarray(lon, dtype=np.float64)[usados],
+        'indptr': indptr.astype(np.int32),
+        'destinos': destinos.astype(np.int32),
+        'longitudes': longitudes,
+        'tiempos': tiempos,
+        'rev_indptr': rev_indptr.astype(np.int32),
+        'rev_origenes': origenes[rev_aristas].astype(np.int32),
+        'rev_aristas': rev_aristas.astype(np.int32),
+    }
+
+
+def guardar_grafo(directorio, arreglos):
+    os.makedirs(directorio, exist_ok=True)
+    for nombre in ARCHIVOS:
+        np.save(os.path.join(directorio, f'{nombre}.npy'), arreglos[nombre])
+
+
+def generar_grafo_sintetico(filas=550, columnas=550, lat0=19.25, lon0=-99.30, separacion_m=80.0, semilla=7):
+    """
+    Rejilla vial del tamaño de la CDMX para pruebas y benchmarks:
+    avenidas de doble sentido cada 10 cuadras, calles de un solo sentido
+    alternado y ~8% de cuadras cerradas.
+    """
+    rnd = np.random.default_rng(semilla)
+    paso_lat = separacion_m / METROS_POR_GRADO
+    paso_lon = separacion_m / (METROS_POR_GRADO * math.cos(math.radians(lat0)))
+
+    i, j = np.meshgrid(np.arange(filas), np.arange(columnas), indexing='ij')
+    lat = (lat0 + i * paso_lat + rnd.normal(0, paso_lat * 0.08, i.shape)).ravel()
+    lon = (lon0 + j * paso_lon + rnd.normal(0, paso_lon * 0.08, j.shape)).ravel()
+    nodo = (i * columnas + j)
+
+    origenes, destinos, velocidades = [], [], []
+    # Cuadras horizontales (misma fila) y verticales (misma columna)
+    for a, b, linea in (
+        (nodo[:, :-1], nodo[:, 1:], i[:, :-1]),
+        (nodo[:-1, :], nodo[1:, :], j[:-1, :]),
+    ):
+        a, b, linea = a.ravel(), b.ravel(), linea.ravel()
+        abiertas = rnd.random(len(a)) > 0.08
+        avenida = (linea % 10 == 0)
+        abiertas |= avenida
+        a, b, linea, avenida = a[abiertas], b[abiertas], linea[abiertas], avenida[abiertas]
+        velocidad = np.where(avenida, 50.0, 25.0)
+
+        # Avenidas en ambos sentidos; calles en un sentido alternado por línea
+        ida = avenida | (linea % 2 == 0)
+        vuelta = avenida | (linea % 2 == 1)
+        origenes += [a[ida], b[vuelta]]
+        destinos += [b[ida], a[vuelta]]
+        velocidades += [velocidad[ida], velocidad[vuelta]]
+
+    origenes = np.concatenate(origenes)
+    destinos = np.concatenate(destinos)
+    longitudes = haversine_m(lat[origenes], lon[origenes], lat[destinos], lon[destinos])
+    tiempos = longitudes / (np.concatenate(velocidades) / 3.6)
+    return construir_csr(lat, lon, origenes, destinos, longitudes, tiempos)
+
+
+# ==================== CONSULTAS ====================
+
+class GrafoVial:
+    """
+    Grafo vial cargado con mmap y consultas de ruta más rápida
+    """
+
+    def __init__(self, arreglos):
+        self.arreglos = arreglos
+        self.num_nodos = len(arreglos['lat'])
+        self.num_aristas = len(arreglos['destinos'])
+
+        # memoryview devuelve int/float de Python sin crear escalares de NumPy,
+        # lo que hace mucho más rápido el bucle de búsqueda
+        self._vistas = {nombre: memoryview(arreglo) for nombre, arreglo in arreglos.items()}
+
+        longitudes = np.asarray(arreglos['longitudes'], dtype=np.float64)
+        tiempos = np.asarray(arreglos['tiempos'], dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            velocidades = np.where(tiempos > 0, longitudes / tiempos, 0.0)
+        self.velocidad_maxima = float(velocidades.max()) if len(velocidades) else 1.0
+
+        self._construir_indice_nodos()
+
+        self._lock_riesgo = threading.Lock()
+        self._version_riesgo = None
+        self._exposicion = None
+        self._costos_riesgo = {}  # λ -> memoryview de tiempo + λ·exposición
+
+    @classmethod
+    def cargar(cls, directorio, mmap=True):
+        arreglos = {
+            nombre: np.load(os.path.join(directorio, f'{nombre}.npy'), mmap_mode='r' if mmap else None)
+            for nombre in ARCHIVOS
+        }
+        return cls(arreglos)
+
+    def memoria_bytes(self):
+        return sum(arreglo.nbytes for arreglo in self.arreglos.values()) + self._celdas_ordenadas.nbytes + self._orden.nbytes
+
+    # ----- Nodo más cercano -----
+
+    def _construir_indice_nodos(self):
+        lat = np.asarray(self.arreglos['lat'])
+        lon = np.asarray(self.arreglos['lon'])
+        # Solo nodos con salida y entrada, para no anclar la ruta en un callejón aislado
+        grado_salida = np.diff(np.asarray(self.arreglos['indptr']))
+        grado_entrada = np.diff(np.asarray(self.arreglos['rev_indptr']))
+        validos = np.flatnonzero((grado_salida > 0) & (grado_entrada > 0))
+
+        celdas = self._clave_celda(lat[validos], lon[validos])
+        orden = np.argsort(celdas, kind='stable')
+        self._celdas_ordenadas = celdas[orden]
+        self._orden = validos[orden].astype(np.int32)
+
+    @staticmethod
+    def _clave_celda(lat, lon):
+        fila = np.floor(np.asarray(lat) / CELDA_GRADOS).astype(np.int64)
+        columna = np.floor(np.asarray(lon) / CELDA_GRADOS).astype(np.int64)
+        return fila * 1_000_000 + columna
+
+    def _nodos_en_celdas(self, fila, columna, radio):
+        desplazamientos = np.arange(-radio, radio + 1)
+        claves = ((fila + desplazamientos)[:, None] * 1_000_000 + (columna + desplazamientos)[None, :]).ravel()
+        inicio = np.searchsorted(self._celdas_ordenadas, claves, side='left')
+        fin = np.searchsorted(self._celdas_ordenadas, claves, side='right')
+        partes = [self._orden[a:b] for a, b in zip(inicio, fin) if b > a]
+        return np.concatenate(partes) if partes else np.empty(0, dtype=np.int32)
+
+    def nodo_mas_cercano(self, latitud, longitud, max_anillos=20):
+        """
+        Nodo del grafo más cercano a un punto (None si no hay ninguno cerca)
+        """
+        fila = math.floor(latitud / CELDA_GRADOS)
+        columna = math.floor(longitud / CELDA_GRADOS)
+        for radio in range(max_anillos + 1):
+            if len(self._nodos_en_celdas(fila, columna, radio)):
+                # Un anillo más: el nodo más cercano puede estar en la celda vecina
+                nodos = self._nodos_en_celdas(fila, columna, radio + 1)
+                distancias = haversine_m(latitud, longitud, self.arreglos['lat'][nodos], self.arreglos['lon'][nodos])
+                return int(nodos[int(np.argmin(distancias))])
+        return None
+
+    # ----- Búsqueda -----
+
+    def ruta_mas_rapida(self, origen, destino, penalizaciones=None, costos=None, potenciales=None,
+                        ruta_conocida=None):
+        """
+        A* bidireccional entre dos nodos minimizando el tiempo (o el costo dado).
+
+        Args:
+            origen, destino: índices de nodo
+            penalizaciones: dict arista -> factor multiplicador del costo
+            costos: costo por arista, nunca menor que su tiempo (por defecto el tiempo)
+            potenciales: dict a compartir entre búsquedas con el mismo origen y destino
+            ruta_conocida: aristas de un camino ya encontrado; su costo sirve de
+                cota superior para terminar antes y se devuelve si nada lo mejora
+
+        Returns:
+            (aristas, tiempo_s, asentados): lista de índices de arista en orden
+            y número de nodos asentados (para medir el esfuerzo)
+
+        Raises:
+            SinRuta si no hay camino
+        """
+        if origen == destino:
+            return [], 0.0, 0
+
+        lat, lon = self._vistas['lat'], self._vistas['lon']
+        indptr, destinos, tiempos = self._vistas['indptr'], self._vistas['destinos'], self._vistas['tiempos']
+        rev_indptr, rev_origenes, rev_aristas = (
+            self._vistas['rev_indptr'], self._vistas['rev_origenes'], self._vistas['rev_aristas']
+        )
+        penalizaciones = penalizaciones or {}
+        costos = tiempos if costos is None else costos
+
+        # Potencial promedio p(v) = (h_destino(v) - h_origen(v)) / 2, en segundos
+        lat_o, lon_o, lat_d, lon_d = lat[origen], lon[origen], lat[destino], lon[destino]
+        coseno = math.cos(math.radians((lat_o + lat_d) / 2))
+        escala = METROS_POR_GRADO * FACTOR_SEGURIDAD_HEURISTICA / self.velocidad_maxima
+        potenciales = {} if potenciales is None else potenciales
+
+        def potencial(v):
+            p = potenciales.get(v)
+            if p is None:
+                la, lo = lat[v], lon[v]
+                h_destino = math.hypot((lo - lon_d) * coseno, la - lat_d)
+                h_origen = math.hypot((lo - lon_o) * coseno, la - lat_o)
+                p = potenciales[v] = (h_destino - h_origen) * escala / 2
+            return p
+
+        dist_f, dist_r = {origen: 0.0}, {destino: 0.0}
+        pred_f, pred_r = {origen: -1}, {destino: -1}
+        asentados_f, asentados_r = set(), set()
+        cola_f = [(potencial(origen), origen)]
+        cola_r = [(-potencial(destino), destino)]
+        mejor, encuentro = math.inf, -1
+        if ruta_conocida:
+            mejor = sum(costos[e] * penalizaciones.get(e, 1.0) for e in ruta_conocida)
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        while cola_f and cola_r:
+            if cola_f[0][0] + cola_r[0][0] >= mejor:
+                break
+
+            if len(cola_f) <= len(cola_r):
+                _, u = heappop(cola_f)
+                if u in asentados_f:
+                    continue
+                asentados_f.add(u)
+                base = dist_f[u]
+                for e in range(indptr[u], indptr[u + 1]):
+                    v = destinos[e]
+                    nueva = base + costos[e] * penalizaciones.get(e, 1.0)
+                    if nueva < dist_f.get(v, math.inf):
+                        dist_f[v] = nueva
+                        pred_f[v] = e
+                        heappush(cola_f, (nueva + potencial(v), v))
+                        otra = dist_r.get(v)
+                        if otra is not None and nueva + otra < mejor:
+                            mejor, encuentro = nueva + otra, v
+            else:
+                _, u = heappop(cola_r)
+                if u in asentados_r:
+                    continue
+                asentados_r.add(u)
+                base = dist_r[u]
+                for i in range(rev_indptr[u], rev_indptr[u + 1]):
+                    e = rev_aristas[i]
+                    v = rev_origenes[i]
+                    nueva = base + costos[e] * penalizaciones.get(e, 1.0)
+                    if nueva < dist_r.get(v, math.inf):
+                        dist_r[v] = nueva
+                        pred_r[v] = e
+                        heappush(cola_r, (nueva - potencial(v), v))
+                        otra = dist_f.get(v)
+                        if otra is not None and nueva + otra < mejor:
+                            mejor, encuentro = nueva + otra, v
+
+        if encuentro < 0:
+            if ruta_conocida:
+                return list(ruta_conocida), sum(tiempos[e] for e in ruta_conocida), len(asentados_f) + len(asentados_r)
+            raise SinRuta()
+
+        # Reconstruir: origen -> encuentro con pred_f, encuentro -> destino con pred_r
+        aristas = []
+        v = encuentro
+        while pred_f[v] >= 0:
+            e = pred_f[v]
+            aristas.append(e)
+            v = self._origen_arista(e)
+        aristas.reverse()
+        v = encuentro
+        while pred_r[v] >= 0:
+            e = pred_r[v]
+            aristas.append(e)
+            v = destinos[e]
+
+        tiempo = sum(tiempos[e] for e in aristas)
+        return aristas, tiempo, len(asentados_f) + len(asentados_r)
+
+    def costos_desde(self, origen, destinos, costos=None, caja=None):
+        """
+        Búsqueda de un origen hacia varios destinos; termina en cuanto todos
+        están asentados.
+
+        Args:
+            caja: (lat_min, lat_max, lon_min, lon_max) que contiene a los
+                destinos. La distancia a la caja es una cota inferior
+                consistente de la distancia a cualquiera de ellos, así que
+                con ella la búsqueda es A* y no explora más allá de los
+                destinos; sin ella es Dijkstra.
+
+        Returns:
+            dict destino -> costo del camino más barato; los destinos
+            inalcanzables no aparecen
+        """
+        lat, lon = self._vistas['lat'], self._vistas['lon']
+        indptr, salidas = self._vistas['indptr'], self._vistas['destinos']
+        costos = self._vistas['tiempos'] if costos is None else costos
+        pendientes = set(destinos)
+        resultado = {}
+
+        if caja is None:
+            lat_min = lon_min = -math.inf
+            lat_max = lon_max = math.inf
+            coseno = 1.0
+        else:
+            lat_min, lat_max, lon_min, lon_max = caja
+            coseno = math.cos(math.radians((lat_min + lat_max) / 2))
+        escala = METROS_POR_GRADO * FACTOR_SEGURIDAD_HEURISTICA / self.velocidad_maxima
+
+        hypot, inf = math.hypot, math.inf
+        dist = {origen: 0.0}
+        cola = [(0.0, 0.0, origen)]
+        heappush, heappop = heapq.heappush, heapq.heappop
+        while cola and pendientes:
+            _, d, u = heappop(cola)
+            if d > dist[u]:
+                continue
+            if u in pendientes:
+                pendientes.discard(u)
+                resultado[u] = d
+            for e in range(indptr[u], indptr[u + 1]):
+                v = salidas[e]
+                nueva = d + costos[e]
+                if nueva < dist.get(v, inf):
+                    dist[v] = nueva
+                    # Potencial: distancia a la caja (en línea, es el lazo interno)
+                    la, lo = lat[v], lon[v]
+                    dy = lat_min - la if la < lat_min else (la - lat_max if la > lat_max else 0.0)
+                    dx = lon_min - lo if lo < lon_min else (lo - lon_max if lo > lon_max else 0.0)
+                    potencial = hypot(dx * coseno, dy) * escala if dx or dy else 0.0
+                    heappush(cola, (nueva + potencial, nueva, v))
+        return resultado
+
+    def matriz(self, puntos, fuentes=None, raster=None, lambda_riesgo=0.0):
+        """
+        Costo (tiempo + λ·exposición) entre puntos [(lat, lon), ...]
+
+        Args:
+            fuentes: índices de los puntos de los que se calculan las filas
+                (por defecto todos)
+
+        Returns:
+            una fila por fuente con una columna por punto, en segundos;
+            math.inf si no hay camino
+
+        Raises:
+            SinRuta si algún punto está lejos del grafo
+        """
+        nodos = [self.nodo_mas_cercano(float(lat), float(lon)) for lat, lon in puntos]
+        if any(nodo is None for nodo in nodos):
+            raise SinRuta()
+        costos = self._costos(raster, lambda_riesgo) if lambda_riesgo else None
+        lats = [self._vistas['lat'][nodo] for nodo in nodos]
+        lons = [self._vistas['lon'][nodo] for nodo in nodos]
+        caja = (min(lats), max(lats), min(lons), max(lons))
+        fuentes = range(len(puntos)) if fuentes is None else fuentes
+
+        filas = []
+        for fuente in fuentes:
+            alcanzados = self.costos_desde(nodos[fuente], set(nodos), costos, caja)
+            filas.append([alcanzados.get(nodo, math.inf) for nodo in nodos])
+        return filas
+
+    def _origen_arista(self, arista):
+        # bisect sobre indptr: el origen es el nodo cuyo rango contiene la arista
+        indptr = self.arreglos['indptr']
+        return int(np.searchsorted(indptr, arista, side='right') - 1)
+
+    def geometria(self, aristas, origen):
+        """
+        Coordenadas [[lat, lon], ...] de una secuencia de aristas, en
+        micro-grados como las de OSRM
+        """
+        lat, lon, destinos = self._vistas['lat'], self._vistas['lon'], self._vistas['destinos']
+        coordenadas = [[round(lat[origen], 6), round(lon[origen], 6)]]
+        coordenadas.extend([round(lat[destinos[e]], 6), round(lon[destinos[e]], 6)] for e in aristas)
+        return coordenadas
+
+    def formatear_ruta(self, aristas, origen):
+        """
+        Ruta con la misma forma que obtener_ruta_osrm()
+        """
+        longitudes, tiempos = self._vistas['longitudes'], self._vistas['tiempos']
+        return {
+            'coordenadas': self.geometria(aristas, origen),
+            'distancia': round(sum(longitudes[e] for e in aristas) / 1000, 2),  # metros a km
+            'duracion': round(sum(tiempos[e] for e in aristas) / 60),  # segundos a minutos
+        }
+
+    def rutas(self, origen_lat, origen_lon, destino_lat, destino_lon, alternativas=2):
+        """
+        Ruta más rápida y hasta `alternativas` rutas alternativas entre dos puntos
+
+        Raises:
+            SinRuta si algún punto está lejos del grafo o no hay camino
+        """
+        origen = self.nodo_mas_cercano(float(origen_lat), float(origen_lon))
+        destino = self.nodo_mas_cercano(float(destino_lat), float(destino_lon))
+        if origen is None or destino is None:
+            raise SinRuta()
+
+        aristas, _, _ = self.ruta_mas_rapida(origen, destino)
+        encontradas = [aristas]
+
+        penalizaciones = {}
+        intentos = 0
+        while len(encontradas) <= alternativas and intentos < alternativas * 2:
+            intentos += 1
+            for e in encontradas[-1]:
+                penalizaciones[e] = penalizaciones.get(e, 1.0) * PENALIZACION_ALTERNATIVAS
+            candidata, _, _ = self.ruta_mas_rapida(origen, destino, penalizaciones)
+            conjunto = set(candidata)
+            if candidata and all(
+                len(conjunto & set(previa)) <= MAX_SOLAPAMIENTO * max(len(previa), 1)
+                for previa in encontradas
+            ):
+                encontradas.append(candidata)
+
+        return [self.formatear_ruta(aristas, origen) for aristas in encontradas]
+
+    # ----- Rutas seguras -----
+
+    def exposicion_aristas(self, raster):
+        """
+        Exposición al riesgo (riesgo x km) de cada arista, leída en su punto
+        medio; se recalcula solo cuando cambia la versión del raster
+        """
+        version = raster.version_vigente()
+        with self._lock_riesgo:
+            if self._version_riesgo != version:
+                indptr = np.asarray(self.arreglos['indptr'])
+                origenes = np.repeat(np.arange(self.num_nodos, dtype=np.int32), np.diff(indptr))
+                destinos = np.asarray(self.arreglos['destinos'])
+                lat, lon = np.asarray(self.arreglos['lat']), np.asarray(self.arreglos['lon'])
+                riesgo = raster.riesgo_en((lat[origenes] + lat[destinos]) / 2, (lon[origenes] + lon[destinos]) / 2)
+                longitudes_km = np.asarray(self.arreglos['longitudes'], dtype=np.float64) / 1000
+                self._exposicion = (np.asarray(riesgo) * longitudes_km).astype(np.float32)
+                self._costos_riesgo = {}
+                self._version_riesgo = version
+            return self._exposicion
+
+    def _costos(self, raster, lambda_riesgo):
+        exposicion = self.exposicion_aristas(raster)
+        with self._lock_riesgo:
+            costos = self._costos_riesgo.get(lambda_riesgo)
+            if costos is None:
+                arreglo = np.asarray(self.arreglos['tiempos'], dtype=np.float32) + np.float32(lambda_riesgo) * exposicion
+                costos = self._costos_riesgo[lambda_riesgo] = memoryview(arreglo)
+            return costos
+
+    def rutas_pareto(self, origen_lat, origen_lon, destino_lat, destino_lon, raster, lambdas=(0.0, 5.0, 20.0)):
+        """
+        Una ruta por cada λ (segundos de tiempo que vale una unidad de
+        exposición): λ=0 es la más rápida y λ mayores son más seguras.
+
+        Returns:
+            lista de rutas como formatear_ruta() con 'lambda_riesgo' y
+            'exposicion_riesgo', en el orden de lambdas
+
+        Raises:
+            SinRuta si algún punto está lejos del grafo o no hay camino
+        """
+        origen = self.nodo_mas_cercano(float(origen_lat), float(origen_lon))
+        destino = self.nodo_mas_cercano(float(destino_lat), float(destino_lon))
+        if origen is None or destino is None:
+            raise SinRuta()
+
+        exposicion = memoryview(self.exposicion_aristas(raster))
+        potenciales = {}  # La cota inferior es la misma para todos los λ
+        encontradas = {}
+        rutas = []
+        aristas = None
+        for lambda_riesgo in lambdas:
+            costos = self._costos(raster, lambda_riesgo) if lambda_riesgo else None
+            # La ruta del λ anterior acota el costo y corta la búsqueda antes
+            aristas, _, _ = self.ruta_mas_rapida(
+                origen, destino, costos=costos, potenciales=potenciales, ruta_conocida=aristas,
+            )
+            clave = tuple(aristas)
+            if clave not in encontradas:
+                encontradas[clave] = self.formatear_ruta(aristas, origen)
+            rutas.append({
+                **encontradas[clave],
+                'lambda_riesgo': lambda_riesgo,
+                'exposicion_riesgo': round(sum(exposicion[e] for e in aristas), 2),
+            })
+        return rutas
+
+
+_grafos = {}
+_lock = threading.Lock()
+
+
+def cargar_grafo(directorio):
+    """
+    Grafo del directorio, cargado una sola vez por proceso
+    """
+    directorio = os.fspath(directorio)
+    grafo = _grafos.get(directorio)
+    if grafo is None:
+        with _lock:
+            grafo = _grafos.get(directorio)
+            if grafo is None:
+                grafo = _grafos[directorio] = GrafoVial.cargar(directorio)
+    return grafo
@@ -0,0 +1,163 @@
+"""
+Índice espacial de zonas de riesgo (EstadisticaRiesgo).
+
+Los centros de las zonas se agrupan en una rejilla de celdas de CELDA_GRADOS;
+una búsqueda solo revisa las celdas que cubre el radio pedido y calcula la
+distancia exacta (Haversine) contra esas zonas, así que el resultado es el
+mismo que recorrer todas las zonas pero sin depender de cuántas haya.
+
+El índice se construye la primera vez que se usa en cada proceso y se marca
+como obsoleto cuando una zona se guarda o se borra (señales en signals.py).
+Como otros procesos no reciben esas señales, además se reconstruye cada
+INDICE_ZONAS_TTL segundos.
+"""
+import heapq
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .geo import KM_POR_GRADO, haversine_km
+
+CELDA_GRADOS = 0.05  # ~5.5 km de lado
+
+
+def centro_zona(coordenadas):
+    """
+    Centro (lat, lon) de una zona a partir de coordenadas_zona.
+
+    Acepta {'center': {'lat', 'lng'}}, un Point GeoJSON o un Polygon GeoJSON
+    (promedio de los vértices del anillo exterior). Devuelve None si la zona
+    no tiene coordenadas utilizables.
+    """
+    if not isinstance(coordenadas, dict):
+        return None
+    try:
+        if 'center' in coordenadas:
+            return float(coordenadas['center']['lat']), float(coordenadas['center']['lng'])
+
+        tipo = coordenadas.get('type')
+        if tipo == 'Point':
+            lon, lat = coordenadas['coordinates'][:2]
+            return float(lat), float(lon)
+        if tipo == 'Polygon' and coordenadas.get('coordinates'):
+            anillo = coordenadas['coordinates'][0]
+            if anillo and anillo[0] == anillo[-1]:
+                anillo = anillo[:-1]  # El anillo GeoJSON repite el primer vértice
+            if anillo:
+                return (
+                    sum(float(v[1]) for v in anillo) / len(anillo),
+                    sum(float(v[0]) for v in anillo) / len(anillo),
+                )
+    except (KeyError, IndexError, TypeError, ValueError):
+        pass
+    return None
+
+
+class IndiceZonas:
+    """
+    Rejilla de zonas de riesgo por centro
+    """
+
+    def __init__(self, tamano_celda=CELDA_GRADOS, ttl=300):
+        self.tamano_celda = tamano_celda
+        self.ttl = ttl
+        self._celdas = None
+        self._construido_en = 0.0
+        self._lock = threading.Lock()
+        self.total_construcciones = 0
+
+    def _celda(self, latitud, longitud):
+        return (math.floor(latitud / self.tamano_celda), math.floor(longitud / self.tamano_celda))
+
+    def construir(self):
+        """
+        Leer todas las zonas y repartirlas en la rejilla
+        """
+        from .models import EstadisticaRiesgo
+
+        celdas = {}
+        for zona in EstadisticaRiesgo.objects.all():
+            centro = centro_zona(zona.coordenadas_zona)
+            if centro is None:
+                continue
+            celdas.setdefault(self._celda(*centro), []).append((centro[0], centro[1], zona))
+        return celdas
+
+    def _obtener_celdas(self):
+        celdas = self._celdas
+        if celdas is not None and time.monotonic() - self._construido_en < self.ttl:
+            return celdas
+        with self._lock:
+            celdas = self._celdas
+            if celdas is None or time.monotonic() - self._construido_en >= self.ttl:
+                celdas = self._celdas = self.construir()
+                self._construido_en = time.monotonic()
+                self.total_construcciones += 1
+            return celdas
+
+    def invalidar(self):
+        """
+        Marcar el índice como obsoleto; se reconstruye en la siguiente búsqueda
+        """
+        self._celdas = None
+
+    def zonas_cercanas(self, latitud, longitud, radio_km=10, k=5):
+        """
+        Las k zonas más cercanas dentro de radio_km.
+
+        Returns:
+            list[tuple[EstadisticaRiesgo, float]]: (zona, distancia en km)
+            ordenada de la más cercana a la más lejana
+        """
+        celdas = self._obtener_celdas()
+        if not celdas or k <= 0:
+            return []
+
+        latitud, longitud = float(latitud), float(longitud)
+
+        # Celdas que cubren el rectángulo del radio
+        delta_lat = radio_km / KM_POR_GRADO
+        delta_lon = radio_km / (KM_POR_GRADO * max(math.cos(math.radians(latitud)), 1e-6))
+        fila_min, columna_min = self._celda(latitud - delta_lat, longitud - delta_lon)
+        fila_max, columna_max = self._celda(latitud + delta_lat, longitud + delta_lon)
+
+        total_celdas = (fila_max - fila_min + 1) * (columna_max - columna_min + 1)
+        if total_celdas > len(celdas):
+            # Radio muy grande: es más barato recorrer solo las celdas ocupadas
+            grupos = celdas.values()
+        else:
+            grupos = (
+                celdas.get((fila, columna), ())
+                for fila in range(fila_min, fila_max + 1)
+                for columna in range(columna_min, columna_max + 1)
+            )
+
+        candidatos = [entrada for grupo in grupos for entrada in grupo]
+        if not candidatos:
+            return []
+
+        # Distancias de todos los candidatos en una sola llamada vectorizada
+        distancias = haversine_km(
+            latitud, longitud,
+            [entrada[0] for entrada in candidatos],
+            [entrada[1] for entrada in candidatos],
+        )
+        cercanas = (
+            (float(distancia), entrada[2].pk, entrada[2])
+            for distancia, entrada in zip(distancias, candidatos)
+            if distancia <= radio_km
+        )
+        return [(zona, distancia) for distancia, _, zona in heapq.nsmallest(k, cercanas)]
+
+
+# Índice único por proceso
+indice_zonas = IndiceZonas(ttl=getattr(settings, 'INDICE_ZONAS_TTL', 300))
+
+
+def zonas_cercanas(latitud, longitud, radio_km=10, k=5):
+    """
+    Atajo a indice_zonas.zonas_cercanas()
+    """
+    return indice_zonas.zonas_cercanas(latitud, longitud, radio_km, k)
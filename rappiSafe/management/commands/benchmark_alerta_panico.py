@@ -0,0 +1,143 @@
+import os
+import secrets
+import socketserver
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from rappiSafe.models import Alerta, ContactoConfianza, NotificacionContacto
+from rappiSafe.notificaciones import canales_contacto, despachador_notificaciones, enviar_por_canal
+from rappiSafe.reintentos import programador_reintentos
+from rappiSafe.utils import mensaje_alerta_contactos, notificar_contactos_emergencia
+
+PREFIJO_USUARIOS = 'benchmark_panico_'
+
+
+class ManejadorSMTPLento(socketserver.BaseRequestHandler):
+    """
+    Proveedor de email lento: tarda latencia_ms en saludar y rechaza la
+    conexión, como un SMTP saturado (smtplib falla tras esa espera)
+    """
+    latencia_ms = 0
+
+    def handle(self):
+        time.sleep(self.latencia_ms / 1000)
+        self.request.sendall(b'554 Servicio no disponible\r\n')
+
+
+class ServidorSMTPLento(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def resumen(latencias):
+    ordenadas = sorted(latencias)
+    p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+    return f'p50 {statistics.median(ordenadas) * 1000:8.1f} ms | p95 {p95 * 1000:8.1f} ms | máx {ordenadas[-1] * 1000:8.1f} ms'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide cuánto tarda en responder el botón de pánico con las notificaciones a contactos '
+        'enviadas en la petición (una por una o en paralelo) y encoladas en la bandeja de salida'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contactos', type=int, default=3, help='Contactos validados del repartidor')
+        parser.add_argument('--alertas', type=int, default=10, help='Alertas medidas en cada fase')
+        parser.add_argument('--latencia-ms', type=float, default=800,
+                            help='Lo que tarda el proveedor de email simulado en cada envío')
+
+    def handle(self, *args, **options):
+        if not despachador_notificaciones.en_proceso:
+            raise CommandError('El benchmark usa el despachador del proceso: NOTIFICACIONES_EN_PROCESO=True')
+        # Se mide el primer envío; los reintentos cargarían al proveedor lento entre fases
+        programador_reintentos.max_intentos = 1
+
+        # Solo el email sale del proceso, contra el servidor lento local
+        for variable in ('MOCEAN_API_TOKEN', 'TELEGRAM_BOT_TOKEN'):
+            os.environ.pop(variable, None)
+        ManejadorSMTPLento.latencia_ms = options['latencia_ms']
+        servidor = ServidorSMTPLento(('127.0.0.1', 0), ManejadorSMTPLento)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        settings.EMAIL_HOST, settings.EMAIL_PORT = servidor.server_address
+
+        repartidor = self._crear_repartidor(options['contactos'])
+        try:
+            cliente = Client()
+            cliente.force_login(repartidor)
+            self.stdout.write(
+                f'{options["contactos"]} contactos con email | proveedor con {options["latencia_ms"]:.0f} ms por envío | '
+                f'{options["alertas"]} alertas por fase'
+            )
+
+            secuencial = [self._alerta_en_linea(repartidor, self._uno_por_uno) for _ in range(options['alertas'])]
+            paralelo = [self._alerta_en_linea(repartidor, notificar_contactos_emergencia) for _ in range(options['alertas'])]
+            respuestas, entregas = zip(*(self._alerta_en_cola(cliente, repartidor) for _ in range(options['alertas'])))
+
+            self.stdout.write('')
+            self.stdout.write(f'Envío en la petición, uno por uno:       {resumen(secuencial)}')
+            self.stdout.write(f'Envío en la petición, en paralelo:       {resumen(paralelo)}')
+            self.stdout.write(f'Respuesta con bandeja de salida:         {resumen(respuestas)}')
+            self.stdout.write(f'Hasta procesar todos los envíos:         {resumen(entregas)}')
+            self.stdout.write(self.style.SUCCESS(
+                f'[OK] El botón de pánico responde {statistics.median(secuencial) / statistics.median(respuestas):.0f}x '
+                f'más rápido que enviando uno por uno'
+            ))
+        finally:
+            servidor.shutdown()
+            get_user_model().objects.filter(username__startswith=PREFIJO_USUARIOS).delete()
+
+    def _crear_repartidor(self, contactos):
+        User = get_user_model()
+        User.objects.filter(username__startswith=PREFIJO_USUARIOS).delete()
+        repartidor = User.objects.create_user(
+            username=f'{PREFIJO_USUARIOS}repartidor', email=f'{PREFIJO_USUARIOS}repartidor@benchmark.local',
+            password=secrets.token_urlsafe(16), rol='repartidor', first_name='Benchmark',
+        )
+        ContactoConfianza.objects.bulk_create([
+            ContactoConfianza(
+                repartidor=repartidor, nombre=f'Contacto {i}', telefono=f'+52155500{i:05d}',
+                email=f'contacto{i}@benchmark.local', validado=True,
+            )
+            for i in range(contactos)
+        ])
+        return repartidor
+
+    @staticmethod
+    def _uno_por_uno(alerta):
+        """Cada canal de cada contacto después del anterior, como se enviaba antes"""
+        mensaje = mensaje_alerta_contactos(alerta)
+        for contacto in ContactoConfianza.objects.filter(repartidor=alerta.repartidor, validado=True):
+            for canal in canales_contacto(contacto):
+                enviar_por_canal(canal, contacto, mensaje)
+
+    def _alerta_en_linea(self, repartidor, notificar):
+        """Crear la alerta y notificar antes de responder"""
+        inicio = time.perf_counter()
+        alerta = Alerta.objects.create(repartidor=repartidor, tipo='panico', estado='pendiente',
+                                       latitud=19.4, longitud=-99.15, nivel_bateria=80)
+        notificar(alerta)
+        duracion = time.perf_counter() - inicio
+        Alerta.objects.filter(id=alerta.id).update(estado='falsa_alarma')
+        return duracion
+
+    def _alerta_en_cola(self, cliente, repartidor):
+        inicio = time.perf_counter()
+        respuesta = cliente.post('/repartidor/alerta/panico/', {'latitud': 19.4, 'longitud': -99.15, 'bateria': 80},
+                                 content_type='application/json')
+        duracion = time.perf_counter() - inicio
+        datos = respuesta.json()
+        if not datos.get('success'):
+            raise CommandError(f'Error al crear la alerta: {datos.get("error")}')
+
+        pendientes = NotificacionContacto.objects.filter(alerta_id=datos['alerta_id'], estado='pendiente')
+        while pendientes.exists():
+            time.sleep(0.01)
+        entrega = time.perf_counter() - inicio
+        Alerta.objects.filter(id=datos['alerta_id']).update(estado='falsa_alarma')
+        return duracion, entrega
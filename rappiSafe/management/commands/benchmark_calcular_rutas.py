@@ -0,0 +1,193 @@
+import asyncio
+import os
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.management.commands.servidor_ruteo_local import ManejadorRuteo, ServidorRuteo
+
+PREFIJO_USUARIOS = 'benchmark_rutas_'
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def esperar_puerto(puerto, limite_s=20):
+    fin = time.monotonic() + limite_s
+    while time.monotonic() < fin:
+        try:
+            socket.create_connection(('127.0.0.1', puerto), timeout=0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def hilos_proceso(pid):
+    """Hilos del proceso según /proc (solo Linux); None si no se puede leer"""
+    try:
+        with open(f'/proc/{pid}/status') as archivo:
+            for linea in archivo:
+                if linea.startswith('Threads:'):
+                    return int(linea.split()[1])
+    except OSError:
+        return None
+
+
+def resumen(latencias):
+    ordenadas = sorted(latencias)
+    p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+    return f'p50 {statistics.median(ordenadas) * 1000:7.1f} ms | p95 {p95 * 1000:7.1f} ms | máx {ordenadas[-1] * 1000:7.1f} ms'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia de crear alertas de pánico mientras hay muchas consultas de '
+        'calcular_rutas en curso contra un servidor de rutas lento (Daphne real)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rutas', type=int, default=50, help='Consultas de rutas simultáneas')
+        parser.add_argument('--alertas', type=int, default=20, help='Alertas medidas en cada fase')
+        parser.add_argument('--latencia-ms', type=float, default=1500,
+                            help='Latencia del servidor de rutas simulado (menor que el TIMEOUT del backend local)')
+        parser.add_argument('--url', help='Usar un servidor ya levantado (con RUTEO_BACKEND=local) en lugar de iniciar Daphne')
+
+    def handle(self, *args, **options):
+        # Servidor de rutas lento en este proceso
+        ManejadorRuteo.latencia_ms = options['latencia_ms']
+        ManejadorRuteo.variacion_ms = 0
+        puerto_rutas = puerto_libre()
+        servidor_rutas = ServidorRuteo(('127.0.0.1', puerto_rutas), ManejadorRuteo)
+        threading.Thread(target=servidor_rutas.serve_forever, daemon=True).start()
+
+        repartidor, alertador = self._crear_usuarios()
+        daphne = None
+        try:
+            url = options['url']
+            if not url:
+                puerto = puerto_libre()
+                entorno = {
+                    **os.environ,
+                    'RUTEO_BACKEND': 'local',
+                    'OSRM_LOCAL_URL': f'http://127.0.0.1:{puerto_rutas}',
+                    'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'mysite.settings'),
+                }
+                daphne = subprocess.Popen(
+                    [sys.executable, '-m', 'daphne', '-p', str(puerto), 'mysite.asgi:application'],
+                    cwd=settings.BASE_DIR, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                )
+                if not esperar_puerto(puerto):
+                    raise CommandError('Daphne no arrancó')
+                url = f'http://127.0.0.1:{puerto}'
+
+            self.stdout.write(
+                f'Servidor {url} | rutas con latencia {options["latencia_ms"]:.0f} ms | '
+                f'{options["rutas"]} consultas simultáneas'
+            )
+            asyncio.run(self._medir(
+                url, self._credenciales(repartidor), self._credenciales(alertador), options,
+                pid=daphne.pid if daphne else None,
+            ))
+        finally:
+            if daphne is not None:
+                daphne.terminate()
+                daphne.wait(timeout=10)
+            servidor_rutas.shutdown()
+            get_user_model().objects.filter(username__startswith=PREFIJO_USUARIOS).delete()
+
+    def _crear_usuarios(self):
+        User = get_user_model()
+        User.objects.filter(username__startswith=PREFIJO_USUARIOS).delete()
+        return [
+            User.objects.create_user(
+                username=f'{PREFIJO_USUARIOS}{nombre}', email=f'{PREFIJO_USUARIOS}{nombre}@benchmark.local',
+                password=secrets.token_urlsafe(16), rol='repartidor',
+            )
+            for nombre in ('repartidor', 'alertas')
+        ]
+
+    @staticmethod
+    def _credenciales(usuario):
+        """Cookies de una sesión iniciada y un token CSRF válido"""
+        sesion = SessionStore()
+        sesion[SESSION_KEY] = str(usuario.pk)
+        sesion[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        sesion[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+        sesion.create()
+
+        token = secrets.token_hex(16)  # 32 caracteres: un secreto CSRF sin máscara
+        return {settings.SESSION_COOKIE_NAME: sesion.session_key, settings.CSRF_COOKIE_NAME: token}
+
+    @staticmethod
+    def _cliente(url, cookies):
+        return httpx.AsyncClient(
+            base_url=url,
+            cookies=cookies,
+            headers={'X-CSRFToken': cookies[settings.CSRF_COOKIE_NAME]},
+            timeout=60,
+            limits=httpx.Limits(max_connections=None),
+        )
+
+    async def _alertas(self, cliente, cantidad):
+        latencias = []
+        for _ in range(cantidad):
+            inicio = time.perf_counter()
+            respuesta = await cliente.post('/repartidor/alerta/panico/', json={'latitud': 19.4, 'longitud': -99.15, 'bateria': 80})
+            latencias.append(time.perf_counter() - inicio)
+            datos = respuesta.json()
+            if not datos.get('success'):
+                raise CommandError(f'Error al crear la alerta: {datos.get("error")}')
+            await cliente.post(f'/repartidor/alerta/{datos["alerta_id"]}/cancelar/')
+        return latencias
+
+    async def _medir(self, url, credenciales_rutas, credenciales_alertas, options, pid=None):
+        async with self._cliente(url, credenciales_rutas) as rutas, self._cliente(url, credenciales_alertas) as alertas:
+            await self._alertas(alertas, 2)  # Calentar conexiones y cachés
+
+            sin_carga = await self._alertas(alertas, options['alertas'])
+            hilos_reposo = hilos_proceso(pid) if pid else None
+
+            async def consultar(i):
+                inicio = time.perf_counter()
+                # Orígenes distintos para no acertar en la caché de rutas
+                respuesta = await rutas.post('/repartidor/rutas/calcular/', json={
+                    'origen_lat': 19.30 + i * 0.002, 'origen_lon': -99.20,
+                    'destino_lat': 19.42, 'destino_lon': -99.13,
+                })
+                return respuesta.status_code, time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            tareas = [asyncio.create_task(consultar(i)) for i in range(options['rutas'])]
+            # Medir mientras las consultas esperan al servidor de rutas, no
+            # durante la ráfaga inicial de llegada de las peticiones
+            await asyncio.sleep(options['latencia_ms'] / 2000)
+            hilos_carga = hilos_proceso(pid) if pid else None
+            con_carga = await self._alertas(alertas, options['alertas'])
+            resultados = await asyncio.gather(*tareas)
+            total = time.perf_counter() - inicio
+
+        correctas = [duracion for codigo, duracion in resultados if codigo == 200]
+        self.stdout.write('')
+        self.stdout.write(f'Alerta de pánico sin carga:          {resumen(sin_carga)}')
+        self.stdout.write(f'Alerta de pánico con rutas en curso: {resumen(con_carga)}')
+        self.stdout.write(
+            f'calcular_rutas: {len(correctas)}/{len(resultados)} correctas'
+            + (f' | {resumen(correctas)}' if correctas else '')
+            + f' | todas en {total:.1f} s'
+        )
+        if hilos_reposo is not None and hilos_carga is not None:
+            self.stdout.write(f'Hilos de Daphne: {hilos_reposo} en reposo, {hilos_carga} con las rutas en curso')
+        self.stdout.write(self.style.SUCCESS('[OK] Benchmark terminado'))
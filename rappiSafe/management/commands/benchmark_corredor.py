@@ -0,0 +1,65 @@
+import math
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.corredor import IndiceSegmentos
+from rappiSafe.geo import distancia_a_polilinea_m
+from rappiSafe.management.commands.benchmark_puntuacion_rutas import generar_rutas
+
+
+def generar_posiciones(ruta, cantidad, rnd, desvio_m=150):
+    """Posiciones alrededor de la ruta: la mayoría dentro del corredor, algunas fuera"""
+    posiciones = []
+    for _ in range(cantidad):
+        lat, lon = ruta[rnd.randrange(len(ruta))]
+        radio = rnd.uniform(0, desvio_m) / 111_320
+        angulo = rnd.uniform(0, 2 * math.pi)
+        posiciones.append((lat + radio * math.sin(angulo), lon + radio * math.cos(angulo)))
+    return posiciones
+
+
+class Command(BaseCommand):
+    help = 'Compara la distancia al corredor con la rejilla de segmentos contra recorrer toda la polilínea'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puntos', default='200,1000,5000', help='Vértices por ruta separados por coma')
+        parser.add_argument('--posiciones', type=int, default=2000, help='Posiciones verificadas por ruta')
+        parser.add_argument('--ancho', type=float, default=100.0, help='Celda de la rejilla (ancho + tolerancia)')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        ancho = options['ancho']
+
+        self.stdout.write(f'{options["posiciones"]:,} posiciones por ruta, celda de {ancho:g} m')
+        self.stdout.write(
+            f'{"Vértices":>9}{"Índice ms":>11}{"Índice µs/pos":>15}{"Lineal µs/pos":>15}{"Aceleración":>13}'
+        )
+        for puntos in (int(valor) for valor in options['puntos'].split(',')):
+            ruta = [tuple(punto) for punto in generar_rutas(1, puntos, semilla=rnd.randrange(1 << 30))[0]]
+            posiciones = generar_posiciones(ruta, options['posiciones'], rnd)
+
+            inicio = time.perf_counter()
+            indice = IndiceSegmentos(ruta, ancho)
+            construccion = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            rapidas = [indice.distancia_m(lat, lon)[0] for lat, lon in posiciones]
+            tiempo_indice = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            exactas = [distancia_a_polilinea_m(lat, lon, ruta) for lat, lon in posiciones]
+            tiempo_lineal = time.perf_counter() - inicio
+
+            # Dentro de una celda ambas distancias deben coincidir (proyecciones distintas: 1 m de margen)
+            for rapida, exacta in zip(rapidas, exactas):
+                if exacta < ancho - 1 and abs(rapida - exacta) > 1:
+                    raise CommandError(f'El índice no coincide con la distancia exacta: {rapida:.1f} != {exacta:.1f}')
+
+            por_posicion = 1e6 / len(posiciones)
+            self.stdout.write(
+                f'{puntos:>9}{construccion * 1000:>11.1f}{tiempo_indice * por_posicion:>15.1f}'
+                f'{tiempo_lineal * por_posicion:>15.1f}{tiempo_lineal / tiempo_indice:>12.1f}x'
+            )
+        self.stdout.write(self.style.SUCCESS('[OK] Benchmark terminado'))
@@ -0,0 +1,85 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from rappiSafe import geo
+
+
+def generar_pares(cantidad, semilla=42):
+    """Pares de puntos aleatorios dentro de la CDMX"""
+    rnd = random.Random(semilla)
+    return [
+        [19.2 + rnd.random() * 0.4 for _ in range(cantidad)],
+        [-99.3 + rnd.random() * 0.4 for _ in range(cantidad)],
+        [19.2 + rnd.random() * 0.4 for _ in range(cantidad)],
+        [-99.3 + rnd.random() * 0.4 for _ in range(cantidad)],
+    ]
+
+
+def medir(funcion, repeticiones):
+    """Mejor tiempo de varias repeticiones (segundos)"""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+class Command(BaseCommand):
+    help = 'Mide el rendimiento de rappiSafe.geo (vectorizado vs Python puro) para 1, 1k y 1M pares'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5, help='Repeticiones por medición')
+        parser.add_argument('--sin-python', action='store_true', help='No medir el bucle de Python con 1M pares')
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        if geo.np is None:
+            self.stdout.write(self.style.WARNING('NumPy no está instalado: ambas columnas usan Python puro'))
+
+        self.stdout.write(f'{"Función":<26}{"Pares":>10}{"Vectorizado (pares/s)":>24}{"Python puro (pares/s)":>24}{"Aceleración":>13}')
+        for nombre, funcion in (
+            ('haversine_km', geo.haversine_km),
+            ('rumbo_grados', geo.rumbo_grados),
+            ('distancia_equirectangular', geo.distancia_equirectangular_m),
+        ):
+            for cantidad in (1, 1_000, 1_000_000):
+                lat1, lon1, lat2, lon2 = generar_pares(cantidad)
+                rep = 1 if cantidad >= 1_000_000 else repeticiones
+
+                if cantidad == 1:
+                    # Un solo par usa la ruta escalar (math), igual en ambas columnas
+                    vectorizado = medir(lambda: [funcion(lat1[0], lon1[0], lat2[0], lon2[0]) for _ in range(10_000)], rep) / 10_000
+                else:
+                    vectorizado = medir(lambda: funcion(lat1, lon1, lat2, lon2), rep)
+
+                if cantidad >= 1_000_000 and options['sin_python']:
+                    python = None
+                elif cantidad == 1:
+                    python = vectorizado
+                else:
+                    python = medir(lambda: [funcion(*par) for par in zip(lat1, lon1, lat2, lon2)], rep)
+
+                self.stdout.write(
+                    f'{nombre:<26}{cantidad:>10,}{cantidad / vectorizado:>24,.0f}'
+                    + (f'{cantidad / python:>24,.0f}{python / vectorizado:>12.1f}x' if python else f'{"-":>24}{"-":>13}')
+                )
+
+        # Distancia de puntos a una ruta de 200 vértices
+        rnd = random.Random(7)
+        ruta = [(19.40 + i * 0.0005, -99.15 + rnd.uniform(-0.0003, 0.0003)) for i in range(200)]
+        self.stdout.write('')
+        self.stdout.write(f'{"distancia_a_polilinea_m":<26}{"Puntos":>10}{"Vectorizado (pts/s)":>24}{"Python puro (pts/s)":>24}{"Aceleración":>13}')
+        for cantidad in (1, 1_000, 100_000):
+            lats, lons = generar_pares(cantidad)[:2]
+            vectorizado = medir(lambda: geo.distancia_a_polilinea_m(lats, lons, ruta), repeticiones)
+            python = None
+            if cantidad <= 1_000:
+                python = medir(lambda: geo._distancias_polilinea_python(lats, lons, ruta), repeticiones)
+            self.stdout.write(
+                f'{"":<26}{cantidad:>10,}{cantidad / vectorizado:>24,.0f}'
+                + (f'{cantidad / python:>24,.0f}{python / vectorizado:>12.1f}x' if python else f'{"-":>24}{"-":>13}')
+            )
+
+        self.stdout.write(self.style.SUCCESS('[OK] Benchmark terminado'))
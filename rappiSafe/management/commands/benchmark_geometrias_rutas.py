@@ -0,0 +1,197 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from rappiSafe.geometrias import codificar_geometria, decodificar_geometria, huella_geometria, ruta_con_huella
+from rappiSafe.management.commands.servidor_ruteo_local import generar_rutas
+
+# Centro y radio (grados) de la zona de reparto sintética
+CENTRO = (19.40, -99.15)
+RADIO = 0.08
+
+
+def _sinuosa(coordenadas, rnd):
+    """Desviar los vértices unos metros para que no sean rectas perfectas"""
+    ultimo = len(coordenadas) - 1
+    return [
+        [lat, lon] if i in (0, ultimo) else
+        [round(lat + rnd.gauss(0, 0.00003), 5), round(lon + rnd.gauss(0, 0.00003), 5)]
+        for i, (lon, lat) in enumerate(coordenadas)
+    ]
+
+
+def generar_respuesta(origen, destino, rnd):
+    """
+    Rutas guardadas por calcular_rutas para un par: la directa como rápida y
+    las dos alternativas como seguras, con la geometría de OSRM (5 decimales)
+    """
+    rutas = []
+    for tipo, ruta in zip(('rapida', 'segura', 'segura'), generar_rutas(origen, destino, alternativas=True)):
+        rutas.append({
+            'tipo': tipo,
+            'distancia': round(ruta['distance'] / 1000, 2),
+            'duracion': round(ruta['duration'] / 60, 1),
+            'puntuacion_riesgo': round(rnd.uniform(0, 60), 1),
+            'exposicion_riesgo': round(rnd.uniform(0, 3), 3),
+            'coordenadas': _sinuosa(ruta['geometry']['coordinates'], rnd),
+        })
+    return rutas
+
+
+def generar_mes(dias, consultas_dia, pares, exponente, semilla):
+    """
+    Consultas de un mes: pares origen-destino con popularidad tipo Zipf.
+    Las consultas repetidas de un par (misma celda de la caché de rutas)
+    reciben exactamente las mismas rutas.
+
+    Returns:
+        (extremos por par, rutas por par, lista de (par, fecha) en orden)
+    """
+    rnd = random.Random(semilla)
+
+    def punto():
+        return (round(CENTRO[0] + rnd.uniform(-RADIO, RADIO), 6), round(CENTRO[1] + rnd.uniform(-RADIO, RADIO), 6))
+
+    extremos = [(punto(), punto()) for _ in range(pares)]
+    respuestas = [generar_respuesta(origen, destino, rnd) for origen, destino in extremos]
+    pesos = [1 / (rango + 1) ** exponente for rango in range(pares)]
+
+    inicio = datetime(2025, 1, 1)
+    consultas = []
+    for dia in range(dias):
+        for par in rnd.choices(range(pares), weights=pesos, k=consultas_dia):
+            consultas.append((par, inicio + timedelta(days=dia, seconds=rnd.randint(0, 86399))))
+    consultas.sort(key=lambda consulta: consulta[1])
+    return extremos, respuestas, consultas
+
+
+ESQUEMA_RUTAS = (
+    'CREATE TABLE rutasegura (id integer PRIMARY KEY AUTOINCREMENT, origen_lat decimal NOT NULL, '
+    'origen_lon decimal NOT NULL, destino_lat decimal NOT NULL, destino_lon decimal NOT NULL, '
+    'ruta_rapida text NOT NULL, ruta_segura text NOT NULL, puntuacion_riesgo_rapida real NOT NULL, '
+    'puntuacion_riesgo_segura real NOT NULL, seleccionada varchar(10) NOT NULL, '
+    'creado_en datetime NOT NULL, repartidor_id bigint NOT NULL)'
+)
+
+
+def _filas(extremos, respuestas, consultas):
+    for par, fecha in consultas:
+        (origen, destino), (rapida, *seguras) = extremos[par], respuestas[par]
+        yield (*origen, *destino, rapida, seguras, fecha.strftime('%Y-%m-%d %H:%M:%S.%f'), par % 500 + 1)
+
+
+def _guardar_rutas(conexion, filas):
+    conexion.execute(ESQUEMA_RUTAS)
+    conexion.executemany(
+        'INSERT INTO rutasegura (origen_lat, origen_lon, destino_lat, destino_lon, ruta_rapida, ruta_segura, '
+        "puntuacion_riesgo_rapida, puntuacion_riesgo_segura, seleccionada, creado_en, repartidor_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'rapida', ?, ?)",
+        (
+            (str(o_lat), str(o_lon), str(d_lat), str(d_lon), json.dumps(rapida), json.dumps({'rutas': seguras}),
+             rapida['puntuacion_riesgo'], seguras[0]['puntuacion_riesgo'], fecha, repartidor)
+            for o_lat, o_lon, d_lat, d_lon, rapida, seguras, fecha, repartidor in filas
+        )
+    )
+
+
+def _tamano(ruta, preparar):
+    conexion = sqlite3.connect(ruta)
+    preparar(conexion)
+    conexion.commit()
+    conexion.execute('VACUUM')
+    conexion.close()
+    return os.path.getsize(ruta)
+
+
+class Command(BaseCommand):
+    help = 'Compara el tamaño de RutaSegura con las coordenadas en JSON vs geometrías deduplicadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=30, help='Días de consultas simuladas')
+        parser.add_argument('--consultas-dia', type=int, default=2000, help='Consultas de rutas por día')
+        parser.add_argument('--pares', type=int, default=3000, help='Pares origen-destino distintos')
+        parser.add_argument('--zipf', type=float, default=1.0, help='Exponente de popularidad de los pares')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        extremos, respuestas, consultas = generar_mes(
+            options['dias'], options['consultas_dia'], options['pares'], options['zipf'], options['semilla']
+        )
+
+        # Codificar cada geometría de cada par una vez (como hace aguardar_geometrias)
+        inicio = time.perf_counter()
+        geometrias, guardadas = {}, []
+        for rutas in respuestas:
+            huellas = []
+            for ruta in rutas:
+                datos = codificar_geometria(ruta['coordenadas'])
+                huella = huella_geometria(datos)
+                geometrias[huella] = (len(ruta['coordenadas']), datos)
+                huellas.append(huella)
+            guardadas.append(list(map(ruta_con_huella, rutas, huellas)))
+        tiempo_codificar = time.perf_counter() - inicio
+        pares_usados = {par for par, _ in consultas}
+        usadas = {ruta['geometria'] for par in pares_usados for ruta in guardadas[par]}
+        geometrias = {huella: geometrias[huella] for huella in usadas}
+
+        inicio = time.perf_counter()
+        for _, datos in geometrias.values():
+            decodificar_geometria(datos)
+        tiempo_decodificar = time.perf_counter() - inicio
+
+        with tempfile.TemporaryDirectory() as directorio:
+            tamano_json = _tamano(
+                os.path.join(directorio, 'json.sqlite3'),
+                lambda conexion: _guardar_rutas(conexion, _filas(extremos, respuestas, consultas)),
+            )
+
+            def preparar_deduplicado(conexion):
+                _guardar_rutas(conexion, _filas(extremos, guardadas, consultas))
+                conexion.execute(
+                    'CREATE TABLE geometriaruta (huella varchar(32) NOT NULL PRIMARY KEY, '
+                    'num_puntos integer unsigned NOT NULL, datos BLOB NOT NULL, creado_en datetime NOT NULL)'
+                )
+                conexion.executemany(
+                    "INSERT INTO geometriaruta (huella, num_puntos, datos, creado_en) VALUES (?, ?, ?, '')",
+                    ((huella, num_puntos, datos) for huella, (num_puntos, datos) in geometrias.items())
+                )
+
+            tamano_deduplicado = _tamano(os.path.join(directorio, 'deduplicado.sqlite3'), preparar_deduplicado)
+
+        referencias = len(consultas) * 3
+        puntos = sum(num_puntos for num_puntos, _ in geometrias.values())
+        bytes_json = sum(len(json.dumps(ruta['coordenadas'])) for rutas in respuestas for ruta in rutas)
+        bytes_blob = sum(len(datos) for _, datos in geometrias.values())
+        puntos_todas = sum(len(ruta['coordenadas']) for rutas in respuestas for ruta in rutas)
+
+        self.stdout.write(
+            f'Mes sintético: {len(consultas):,} consultas en {options["dias"]} días, '
+            f'{len(pares_usados):,} pares distintos'
+        )
+        self.stdout.write(
+            f'Geometrías: {referencias:,} referencias, {len(geometrias):,} únicas '
+            f'({referencias / len(geometrias):.1f} usos por geometría), {puntos / len(geometrias):.0f} puntos de media'
+        )
+        self.stdout.write(
+            f'Por punto: {bytes_json / puntos_todas:.1f} B en JSON, {bytes_blob / puntos:.1f} B codificado'
+        )
+        self.stdout.write('')
+        self.stdout.write(f'{"Almacenamiento":<28}{"Bytes SQLite":>16}{"Bytes/consulta":>16}')
+        for nombre, tamano in (
+            ('Coordenadas en JSON', tamano_json),
+            ('Geometrías deduplicadas', tamano_deduplicado),
+        ):
+            self.stdout.write(f'{nombre:<28}{tamano:>16,}{tamano / len(consultas):>16,.0f}')
+        self.stdout.write('')
+        self.stdout.write(
+            f'Codificación: {tiempo_codificar / (len(respuestas) * 3) * 1e6:.0f} µs por geometría | '
+            f'decodificación: {tiempo_decodificar / len(geometrias) * 1e6:.0f} µs por geometría'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Reducción de tamaño: {tamano_json / tamano_deduplicado:.1f}x'
+        ))
@@ -0,0 +1,106 @@
+import random
+import resource
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.geo import haversine_km
+from rappiSafe.grafo_vial import GrafoVial, SinRuta, generar_grafo_sintetico, guardar_grafo
+
+
+def rss_mb():
+    """Memoria residente máxima del proceso (Linux reporta KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+class Command(BaseCommand):
+    help = 'Mide consultas por segundo y memoria del motor de ruteo local (grafo_vial)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grafo', default=str(getattr(settings, 'GRAFO_VIAL_DIR', 'grafo_vial')),
+                            help='Directorio del grafo preparado')
+        parser.add_argument('--sintetico', action='store_true',
+                            help='Generar una rejilla del tamaño de la CDMX en un directorio temporal')
+        parser.add_argument('--consultas', type=int, default=50, help='Consultas por tipo de viaje')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rss_inicial = rss_mb()
+        temporal = None
+        directorio = options['grafo']
+        if options['sintetico']:
+            temporal = tempfile.TemporaryDirectory()
+            directorio = temporal.name
+            inicio = time.perf_counter()
+            guardar_grafo(directorio, generar_grafo_sintetico())
+            self.stdout.write(f'Grafo sintético generado en {time.perf_counter() - inicio:.1f} s')
+
+        try:
+            inicio = time.perf_counter()
+            try:
+                grafo = GrafoVial.cargar(directorio)
+            except FileNotFoundError:
+                raise CommandError(f'No existe el grafo en {directorio}; usar preparar_grafo_vial o --sintetico')
+            carga = time.perf_counter() - inicio
+
+            self.stdout.write(
+                f'Grafo: {grafo.num_nodos:,} nodos, {grafo.num_aristas:,} aristas | '
+                f'arreglos {grafo.memoria_bytes() / 1e6:.1f} MB | carga {carga * 1000:.0f} ms | '
+                f'RSS +{rss_mb() - rss_inicial:.0f} MB'
+            )
+            self._medir(grafo, options['consultas'], options['semilla'])
+        finally:
+            if temporal is not None:
+                temporal.cleanup()
+
+        self.stdout.write(self.style.SUCCESS('[OK] Benchmark terminado'))
+
+    def _medir(self, grafo, consultas, semilla):
+        rnd = random.Random(semilla)
+        lat, lon = grafo.arreglos['lat'], grafo.arreglos['lon']
+
+        # Pares de nodos agrupados por distancia en línea recta
+        tipos = {'corto (<3 km)': (0, 3), 'reparto (3-8 km)': (3, 8), 'ciudad (>8 km)': (8, 1e9)}
+        pares = {tipo: [] for tipo in tipos}
+        while any(len(lista) < consultas for lista in pares.values()):
+            a, b = rnd.randrange(grafo.num_nodos), rnd.randrange(grafo.num_nodos)
+            distancia = haversine_km(lat[a], lon[a], lat[b], lon[b])
+            for tipo, (minimo, maximo) in tipos.items():
+                if minimo <= distancia < maximo and len(pares[tipo]) < consultas:
+                    pares[tipo].append((a, b))
+
+        self.stdout.write('')
+        self.stdout.write(f'{"Viaje":<20}{"Consultas/s":>13}{"Prom. ms":>10}{"p95 ms":>10}{"Asentados":>12}{"Con 2 alt. ms":>15}')
+        for tipo, lista in pares.items():
+            tiempos, asentados, conectados = [], [], []
+            for a, b in lista:
+                inicio = time.perf_counter()
+                try:
+                    _, _, nodos = grafo.ruta_mas_rapida(a, b)
+                except SinRuta:
+                    continue  # Nodo aislado (callejón sin salida del grafo)
+                tiempos.append(time.perf_counter() - inicio)
+                asentados.append(nodos)
+                conectados.append((a, b))
+            if not tiempos:
+                continue
+
+            # Flujo completo de calcular_rutas: nodo más cercano, 3 rutas y geometría
+            completas = []
+            for a, b in conectados[:max(1, len(conectados) // 5)]:
+                inicio = time.perf_counter()
+                grafo.rutas(lat[a], lon[a], lat[b], lon[b])
+                completas.append(time.perf_counter() - inicio)
+
+            promedio = sum(tiempos) / len(tiempos)
+            self.stdout.write(
+                f'{tipo:<20}{1 / promedio:>13,.1f}{promedio * 1000:>10.1f}{percentil(tiempos, 0.95) * 1000:>10.1f}'
+                f'{sum(asentados) / len(asentados):>12,.0f}{sum(completas) / len(completas) * 1000:>15.1f}'
+            )
+        self.stdout.write(f'RSS máximo del proceso: {rss_mb():.0f} MB')
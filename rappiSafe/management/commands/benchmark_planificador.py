@@ -0,0 +1,147 @@
+import math
+import random
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.cache_rutas import cache_rutas
+from rappiSafe.grafo_vial import cargar_grafo, generar_grafo_sintetico, guardar_grafo
+from rappiSafe.management.commands.benchmark_puntuacion_rutas import generar_zonas
+from rappiSafe.planificador import coser_tramos, costo_camino, lambda_criterio, matriz_costos, resolver_orden
+from rappiSafe.riesgo import raster_riesgo
+from rappiSafe.ruteo import BackendGrafoLocal
+
+
+def held_karp(costos):
+    """
+    Costo óptimo del camino abierto que sale del punto 0 y visita todos los
+    demás (programación dinámica, solo para pocas paradas)
+    """
+    n = len(costos) - 1
+    mejor = {(1 << k, k): costos[0][k + 1] for k in range(n)}
+    for mascara in range(1, 1 << n):
+        for ultimo in range(n):
+            actual = mejor.get((mascara, ultimo))
+            if actual is None:
+                continue
+            for siguiente in range(n):
+                if mascara & (1 << siguiente):
+                    continue
+                clave = (mascara | (1 << siguiente), siguiente)
+                valor = actual + costos[ultimo + 1][siguiente + 1]
+                if valor < mejor.get(clave, float('inf')):
+                    mejor[clave] = valor
+    completa = (1 << n) - 1
+    return min(mejor[(completa, ultimo)] for ultimo in range(n))
+
+
+def generar_paradas(rnd, cantidad, radio_grados=0.03):
+    """Origen y paradas de un reparto en un radio de ~3 km"""
+    lat, lon = rnd.uniform(19.33, 19.55), rnd.uniform(-99.20, -98.98)
+    return [(lat + rnd.uniform(-radio_grados, radio_grados), lon + rnd.uniform(-radio_grados, radio_grados))
+            for _ in range(cantidad + 1)]
+
+
+class Command(BaseCommand):
+    help = 'Mide construcción de la matriz y orden de visita del planificador según el número de paradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grafo', default=str(getattr(settings, 'GRAFO_VIAL_DIR', 'grafo_vial')),
+                            help='Directorio del grafo preparado')
+        parser.add_argument('--sintetico', action='store_true',
+                            help='Generar una rejilla del tamaño de la CDMX en un directorio temporal')
+        parser.add_argument('--paradas', default='5,10,20,30,40', help='Números de paradas separados por coma')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Repartos por número de paradas')
+        parser.add_argument('--criterio', default='balanceada', choices=('rapida', 'balanceada', 'segura'))
+        parser.add_argument('--zonas', type=int, default=300, help='Zonas de riesgo sintéticas')
+        parser.add_argument('--exacto', type=int, default=9,
+                            help='Comparar contra el óptimo (Held-Karp) hasta este número de paradas')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        temporal = None
+        directorio = options['grafo']
+        if options['sintetico']:
+            temporal = tempfile.TemporaryDirectory()
+            directorio = temporal.name
+            guardar_grafo(directorio, generar_grafo_sintetico())
+
+        try:
+            try:
+                cargar_grafo(directorio)
+            except FileNotFoundError:
+                raise CommandError(f'No existe el grafo en {directorio}; usar preparar_grafo_vial o --sintetico')
+            raster_riesgo.construir(generar_zonas(options['zonas']))
+            backend = BackendGrafoLocal('benchmark_planificador', directorio)
+            self._medir(backend, options)
+        finally:
+            if temporal is not None:
+                temporal.cleanup()
+
+    def _medir(self, backend, options):
+        rnd = random.Random(options['semilla'])
+        lambda_riesgo = lambda_criterio(options['criterio'])
+        cantidades = [int(valor) for valor in options['paradas'].split(',')]
+        repeticiones = options['repeticiones']
+
+        self.stdout.write(f'Criterio {options["criterio"]} (λ={lambda_riesgo:g}), {repeticiones} repartos por fila')
+        self.stdout.write(
+            f'{"Paradas":>8}{"Matriz ms":>11}{"Replan ms":>11}{"Orden ms":>10}'
+            f'{"Tramos ms":>11}{"Total ms":>10}{"Brecha %":>10}'
+        )
+        descartados = 0
+        for cantidad in cantidades:
+            tiempos = {'matriz': 0.0, 'replan': 0.0, 'orden': 0.0, 'tramos': 0.0}
+            brechas = []
+            for _ in range(repeticiones):
+                # Las cuadras cerradas y de un solo sentido dejan nodos sin
+                # salida o sin entrada; esos repartos no tienen recorrido
+                while True:
+                    cache_rutas.backend.limpiar()
+                    puntos = generar_paradas(rnd, cantidad)
+
+                    inicio = time.perf_counter()
+                    matriz = matriz_costos(backend, puntos, lambda_riesgo, hasta_origen=False)
+                    duracion_matriz = time.perf_counter() - inicio
+                    if not matriz['success']:
+                        raise CommandError(matriz['error'])
+
+                    inicio = time.perf_counter()
+                    orden, costo = resolver_orden(matriz['costos'])
+                    duracion_orden = time.perf_counter() - inicio
+                    if math.isfinite(costo_camino(matriz['costos'], [0, *orden])):
+                        break
+                    descartados += 1
+                tiempos['matriz'] += duracion_matriz
+                tiempos['orden'] += duracion_orden
+
+                inicio = time.perf_counter()
+                cosida = coser_tramos(backend, puntos, [0, *orden], lambda_riesgo)
+                tiempos['tramos'] += time.perf_counter() - inicio
+                if not cosida['success']:
+                    raise CommandError(cosida['error'])
+
+                # Replanificar tras la primera entrega: el repartidor salió de
+                # esa parada y solo falta la fila de su nueva posición
+                lat, lon = puntos[orden[0]]
+                restantes = [(lat + 0.001, lon + 0.001)] + [puntos[k] for k in orden[1:]]
+                inicio = time.perf_counter()
+                matriz_costos(backend, restantes, lambda_riesgo, hasta_origen=False)
+                tiempos['replan'] += time.perf_counter() - inicio
+
+                if cantidad <= options['exacto']:
+                    optimo = held_karp(matriz['costos'])
+                    brechas.append((costo - optimo) / optimo * 100)
+
+            promedio = {clave: valor / repeticiones * 1000 for clave, valor in tiempos.items()}
+            total = promedio['matriz'] + promedio['orden'] + promedio['tramos']
+            brecha = f'{sum(brechas) / len(brechas):.2f}' if brechas else '-'
+            self.stdout.write(
+                f'{cantidad:>8}{promedio["matriz"]:>11.1f}{promedio["replan"]:>11.1f}{promedio["orden"]:>10.1f}'
+                f'{promedio["tramos"]:>11.1f}{total:>10.1f}{brecha:>10}'
+            )
+
+        if descartados:
+            self.stdout.write(f'Repartos descartados por paradas inalcanzables: {descartados}')
+        self.stdout.write(self.style.SUCCESS('[OK] Benchmark terminado'))
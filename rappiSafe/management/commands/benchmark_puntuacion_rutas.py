@@ -0,0 +1,105 @@
+import random
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.geometrias import codificar_polilinea, decodificar_polilineas
+from rappiSafe.puntuacion_lote import PoolPuntuacion
+from rappiSafe.riesgo import np, raster_riesgo
+
+
+def generar_zonas(cantidad, semilla=42):
+    """Zonas de riesgo sintéticas repartidas por la CDMX (sin tocar la BD)"""
+    rnd = random.Random(semilla)
+    return [
+        SimpleNamespace(
+            pk=i,
+            coordenadas_zona={'center': {'lat': rnd.uniform(19.28, 19.52), 'lng': rnd.uniform(-99.25, -99.05)}},
+            puntuacion_riesgo=rnd.uniform(20, 90),
+        )
+        for i in range(cantidad)
+    ]
+
+
+def generar_rutas(cantidad, puntos, semilla=42):
+    """Rutas sintéticas: caminatas con vértices cada ~40 m y 5 decimales, como OSRM"""
+    rnd = random.Random(semilla)
+    rutas = []
+    for _ in range(cantidad):
+        lat, lon = rnd.uniform(19.30, 19.50), rnd.uniform(-99.23, -99.07)
+        rumbo_lat, rumbo_lon = rnd.uniform(-0.0003, 0.0003), rnd.uniform(-0.0003, 0.0003)
+        ruta = []
+        for _ in range(puntos):
+            lat += rumbo_lat + rnd.gauss(0, 0.0001)
+            lon += rumbo_lon + rnd.gauss(0, 0.0001)
+            ruta.append([round(lat, 5), round(lon, 5)])
+        rutas.append(ruta)
+    return rutas
+
+
+def medir(funcion, repeticiones):
+    funcion()  # Calentar
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones, resultado
+
+
+class Command(BaseCommand):
+    help = 'Compara puntuar rutas una a una contra el lote vectorizado (y el pool de procesos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rutas', type=int, default=2000, help='Rutas del lote')
+        parser.add_argument('--puntos', type=int, default=150, help='Puntos por ruta')
+        parser.add_argument('--zonas', type=int, default=300, help='Zonas de riesgo sintéticas')
+        parser.add_argument('--procesos', type=int, default=0, help='Medir también el pool con N procesos')
+        parser.add_argument('--repeticiones', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('El benchmark necesita NumPy')
+
+        raster_riesgo.construir(generar_zonas(options['zonas']))
+        rutas = generar_rutas(options['rutas'], options['puntos'])
+        polilineas = [codificar_polilinea(ruta) for ruta in rutas]
+        repeticiones = options['repeticiones']
+
+        mediciones = [
+            ('Una a una (evaluar_ruta)', lambda: [raster_riesgo.evaluar_ruta(ruta) for ruta in rutas]),
+            ('Lote de listas', lambda: raster_riesgo.evaluar_rutas(rutas)),
+            ('Lote de polilíneas', lambda: raster_riesgo.evaluar_lote(*decodificar_polilineas(polilineas))),
+        ]
+        pool = None
+        if options['procesos']:
+            pool = PoolPuntuacion(procesos=options['procesos'], minimo_puntos=0)
+            mediciones.append((
+                f'Pool de {options["procesos"]} procesos',
+                lambda: pool.evaluar(*decodificar_polilineas(polilineas)),
+            ))
+
+        try:
+            resultados = [(nombre, *medir(funcion, repeticiones)) for nombre, funcion in mediciones]
+        finally:
+            if pool is not None:
+                pool.cerrar()
+
+        referencia = resultados[0][2]
+        for nombre, _, resultado in resultados[1:]:
+            for uno, otro in zip(referencia, resultado):
+                if any(uno[clave] != otro[clave] for clave in uno):
+                    raise CommandError(f'{nombre} no coincide con evaluar_ruta: {uno} != {otro}')
+
+        total_puntos = options['rutas'] * options['puntos']
+        self.stdout.write(
+            f'{options["rutas"]:,} rutas de {options["puntos"]} puntos '
+            f'({sum(r["distancia"] for r in resultados[1][2]) / len(referencia):.1f} km de media), '
+            f'{options["zonas"]} zonas'
+        )
+        self.stdout.write(f'{"Método":<28}{"ms":>10}{"Rutas/s":>12}{"Puntos/s":>14}')
+        for nombre, tiempo, _ in resultados:
+            self.stdout.write(
+                f'{nombre:<28}{tiempo * 1000:>10.1f}{options["rutas"] / tiempo:>12,.0f}{total_puntos / tiempo:>14,.0f}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Lote de polilíneas {resultados[0][1] / resultados[2][1]:.1f}x más rápido que una a una'
+        ))
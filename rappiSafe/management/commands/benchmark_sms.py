@@ -0,0 +1,201 @@
+import json
+import os
+import secrets
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import httpx
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.cliente_sms import ClienteMocean, cliente_mocean
+from rappiSafe.models import Alerta, ContactoConfianza, NotificacionContacto
+from rappiSafe.notificaciones import DespachadorNotificaciones, despachador_notificaciones, encolar_notificaciones
+from rappiSafe.reintentos import programador_reintentos
+
+PREFIJO_USUARIOS = 'benchmark_sms_'
+SUFIJO_RECHAZADO = '99'  # La API simulada rechaza los números que terminan así
+
+
+class ManejadorMocean(BaseHTTPRequestHandler):
+    """
+    API de SMS de Mocean simulada: tarda latencia_ms en cada petición y
+    2 × latencia_ms en aceptar cada conexión nueva (handshakes TCP y TLS)
+    """
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+    latencia_ms = 0
+    peticiones = 0
+    conexiones = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        time.sleep(2 * self.latencia_ms / 1000)
+        with self.lock:
+            ManejadorMocean.conexiones += 1
+        super().setup()
+
+    def do_POST(self):
+        datos = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        time.sleep(self.latencia_ms / 1000)
+        with self.lock:
+            ManejadorMocean.peticiones += 1
+        mensajes = []
+        for numero in datos['mocean-to'][0].split(','):
+            if numero.endswith(SUFIJO_RECHAZADO):
+                mensajes.append({'status': 1, 'receiver': numero, 'err_msg': 'Invalid receiver'})
+            else:
+                mensajes.append({'status': 0, 'receiver': numero, 'msgid': secrets.token_hex(8)})
+        cuerpo = json.dumps({'messages': mensajes}).encode()
+        self.send_response(202)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def resumen(latencias):
+    ordenadas = sorted(latencias)
+    p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+    return f'{statistics.median(ordenadas) * 1000:>10.1f}{p95 * 1000:>10.1f}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara enviar los SMS de una alerta uno por uno con un cliente nuevo contra una sola petición '
+        'a Mocean por alerta, contra una API simulada local'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contactos', type=int, default=5, help='Contactos por alerta')
+        parser.add_argument('--alertas', type=int, default=10, help='Alertas medidas en cada fase')
+        parser.add_argument('--latencia-ms', type=float, default=60, help='Ida y vuelta simulada hasta Mocean')
+
+    def handle(self, *args, **options):
+        ManejadorMocean.latencia_ms = options['latencia_ms']
+        servidor = ThreadingHTTPServer(('127.0.0.1', 0), ManejadorMocean)
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        url_api = f'http://127.0.0.1:{servidor.server_address[1]}/rest/2'
+        os.environ.setdefault('MOCEAN_API_TOKEN', 'benchmark')
+
+        cliente = ClienteMocean(url_api=url_api)
+        try:
+            self._medir(cliente, url_api, options)
+            self._comprobar_bandeja(url_api, options['contactos'])
+        finally:
+            cliente.cerrar()
+            servidor.shutdown()
+            get_user_model().objects.filter(username__startswith=PREFIJO_USUARIOS).delete()
+
+    def _medir(self, cliente, url_api, options):
+        telefonos = [f'+52 1 555 000 {i:04d}' for i in range(options['contactos'])]
+        mensaje = '🚨 ALERTA DE EMERGENCIA - RAPPI SAFE (benchmark)'
+
+        def cliente_nuevo_por_sms():
+            # Como antes: un cliente nuevo (y su conexión) por cada SMS, uno tras otro
+            for telefono in telefonos:
+                with httpx.Client(timeout=10) as http:
+                    http.post(f'{url_api}/sms', data={
+                        'mocean-from': 'RAPPI SAFE', 'mocean-to': ''.join(filter(str.isdigit, telefono)),
+                        'mocean-text': mensaje, 'mocean-resp-format': 'json',
+                    }).raise_for_status()
+
+        def cliente_del_proceso_por_sms():
+            for telefono in telefonos:
+                if not cliente.enviar(telefono, mensaje)['success']:
+                    raise CommandError(f'Falló el SMS a {telefono}')
+
+        def una_peticion_por_alerta():
+            if not all(resultado['success'] for resultado in cliente.enviar_lote(telefonos, mensaje)):
+                raise CommandError('Falló un SMS del lote')
+
+        self.stdout.write(
+            f'API de Mocean simulada con {options["latencia_ms"]:g} ms de ida y vuelta | '
+            f'{options["contactos"]} contactos por alerta | {options["alertas"]} alertas por fase'
+        )
+        self.stdout.write(f'{"Fase":<46}{"p50 ms":>10}{"p95 ms":>10}{"Peticiones":>12}{"Conexiones":>12}')
+
+        filas = []
+        for nombre, enviar in (
+            ('Cliente nuevo, una petición por SMS (antes)', cliente_nuevo_por_sms),
+            ('Cliente del proceso, una petición por SMS', cliente_del_proceso_por_sms),
+            ('Cliente del proceso, una petición por alerta', una_peticion_por_alerta),
+        ):
+            peticiones, conexiones = ManejadorMocean.peticiones, ManejadorMocean.conexiones
+            latencias = []
+            for _ in range(options['alertas']):
+                inicio = time.perf_counter()
+                enviar()
+                latencias.append(time.perf_counter() - inicio)
+            filas.append((nombre, latencias, ManejadorMocean.peticiones - peticiones,
+                          ManejadorMocean.conexiones - conexiones))
+
+        for nombre, latencias, peticiones, conexiones in filas:
+            self.stdout.write(f'{nombre:<46}{resumen(latencias)}{peticiones:>12}{conexiones:>12}')
+        self.antes, self.ahora = statistics.median(filas[0][1]), statistics.median(filas[2][1])
+
+    def _comprobar_bandeja(self, url_api, contactos):
+        """
+        Recorrido completo: alerta → bandeja → despachador → una petición
+        con todos los números → un resultado en cada NotificacionContacto
+        """
+        User = get_user_model()
+        User.objects.filter(username__startswith=PREFIJO_USUARIOS).delete()
+        repartidor = User.objects.create_user(
+            username=f'{PREFIJO_USUARIOS}repartidor', email=f'{PREFIJO_USUARIOS}repartidor@benchmark.local',
+            password=secrets.token_urlsafe(16), rol='repartidor', first_name='Benchmark',
+        )
+        # Solo teléfono para medir solo SMS; el último número lo rechaza la API simulada
+        ContactoConfianza.objects.bulk_create([
+            ContactoConfianza(
+                repartidor=repartidor, nombre=f'Contacto {i}', validado=True,
+                telefono=f'+52155500{i:03d}{SUFIJO_RECHAZADO if i == contactos - 1 else "00"}',
+            )
+            for i in range(contactos)
+        ])
+        alerta = Alerta.objects.create(repartidor=repartidor, tipo='panico', estado='pendiente',
+                                       latitud=19.4, longitud=-99.15, nivel_bateria=80)
+        # Que la bandeja la despache solo el despachador medido, no el del proceso
+        despachador_notificaciones.en_proceso = False
+        encolar_notificaciones(alerta)
+
+        url_original = cliente_mocean.url_api
+        cliente_mocean.url_api = url_api
+        despachador = DespachadorNotificaciones(hilos=contactos, en_proceso=False)
+        peticiones = ManejadorMocean.peticiones
+        try:
+            despachador.despachar()
+        finally:
+            despachador.cerrar()
+            programador_reintentos.cerrar()
+            cliente_mocean.url_api = url_original
+        peticiones = ManejadorMocean.peticiones - peticiones
+
+        filas = list(NotificacionContacto.objects.filter(alerta=alerta).select_related('contacto'))
+        for notificacion in filas:
+            rechazado = notificacion.contacto.telefono.endswith(SUFIJO_RECHAZADO)
+            # El rechazado queda con su reintento programado
+            esperado = 'reintento' if rechazado else 'enviado'
+            if notificacion.estado != esperado:
+                raise CommandError(
+                    f'{notificacion.contacto.telefono}: estado {notificacion.estado}, se esperaba {esperado} '
+                    f'({notificacion.error_mensaje})'
+                )
+            if not rechazado and not notificacion.respuesta_api.get('receiver', '').endswith(
+                    notificacion.contacto.telefono[-5:]):
+                raise CommandError(f'{notificacion.contacto.telefono}: recibió el resultado de otro número')
+
+        self.stdout.write(
+            f'Despachador: {len(filas)} SMS de una alerta en {peticiones} petición(es); '
+            f'{sum(1 for fila in filas if fila.estado == "enviado")} enviados y '
+            f'{sum(1 for fila in filas if fila.estado == "reintento")} rechazado, cada uno en su fila'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Los SMS de una alerta salen {self.antes / self.ahora:.1f}x más rápido en una sola petición'
+        ))
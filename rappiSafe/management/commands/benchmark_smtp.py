@@ -0,0 +1,215 @@
+import asyncio
+import datetime
+import logging
+import os
+import smtplib
+import socket
+import ssl
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.pool_smtp import PoolSMTP, construir_mensaje
+
+try:
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import SMTP, AuthResult
+except ImportError:  # Solo hace falta para este benchmark
+    Controller = None
+
+
+def certificado_autofirmado(directorio):
+    """Certificado y llave para el STARTTLS del servidor local"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    llave = ec.generate_private_key(ec.SECP256R1())
+    nombre = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    ahora = datetime.datetime.now(datetime.timezone.utc)
+    certificado = (
+        x509.CertificateBuilder()
+        .subject_name(nombre).issuer_name(nombre).public_key(llave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(ahora).not_valid_after(ahora + datetime.timedelta(days=1))
+        .sign(llave, hashes.SHA256())
+    )
+    ruta_certificado = os.path.join(directorio, 'smtp.crt')
+    ruta_llave = os.path.join(directorio, 'smtp.key')
+    with open(ruta_certificado, 'wb') as archivo:
+        archivo.write(certificado.public_bytes(serialization.Encoding.PEM))
+    with open(ruta_llave, 'wb') as archivo:
+        archivo.write(llave.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+    return ruta_certificado, ruta_llave
+
+
+class ManejadorMensajes:
+    recibidos = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        ManejadorMensajes.recibidos += 1
+        return '250 OK'
+
+
+def aceptar_credenciales(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+class ControladorConLatencia(Controller if Controller else object):
+    """
+    Servidor SMTP local que tarda latencia_ms en cada respuesta, como un
+    proveedor al otro lado de internet (cada comando es un viaje de ida y vuelta)
+    """
+    latencia_ms = 0
+
+    def factory(self):
+        latencia = self.latencia_ms / 1000
+
+        class SMTPConLatencia(SMTP):
+            async def push(self, status):
+                await asyncio.sleep(latencia)
+                await super().push(status)
+
+        return SMTPConLatencia(self.handler, **self.SMTP_kwargs)
+
+
+def enviar_sesion_nueva(destinatario, asunto, mensaje, timeout=10):
+    """Como se enviaba antes: conectar, cifrar, autenticar, un mensaje y QUIT"""
+    contexto = ssl.create_default_context()
+    contexto.check_hostname = False
+    contexto.verify_mode = ssl.CERT_NONE
+    servidor = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=timeout)
+    servidor.ehlo()
+    servidor.starttls(context=contexto)
+    servidor.ehlo()
+    servidor.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
+    servidor.send_message(construir_mensaje(destinatario, asunto, mensaje))
+    servidor.quit()
+
+
+def puerto_libre():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def resumen(latencias):
+    ordenadas = sorted(latencias)
+    p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+    return f'{statistics.median(ordenadas) * 1000:>10.1f}{p95 * 1000:>10.1f}'
+
+
+def medir(funcion, cantidad):
+    latencias = []
+    for i in range(cantidad):
+        inicio = time.perf_counter()
+        funcion(i)
+        latencias.append(time.perf_counter() - inicio)
+    return latencias
+
+
+class Command(BaseCommand):
+    help = 'Compara abrir una sesión SMTP por email contra el pool de sesiones contra un servidor local (aiosmtpd)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mensajes', type=int, default=30, help='Mensajes por fase')
+        parser.add_argument('--latencia-ms', type=float, default=20,
+                            help='Espera del servidor antes de cada respuesta (ida y vuelta simulada)')
+        parser.add_argument('--concurrentes', type=int, default=8, help='Hilos enviando a la vez en la fase concurrente')
+        parser.add_argument('--conexiones', type=int, default=4, help='Sesiones del pool')
+
+    def handle(self, *args, **options):
+        if Controller is None:
+            raise CommandError('El benchmark necesita aiosmtpd: pip install aiosmtpd')
+        try:
+            import cryptography  # noqa: F401
+        except ImportError:
+            raise CommandError('El benchmark necesita cryptography para el certificado de STARTTLS')
+
+        # aiosmtpd registra un aviso de obsolescencia propio en cada AUTH
+        logging.getLogger('mail.log').setLevel(logging.ERROR)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            contexto = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            contexto.load_cert_chain(*certificado_autofirmado(directorio))
+
+            ControladorConLatencia.latencia_ms = options['latencia_ms']
+            controlador = ControladorConLatencia(
+                ManejadorMensajes(), hostname='127.0.0.1', port=puerto_libre(),
+                tls_context=contexto, require_starttls=True, auth_required=True,
+                authenticator=aceptar_credenciales,
+            )
+            controlador.start()
+            try:
+                self._medir(controlador, options)
+            finally:
+                controlador.stop()
+
+    def _medir(self, controlador, options):
+        settings.EMAIL_HOST, settings.EMAIL_PORT = controlador.hostname, controlador.port
+        settings.EMAIL_USE_TLS, settings.EMAIL_USE_SSL = True, False
+        settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD = 'benchmark@rappisafe.local', 'benchmark'
+
+        cantidad = options['mensajes']
+        pool = PoolSMTP(conexiones=options['conexiones'])
+        asunto, mensaje = 'Benchmark', 'Mensaje de prueba del benchmark SMTP'
+        destinatario = 'contacto{}@benchmark.local'.format
+
+        self.stdout.write(
+            f'Servidor aiosmtpd con STARTTLS y AUTH, {options["latencia_ms"]:g} ms por respuesta | '
+            f'{cantidad} mensajes por fase'
+        )
+        self.stdout.write(f'{"Fase":<40}{"p50 ms":>10}{"p95 ms":>10}{"Total s":>10}')
+
+        filas = []
+        inicio = time.perf_counter()
+        latencias = medir(lambda i: enviar_sesion_nueva(destinatario(i), asunto, mensaje), cantidad)
+        filas.append(('Sesión nueva por mensaje (antes)', latencias, time.perf_counter() - inicio))
+
+        inicio = time.perf_counter()
+        latencias = medir(lambda i: pool.enviar(destinatario(i), asunto, mensaje), cantidad)
+        filas.append(('Pool, uno tras otro', latencias, time.perf_counter() - inicio))
+
+        inicio = time.perf_counter()
+        errores = pool.enviar_varios([(destinatario(i), asunto, mensaje) for i in range(cantidad)])
+        total = time.perf_counter() - inicio
+        if any(errores):
+            raise CommandError(f'enviar_varios falló: {next(e for e in errores if e)}')
+        filas.append(('Pool, enviar_varios (una sesión)', [total / cantidad], total))
+
+        for nombre, funcion in (
+            (f'{options["concurrentes"]} hilos, sesión nueva', lambda i: enviar_sesion_nueva(destinatario(i), asunto, mensaje)),
+            (f'{options["concurrentes"]} hilos, pool de {options["conexiones"]}', lambda i: pool.enviar(destinatario(i), asunto, mensaje)),
+        ):
+            latencias = []
+
+            def cronometrar(i, funcion=funcion):
+                comienzo = time.perf_counter()
+                funcion(i)
+                latencias.append(time.perf_counter() - comienzo)
+
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrentes']) as hilos:
+                list(hilos.map(cronometrar, range(cantidad)))
+            filas.append((nombre, latencias, time.perf_counter() - inicio))
+
+        for nombre, latencias, total in filas:
+            self.stdout.write(f'{nombre:<40}{resumen(latencias)}{total:>10.2f}')
+
+        estadisticas = pool.estadisticas()
+        pool.cerrar()
+        esperados = cantidad * 5
+        if ManejadorMensajes.recibidos != esperados:
+            raise CommandError(f'El servidor recibió {ManejadorMensajes.recibidos} de {esperados} mensajes')
+        self.stdout.write(
+            f'Pool: {estadisticas["sesiones_abiertas"]} sesiones abiertas para {estadisticas["mensajes"]} mensajes, '
+            f'{estadisticas["reusos"]} reusos'
+        )
+        antes, ahora = statistics.median(filas[0][1]), statistics.median(filas[1][1])
+        self.stdout.write(self.style.SUCCESS(f'[OK] Con el pool cada email tarda {antes / ahora:.1f}x menos'))
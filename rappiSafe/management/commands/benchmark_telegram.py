@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.cliente_telegram import EnviadorTelegram
+
+
+class ManejadorBotAPI(BaseHTTPRequestHandler):
+    """
+    Bot API de Telegram simulada: tarda latencia_ms en cada respuesta y
+    2 × latencia_ms en aceptar cada conexión nueva (handshakes TCP y TLS)
+    """
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+    latencia_ms = 0
+    llegadas = deque()
+    conexiones = 0
+    siguiente_id = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        time.sleep(2 * self.latencia_ms / 1000)
+        with self.lock:
+            ManejadorBotAPI.conexiones += 1
+        super().setup()
+
+    def do_POST(self):
+        datos = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            ManejadorBotAPI.siguiente_id += 1
+            message_id = ManejadorBotAPI.siguiente_id
+            self.llegadas.append((time.monotonic(), datos['chat_id']))
+        time.sleep(self.latencia_ms / 1000)
+        cuerpo = json.dumps({
+            'ok': True, 'result': {'message_id': message_id, 'chat': {'id': datos['chat_id']}, 'text': datos['text']}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def maximo_por_ventana(instantes, ventana=1.0):
+    """Máximo de mensajes recibidos en cualquier ventana de 'ventana' segundos"""
+    maximo, inicio = 0, 0
+    for fin in range(len(instantes)):
+        while instantes[fin] - instantes[inicio] >= ventana:
+            inicio += 1
+        maximo = max(maximo, fin - inicio + 1)
+    return maximo
+
+
+def resumen(latencias):
+    ordenadas = sorted(latencias)
+    p95 = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))]
+    return f'{statistics.median(ordenadas) * 1000:>10.1f}{p95 * 1000:>10.1f}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara crear un cliente y un event loop por mensaje de Telegram contra el cliente del proceso, '
+        'contra una Bot API simulada local, y comprueba el límite de mensajes por segundo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mensajes', type=int, default=20, help='Mensajes por fase')
+        parser.add_argument('--chats', type=int, default=60, help='Chats distintos en el envío a muchos chats')
+        parser.add_argument('--latencia-ms', type=float, default=40, help='Ida y vuelta simulada hasta Telegram')
+        parser.add_argument('--limite-por-s', type=float, default=30,
+                            help='Mensajes por segundo que la API acepta del bot (el enviador usa TELEGRAM["MENSAJES_POR_S"])')
+
+    def handle(self, *args, **options):
+        mensajes_por_s = getattr(settings, 'TELEGRAM', {}).get('MENSAJES_POR_S', 25.0)
+        if mensajes_por_s > options['limite_por_s']:
+            raise CommandError('TELEGRAM["MENSAJES_POR_S"] está por encima del límite de la API')
+        if options['chats'] <= mensajes_por_s:
+            raise CommandError('--chats debe superar TELEGRAM["MENSAJES_POR_S"] para comprobar el límite')
+
+        ManejadorBotAPI.latencia_ms = options['latencia_ms']
+        servidor = ThreadingHTTPServer(('127.0.0.1', 0), ManejadorBotAPI)
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        url_api = f'http://127.0.0.1:{servidor.server_address[1]}'
+        os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'benchmark')
+
+        enviador = EnviadorTelegram(url_api=url_api, mensajes_por_s=mensajes_por_s)
+        try:
+            self._medir(enviador, url_api, options)
+        finally:
+            enviador.cerrar()
+            servidor.shutdown()
+
+    def _medir(self, enviador, url_api, options):
+        cantidad = options['mensajes']
+        url = f'{url_api}/bot{os.environ["TELEGRAM_BOT_TOKEN"]}/sendMessage'
+        texto = 'Mensaje de prueba del benchmark de Telegram'
+
+        def cliente_nuevo(chat_id):
+            # Como antes: cliente (pool de conexiones) y event loop nuevos en cada mensaje
+            async def enviar():
+                async with httpx.AsyncClient(timeout=10) as cliente:
+                    respuesta = await cliente.post(url, json={'chat_id': chat_id, 'text': texto, 'parse_mode': 'HTML'})
+                    return respuesta.json()['ok']
+            return asyncio.run(enviar())
+
+        self.stdout.write(
+            f'Bot API simulada con {options["latencia_ms"]:g} ms de ida y vuelta | {cantidad} mensajes por fase'
+        )
+        self.stdout.write(f'{"Fase":<44}{"p50 ms":>10}{"p95 ms":>10}{"Total s":>10}{"Conexiones":>12}')
+
+        filas = []
+        for nombre, enviar in (
+            ('Cliente y loop nuevos por mensaje (antes)', cliente_nuevo),
+            ('Cliente del proceso, uno tras otro', lambda chat_id: enviador.enviar(chat_id, texto)['success']),
+        ):
+            conexiones_antes = ManejadorBotAPI.conexiones
+            latencias = []
+            inicio = time.perf_counter()
+            for i in range(cantidad):
+                comienzo = time.perf_counter()
+                if not enviar(1000 + i):
+                    raise CommandError(f'Falló un envío en la fase "{nombre}"')
+                latencias.append(time.perf_counter() - comienzo)
+            filas.append((nombre, latencias, time.perf_counter() - inicio, ManejadorBotAPI.conexiones - conexiones_antes))
+
+        # Muchos chats a la vez: el límite global debe repartir los envíos en el tiempo
+        chats = options['chats']
+        ManejadorBotAPI.llegadas.clear()
+        conexiones_antes = ManejadorBotAPI.conexiones
+        inicio = time.perf_counter()
+        resultados = enviador.enviar_varios([(2000 + i, texto) for i in range(chats)], timeout=30)
+        total = time.perf_counter() - inicio
+        if not all(resultado['success'] for resultado in resultados):
+            raise CommandError(f'enviar_varios falló: {next(r["error"] for r in resultados if not r["success"])}')
+        filas.append((f'enviar_varios a {chats} chats', [total / chats], total, ManejadorBotAPI.conexiones - conexiones_antes))
+
+        for nombre, latencias, total, conexiones in filas:
+            self.stdout.write(f'{nombre:<44}{resumen(latencias)}{total:>10.2f}{conexiones:>12}')
+
+        maximo = maximo_por_ventana([instante for instante, _ in ManejadorBotAPI.llegadas])
+        limite = options['limite_por_s']
+        self.stdout.write(
+            f'Máximo recibido por la API en 1 s: {maximo} (enviador a {enviador.mensajes_por_s:g}/s, '
+            f'límite de la API {limite:g}/s)'
+        )
+        if maximo > limite:
+            raise CommandError(f'Se superó el límite de envío: {maximo} mensajes en un segundo')
+
+        antes, ahora = statistics.median(filas[0][1]), statistics.median(filas[1][1])
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Con el cliente del proceso cada mensaje tarda {antes / ahora:.1f}x menos y se respeta el límite'
+        ))
@@ -0,0 +1,135 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rappiSafe.trayectorias import (
+    PuntoTrayectoria, TAMANO_SEGMENTO, codificar_puntos, decodificar_puntos
+)
+
+
+def generar_trayectoria(num_puntos, semilla=42):
+    """Trayectoria sintética: caminata aleatoria con un punto cada ~3 s en CDMX"""
+    rnd = random.Random(semilla)
+    lat, lon = 19.4326, -99.1332
+    fecha = datetime(2025, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+    puntos = []
+    for _ in range(num_puntos):
+        lat += rnd.gauss(0, 0.00005)
+        lon += rnd.gauss(0, 0.00005)
+        fecha += timedelta(milliseconds=rnd.randint(2500, 3500))
+        puntos.append(PuntoTrayectoria(
+            latitud=Decimal(f'{lat:.6f}'),
+            longitud=Decimal(f'{lon:.6f}'),
+            precision=round(rnd.uniform(3, 30), 1),
+            velocidad=round(rnd.uniform(0, 12), 2),
+            timestamp=fecha,
+        ))
+    return puntos
+
+
+class Command(BaseCommand):
+    help = 'Compara tamaño y velocidad de lectura: fila por punto vs segmentos compactos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puntos', type=int, default=10000, help='Puntos de la trayectoria sintética')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Repeticiones para medir lectura')
+
+    def handle(self, *args, **options):
+        puntos = generar_trayectoria(options['puntos'])
+        repeticiones = options['repeticiones']
+
+        with tempfile.TemporaryDirectory() as directorio:
+            # Mismo esquema que la tabla de Trayectoria en SQLite
+            ruta_filas = os.path.join(directorio, 'filas.sqlite3')
+            conexion = sqlite3.connect(ruta_filas)
+            conexion.execute(
+                'CREATE TABLE trayectoria (id integer PRIMARY KEY AUTOINCREMENT, '
+                'latitud decimal NOT NULL, longitud decimal NOT NULL, precision real NULL, '
+                'velocidad real NULL, timestamp datetime NOT NULL, alerta_id char(32) NOT NULL)'
+            )
+            conexion.execute('CREATE INDEX trayectoria_alerta ON trayectoria (alerta_id)')
+            conexion.executemany(
+                'INSERT INTO trayectoria (latitud, longitud, precision, velocidad, timestamp, alerta_id) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(str(p.latitud), str(p.longitud), p.precision, p.velocidad,
+                  p.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'), 'a' * 32) for p in puntos]
+            )
+            conexion.commit()
+            conexion.execute('VACUUM')
+            conexion.close()
+            tamano_filas = os.path.getsize(ruta_filas)
+
+            ruta_segmentos = os.path.join(directorio, 'segmentos.sqlite3')
+            inicio = time.perf_counter()
+            blobs = [
+                codificar_puntos(puntos[i:i + TAMANO_SEGMENTO])
+                for i in range(0, len(puntos), TAMANO_SEGMENTO)
+            ]
+            tiempo_codificar = time.perf_counter() - inicio
+            conexion = sqlite3.connect(ruta_segmentos)
+            conexion.execute(
+                'CREATE TABLE segmento (id integer PRIMARY KEY AUTOINCREMENT, secuencia integer NOT NULL, '
+                'inicio datetime NOT NULL, fin datetime NOT NULL, num_puntos integer NOT NULL, '
+                'datos BLOB NOT NULL, creado_en datetime NOT NULL, alerta_id char(32) NOT NULL)'
+            )
+            conexion.executemany(
+                'INSERT INTO segmento (secuencia, inicio, fin, num_puntos, datos, creado_en, alerta_id) '
+                "VALUES (?, '', '', ?, ?, '', ?)",
+                [(i, TAMANO_SEGMENTO, blob, 'a' * 32) for i, blob in enumerate(blobs)]
+            )
+            conexion.commit()
+            conexion.execute('VACUUM')
+            conexion.close()
+            tamano_segmentos = os.path.getsize(ruta_segmentos)
+
+            # Lectura fila por punto: SELECT + conversión a Decimal/datetime como hace el ORM
+            conexion = sqlite3.connect(ruta_filas)
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                leidos = [
+                    (Decimal(lat), Decimal(lon), prec, vel, datetime.fromisoformat(ts))
+                    for lat, lon, prec, vel, ts in conexion.execute(
+                        'SELECT latitud, longitud, precision, velocidad, timestamp '
+                        'FROM trayectoria WHERE alerta_id = ? ORDER BY timestamp', ('a' * 32,)
+                    )
+                ]
+            tiempo_filas = (time.perf_counter() - inicio) / repeticiones
+            conexion.close()
+
+            conexion = sqlite3.connect(ruta_segmentos)
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                decodificados = [
+                    punto
+                    for (datos,) in conexion.execute(
+                        'SELECT datos FROM segmento WHERE alerta_id = ? ORDER BY secuencia', ('a' * 32,)
+                    )
+                    for punto in decodificar_puntos(datos)
+                ]
+            tiempo_segmentos = (time.perf_counter() - inicio) / repeticiones
+            conexion.close()
+
+        assert len(leidos) == len(decodificados) == len(puntos)
+        assert decodificados[-1].latitud == puntos[-1].latitud
+
+        n = len(puntos)
+        self.stdout.write(f'Trayectoria sintética: {n} puntos, {len(blobs)} segmentos\n')
+        self.stdout.write(f'{"Formato":<22}{"Bytes":>12}{"Bytes/punto":>14}{"Lectura (ms)":>15}{"Puntos/s":>14}')
+        for nombre, tamano, tiempo in (
+            ('Fila por punto', tamano_filas, tiempo_filas),
+            ('Segmentos compactos', tamano_segmentos, tiempo_segmentos),
+        ):
+            self.stdout.write(
+                f'{nombre:<22}{tamano:>12,}{tamano / n:>14.1f}{tiempo * 1000:>15.1f}{n / tiempo:>14,.0f}'
+            )
+        self.stdout.write('')
+        self.stdout.write(f'Bytes del blob puro: {sum(len(b) for b in blobs):,} ({sum(len(b) for b in blobs) / n:.1f} B/punto)')
+        self.stdout.write(f'Codificación: {tiempo_codificar * 1000:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Reducción de tamaño: {tamano_filas / tamano_segmentos:.1f}x'
+        ))
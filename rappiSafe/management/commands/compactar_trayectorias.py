@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.models import Alerta, Trayectoria
+from rappiSafe.trayectorias import ESTADOS_CERRADOS, TAMANO_SEGMENTO, compactar_alerta
+
+
+class Command(BaseCommand):
+    help = 'Empaqueta las trayectorias de alertas cerradas en segmentos binarios compactos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alerta', help='Compactar solo esta alerta (UUID), sin importar su estado')
+        parser.add_argument('--tamano-segmento', type=int, default=TAMANO_SEGMENTO,
+                            help=f'Puntos por segmento (default: {TAMANO_SEGMENTO})')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Mostrar qué se compactaría sin modificar la base de datos')
+
+    def handle(self, *args, **options):
+        if options['alerta']:
+            alertas = Alerta.objects.filter(id=options['alerta'])
+            if not alertas.exists():
+                raise CommandError(f'No existe la alerta {options["alerta"]}')
+        else:
+            alertas = Alerta.objects.filter(
+                estado__in=ESTADOS_CERRADOS,
+                trayectorias__isnull=False
+            ).distinct()
+
+        total_alertas = 0
+        total_puntos = 0
+        for alerta in alertas.iterator():
+            if options['dry_run']:
+                puntos = Trayectoria.objects.filter(alerta=alerta).count()
+            else:
+                puntos = compactar_alerta(alerta, tamano_segmento=options['tamano_segmento'])
+
+            if puntos:
+                total_alertas += 1
+                total_puntos += puntos
+                self.stdout.write(f'  Alerta {alerta.id}: {puntos} puntos')
+
+        accion = 'se compactarían' if options['dry_run'] else 'compactados'
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] {total_puntos} puntos de {total_alertas} alertas {accion}'
+        ))
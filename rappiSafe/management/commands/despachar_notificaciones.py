@@ -0,0 +1,58 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rappiSafe.notificaciones import DespachadorNotificaciones
+from rappiSafe.reintentos import programador_reintentos
+
+
+class Command(BaseCommand):
+    help = 'Envía las notificaciones a contactos que las alertas dejan en la bandeja de salida'
+
+    def add_arguments(self, parser):
+        configuracion = getattr(settings, 'NOTIFICACIONES', {})
+        parser.add_argument('--hilos', type=int, default=configuracion.get('HILOS', 16),
+                            help='Envíos simultáneos')
+        parser.add_argument('--intervalo', type=float, default=configuracion.get('INTERVALO_S', 1.0),
+                            help='Segundos entre revisiones de la bandeja')
+        parser.add_argument('--una-vez', action='store_true', help='Vaciar la bandeja y terminar')
+
+    def handle(self, *args, **options):
+        configuracion = getattr(settings, 'NOTIFICACIONES', {})
+        despachador = DespachadorNotificaciones(
+            hilos=options['hilos'],
+            plazo_s=configuracion.get('PLAZO_S', 8.0),
+            arrendamiento_s=configuracion.get('ARRENDAMIENTO_S', 120.0),
+            max_intentos=configuracion.get('MAX_INTENTOS', 5),
+            intervalo_s=options['intervalo'],
+            en_proceso=False,
+        )
+
+        if options['una_vez']:
+            procesadas = despachador.despachar()
+            despachador.cerrar()
+            self.stdout.write(self.style.SUCCESS(f'[OK] {procesadas} notificación(es) procesadas'))
+            return
+
+        # systemd/supervisor detienen con SIGTERM: terminar el lote en curso y salir
+        signal.signal(signal.SIGTERM, lambda *_: despachador.detener())
+        # Retomar a su hora los reintentos que dejó programados un proceso anterior
+        programador_reintentos.iniciar()
+        self.stdout.write(self.style.SUCCESS(
+            f'Despachador de notificaciones con {options["hilos"]} hilos '
+            f'(revisión cada {options["intervalo"]:g} s). Ctrl+C para detener.'
+        ))
+        try:
+            despachador.ejecutar()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            despachador.cerrar()
+            # Los reintentos que falten quedan en la tabla y se retoman al volver a arrancar
+            programador_reintentos.cerrar()
+            estadisticas = despachador.estadisticas()
+            self.stdout.write(
+                f'\nEnviadas: {estadisticas["enviadas"]} | fallidas: {estadisticas["fallidas"]} | '
+                f'agotadas: {estadisticas["agotadas"]} | '
+                f'reintentos en espera: {programador_reintentos.estadisticas()["en_espera"]}'
+            )
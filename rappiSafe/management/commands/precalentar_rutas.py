@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rappiSafe.precalculo_rutas import evaluar_dia, precalcular_hora
+
+
+class Command(BaseCommand):
+    help = 'Precalcular en la caché las rutas más pedidas de la próxima hora (o evaluar la tasa de aciertos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hora', type=int, help='Hora del día (0-23) a precalcular; por defecto la siguiente')
+        parser.add_argument('--dias', type=int, help='Días de historial de RutaSegura')
+        parser.add_argument('--minimo', type=int, help='Consultas mínimas de un par para precalcularlo')
+        parser.add_argument('--max-pares', type=int, help='Pares por hora como máximo')
+        parser.add_argument('--evaluar', metavar='AAAA-MM-DD', nargs='?', const='ayer',
+                            help='Simular la caché sobre el tráfico de ese día (por defecto ayer) sin calcular rutas')
+
+    def handle(self, *args, **options):
+        parametros = {
+            'dias': options['dias'],
+            'minimo': options['minimo'],
+            'max_pares': options['max_pares'],
+        }
+
+        if options['evaluar']:
+            if options['evaluar'] == 'ayer':
+                dia = timezone.localdate() - timedelta(days=1)
+            else:
+                try:
+                    dia = date.fromisoformat(options['evaluar'])
+                except ValueError:
+                    raise CommandError('La fecha debe tener formato AAAA-MM-DD')
+            self._mostrar_evaluacion(evaluar_dia(dia, **parametros))
+            return
+
+        if getattr(settings, 'CACHE_RUTAS', {}).get('BACKEND', 'memoria') == 'memoria':
+            self.stdout.write(self.style.WARNING(
+                'CACHE_RUTAS usa el backend "memoria": las rutas quedan solo en la caché de este '
+                'proceso. Usar el backend "cache" o PRECALCULO_RUTAS["ACTIVO"] en el servidor.'
+            ))
+
+        inicio_hora = None
+        if options['hora'] is not None:
+            if not 0 <= options['hora'] <= 23:
+                raise CommandError('La hora debe estar entre 0 y 23')
+            inicio_hora = timezone.localtime().replace(hour=options['hora'], minute=0, second=0, microsecond=0)
+            if inicio_hora <= timezone.localtime():
+                inicio_hora += timedelta(days=1)
+
+        resultado = precalcular_hora(inicio_hora, **parametros)
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Hora {resultado["hora"]:02d}:00 - {resultado["calculados"]}/{resultado["pares"]} pares '
+            f'precalculados ({resultado["errores"]} errores), válidos por {resultado["ttl"] // 60} min'
+        ))
+
+    def _mostrar_evaluacion(self, resultado):
+        self.stdout.write(f'Tráfico del {resultado["dia"]}: {resultado["consultas"]:,} consultas, '
+                          f'{resultado["pares_precalculados"]:,} pares precalculados en total')
+        if not resultado['consultas']:
+            return
+        self.stdout.write(f'{"Hora":<6}{"Consultas":>10}{"Pares":>8}{"Sin precálculo":>16}{"Con precálculo":>16}')
+        for hora, fila in resultado['por_hora'].items():
+            self.stdout.write(
+                f'{hora:02d}:00 {fila["consultas"]:>10,}{fila["pares_precalculados"]:>8,}'
+                f'{fila["tasa_sin_precalculo"]:>16.1%}{fila["tasa_con_precalculo"]:>16.1%}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Tasa de aciertos: {resultado["tasa_sin_precalculo"]:.1%} sin precálculo, '
+            f'{resultado["tasa_con_precalculo"]:.1%} con precálculo '
+            f'({resultado["tasa_solo_precalculo"]:.1%} servidas por rutas precalculadas)'
+        ))
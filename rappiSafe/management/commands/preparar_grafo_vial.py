@@ -0,0 +1,116 @@
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rappiSafe.geo import haversine_m
+from rappiSafe.grafo_vial import construir_csr, generar_grafo_sintetico, guardar_grafo
+
+# Velocidad por defecto (km/h) de cada tipo de vía que puede usar una moto
+VELOCIDADES_VIA = {
+    'motorway': 80, 'trunk': 70, 'primary': 50, 'secondary': 45, 'tertiary': 40,
+    'unclassified': 30, 'residential': 25, 'living_street': 10, 'service': 15,
+    'motorway_link': 50, 'trunk_link': 45, 'primary_link': 40, 'secondary_link': 35,
+    'tertiary_link': 30,
+}
+
+
+def velocidad_via(etiquetas):
+    """Velocidad en km/h a partir de maxspeed o del tipo de vía"""
+    maxima = etiquetas.get('maxspeed', '').split(' ')[0]
+    if maxima.isdigit() and int(maxima) > 0:
+        return float(maxima)
+    return float(VELOCIDADES_VIA[etiquetas['highway']])
+
+
+def sentido_via(etiquetas):
+    """(ida, vuelta) según oneway, rotondas y autopistas"""
+    oneway = etiquetas.get('oneway', '').lower()
+    if oneway == '-1':
+        return False, True
+    if oneway in ('yes', 'true', '1') or etiquetas.get('junction') == 'roundabout' \
+            or etiquetas['highway'] == 'motorway':
+        return True, False
+    return True, True
+
+
+def leer_osm(ruta):
+    """
+    Leer un extracto .osm (XML) en dos pasadas: primero las vías transitables
+    y luego solo las coordenadas de sus nodos, para no cargar todo el extracto
+    """
+    vias = []
+    for _, elemento in ET.iterparse(ruta, events=('end',)):
+        if elemento.tag == 'way':
+            etiquetas = {tag.get('k'): tag.get('v') for tag in elemento.iter('tag')}
+            if etiquetas.get('highway') in VELOCIDADES_VIA and etiquetas.get('access') not in ('no', 'private'):
+                nodos = [int(nd.get('ref')) for nd in elemento.iter('nd')]
+                if len(nodos) >= 2:
+                    vias.append((nodos, velocidad_via(etiquetas), *sentido_via(etiquetas)))
+        if elemento.tag in ('node', 'way', 'relation'):
+            elemento.clear()
+
+    necesarios = {nodo for nodos, *_ in vias for nodo in nodos}
+    coordenadas = {}
+    for _, elemento in ET.iterparse(ruta, events=('end',)):
+        if elemento.tag == 'node':
+            identificador = int(elemento.get('id'))
+            if identificador in necesarios:
+                coordenadas[identificador] = (float(elemento.get('lat')), float(elemento.get('lon')))
+        if elemento.tag in ('node', 'way', 'relation'):
+            elemento.clear()
+
+    return vias, coordenadas
+
+
+class Command(BaseCommand):
+    help = 'Preparar el grafo vial (CSR en .npy) desde un extracto OSM o generar uno sintético'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--osm', help='Archivo .osm (XML) con el extracto de la ciudad')
+        parser.add_argument('--sintetico', action='store_true', help='Generar una rejilla del tamaño de la CDMX')
+        parser.add_argument('--filas', type=int, default=550, help='Filas de la rejilla sintética')
+        parser.add_argument('--columnas', type=int, default=550, help='Columnas de la rejilla sintética')
+        parser.add_argument('--salida', default=str(getattr(settings, 'GRAFO_VIAL_DIR', 'grafo_vial')),
+                            help='Directorio de salida')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        if options['sintetico']:
+            arreglos = generar_grafo_sintetico(options['filas'], options['columnas'])
+        elif options['osm']:
+            vias, coordenadas = leer_osm(options['osm'])
+            self.stdout.write(f'{len(vias):,} vías y {len(coordenadas):,} nodos leídos')
+
+            indices = {identificador: i for i, identificador in enumerate(coordenadas)}
+            lat = np.array([c[0] for c in coordenadas.values()])
+            lon = np.array([c[1] for c in coordenadas.values()])
+
+            origenes, destinos, velocidades = [], [], []
+            for nodos, velocidad, ida, vuelta in vias:
+                nodos = [indices[nodo] for nodo in nodos if nodo in indices]
+                for a, b in zip(nodos, nodos[1:]):
+                    if ida:
+                        origenes.append(a); destinos.append(b); velocidades.append(velocidad)
+                    if vuelta:
+                        origenes.append(b); destinos.append(a); velocidades.append(velocidad)
+
+            if not origenes:
+                raise CommandError('El extracto no contiene vías transitables')
+
+            origenes, destinos = np.array(origenes), np.array(destinos)
+            longitudes = haversine_m(lat[origenes], lon[origenes], lat[destinos], lon[destinos])
+            tiempos = longitudes / (np.array(velocidades) / 3.6)
+            arreglos = construir_csr(lat, lon, origenes, destinos, longitudes, tiempos)
+        else:
+            raise CommandError('Indica --osm <archivo> o --sintetico')
+
+        guardar_grafo(options['salida'], arreglos)
+        tamano = sum(arreglo.nbytes for arreglo in arreglos.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Grafo guardado en {options["salida"]}: {len(arreglos["lat"]):,} nodos, '
+            f'{len(arreglos["destinos"]):,} aristas, {tamano / 1e6:.1f} MB '
+            f'({time.perf_counter() - inicio:.1f} s)'
+        ))
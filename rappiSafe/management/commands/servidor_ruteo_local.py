@@ -0,0 +1,162 @@
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management.base import BaseCommand
+from rappiSafe.geo import haversine_m
+
+RUTA_OSRM = re.compile(r'^/(?P<servicio>route|table)/v1/(?P<perfil>[\w-]+)/(?P<coordenadas>[-\d.,;]+)$')
+VELOCIDAD_KMH = 22  # Velocidad media urbana de una moto de reparto
+PASO_GRADOS = 0.0005  # ~50 m entre vértices
+
+
+def densificar(vertices):
+    """Agregar vértices cada ~50 m, como una geometría 'full' de OSRM"""
+    puntos = [vertices[0]]
+    for (lat1, lon1), (lat2, lon2) in zip(vertices, vertices[1:]):
+        pasos = max(1, int(max(abs(lat2 - lat1), abs(lon2 - lon1)) / PASO_GRADOS))
+        puntos.extend(
+            (lat1 + (lat2 - lat1) * i / pasos, lon1 + (lon2 - lon1) * i / pasos)
+            for i in range(1, pasos + 1)
+        )
+    return puntos
+
+
+def generar_rutas(origen, destino, alternativas):
+    """
+    Rutas sintéticas con la forma de la respuesta de OSRM:
+    la directa primero y dos alternativas en 'L' por cada esquina
+    """
+    (lat1, lon1), (lat2, lon2) = origen, destino
+    trazos = [[origen, destino]]
+    if alternativas:
+        trazos += [[origen, (lat1, lon2), destino], [origen, (lat2, lon1), destino]]
+
+    rutas = []
+    for trazo in trazos:
+        puntos = densificar(trazo)
+        distancia = sum(
+            haversine_m(a[0], a[1], b[0], b[1]) for a, b in zip(puntos, puntos[1:])
+        )
+        rutas.append({
+            'geometry': {
+                'type': 'LineString',
+                'coordinates': [[round(lon, 6), round(lat, 6)] for lat, lon in puntos],
+            },
+            'distance': round(distancia, 1),
+            'duration': round(distancia / (VELOCIDAD_KMH / 3.6), 1),
+        })
+    return rutas
+
+
+def generar_tabla(puntos, fuentes):
+    """
+    Matriz de duraciones como /table de OSRM, con el tiempo de la ruta
+    directa de generar_rutas() entre cada par
+    """
+    return [
+        [
+            round(haversine_m(*puntos[fuente], *destino) / (VELOCIDAD_KMH / 3.6), 1)
+            for destino in puntos
+        ]
+        for fuente in fuentes
+    ]
+
+
+class ManejadorRuteo(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, igual que un OSRM real detrás de nginx
+    disable_nagle_algorithm = True  # Sin esto cada respuesta espera el ACK retrasado del cliente
+    latencia_ms = 0
+    variacion_ms = 0
+    verboso = False
+    total_consultas = 0
+
+    def do_GET(self):
+        url = urlsplit(self.path)  # urlparse separaría las coordenadas en ';'
+        coincidencia = RUTA_OSRM.match(url.path)
+        if not coincidencia or ';' not in coincidencia['coordenadas']:
+            self._responder(400, {'code': 'InvalidUrl', 'message': 'URL no reconocida'})
+            return
+
+        try:
+            pares = [tuple(map(float, par.split(','))) for par in coincidencia['coordenadas'].split(';')]
+            origen, destino = (pares[0][1], pares[0][0]), (pares[-1][1], pares[-1][0])
+            parametros = parse_qs(url.query)
+            fuentes = [int(fuente) for fuente in parametros.get('sources', ['all'])[0].split(';')
+                       if fuente != 'all'] or range(len(pares))
+            if any(not 0 <= fuente < len(pares) for fuente in fuentes):
+                raise IndexError(fuentes)
+        except (ValueError, IndexError):
+            self._responder(400, {'code': 'InvalidQuery', 'message': 'Coordenadas inválidas'})
+            return
+
+        alternativas = parametros.get('alternatives', ['false'])[0] == 'true'
+
+        # Latencia simulada de la red y del cálculo de OSRM
+        espera = self.latencia_ms + random.uniform(-self.variacion_ms, self.variacion_ms)
+        if espera > 0:
+            time.sleep(espera / 1000)
+
+        ManejadorRuteo.total_consultas += 1
+        if coincidencia['servicio'] == 'table':
+            puntos = [(lat, lon) for lon, lat in pares]
+            self._responder(200, {'code': 'Ok', 'durations': generar_tabla(puntos, fuentes)})
+            return
+        self._responder(200, {
+            'code': 'Ok',
+            'routes': generar_rutas(origen, destino, alternativas),
+            'waypoints': [
+                {'location': [origen[1], origen[0]], 'name': ''},
+                {'location': [destino[1], destino[0]], 'name': ''},
+            ],
+        })
+
+    def _responder(self, estado, cuerpo):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, formato, *args):
+        if self.verboso:
+            super().log_message(formato, *args)
+
+
+class ServidorRuteo(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # La cola por defecto (5) rechaza ráfagas de conexiones simultáneas
+
+
+class Command(BaseCommand):
+    help = 'Servidor local compatible con /route/v1 y /table/v1 de OSRM para pruebas de carga sin internet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--puerto', type=int, default=5001)
+        parser.add_argument('--latencia-ms', type=float, default=150, help='Latencia media simulada por consulta')
+        parser.add_argument('--variacion-ms', type=float, default=50, help='Variación aleatoria (+/-) de la latencia')
+        parser.add_argument('--verboso', action='store_true', help='Registrar cada consulta')
+
+    def handle(self, *args, **options):
+        ManejadorRuteo.latencia_ms = options['latencia_ms']
+        ManejadorRuteo.variacion_ms = min(options['variacion_ms'], options['latencia_ms'])
+        ManejadorRuteo.verboso = options['verboso']
+
+        servidor = ServidorRuteo((options['host'], options['puerto']), ManejadorRuteo)
+        self.stdout.write(self.style.SUCCESS(
+            f'Servidor de ruteo local en http://{options["host"]}:{options["puerto"]} '
+            f'(latencia {options["latencia_ms"]:.0f}±{ManejadorRuteo.variacion_ms:.0f} ms)'
+        ))
+        self.stdout.write('Usar con RUTEO_BACKEND=local. Ctrl+C para detener.')
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(f'\nConsultas atendidas: {ManejadorRuteo.total_consultas}')
@@ -0,0 +1,39 @@
+"""
+Middlewares del proyecto.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class WhiteNoiseAsyncMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise compatible con vistas async.
+
+    WhiteNoiseMiddleware solo es síncrono: con él en la cadena Django ejecuta
+    toda la petición (incluidas las vistas async como calcular_rutas) dentro
+    de un hilo, que queda ocupado mientras la vista espera. Esta versión deja
+    pasar las peticiones que no son archivos estáticos sin salir del event
+    loop; los estáticos se sirven igual que antes, en un hilo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rappiSafe', '0006_alter_user_telefono'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trayectoria',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha y hora'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rappiSafe', '0007_trayectoria_timestamp_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentoTrayectoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('secuencia', models.PositiveIntegerField(verbose_name='Número de segmento')),
+                ('inicio', models.DateTimeField(verbose_name='Primer punto')),
+                ('fin', models.DateTimeField(verbose_name='Último punto')),
+                ('num_puntos', models.PositiveIntegerField(verbose_name='Número de puntos')),
+                ('datos', models.BinaryField(verbose_name='Puntos codificados')),
+                ('creado_en', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de compactación')),
+                ('alerta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segmentos_trayectoria', to='rappiSafe.alerta')),
+            ],
+            options={
+                'verbose_name': 'Segmento de Trayectoria',
+                'verbose_name_plural': 'Segmentos de Trayectoria',
+                'ordering': ['alerta', 'secuencia'],
+                'unique_together': {('alerta', 'secuencia')},
+            },
+        ),
+    ]
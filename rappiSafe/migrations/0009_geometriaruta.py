@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+from rappiSafe.geometrias import codificar_geometria, decodificar_geometria, huella_geometria
+
+
+def _rutas(ruta_segura):
+    return [ruta_segura.ruta_rapida, *ruta_segura.ruta_segura.get('rutas', [])]
+
+
+def extraer_geometrias(apps, schema_editor):
+    """Mover las coordenadas del JSON de cada RutaSegura a GeometriaRuta"""
+    GeometriaRuta = apps.get_model('rappiSafe', 'GeometriaRuta')
+    RutaSegura = apps.get_model('rappiSafe', 'RutaSegura')
+
+    pendientes = []
+    for ruta_segura in RutaSegura.objects.only('ruta_rapida', 'ruta_segura').iterator(chunk_size=500):
+        geometrias = []
+        for ruta in _rutas(ruta_segura):
+            if 'coordenadas' not in ruta:
+                continue
+            coordenadas = ruta.pop('coordenadas')
+            datos = codificar_geometria(coordenadas)
+            ruta['geometria'] = huella_geometria(datos)
+            geometrias.append(GeometriaRuta(huella=ruta['geometria'], num_puntos=len(coordenadas), datos=datos))
+        if geometrias:
+            GeometriaRuta.objects.bulk_create(geometrias, ignore_conflicts=True)
+            pendientes.append(ruta_segura)
+        if len(pendientes) >= 500:
+            RutaSegura.objects.bulk_update(pendientes, ['ruta_rapida', 'ruta_segura'])
+            pendientes = []
+    RutaSegura.objects.bulk_update(pendientes, ['ruta_rapida', 'ruta_segura'])
+
+
+def restaurar_coordenadas(apps, schema_editor):
+    GeometriaRuta = apps.get_model('rappiSafe', 'GeometriaRuta')
+    RutaSegura = apps.get_model('rappiSafe', 'RutaSegura')
+
+    pendientes = []
+    for ruta_segura in RutaSegura.objects.only('ruta_rapida', 'ruta_segura').iterator(chunk_size=500):
+        rutas = [ruta for ruta in _rutas(ruta_segura) if 'geometria' in ruta]
+        if not rutas:
+            continue
+        geometrias = GeometriaRuta.objects.in_bulk({ruta['geometria'] for ruta in rutas})
+        for ruta in rutas:
+            geometria = geometrias.get(ruta.pop('geometria'))
+            ruta['coordenadas'] = decodificar_geometria(geometria.datos) if geometria else []
+        pendientes.append(ruta_segura)
+        if len(pendientes) >= 500:
+            RutaSegura.objects.bulk_update(pendientes, ['ruta_rapida', 'ruta_segura'])
+            pendientes = []
+    RutaSegura.objects.bulk_update(pendientes, ['ruta_rapida', 'ruta_segura'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rappiSafe', '0008_segmentotrayectoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeometriaRuta',
+            fields=[
+                ('huella', models.CharField(max_length=32, primary_key=True, serialize=False, verbose_name='Huella del contenido')),
+                ('num_puntos', models.PositiveIntegerField(verbose_name='Número de puntos')),
+                ('datos', models.BinaryField(verbose_name='Coordenadas codificadas')),
+                ('creado_en', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+            ],
+            options={
+                'verbose_name': 'Geometría de Ruta',
+                'verbose_name_plural': 'Geometrías de Rutas',
+            },
+        ),
+        migrations.RunPython(extraer_geometrias, restaurar_coordenadas),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rappiSafe', '0009_geometriaruta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rutasegura',
+            name='navegacion_finalizada_en',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Fin de navegación'),
+        ),
+        migrations.AddField(
+            model_name='rutasegura',
+            name='navegacion_iniciada_en',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Inicio de navegación'),
+        ),
+        migrations.AlterField(
+            model_name='rutasegura',
+            name='seleccionada',
+            field=models.CharField(choices=[('rapida', 'Rápida'), ('segura', 'Segura'), ('segura2', 'Segura alternativa')], max_length=10, verbose_name='Ruta seleccionada'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rappiSafe', '0010_rutasegura_navegacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacioncontacto',
+            name='disponible_en',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Disponible para enviar desde'),
+        ),
+        migrations.AddField(
+            model_name='notificacioncontacto',
+            name='intentos',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Intentos'),
+        ),
+        migrations.AddField(
+            model_name='notificacioncontacto',
+            name='procesado_en',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Procesado en'),
+        ),
+        migrations.AddField(
+            model_name='notificacioncontacto',
+            name='tomado_en',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Tomado en'),
+        ),
+        migrations.AddField(
+            model_name='notificacioncontacto',
+            name='tomado_por',
+            field=models.CharField(blank=True, max_length=32, verbose_name='Despachador'),
+        ),
+        migrations.AlterField(
+            model_name='notificacioncontacto',
+            name='metodo',
+            field=models.CharField(choices=[('sms', 'SMS'), ('whatsapp', 'WhatsApp'), ('llamada', 'Llamada'), ('telegram', 'Telegram'), ('email', 'Email'), ('simulado', 'Simulado')], default='sms', max_length=20, verbose_name='Método de notificación'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacioncontacto',
+            index=models.Index(fields=['estado', 'disponible_en'], name='notificacion_bandeja'),
+        ),
+    ]
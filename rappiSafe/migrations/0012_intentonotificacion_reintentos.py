@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rappiSafe', '0011_notificacioncontacto_bandeja'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificacioncontacto',
+            name='estado',
+            field=models.CharField(choices=[('enviado', 'Enviado'), ('entregado', 'Entregado'), ('fallido', 'Fallido'), ('pendiente', 'Pendiente'), ('reintento', 'Reintento programado')], default='pendiente', max_length=20, verbose_name='Estado'),
+        ),
+        migrations.CreateModel(
+            name='IntentoNotificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveSmallIntegerField(verbose_name='Número de intento')),
+                ('exitoso', models.BooleanField(default=False, verbose_name='Exitoso')),
+                ('error_mensaje', models.TextField(blank=True, verbose_name='Mensaje de error')),
+                ('respuesta_api', models.JSONField(blank=True, null=True, verbose_name='Respuesta del servicio')),
+                ('creado_en', models.DateTimeField(auto_now_add=True, verbose_name='Fecha del intento')),
+                ('notificacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial', to='rappiSafe.notificacioncontacto')),
+            ],
+            options={
+                'verbose_name': 'Intento de Notificación',
+                'verbose_name_plural': 'Intentos de Notificación',
+                'ordering': ['creado_en'],
+            },
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
+from django.utils import timezone
+from django.utils.functional import cached_property
 import uuid
 
 
@@ -120,7 +122,8 @@ class Trayectoria(models.Model):
     longitud = models.DecimalField(max_digits=9, decimal_places=6, verbose_name='Longitud')
     precision = models.FloatField(null=True, blank=True, verbose_name='Precisión (metros)')
     velocidad = models.FloatField(null=True, blank=True, verbose_name='Velocidad (m/s)')
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name='Fecha y hora')
+    # Default en lugar de auto_now_add para conservar la hora reportada por el cliente en lotes
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name='Fecha y hora')
 
     class Meta:
         verbose_name = 'Punto de Trayectoria'
@@ -131,6 +134,29 @@ class Trayectoria(models.Model):
         return f"Trayectoria de alerta {self.alerta.id} - {self.timestamp.strftime('%H:%M:%S')}"
 
 
+class SegmentoTrayectoria(models.Model):
+    """
+    Segmento compacto de la trayectoria de una alerta cerrada.
+    Los puntos se guardan codificados en binario (ver trayectorias.py).
+    """
+    alerta = models.ForeignKey(Alerta, on_delete=models.CASCADE, related_name='segmentos_trayectoria')
+    secuencia = models.PositiveIntegerField(verbose_name='Número de segmento')
+    inicio = models.DateTimeField(verbose_name='Primer punto')
+    fin = models.DateTimeField(verbose_name='Último punto')
+    num_puntos = models.PositiveIntegerField(verbose_name='Número de puntos')
+    datos = models.BinaryField(verbose_name='Puntos codificados')
+    creado_en = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de compactación')
+
+    class Meta:
+        verbose_name = 'Segmento de Trayectoria'
+        verbose_name_plural = 'Segmentos de Trayectoria'
+        ordering = ['alerta', 'secuencia']
+        unique_together = ['alerta', 'secuencia']
+
+    def __str__(self):
+        return f"Segmento {self.secuencia} de alerta {self.alerta_id} ({self.num_puntos} puntos)"
+
+
 class ContactoConfianza(models.Model):
     """
     Contactos de confianza de un repartidor
@@ -269,10 +295,43 @@ class SolicitudAyudaPsicologica(models.Model):
         return f"Solicitud {self.id} - {self.repartidor.get_full_name()} - {self.get_estado_display()}"
 
 
+class GeometriaRuta(models.Model):
+    """
+    Geometría de una ruta, guardada una sola vez aunque la usen muchas RutaSegura.
+    Las coordenadas se guardan codificadas en binario (ver geometrias.py).
+    """
+    huella = models.CharField(max_length=32, primary_key=True, verbose_name='Huella del contenido')
+    num_puntos = models.PositiveIntegerField(verbose_name='Número de puntos')
+    datos = models.BinaryField(verbose_name='Coordenadas codificadas')
+    creado_en = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')
+
+    class Meta:
+        verbose_name = 'Geometría de Ruta'
+        verbose_name_plural = 'Geometrías de Rutas'
+
+    def __str__(self):
+        return f"Geometría {self.huella[:8]} ({self.num_puntos} puntos)"
+
+    @cached_property
+    def coordenadas(self):
+        """Lista de [lat, lon], decodificada la primera vez que se pide"""
+        from .geometrias import decodificar_geometria
+        return decodificar_geometria(self.datos)
+
+
 class RutaSegura(models.Model):
     """
-    Rutas seguras calculadas y guardadas
+    Rutas seguras calculadas y guardadas.
+    Cada ruta referencia su geometría por huella ('geometria'), ver GeometriaRuta.
+    Mientras el repartidor navega la ruta seleccionada se vigila que no salga
+    de su corredor (ver corredor.py).
     """
+    SELECCIONES = (
+        ('rapida', 'Rápida'),
+        ('segura', 'Segura'),
+        ('segura2', 'Segura alternativa'),
+    )
+
     repartidor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='rutas', limit_choices_to={'rol': 'repartidor'})
     origen_lat = models.DecimalField(max_digits=9, decimal_places=6, verbose_name='Latitud origen')
     origen_lon = models.DecimalField(max_digits=9, decimal_places=6, verbose_name='Longitud origen')
@@ -282,7 +341,9 @@ class RutaSegura(models.Model):
     ruta_segura = models.JSONField(verbose_name='Datos de ruta segura')
     puntuacion_riesgo_rapida = models.FloatField(verbose_name='Riesgo ruta rápida')
     puntuacion_riesgo_segura = models.FloatField(verbose_name='Riesgo ruta segura')
-    seleccionada = models.CharField(max_length=10, choices=[('rapida', 'Rápida'), ('segura', 'Segura')], verbose_name='Ruta seleccionada')
+    seleccionada = models.CharField(max_length=10, choices=SELECCIONES, verbose_name='Ruta seleccionada')
+    navegacion_iniciada_en = models.DateTimeField(null=True, blank=True, verbose_name='Inicio de navegación')
+    navegacion_finalizada_en = models.DateTimeField(null=True, blank=True, verbose_name='Fin de navegación')
     creado_en = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de cálculo')
 
     class Meta:
@@ -293,15 +354,54 @@ class RutaSegura(models.Model):
     def __str__(self):
         return f"Ruta de {self.repartidor.get_full_name()} - {self.creado_en.strftime('%Y-%m-%d %H:%M')}"
 
+    def huellas_geometria(self):
+        rutas = [self.ruta_rapida, *self.ruta_segura.get('rutas', [])]
+        return [ruta['geometria'] for ruta in rutas if 'geometria' in ruta]
+
+    def rutas_con_coordenadas(self):
+        """
+        Ruta rápida y rutas seguras con sus coordenadas (una consulta para
+        todas las geometrías)
+
+        Returns:
+            (rapida, seguras) con el mismo formato que la respuesta de calcular_rutas
+        """
+        from .geometrias import cargar_geometrias, coordenadas_ruta
+
+        geometrias = cargar_geometrias(self.huellas_geometria())
+
+        def completar(ruta):
+            datos = {clave: valor for clave, valor in ruta.items() if clave != 'geometria'}
+            datos['coordenadas'] = coordenadas_ruta(ruta, geometrias)
+            return datos
+
+        return completar(self.ruta_rapida), [completar(ruta) for ruta in self.ruta_segura.get('rutas', [])]
+
+    def coordenadas_seleccionada(self):
+        """
+        Coordenadas de la ruta seleccionada ('segura' es la primera de las
+        seguras y 'segura2' la segunda)
+        """
+        rapida, seguras = self.rutas_con_coordenadas()
+        if self.seleccionada == 'rapida' or not seguras:
+            return rapida['coordenadas']
+        indice = 1 if self.seleccionada == 'segura2' and len(seguras) > 1 else 0
+        return seguras[indice]['coordenadas']
+
 
 class NotificacionContacto(models.Model):
     """
-    Registro de notificaciones enviadas a contactos de emergencia
+    Registro de notificaciones enviadas a contactos de emergencia.
+    También es la bandeja de salida: las alertas crean filas 'pendiente' que
+    los despachadores toman y envían (ver notificaciones.py).
     """
     METODOS = (
         ('sms', 'SMS'),
         ('whatsapp', 'WhatsApp'),
         ('llamada', 'Llamada'),
+        ('telegram', 'Telegram'),
+        ('email', 'Email'),
+        ('simulado', 'Simulado'),
     )
 
     ESTADOS = (
@@ -309,6 +409,7 @@ class NotificacionContacto(models.Model):
         ('entregado', 'Entregado'),
         ('fallido', 'Fallido'),
         ('pendiente', 'Pendiente'),
+        ('reintento', 'Reintento programado'),
     )
 
     alerta = models.ForeignKey(Alerta, on_delete=models.CASCADE, related_name='notificaciones_contactos')
@@ -320,10 +421,42 @@ class NotificacionContacto(models.Model):
     enviado_en = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de envío')
     error_mensaje = models.TextField(blank=True, verbose_name='Mensaje de error')
 
+    # Bandeja de salida: un despachador toma la fila por un tiempo limitado
+    # (si se cae, otro la vuelve a tomar al vencer el plazo)
+    intentos = models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')
+    disponible_en = models.DateTimeField(default=timezone.now, verbose_name='Disponible para enviar desde')
+    tomado_por = models.CharField(max_length=32, blank=True, verbose_name='Despachador')
+    tomado_en = models.DateTimeField(null=True, blank=True, verbose_name='Tomado en')
+    procesado_en = models.DateTimeField(null=True, blank=True, verbose_name='Procesado en')
+
     class Meta:
         verbose_name = 'Notificación a Contacto'
         verbose_name_plural = 'Notificaciones a Contactos'
         ordering = ['-enviado_en']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en'], name='notificacion_bandeja'),
+        ]
 
     def __str__(self):
         return f"Notificación a {self.contacto.nombre} - {self.get_metodo_display()}"
+
+
+class IntentoNotificacion(models.Model):
+    """
+    Cada intento de envío de una notificación a contacto (el primero y los
+    reintentos), para el historial que ve el operador en la alerta
+    """
+    notificacion = models.ForeignKey(NotificacionContacto, on_delete=models.CASCADE, related_name='historial')
+    numero = models.PositiveSmallIntegerField(verbose_name='Número de intento')
+    exitoso = models.BooleanField(default=False, verbose_name='Exitoso')
+    error_mensaje = models.TextField(blank=True, verbose_name='Mensaje de error')
+    respuesta_api = models.JSONField(null=True, blank=True, verbose_name='Respuesta del servicio')
+    creado_en = models.DateTimeField(auto_now_add=True, verbose_name='Fecha del intento')
+
+    class Meta:
+        verbose_name = 'Intento de Notificación'
+        verbose_name_plural = 'Intentos de Notificación'
+        ordering = ['creado_en']
+
+    def __str__(self):
+        return f"Intento {self.numero} de {self.notificacion}"
@@ -0,0 +1,492 @@
+"""
+Bandeja de salida (outbox) de notificaciones a contactos de emergencia.
+
+Crear una alerta solo inserta una fila NotificacionContacto 'pendiente' por
+contacto validado, en la misma petición y con un solo bulk_create; el envío
+por SMS, Telegram y email (cada uno con timeouts de hasta 10 s) lo hacen
+después los despachadores, así que el botón de pánico responde sin esperar
+a ningún proveedor.
+
+Cada fila es un envío: un contacto por un canal (SMS, Telegram o email).
+Un despachador toma tantas filas como hilos tiene, marcándolas con su
+identificador y la hora (tomado_por / tomado_en) en un solo UPDATE
+condicional, de modo que dos despachadores nunca envían la misma fila. Los
+envíos del lote salen todos a la vez, cada uno con un plazo (PLAZO_S): el
+lote tarda lo que el envío más lento, no la suma de todos, y los resultados
+se guardan con un solo UPDATE. Los SMS de una misma alerta van juntos en una
+petición a Mocean (cliente_sms.py) y cada fila recibe el resultado de su
+número. Si un despachador se cae a mitad del envío, la fila vuelve a estar
+disponible cuando vence ARRENDAMIENTO_S y otro la reintenta, hasta
+MAX_INTENTOS veces. Los envíos que fallan se reprograman con espera
+exponencial (reintentos.py) y cada intento queda en IntentoNotificacion; los
+despachadores también toman los reintentos vencidos, así que ninguno se
+pierde aunque se reinicie el proceso que lo programó.
+
+Formas de ejecutarlo:
+
+- `python manage.py despachar_notificaciones` como proceso aparte (un pool de
+  HILOS hilos vaciando la bandeja; revisa la tabla cada INTERVALO_S)
+- el despachador dentro del proceso web (NOTIFICACIONES['EN_PROCESO']), que
+  se despierta en cuanto se encola una alerta; es el respaldo para que las
+  notificaciones salgan aunque no haya un proceso aparte corriendo
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, JSONField, Q, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ASUNTO_EMAIL = '🚨 ALERTA DE EMERGENCIA - RAPPI SAFE'
+MAX_HILOS_ENVIO = 32
+
+
+def plazo_envio():
+    """Segundos que se espera a cada envío antes de darlo por fallido"""
+    return getattr(settings, 'NOTIFICACIONES', {}).get('PLAZO_S', 8.0)
+
+
+def canales_contacto(contacto):
+    """Canales por los que se puede avisar a un contacto, en orden de prioridad"""
+    canales = ['sms'] if contacto.telefono else []
+    if contacto.telegram_id:
+        canales.append('telegram')
+    if contacto.email:
+        canales.append('email')
+    return canales
+
+
+def enviar_por_canal(canal, contacto, mensaje, plazo_s=None):
+    """
+    Un envío a un contacto por un canal
+
+    Returns:
+        dict: {'success': bool, 'respuesta': dict, 'error': str}
+    """
+    from .utils import enviar_email, enviar_sms_mocean, enviar_telegram
+
+    if canal == 'sms':
+        return enviar_sms_mocean(contacto.telefono, mensaje, timeout=plazo_s)
+    if canal == 'telegram':
+        return enviar_telegram(contacto.telegram_id, mensaje, timeout=plazo_s)
+    if canal == 'email':
+        return enviar_email(contacto.email, ASUNTO_EMAIL, mensaje, timeout=plazo_s or 10)
+    return {'success': False, 'error': f'Canal no soportado: {canal}'}
+
+
+def _enviar_uno(canal, contacto, mensaje, plazo_s):
+    return [enviar_por_canal(canal, contacto, mensaje, plazo_s)]
+
+
+def _enviar_sms_lote(contactos, mensaje, plazo_s):
+    from .utils import enviar_sms_mocean_lote
+
+    return enviar_sms_mocean_lote([contacto.telefono for contacto in contactos], mensaje, timeout=plazo_s)
+
+
+def enviar_en_paralelo(envios, plazo_s, pool=None):
+    """
+    Hacer todos los envíos a la vez y esperar como mucho plazo_s.
+
+    Los SMS con el mismo mensaje (los contactos de una alerta) salen en una
+    sola petición a Mocean; su resultado se reparte por contacto.
+
+    Un envío que no termina en el plazo se da por fallido con
+    'sin_respuesta': su hilo sigue hasta el timeout del proveedor y todavía
+    puede entregarlo, así que su reintento espera más (ver
+    ProgramadorReintentos.planificar). Con un pool propio, los envíos que
+    ni siquiera empezaron se cancelan y quedan como None para devolverlos a
+    la bandeja.
+
+    Args:
+        envios: lista de (canal, contacto, mensaje)
+        pool: ThreadPoolExecutor a usar; sin él se crea uno con un hilo por envío
+
+    Returns:
+        lista de resultados en el orden de envios
+    """
+    if not envios:
+        return []
+
+    # (posiciones en envios, función que devuelve un resultado por posición, argumentos)
+    tareas = []
+    sms_por_mensaje = {}
+    for posicion, (canal, contacto, mensaje) in enumerate(envios):
+        if canal == 'sms':
+            sms_por_mensaje.setdefault(mensaje, []).append(posicion)
+        else:
+            tareas.append(([posicion], _enviar_uno, (canal, contacto, mensaje, plazo_s)))
+    for mensaje, posiciones in sms_por_mensaje.items():
+        tareas.append((posiciones, _enviar_sms_lote, ([envios[i][1] for i in posiciones], mensaje, plazo_s)))
+
+    propio = pool is None
+    if propio:
+        pool = ThreadPoolExecutor(max_workers=min(len(tareas), MAX_HILOS_ENVIO), thread_name_prefix='envio')
+    try:
+        futuros = [pool.submit(funcion, *argumentos) for _, funcion, argumentos in tareas]
+        wait(futuros, timeout=plazo_s)
+    finally:
+        if propio:
+            pool.shutdown(wait=False)
+
+    resultados = [None] * len(envios)
+    for (posiciones, _, _), futuro in zip(tareas, futuros):
+        if futuro.cancel():
+            por_posicion = [None if not propio else {'success': False, 'error': 'No se alcanzó a intentar'}]
+        elif not futuro.done():
+            por_posicion = [{'success': False, 'sin_respuesta': True, 'error': f'Sin respuesta en {plazo_s:g} s'}]
+        elif futuro.exception() is not None:
+            por_posicion = [{'success': False, 'error': str(futuro.exception())}]
+        else:
+            por_posicion = futuro.result()
+        if len(por_posicion) == 1:
+            # Un error de la tarea completa vale para todos sus envíos
+            por_posicion = por_posicion * len(posiciones)
+        for posicion, resultado in zip(posiciones, por_posicion):
+            resultados[posicion] = resultado
+    return resultados
+
+
+def encolar_notificaciones(alerta):
+    """
+    Dejar en la bandeja un envío por cada canal de cada contacto validado
+    del repartidor y despertar al despachador del proceso.
+
+    Returns:
+        dict: {'success': bool, 'contactos_notificados': int, 'mensaje': str}
+    """
+    from .models import ContactoConfianza, NotificacionContacto
+    from .utils import mensaje_alerta_contactos
+
+    contactos = list(
+        ContactoConfianza.objects.filter(repartidor=alerta.repartidor, validado=True)
+        .only('id', 'telefono', 'telegram_id', 'email')
+    )
+    if not contactos:
+        return {
+            'success': False,
+            'contactos_notificados': 0,
+            'mensaje': 'No hay contactos de emergencia validados'
+        }
+
+    mensaje = mensaje_alerta_contactos(alerta)
+    ahora = timezone.now()
+    envios = NotificacionContacto.objects.bulk_create([
+        NotificacionContacto(
+            alerta=alerta, contacto=contacto, metodo=canal, estado='pendiente', mensaje=mensaje, disponible_en=ahora
+        )
+        for contacto in contactos
+        for canal in canales_contacto(contacto)
+    ])
+    transaction.on_commit(despachador_notificaciones.avisar)
+    return {
+        'success': True,
+        'contactos_notificados': len(contactos),
+        'mensaje': f'{len(envios)} envío(s) a {len(contactos)} contacto(s) en cola'
+    }
+
+
+def reencolar_fallidas(alerta):
+    """
+    Volver a poner en la bandeja, para que salgan ya, solo los envíos de la
+    alerta que fallaron o esperan su reintento; los que ya se enviaron no se
+    repiten. Si la alerta aún no tiene envíos, se encolan como al crearla.
+
+    Returns:
+        dict: {'success': bool, 'notificaciones_reencoladas': int, 'detalles': list, 'mensaje': str}
+    """
+    from .models import NotificacionContacto
+
+    envios = NotificacionContacto.objects.filter(alerta=alerta)
+    if not envios.exists():
+        resultado = encolar_notificaciones(alerta)
+        return {**resultado, 'notificaciones_reencoladas': 0, 'detalles': []}
+
+    fallidas = list(
+        envios.filter(estado__in=['fallido', 'reintento'])
+        .values_list('pk', 'contacto__nombre', 'metodo')
+        .order_by('contacto__nombre', 'metodo')
+    )
+    # Condicional: una fila que el programador de reintentos tomó entre medias ya no cuenta
+    reencoladas = NotificacionContacto.objects.filter(
+        pk__in=[pk for pk, _, _ in fallidas], estado__in=['fallido', 'reintento']
+    ).update(estado='pendiente', disponible_en=timezone.now(), tomado_por='', tomado_en=None)
+    if reencoladas:
+        transaction.on_commit(despachador_notificaciones.avisar)
+    return {
+        'success': True,
+        'notificaciones_reencoladas': reencoladas,
+        'detalles': [{'contacto': nombre, 'metodo': metodo} for _, nombre, metodo in fallidas],
+        'mensaje': f'{reencoladas} envío(s) fallido(s) de vuelta en la cola' if reencoladas
+        else 'No hay envíos fallidos que reenviar',
+    }
+
+
+def guardar_resultados(notificaciones, resultados, tomado_por):
+    """
+    Guardar el resultado de notificaciones tomadas por 'tomado_por' con un
+    solo UPDATE (solo las filas que sigue teniendo), registrar cada intento
+    en el historial y programar el reintento de las que fallaron.
+
+    Args:
+        notificaciones: NotificacionContacto tomadas, con su intento ya contado
+        resultados: un resultado por notificación; None si no se alcanzó a intentar
+
+    Returns:
+        tuple: (enviadas, fallidas, sin intentar)
+    """
+    from .models import IntentoNotificacion, NotificacionContacto
+    from .reintentos import programador_reintentos
+
+    terminados = {
+        notificacion.pk: (notificacion, resultado)
+        for notificacion, resultado in zip(notificaciones, resultados)
+        if resultado is not None
+    }
+
+    # Las que no alcanzaron hilo vuelven a la bandeja sin gastar un intento
+    sin_intentar = [notificacion.pk for notificacion in notificaciones if notificacion.pk not in terminados]
+    if sin_intentar:
+        NotificacionContacto.objects.filter(pk__in=sin_intentar, tomado_por=tomado_por).update(
+            tomado_por='', tomado_en=None, intentos=F('intentos') - 1,
+        )
+    if not terminados:
+        return 0, 0, len(sin_intentar)
+
+    IntentoNotificacion.objects.bulk_create([
+        IntentoNotificacion(
+            notificacion=notificacion,
+            numero=notificacion.intentos,
+            exitoso=resultado['success'],
+            error_mensaje=resultado.get('error', ''),
+            respuesta_api=resultado.get('respuesta'),
+        )
+        for notificacion, resultado in terminados.values()
+    ])
+    reintentos = programador_reintentos.planificar(
+        [notificacion for notificacion, resultado in terminados.values() if not resultado['success']],
+        sin_respuesta={pk for pk, (_, resultado) in terminados.items() if resultado.get('sin_respuesta')},
+    )
+
+    def estado(pk, resultado):
+        if resultado['success']:
+            return 'enviado'
+        return 'reintento' if pk in reintentos else 'fallido'
+
+    def por_envio(valor, campo):
+        casos = [
+            When(pk=pk, then=Value(valor(pk, resultado), output_field=campo))
+            for pk, (_, resultado) in terminados.items()
+        ]
+        return Case(*casos, output_field=campo)
+
+    campo = NotificacionContacto._meta.get_field
+    cambios = {
+        'estado': por_envio(estado, campo('estado')),
+        'respuesta_api': por_envio(lambda pk, resultado: resultado.get('respuesta'), JSONField()),
+        'error_mensaje': por_envio(lambda pk, resultado: resultado.get('error', ''), campo('error_mensaje')),
+        'tomado_por': '',
+        'procesado_en': timezone.now(),
+    }
+    if reintentos:
+        cambios['disponible_en'] = Case(
+            *[When(pk=pk, then=Value(disponible_en, output_field=campo('disponible_en')))
+              for pk, disponible_en in reintentos.items()],
+            default=F('disponible_en'),
+        )
+    NotificacionContacto.objects.filter(pk__in=list(terminados), tomado_por=tomado_por).update(**cambios)
+    if reintentos:
+        # Al confirmar la transacción: antes el hilo no vería las filas en 'reintento'
+        transaction.on_commit(lambda: programador_reintentos.programar(reintentos))
+
+    enviados = sum(1 for _, resultado in terminados.values() if resultado['success'])
+    return enviados, len(terminados) - enviados, len(sin_intentar)
+
+
+class DespachadorNotificaciones:
+    """
+    Toma envíos pendientes de la bandeja y los hace a la vez con un pool de hilos
+    """
+
+    def __init__(self, hilos=16, plazo_s=8.0, arrendamiento_s=120.0, max_intentos=5, intervalo_s=1.0,
+                 en_proceso=True):
+        self.hilos = hilos
+        self.plazo_s = plazo_s
+        self.arrendamiento_s = arrendamiento_s
+        self.max_intentos = max_intentos
+        self.intervalo_s = intervalo_s
+        self.en_proceso = en_proceso
+        self.identificador = uuid.uuid4().hex
+        self._pool = None
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+
+        self.total_enviadas = 0
+        self.total_fallidas = 0
+        self.total_agotadas = 0
+        self.total_errores = 0
+
+    def tomar(self, cantidad=None):
+        """
+        Reservar hasta 'cantidad' notificaciones listas para enviar
+
+        Returns:
+            lista de NotificacionContacto con contacto y alerta cargados
+        """
+        from .models import NotificacionContacto
+
+        ahora = timezone.now()
+        libres = Q(estado='pendiente') & (
+            Q(tomado_en__isnull=True) | Q(tomado_en__lt=ahora - timedelta(seconds=self.arrendamiento_s))
+        )
+        # Los reintentos vencidos también: la tabla es la que manda y el heap de
+        # reintentos.py solo hace que salgan a tiempo sin esperar a la pasada
+        listas = (libres | Q(estado='reintento')) & Q(disponible_en__lte=ahora)
+
+        # Las que se tomaron max_intentos veces sin terminar no se reintentan más
+        # (las que el operador reencoló no tienen arrendamiento y sí salen)
+        abandonadas = Q(estado='pendiente', tomado_en__lt=ahora - timedelta(seconds=self.arrendamiento_s))
+        agotadas = NotificacionContacto.objects.filter(abandonadas, intentos__gte=self.max_intentos).update(
+            estado='fallido',
+            error_mensaje='Se agotaron los intentos de envío',
+            tomado_por='',
+            procesado_en=ahora,
+        )
+        self.total_agotadas += agotadas
+
+        candidatas = (
+            NotificacionContacto.objects
+            .filter(listas)
+            .order_by('disponible_en')
+            .values('pk')[:cantidad or self.hilos]
+        )
+        # La condición se repite fuera de la subconsulta: si otro despachador
+        # (o el programador de reintentos) tomó la fila entre medias, el UPDATE
+        # ya no la incluye
+        tomadas = NotificacionContacto.objects.filter(listas, pk__in=candidatas).update(
+            estado='pendiente',
+            tomado_por=self.identificador,
+            tomado_en=ahora,
+            intentos=F('intentos') + 1,
+        )
+        if not tomadas:
+            return []
+        return list(
+            NotificacionContacto.objects
+            .filter(estado='pendiente', tomado_por=self.identificador, tomado_en=ahora)
+            .select_related('contacto', 'alerta')
+        )
+
+    def enviar(self, notificaciones):
+        """
+        Hacer a la vez los envíos tomados y guardar todos los resultados
+
+        Returns:
+            int: envíos que salieron
+        """
+        resultados = enviar_en_paralelo(
+            [(notificacion.metodo, notificacion.contacto, notificacion.mensaje) for notificacion in notificaciones],
+            self.plazo_s,
+            pool=self._obtener_pool(),
+        )
+        enviados, fallidos, _ = guardar_resultados(notificaciones, resultados, self.identificador)
+        self.total_enviadas += enviados
+        self.total_fallidas += fallidos
+        return enviados
+
+    def despachar(self):
+        """
+        Vaciar la bandeja: tomar lotes y enviarlos hasta que no quede nada listo
+
+        Returns:
+            int: envíos procesados
+        """
+        procesadas = 0
+        while True:
+            notificaciones = self.tomar()
+            if not notificaciones:
+                return procesadas
+            self.enviar(notificaciones)
+            procesadas += len(notificaciones)
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='notificaciones')
+        return self._pool
+
+    def ejecutar(self):
+        """
+        Despachar hasta que se llame a detener(); entre pasadas espera
+        intervalo_s o a que avisar() lo despierte
+        """
+        while not self._detener.is_set():
+            try:
+                self.despachar()
+            except Exception:
+                self.total_errores += 1
+                logger.exception('Error al despachar notificaciones')
+            finally:
+                close_old_connections()
+            self._despertar.wait(self.intervalo_s)
+            self._despertar.clear()
+
+    def avisar(self):
+        """
+        Hay notificaciones nuevas: arrancar el hilo del proceso si hace falta
+        y despertarlo
+        """
+        if not self.en_proceso:
+            return
+        if self._hilo is None:
+            with self._lock:
+                if self._hilo is None:
+                    self._hilo = threading.Thread(target=self.ejecutar, name='despachador-notificaciones', daemon=True)
+                    self._hilo.start()
+        self._despertar.set()
+
+    def detener(self):
+        """Pedir que ejecutar() termine después del lote en curso"""
+        self._detener.set()
+        self._despertar.set()
+
+    def cerrar(self):
+        self.detener()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def estadisticas(self):
+        return {
+            'hilos': self.hilos,
+            'plazo_s': self.plazo_s,
+            'en_proceso': self.en_proceso,
+            'enviadas': self.total_enviadas,
+            'fallidas': self.total_fallidas,
+            'agotadas': self.total_agotadas,
+            'errores': self.total_errores,
+        }
+
+
+def _crear_despachador():
+    configuracion = getattr(settings, 'NOTIFICACIONES', {})
+    return DespachadorNotificaciones(
+        hilos=configuracion.get('HILOS', 16),
+        plazo_s=configuracion.get('PLAZO_S', 8.0),
+        arrendamiento_s=configuracion.get('ARRENDAMIENTO_S', 120.0),
+        max_intentos=configuracion.get('MAX_INTENTOS', 5),
+        intervalo_s=configuracion.get('INTERVALO_S', 1.0),
+        en_proceso=configuracion.get('EN_PROCESO', True),
+    )
+
+
+# Despachador único por proceso
+despachador_notificaciones = _crear_despachador()
@@ -0,0 +1,412 @@
+"""
+Planificador de entregas con varias paradas.
+
+Un repartidor con varios pedidos necesita saber en qué orden visitarlos.
+planificar_entrega() lo resuelve en tres pasos:
+
+1. Matriz de costos N×N entre origen y paradas con matriz() del backend de
+   ruteo (una consulta /table de OSRM o Dijkstra de uno a muchos sobre el
+   grafo local). El costo es tiempo + λ·exposición, igual que en las rutas
+   seguras: con el grafo local la exposición es la del camino real; con OSRM
+   se aproxima con la del segmento en línea recta entre paradas. Cada par se
+   guarda en la caché de rutas, así que al replanificar (nueva ubicación,
+   una parada menos) solo se calculan las filas que faltan.
+2. Orden de visita con una heurística: inserción más cercana y después 2-opt
+   y Or-opt (mover tramos de 1 a 3 paradas) hasta que ningún movimiento
+   mejore, repetido desde unas cuantas perturbaciones (doble puente) del
+   mejor recorrido. La matriz es asimétrica (sentidos de las calles), así
+   que los deltas de 2-opt usan sumas acumuladas de los costos en ambos
+   sentidos; cada pasada evalúa todos los movimientos de una vez con NumPy.
+3. Ruta cosida: cada tramo sale de la misma caché de rutas que usa
+   calcular_rutas (se comparten entradas) y se elige la alternativa con
+   menor tiempo + λ·exposición.
+
+El recorrido es un camino abierto desde el origen; con regresar=True termina
+de nuevo en el origen. Internamente ambos casos son un camino con extremos
+fijos: se agrega un nodo final que es una copia del origen (regresar) o un
+nodo ficticio al que se llega gratis desde cualquier parada.
+"""
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+COSTO_SIN_CAMINO = 1e9  # Segundos equivalentes de un par sin camino
+CRITERIOS = ('rapida', 'balanceada', 'segura')
+TOLERANCIA = 1e-6
+
+
+def lambda_criterio(criterio):
+    """
+    λ de un criterio: 'rapida' usa el primero de RIESGO_LAMBDAS, 'balanceada'
+    el segundo y 'segura' el último
+    """
+    lambdas = tuple(getattr(settings, 'RIESGO_LAMBDAS', (0, 5, 20)))
+    indice = {'rapida': 0, 'balanceada': min(1, len(lambdas) - 1), 'segura': len(lambdas) - 1}[criterio]
+    return float(lambdas[indice])
+
+
+# ==================== MATRIZ DE COSTOS ====================
+
+def _perfil_matriz(backend, lambda_riesgo):
+    from .riesgo import raster_riesgo
+
+    if backend.soporta_riesgo:
+        return f'matriz/{backend.nombre}/{raster_riesgo.version_vigente()}/{lambda_riesgo:g}'
+    return f'matriz/{backend.nombre}'
+
+
+def exposicion_rectas(puntos):
+    """
+    Exposición al riesgo del segmento en línea recta entre cada par de
+    puntos, para backends que no conocen el riesgo
+
+    Returns:
+        ndarray N×N (riesgo x km)
+    """
+    from .puntuacion_lote import puntuar_rutas_lote
+
+    n = len(puntos)
+    pares = [(i, j) for i in range(n) for j in range(n) if i != j]
+    exposicion = np.zeros((n, n))
+    riesgos = puntuar_rutas_lote([[list(puntos[i]), list(puntos[j])] for i, j in pares])
+    for (i, j), riesgo in zip(pares, riesgos):
+        exposicion[i, j] = riesgo['exposicion']
+    return exposicion
+
+
+def matriz_costos(backend, puntos, lambda_riesgo=0.0, hasta_origen=True):
+    """
+    Matriz de costos (segundos + λ·exposición) entre puntos, leyendo de la
+    caché de rutas los pares ya calculados
+
+    Args:
+        hasta_origen: si hacen falta los costos de volver al punto 0; sin
+            ellos, un origen nuevo solo agrega su fila
+
+    Returns:
+        dict con 'success', 'costos' (ndarray N×N, inf sin camino) y
+        'filas_calculadas'
+    """
+    from .cache_rutas import _AUSENTE, cache_rutas
+
+    n = len(puntos)
+    perfil = _perfil_matriz(backend, lambda_riesgo)
+    claves = [[cache_rutas.clave(*puntos[i], *puntos[j], perfil=perfil) for j in range(n)] for i in range(n)]
+    costos = np.zeros((n, n))
+
+    fuentes = []
+    primera_columna = 0 if hasta_origen else 1
+    for i in range(n):
+        for j in range(primera_columna, n):
+            if i == j:
+                continue
+            valor = cache_rutas.backend.obtener(claves[i][j])
+            if valor is _AUSENTE:
+                fuentes.append(i)
+                break
+            costos[i, j] = valor
+
+    if fuentes:
+        resultado = backend.matriz(puntos, fuentes, lambda_riesgo)
+        if not resultado.get('success'):
+            return resultado
+        for i, fila in zip(fuentes, resultado['costos']):
+            costos[i] = fila
+            for j in range(n):
+                if j != i:
+                    cache_rutas.backend.guardar(claves[i][j], float(costos[i, j]), cache_rutas.ttl)
+        np.fill_diagonal(costos, 0)
+
+    if lambda_riesgo and not backend.soporta_riesgo:
+        costos = costos + lambda_riesgo * exposicion_rectas(puntos)
+    return {'success': True, 'costos': costos, 'filas_calculadas': len(fuentes)}
+
+
+# ==================== ORDEN DE VISITA ====================
+
+def _matriz_extendida(costos, regresar):
+    """
+    Agregar el nodo final fijo: copia del origen si se regresa, o un nodo
+    al que se llega gratis desde cualquier parada si no
+    """
+    n = len(costos)
+    extendida = np.full((n + 1, n + 1), COSTO_SIN_CAMINO)
+    extendida[:n, :n] = np.where(np.isfinite(costos), costos, COSTO_SIN_CAMINO)
+    extendida[:n, n] = extendida[:n, 0] if regresar else 0.0
+    extendida[n, n] = 0.0
+    return extendida
+
+
+def costo_camino(matriz, camino):
+    camino = np.asarray(camino)
+    return float(matriz[camino[:-1], camino[1:]].sum())
+
+
+def insercion_mas_cercana(matriz):
+    """
+    Camino inicial de 0 al último nodo: se agrega la parada más cercana a
+    las ya visitadas, en la posición donde menos alarga el camino
+    """
+    final = len(matriz) - 1
+    camino = [0, final]
+    pendientes = np.ones(len(matriz), dtype=bool)
+    pendientes[[0, final]] = False
+    cercania = matriz[0].copy()
+
+    while pendientes.any():
+        candidatos = np.flatnonzero(pendientes)
+        k = int(candidatos[np.argmin(cercania[candidatos])])
+        anteriores, siguientes = np.asarray(camino[:-1]), np.asarray(camino[1:])
+        aumento = matriz[anteriores, k] + matriz[k, siguientes] - matriz[anteriores, siguientes]
+        camino.insert(int(np.argmin(aumento)) + 1, k)
+        pendientes[k] = False
+        cercania = np.minimum(cercania, np.minimum(matriz[k], matriz[:, k]))
+    return camino
+
+
+def _mejor_2opt(matriz, camino):
+    """
+    Mejor inversión de un tramo camino[i..j] (extremos fijos)
+
+    Returns:
+        (delta, i, j) o None si ninguna inversión mejora
+    """
+    camino = np.asarray(camino)
+    m = len(camino)
+    if m < 4:
+        return None
+    # Costos acumulados del camino hacia adelante y recorrido al revés
+    adelante = np.concatenate(([0.0], np.cumsum(matriz[camino[:-1], camino[1:]])))
+    reves = np.concatenate(([0.0], np.cumsum(matriz[camino[1:], camino[:-1]])))
+
+    i = np.arange(1, m - 1)[:, None]
+    j = np.arange(1, m - 1)[None, :]
+    delta = (
+        matriz[camino[i - 1], camino[j]] + matriz[camino[i], camino[j + 1]]
+        - matriz[camino[i - 1], camino[i]] - matriz[camino[j], camino[j + 1]]
+        + (reves[j] - reves[i]) - (adelante[j] - adelante[i])
+    )
+    delta = np.where(j > i, delta, np.inf)
+    mejor = np.unravel_index(np.argmin(delta), delta.shape)
+    if delta[mejor] >= -TOLERANCIA:
+        return None
+    return float(delta[mejor]), int(mejor[0]) + 1, int(mejor[1]) + 1
+
+
+def _mejor_or_opt(matriz, camino, max_tramo=3):
+    """
+    Mejor traslado de un tramo de 1 a max_tramo paradas a otra posición
+
+    Returns:
+        (delta, inicio, largo, destino) o None; el tramo se inserta entre
+        camino[destino] y camino[destino + 1]
+    """
+    camino = np.asarray(camino)
+    m = len(camino)
+    mejor = None
+    posiciones = np.arange(m - 1)
+    for largo in range(1, max_tramo + 1):
+        for inicio in range(1, m - 1 - largo + 1):
+            fin = inicio + largo - 1
+            primero, ultimo = camino[inicio], camino[fin]
+            antes, despues = camino[inicio - 1], camino[fin + 1]
+            quitar = matriz[antes, despues] - matriz[antes, primero] - matriz[ultimo, despues]
+
+            a, b = camino[posiciones], camino[posiciones + 1]
+            delta = quitar + matriz[a, primero] + matriz[ultimo, b] - matriz[a, b]
+            delta[inicio - 1:fin + 1] = np.inf  # Posiciones dentro o junto al tramo
+            destino = int(np.argmin(delta))
+            if delta[destino] < -TOLERANCIA and (mejor is None or delta[destino] < mejor[0]):
+                mejor = (float(delta[destino]), inicio, largo, destino)
+    return mejor
+
+
+def busqueda_local(matriz, camino, max_iteraciones=1000):
+    """
+    Aplicar el mejor movimiento 2-opt (u Or-opt si no hay) hasta que
+    ninguno mejore
+    """
+    camino = list(camino)
+    for _ in range(max_iteraciones):
+        movimiento = _mejor_2opt(matriz, camino)
+        if movimiento is not None:
+            _, i, j = movimiento
+            camino[i:j + 1] = camino[i:j + 1][::-1]
+            continue
+        movimiento = _mejor_or_opt(matriz, camino)
+        if movimiento is None:
+            break
+        _, inicio, largo, destino = movimiento
+        tramo = camino[inicio:inicio + largo]
+        resto = camino[:inicio] + camino[inicio + largo:]
+        posicion = destino + 1 if destino < inicio else destino + 1 - largo
+        camino = resto[:posicion] + tramo + resto[posicion:]
+    return camino
+
+
+def perturbar(camino, rnd):
+    """
+    Doble puente: cortar las paradas en cuatro tramos A B C D y unirlas como
+    A C B D, un cambio que 2-opt y Or-opt no deshacen en un paso. Con pocas
+    paradas se barajan.
+    """
+    interior = camino[1:-1]
+    if len(interior) < 8:
+        rnd.shuffle(interior)
+        return [camino[0], *interior, camino[-1]]
+    a, b, c = sorted(rnd.sample(range(1, len(interior)), 3))
+    return [camino[0], *interior[:a], *interior[b:c], *interior[a:b], *interior[c:], camino[-1]]
+
+
+def resolver_orden(costos, regresar=False, perturbaciones=None, semilla=0):
+    """
+    Orden de visita de las paradas (índices 1..N-1 de la matriz):
+    inserción más cercana, búsqueda local y unas cuantas perturbaciones
+    (búsqueda local iterada) quedándose con el mejor recorrido. La semilla
+    es fija para que la misma matriz dé siempre el mismo orden.
+
+    Returns:
+        (orden, costo): índices de la matriz en orden de visita, sin el
+        origen, y costo total del recorrido
+    """
+    n = len(costos)
+    if n <= 1:
+        return [], 0.0
+    if perturbaciones is None:
+        perturbaciones = getattr(settings, 'PLANIFICADOR', {}).get('PERTURBACIONES', 10)
+    matriz = _matriz_extendida(np.asarray(costos, dtype=np.float64), regresar)
+    mejor = busqueda_local(matriz, insercion_mas_cercana(matriz))
+    mejor_costo = costo_camino(matriz, mejor)
+
+    rnd = random.Random(semilla)
+    for _ in range(perturbaciones if n > 3 else 0):
+        candidato = busqueda_local(matriz, perturbar(mejor, rnd))
+        costo = costo_camino(matriz, candidato)
+        if costo < mejor_costo - TOLERANCIA:
+            mejor, mejor_costo = candidato, costo
+
+    return mejor[1:-1], mejor_costo
+
+
+# ==================== RUTA COSIDA ====================
+
+def _tramo(backend, origen, destino):
+    """Rutas de un tramo desde la caché compartida con calcular_rutas"""
+    from .cache_rutas import cache_rutas
+    from .utils import _consulta_rutas
+
+    calcular, perfil = _consulta_rutas(backend, *origen, *destino)
+    return cache_rutas.obtener_o_calcular(*origen, *destino, calcular, perfil=perfil)
+
+
+def coser_tramos(backend, puntos, secuencia, lambda_riesgo):
+    """
+    Pedir la ruta de cada tramo de la secuencia y unirlas
+
+    Returns:
+        dict con 'success', 'ruta' (coordenadas, distancia km, duración min,
+        puntuación y exposición de riesgo) y 'tramos'
+    """
+    from .puntuacion_lote import puntuar_rutas_lote
+
+    pares = list(zip(secuencia, secuencia[1:]))
+    hilos = getattr(settings, 'PLANIFICADOR', {}).get('HILOS_TRAMOS', 8)
+    with ThreadPoolExecutor(max_workers=max(1, min(hilos, len(pares)))) as pool:
+        resultados = list(pool.map(lambda par: _tramo(backend, puntos[par[0]], puntos[par[1]]), pares))
+    for (origen, destino), resultado in zip(pares, resultados):
+        if not resultado.get('success'):
+            return {'success': False, 'error': f'No se encontró ruta entre los puntos {origen} y {destino}'}
+
+    # Todas las alternativas de todos los tramos en una sola pasada sobre el raster
+    candidatas = [ruta for resultado in resultados for ruta in resultado['rutas']]
+    riesgos = iter(puntuar_rutas_lote([ruta['coordenadas'] for ruta in candidatas]))
+
+    tramos, coordenadas = [], []
+    for (origen, destino), resultado in zip(pares, resultados):
+        puntuadas = [(ruta, next(riesgos)) for ruta in resultado['rutas']]
+        ruta, riesgo = min(
+            puntuadas, key=lambda par: par[0]['duracion'] * 60 + lambda_riesgo * par[1]['exposicion']
+        )
+        tramos.append({
+            'desde': origen,
+            'hasta': destino,
+            'distancia': ruta['distancia'],
+            'duracion': ruta['duracion'],
+            'puntuacion_riesgo': riesgo['puntuacion_riesgo'],
+            'exposicion_riesgo': riesgo['exposicion'],
+        })
+        # La primera coordenada de cada tramo repite la última del anterior
+        coordenadas.extend(ruta['coordenadas'][1:] if coordenadas else ruta['coordenadas'])
+
+    riesgo_total = puntuar_rutas_lote([coordenadas])[0]
+    return {
+        'success': True,
+        'ruta': {
+            'coordenadas': coordenadas,
+            'distancia': round(sum(tramo['distancia'] for tramo in tramos), 2),
+            'duracion': round(sum(tramo['duracion'] for tramo in tramos), 1),
+            'puntuacion_riesgo': riesgo_total['puntuacion_riesgo'],
+            'exposicion_riesgo': riesgo_total['exposicion'],
+        },
+        'tramos': tramos,
+    }
+
+
+def planificar_entrega(origen, paradas, criterio='balanceada', regresar=False):
+    """
+    Orden de visita y ruta completa de un recorrido con varias paradas
+
+    Args:
+        origen: (lat, lon) del repartidor
+        paradas: lista de (lat, lon)
+        criterio: 'rapida', 'balanceada' o 'segura'
+        regresar: si el recorrido termina en el origen
+
+    Returns:
+        dict con 'success', 'orden' (índices de paradas en orden de visita),
+        'ruta', 'tramos' (desde/hasta: 0 es el origen y k la parada k-1),
+        'costo' y 'tiempos' (ms de cada paso)
+    """
+    from .ruteo import obtener_backend_ruteo
+
+    backend = obtener_backend_ruteo()
+    lambda_riesgo = lambda_criterio(criterio)
+    puntos = [tuple(map(float, origen))] + [tuple(map(float, parada)) for parada in paradas]
+
+    inicio = time.perf_counter()
+    matriz = matriz_costos(backend, puntos, lambda_riesgo, hasta_origen=regresar)
+    if not matriz.get('success'):
+        return matriz
+    inicio_orden = time.perf_counter()
+    orden, costo = resolver_orden(matriz['costos'], regresar)
+    inicio_tramos = time.perf_counter()
+
+    secuencia = [0, *orden, 0] if regresar else [0, *orden]
+    for desde, hasta in zip(secuencia, secuencia[1:]):
+        if not math.isfinite(matriz['costos'][desde, hasta]):
+            if hasta == 0:
+                return {'success': False, 'error': 'No hay camino de regreso al origen por la red vial'}
+            return {'success': False, 'error': f'La parada {hasta - 1} no es alcanzable por la red vial'}
+    resultado = coser_tramos(backend, puntos, secuencia, lambda_riesgo)
+    if not resultado['success']:
+        return resultado
+    fin = time.perf_counter()
+
+    return {
+        'success': True,
+        'orden': [indice - 1 for indice in orden],
+        'criterio': criterio,
+        'lambda_riesgo': lambda_riesgo,
+        'costo': round(costo, 1),
+        **resultado,
+        'tiempos': {
+            'matriz_ms': round((inicio_orden - inicio) * 1000, 1),
+            'filas_calculadas': matriz['filas_calculadas'],
+            'orden_ms': round((inicio_tramos - inicio_orden) * 1000, 1),
+            'tramos_ms': round((fin - inicio_tramos) * 1000, 1),
+        },
+    }
@@ -0,0 +1,245 @@
+"""
+Conexiones SMTP persistentes para los emails de emergencia.
+
+Abrir una sesión SMTP cuesta varios viajes de ida y vuelta antes del primer
+mensaje: saludo, EHLO, STARTTLS (con su handshake TLS), EHLO otra vez y
+LOGIN. Enviar cada email con una sesión nueva pagaba todo eso por contacto.
+
+PoolSMTP mantiene hasta CONEXIONES sesiones ya autenticadas por proceso y
+las reutiliza:
+
+- una sesión que lleva más de NOOP_TRAS_S sin usarse se comprueba con NOOP
+  antes de reusarla; si no responde se descarta y se abre otra
+- si el envío falla porque el servidor cerró la conexión, se reconecta y
+  se reintenta una vez
+- tras MENSAJES_POR_SESION mensajes o INACTIVIDAD_MAXIMA_S sin uso la
+  sesión se cierra (los servidores limitan ambas cosas)
+- enviar_varios() manda varios mensajes seguidos por la misma sesión
+
+La configuración de conexión es la de Django (EMAIL_HOST, EMAIL_PORT,
+EMAIL_USE_TLS, EMAIL_USE_SSL, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD).
+"""
+import atexit
+import smtplib
+import ssl
+import threading
+import time
+from collections import deque
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from django.conf import settings
+
+# Errores que indican una conexión inservible (se reconecta y se reintenta)
+ERRORES_CONEXION = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, ssl.SSLError)
+# Rechazos de un mensaje concreto; la sesión se puede seguir usando
+RECHAZOS_MENSAJE = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def construir_mensaje(destinatario, asunto, mensaje):
+    correo = MIMEMultipart()
+    correo['From'] = settings.EMAIL_HOST_USER
+    correo['To'] = destinatario
+    correo['Subject'] = asunto
+    correo.attach(MIMEText(mensaje, 'plain', 'utf-8'))
+    return correo
+
+
+class SesionSMTP:
+    """
+    Conexión SMTP autenticada y cuándo se usó por última vez
+    """
+    __slots__ = ('smtp', 'usada_en', 'mensajes')
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.usada_en = time.monotonic()
+        self.mensajes = 0
+
+    def cerrar(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+
+
+class PoolSMTP:
+    """
+    Sesiones SMTP reutilizables, hasta 'conexiones' abiertas a la vez
+    """
+
+    def __init__(self, conexiones=4, noop_tras_s=5.0, inactividad_maxima_s=60.0, mensajes_por_sesion=100,
+                 timeout=10.0):
+        self.conexiones = conexiones
+        self.noop_tras_s = noop_tras_s
+        self.inactividad_maxima_s = inactividad_maxima_s
+        self.mensajes_por_sesion = mensajes_por_sesion
+        self.timeout = timeout
+        self._libres = deque()  # LIFO: la más reciente es la que menos probablemente cerró el servidor
+        self._lock = threading.Lock()
+        self._cupo = threading.BoundedSemaphore(conexiones)
+
+        self.total_sesiones = 0
+        self.total_reusos = 0
+        self.total_noops_fallidos = 0
+        self.total_reconexiones = 0
+        self.total_mensajes = 0
+
+    def _conectar(self, timeout):
+        if getattr(settings, 'EMAIL_USE_SSL', False):
+            smtp = smtplib.SMTP_SSL(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=timeout,
+                                    context=self._contexto_tls())
+        else:
+            smtp = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=timeout)
+        try:
+            smtp.ehlo()
+            if not getattr(settings, 'EMAIL_USE_SSL', False) and getattr(settings, 'EMAIL_USE_TLS', True):
+                smtp.starttls(context=self._contexto_tls())
+                smtp.ehlo()
+            if settings.EMAIL_HOST_USER:
+                smtp.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
+        except Exception:
+            smtp.close()
+            raise
+        self.total_sesiones += 1
+        return SesionSMTP(smtp)
+
+    @staticmethod
+    def _contexto_tls():
+        # Igual que el envío original: sin verificar certificados (para desarrollo)
+        contexto = ssl.create_default_context()
+        contexto.check_hostname = False
+        contexto.verify_mode = ssl.CERT_NONE
+        return contexto
+
+    def _tomar(self, timeout):
+        """
+        Una sesión lista para enviar: la libre más reciente que siga viva o
+        una nueva
+        """
+        if not self._cupo.acquire(timeout=timeout):
+            raise TimeoutError(f'No hubo una conexión SMTP libre en {timeout:g} s')
+        try:
+            while True:
+                with self._lock:
+                    sesion = self._libres.pop() if self._libres else None
+                if sesion is None:
+                    return self._conectar(timeout)
+
+                inactiva = time.monotonic() - sesion.usada_en
+                if inactiva > self.inactividad_maxima_s:
+                    sesion.cerrar()
+                    continue
+                if inactiva > self.noop_tras_s:
+                    try:
+                        sesion.smtp.sock.settimeout(timeout)
+                        if sesion.smtp.noop()[0] != 250:
+                            raise smtplib.SMTPServerDisconnected('NOOP rechazado')
+                    except (smtplib.SMTPException, OSError):
+                        self.total_noops_fallidos += 1
+                        sesion.smtp.close()
+                        continue
+                self.total_reusos += 1
+                return sesion
+        except Exception:
+            self._cupo.release()
+            raise
+
+    def _devolver(self, sesion):
+        try:
+            if sesion is None:
+                return
+            sesion.usada_en = time.monotonic()
+            if sesion.mensajes >= self.mensajes_por_sesion:
+                sesion.cerrar()
+                return
+            with self._lock:
+                self._libres.append(sesion)
+        finally:
+            self._cupo.release()
+
+    def enviar_varios(self, correos, timeout=None):
+        """
+        Enviar varios mensajes por una misma sesión
+
+        Args:
+            correos: lista de (destinatario, asunto, mensaje)
+
+        Returns:
+            lista con None (enviado) o la excepción de cada mensaje
+        """
+        timeout = timeout or self.timeout
+        resultados = []
+        sesion = self._tomar(timeout)
+        try:
+            for destinatario, asunto, mensaje in correos:
+                try:
+                    sesion = self._enviar(sesion, construir_mensaje(destinatario, asunto, mensaje), timeout)
+                    resultados.append(None)
+                except RECHAZOS_MENSAJE as e:
+                    # El servidor rechazó este mensaje pero la sesión sigue sirviendo
+                    resultados.append(e)
+                    sesion.smtp.rset()
+        except (smtplib.SMTPException, OSError) as e:
+            # Sesión inservible aun tras reconectar: el resto falla con el mismo error
+            sesion.smtp.close()
+            sesion = None
+            resultados.extend(e for _ in range(len(correos) - len(resultados)))
+        finally:
+            self._devolver(sesion)
+        return resultados
+
+    def _enviar(self, sesion, correo, timeout):
+        """Enviar por la sesión; si el servidor la cerró, reconectar una vez"""
+        try:
+            sesion.smtp.sock.settimeout(timeout)
+            sesion.smtp.send_message(correo)
+        except ERRORES_CONEXION:
+            sesion.smtp.close()
+            self.total_reconexiones += 1
+            sesion = self._conectar(timeout)
+            sesion.smtp.send_message(correo)
+        sesion.mensajes += 1
+        self.total_mensajes += 1
+        return sesion
+
+    def enviar(self, destinatario, asunto, mensaje, timeout=None):
+        """Enviar un mensaje; lanza la excepción de smtplib si falla"""
+        error = self.enviar_varios([(destinatario, asunto, mensaje)], timeout=timeout)[0]
+        if error is not None:
+            raise error
+
+    def cerrar(self):
+        with self._lock:
+            libres, self._libres = list(self._libres), deque()
+        for sesion in libres:
+            sesion.cerrar()
+
+    def estadisticas(self):
+        return {
+            'conexiones': self.conexiones,
+            'libres': len(self._libres),
+            'sesiones_abiertas': self.total_sesiones,
+            'reusos': self.total_reusos,
+            'noops_fallidos': self.total_noops_fallidos,
+            'reconexiones': self.total_reconexiones,
+            'mensajes': self.total_mensajes,
+        }
+
+
+def _crear_pool():
+    configuracion = getattr(settings, 'EMAIL_POOL', {})
+    return PoolSMTP(
+        conexiones=configuracion.get('CONEXIONES', 4),
+        noop_tras_s=configuracion.get('NOOP_TRAS_S', 5.0),
+        inactividad_maxima_s=configuracion.get('INACTIVIDAD_MAXIMA_S', 60.0),
+        mensajes_por_sesion=configuracion.get('MENSAJES_POR_SESION', 100),
+        timeout=getattr(settings, 'EMAIL_TIMEOUT', None) or 10.0,
+    )
+
+
+# Pool único por proceso
+pool_smtp = _crear_pool()
+
+# Despedirse del servidor (QUIT) al apagar el proceso
+atexit.register(pool_smtp.cerrar)
@@ -0,0 +1,248 @@
+"""
+Precálculo de rutas para los pares origen-destino frecuentes.
+
+RutaSegura guarda cada consulta de rutas, así que sirve como registro de
+demanda: las consultas se agrupan por par origen-destino cuantizado (las
+mismas celdas que usa la clave de la caché de rutas) y por hora del día.
+Antes de cada hora se calculan las rutas de los pares más pedidos en esa
+hora durante los últimos días y se guardan en la caché con un TTL que cubre
+la hora completa, para que la primera consulta del pico ya sea un acierto.
+
+Formas de ejecutarlo:
+
+- `python manage.py precalentar_rutas` desde cron (p. ej. a los :50 de cada
+  hora); solo sirve si CACHE_RUTAS usa el backend 'cache' compartido
+- el programador en el proceso (PRECALCULO_RUTAS['ACTIVO']), necesario con el
+  backend 'memoria' porque cada proceso tiene su propia caché
+- `python manage.py precalentar_rutas --evaluar AAAA-MM-DD` mide qué tasa de
+  aciertos habría tenido el precálculo sobre el tráfico de ese día
+"""
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _consultas(desde, hasta):
+    from .models import RutaSegura
+
+    return (
+        RutaSegura.objects
+        .filter(creado_en__gte=desde, creado_en__lt=hasta)
+        .order_by('creado_en')
+        .values_list('origen_lat', 'origen_lon', 'destino_lat', 'destino_lon', 'creado_en')
+        .iterator(chunk_size=2000)
+    )
+
+
+def demanda_por_hora(desde, hasta):
+    """
+    Consultas por hora del día (hora local) y par de celdas.
+
+    Returns:
+        (conteos, coordenadas): conteos[hora] es un Counter de celdas del par;
+        coordenadas[celdas] es el último origen/destino real visto en ellas
+    """
+    from .cache_rutas import cache_rutas
+
+    conteos = defaultdict(Counter)
+    coordenadas = {}
+    for origen_lat, origen_lon, destino_lat, destino_lon, creado_en in _consultas(desde, hasta):
+        par = (float(origen_lat), float(origen_lon), float(destino_lat), float(destino_lon))
+        celdas = cache_rutas.celdas_par(*par)
+        conteos[timezone.localtime(creado_en).hour][celdas] += 1
+        coordenadas[celdas] = par
+    return conteos, coordenadas
+
+
+def pares_frecuentes(conteos, coordenadas, hora, minimo=2, max_pares=200):
+    """
+    Pares más pedidos en una hora del día: lista de (celdas, par, consultas)
+    """
+    return [
+        (celdas, coordenadas[celdas], total)
+        for celdas, total in conteos.get(hora, Counter()).most_common(max_pares)
+        if total >= minimo
+    ]
+
+
+def _parametros(dias=None, minimo=None, max_pares=None):
+    configuracion = getattr(settings, 'PRECALCULO_RUTAS', {})
+    return (
+        dias if dias is not None else configuracion.get('DIAS_HISTORIAL', 14),
+        minimo if minimo is not None else configuracion.get('MINIMO_CONSULTAS', 2),
+        max_pares if max_pares is not None else configuracion.get('MAX_PARES', 200),
+    )
+
+
+def precalcular_hora(inicio_hora=None, dias=None, minimo=None, max_pares=None):
+    """
+    Precalcular las rutas frecuentes de la hora que empieza en inicio_hora
+    (por defecto la siguiente). Las entradas duran hasta el final de esa hora.
+
+    Returns:
+        dict con la hora, los pares considerados, calculados y errores
+    """
+    from .utils import precalcular_rutas
+
+    dias, minimo, max_pares = _parametros(dias, minimo, max_pares)
+    ahora = timezone.localtime()
+    if inicio_hora is None:
+        inicio_hora = ahora.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    ttl = max(60, int((inicio_hora + timedelta(hours=1) - ahora).total_seconds()))
+
+    conteos, coordenadas = demanda_por_hora(ahora - timedelta(days=dias), ahora)
+    pares = pares_frecuentes(conteos, coordenadas, inicio_hora.hour, minimo, max_pares)
+
+    calculados = errores = 0
+    for _, par, _ in pares:
+        try:
+            if precalcular_rutas(*par, ttl=ttl):
+                calculados += 1
+            else:
+                errores += 1
+        except Exception:
+            logger.exception('Error al precalcular la ruta %s', par)
+            errores += 1
+
+    return {
+        'hora': inicio_hora.hour,
+        'pares': len(pares),
+        'calculados': calculados,
+        'errores': errores,
+        'ttl': ttl,
+    }
+
+
+def evaluar_dia(dia, dias=None, minimo=None, max_pares=None):
+    """
+    Simular la caché de rutas sobre las consultas de un día, con y sin
+    precálculo, usando solo el historial anterior a ese día.
+
+    Sin precálculo una consulta acierta si su par se calculó hace menos de
+    CACHE_RUTAS['TTL'] segundos; con precálculo también acierta si su par
+    estaba entre los frecuentes de su hora.
+
+    Returns:
+        dict con totales y tasas globales y por hora
+    """
+    from .cache_rutas import cache_rutas
+
+    dias, minimo, max_pares = _parametros(dias, minimo, max_pares)
+    inicio = timezone.make_aware(datetime.combine(dia, time.min))
+    fin = inicio + timedelta(days=1)
+
+    conteos, coordenadas = demanda_por_hora(inicio - timedelta(days=dias), inicio)
+    precalculados = {
+        hora: {celdas for celdas, _, _ in pares_frecuentes(conteos, coordenadas, hora, minimo, max_pares)}
+        for hora in range(24)
+    }
+
+    calculado_sin, calculado_con = {}, {}  # celdas -> instante en que se guardó en la caché
+    por_hora = defaultdict(lambda: {'consultas': 0, 'aciertos_sin': 0, 'aciertos_con': 0, 'aciertos_precalculo': 0})
+    for origen_lat, origen_lon, destino_lat, destino_lon, creado_en in _consultas(inicio, fin):
+        celdas = cache_rutas.celdas_par(origen_lat, origen_lon, destino_lat, destino_lon)
+        instante = creado_en.timestamp()
+        hora = timezone.localtime(creado_en).hour
+        fila = por_hora[hora]
+        fila['consultas'] += 1
+
+        if instante - calculado_sin.get(celdas, -1e18) < cache_rutas.ttl:
+            fila['aciertos_sin'] += 1
+        else:
+            calculado_sin[celdas] = instante
+
+        if celdas in precalculados[hora]:
+            fila['aciertos_con'] += 1
+            fila['aciertos_precalculo'] += 1
+        elif instante - calculado_con.get(celdas, -1e18) < cache_rutas.ttl:
+            fila['aciertos_con'] += 1
+        else:
+            calculado_con[celdas] = instante
+
+    consultas = sum(fila['consultas'] for fila in por_hora.values())
+
+    def tasa(clave, filas):
+        total = sum(fila['consultas'] for fila in filas)
+        return round(sum(fila[clave] for fila in filas) / total, 3) if total else 0.0
+
+    return {
+        'dia': dia.isoformat(),
+        'consultas': consultas,
+        'pares_precalculados': sum(len(pares) for pares in precalculados.values()),
+        'tasa_sin_precalculo': tasa('aciertos_sin', por_hora.values()),
+        'tasa_con_precalculo': tasa('aciertos_con', por_hora.values()),
+        'tasa_solo_precalculo': tasa('aciertos_precalculo', por_hora.values()),
+        'por_hora': {
+            hora: {
+                'consultas': fila['consultas'],
+                'pares_precalculados': len(precalculados[hora]),
+                'tasa_sin_precalculo': tasa('aciertos_sin', [fila]),
+                'tasa_con_precalculo': tasa('aciertos_con', [fila]),
+            }
+            for hora, fila in sorted(por_hora.items())
+        },
+    }
+
+
+class ProgramadorPrecalculo:
+    """
+    Hilo que cada hora, en el minuto configurado, precalcula la hora siguiente
+    """
+
+    def __init__(self, activo=False, minuto=50):
+        self.activo = activo
+        self.minuto = minuto
+        self.ultima_ejecucion = None
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+
+    def iniciar(self):
+        """
+        Arrancar el hilo la primera vez que se pide una ruta (si está activo)
+        """
+        if not self.activo or self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ciclo, name='precalculo-rutas', daemon=True)
+                self._hilo.start()
+
+    def _segundos_hasta_siguiente(self):
+        ahora = timezone.localtime()
+        siguiente = ahora.replace(minute=self.minuto, second=0, microsecond=0)
+        if siguiente <= ahora:
+            siguiente += timedelta(hours=1)
+        return (siguiente - ahora).total_seconds()
+
+    def _ciclo(self):
+        while not self._detener.wait(self._segundos_hasta_siguiente()):
+            try:
+                self.ultima_ejecucion = precalcular_hora()
+                logger.info('Precálculo de rutas: %s', self.ultima_ejecucion)
+            except Exception:
+                logger.exception('Error en el precálculo de rutas')
+            finally:
+                close_old_connections()
+
+    def detener(self):
+        self._detener.set()
+
+
+def _crear_programador():
+    configuracion = getattr(settings, 'PRECALCULO_RUTAS', {})
+    return ProgramadorPrecalculo(
+        activo=configuracion.get('ACTIVO', False),
+        minuto=configuracion.get('MINUTO', 50),
+    )
+
+
+# Programador único por proceso
+programador_precalculo = _crear_programador()
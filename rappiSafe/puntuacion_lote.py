@@ -0,0 +1,162 @@
+"""
+Puntuación de riesgo de muchas rutas en una sola llamada.
+
+Selección de rutas, planificación de entregas y analítica necesitan la
+exposición al riesgo de muchas polilíneas a la vez. puntuar_rutas_lote()
+recibe polilíneas codificadas (formato de Google, como las de OSRM) o listas
+de coordenadas, las decodifica en arreglos concatenados y las puntúa con una
+sola pasada vectorizada sobre el raster de riesgo (RasterRiesgo.evaluar_lote).
+
+Los lotes muy grandes se reparten entre un pool de procesos si
+RIESGO_LOTE['PROCESOS'] > 0. Cada proceso recibe al arrancar una copia de la
+rejilla y no toca la BD; cuando la rejilla cambia de versión el pool se crea
+de nuevo. Los procesos se lanzan con 'spawn' porque hacer fork de un
+servidor con hilos (Daphne) no es seguro.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .geometrias import decodificar_polilineas
+from .riesgo import concatenar_rutas, evaluar_lote_instantanea, np, raster_riesgo
+
+
+def puntuar_rutas_lote(rutas, precision=5):
+    """
+    Exposición al riesgo de varias rutas, en el mismo orden.
+
+    Args:
+        rutas: polilíneas codificadas (str) o listas de [lat, lon]
+        precision: decimales de las polilíneas (5 Google/OSRM, 6 polyline6)
+
+    Returns:
+        lista de dicts con 'puntuacion_riesgo', 'exposicion' (riesgo x km),
+        'riesgo_maximo', 'tramo_maximo', 'distancia' (km) y 'muestras'
+
+    Raises:
+        ValueError: si alguna polilínea no es válida o está vacía
+    """
+    if not rutas:
+        return []
+    if not all(isinstance(ruta, str) for ruta in rutas):
+        if np is None or not pool_puntuacion.conviene(sum(map(len, rutas))):
+            return raster_riesgo.evaluar_rutas(rutas)
+        return pool_puntuacion.evaluar(*concatenar_rutas(rutas))
+
+    lats, lons, inicios = decodificar_polilineas(rutas, precision)
+    if np is not None and pool_puntuacion.conviene(len(lats)):
+        return pool_puntuacion.evaluar(lats, lons, inicios)
+    return raster_riesgo.evaluar_lote(lats, lons, inicios)
+
+
+# ==================== POOL DE PROCESOS ====================
+
+_instantanea_trabajador = None
+_paso_trabajador = None
+
+
+def _iniciar_trabajador(instantanea, paso_m):
+    global _instantanea_trabajador, _paso_trabajador
+    _instantanea_trabajador, _paso_trabajador = instantanea, paso_m
+
+
+def _evaluar_bloque(bloque):
+    return evaluar_lote_instantanea(_instantanea_trabajador, _paso_trabajador, *bloque)
+
+
+def partir_lote(lats, lons, inicios, partes):
+    """
+    Dividir rutas concatenadas en bloques de rutas completas con un número
+    parecido de puntos
+
+    Returns:
+        lista de (lats, lons, inicios) con los inicios relativos a cada bloque
+    """
+    total = len(lats)
+    cortes = np.unique(np.searchsorted(inicios, np.linspace(0, total, partes + 1)[1:-1]))
+    cortes = [0, *(int(corte) for corte in cortes if 0 < corte < len(inicios)), len(inicios)]
+    bloques = []
+    for desde, hasta in zip(cortes, cortes[1:]):
+        primero = inicios[desde]
+        ultimo = inicios[hasta] if hasta < len(inicios) else total
+        bloques.append((lats[primero:ultimo], lons[primero:ultimo], inicios[desde:hasta] - primero))
+    return bloques
+
+
+class PoolPuntuacion:
+    """
+    Pool de procesos para lotes de rutas muy grandes
+    """
+
+    def __init__(self, procesos=0, minimo_puntos=200_000):
+        self.procesos = procesos
+        self.minimo_puntos = minimo_puntos
+        self._pool = None
+        self._version = None
+        self._lock = threading.Lock()
+        self.total_lotes = 0
+        self.total_reinicios = 0
+
+    def conviene(self, puntos):
+        """Si un lote de tantos puntos se reparte entre procesos"""
+        return self.procesos > 0 and puntos >= self.minimo_puntos
+
+    def _obtener(self):
+        instantanea, version = raster_riesgo.instantanea()
+        with self._lock:
+            if self._pool is None or version != self._version:
+                if self._pool is not None:
+                    # Los lotes en curso terminan con la rejilla anterior
+                    self._pool.shutdown(wait=False)
+                    self.total_reinicios += 1
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.procesos,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_iniciar_trabajador,
+                    initargs=(instantanea, raster_riesgo.paso_muestreo_m),
+                )
+                self._version = version
+            return self._pool
+
+    def evaluar(self, lats, lons, inicios):
+        """
+        Puntuar rutas concatenadas repartiéndolas entre los procesos
+        """
+        pool = self._obtener()
+        bloques = partir_lote(
+            np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64),
+            np.asarray(inicios, dtype=np.int64), self.procesos * 2,
+        )
+        resultados = []
+        for parcial in pool.map(_evaluar_bloque, bloques):
+            resultados.extend(parcial)
+        self.total_lotes += 1
+        return resultados
+
+    def cerrar(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def estadisticas(self):
+        return {
+            'procesos': self.procesos,
+            'activo': self._pool is not None,
+            'lotes': self.total_lotes,
+            'reinicios': self.total_reinicios,
+        }
+
+
+def _crear_pool():
+    configuracion = getattr(settings, 'RIESGO_LOTE', {})
+    return PoolPuntuacion(
+        procesos=configuracion.get('PROCESOS', 0),
+        minimo_puntos=configuracion.get('MIN_PUNTOS_POOL', 200_000),
+    )
+
+
+# Pool único por proceso (los procesos se crean con el primer lote grande)
+pool_puntuacion = _crear_pool()
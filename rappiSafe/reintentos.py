@@ -0,0 +1,285 @@
+"""
+Reintentos de notificaciones a contactos que fallaron.
+
+Antes un envío fallido quedaba 'fallido' para siempre y lo único que podía
+hacer el operador era volver a notificar a todos los contactos por todos
+los canales. Ahora, cuando un envío falla (en el despachador de la bandeja
+o al notificar desde el operador), solo ese contacto por ese canal se
+reprograma:
+
+- la fila pasa a 'reintento' con disponible_en = cuándo se reintentará
+- la espera crece exponencialmente con cada intento (REINTENTO_BASE_S · 2^n,
+  hasta REINTENTO_MAXIMO_S) con jitter: un valor al azar entre la mitad y el
+  total, para que los reintentos de muchas alertas no caigan juntos sobre un
+  proveedor que se está recuperando
+- un envío que no respondió en el plazo puede seguir en camino (su hilo
+  sigue hasta el timeout del proveedor), así que no se reintenta antes de
+  ESPERA_SIN_RESPUESTA_S, para no mandar el mismo mensaje dos veces
+- cada envío tiene como mucho MAX_INTENTOS intentos y cada alerta
+  MAX_INTENTOS_ALERTA en total (contando los primeros envíos)
+
+ProgramadorReintentos guarda los reintentos del proceso en un heap ordenado
+por hora de vencimiento; su hilo duerme hasta el primero que vence (o hasta
+que llega uno más próximo) en lugar de revisar la tabla cada cierto tiempo.
+Al vencer, toma las filas con un UPDATE condicional (estado='reintento'),
+así que aunque dos procesos tengan el mismo reintento solo uno lo envía.
+
+La tabla es la que manda: los despachadores de la bandeja también toman las
+filas 'reintento' vencidas, así que un reintento sale aunque el proceso que
+lo programó se haya reiniciado; el heap solo hace que salga justo a su hora
+y no en la siguiente pasada. Al arrancar el hilo (con el primer reintento o
+con iniciar(), que llama despachar_notificaciones) se cargan una sola vez
+las filas que sigan en 'reintento'. Cada intento queda en
+IntentoNotificacion, el historial de la alerta.
+"""
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class ProgramadorReintentos:
+    """
+    Heap de reintentos pendientes del proceso y el hilo que los ejecuta
+    """
+
+    def __init__(self, espera_base_s=5.0, espera_maxima_s=300.0, max_intentos=5, max_intentos_alerta=30,
+                 hilos=8, plazo_s=8.0, espera_sin_respuesta_s=60.0):
+        self.espera_base_s = espera_base_s
+        self.espera_maxima_s = espera_maxima_s
+        self.espera_sin_respuesta_s = espera_sin_respuesta_s
+        self.max_intentos = max_intentos
+        self.max_intentos_alerta = max_intentos_alerta
+        self.hilos = hilos
+        self.plazo_s = plazo_s
+        self.identificador = uuid.uuid4().hex
+        self._heap = []  # (vence_en en time.monotonic, secuencia, pk de la notificación)
+        self._en_heap = set()
+        self._secuencia = itertools.count()  # Desempate estable entre los que vencen a la vez
+        self._condicion = threading.Condition()
+        self._hilo = None
+        self._pool = None
+        self._detener = False
+
+        self.total_programados = 0
+        self.total_reintentados = 0
+        self.total_enviados = 0
+        self.total_sin_cupo = 0  # Fallidos que ya no se reintentan por el límite de la alerta
+        self.total_errores = 0
+
+    def espera(self, intentos):
+        """Segundos hasta el siguiente intento tras 'intentos' intentos fallidos"""
+        tope = min(self.espera_maxima_s, self.espera_base_s * 2 ** (intentos - 1))
+        return random.uniform(tope / 2, tope)
+
+    def planificar(self, fallidas, sin_respuesta=()):
+        """
+        Decidir cuáles de las notificaciones que acaban de fallar se reintentan
+
+        Args:
+            fallidas: NotificacionContacto con su número de intentos ya contado
+            sin_respuesta: pks de las que no respondieron en el plazo; su
+                reintento espera al menos espera_sin_respuesta_s
+
+        Returns:
+            dict {pk: disponible_en} de las que se reintentan
+        """
+        from .models import IntentoNotificacion, NotificacionContacto
+
+        fallidas = [notificacion for notificacion in fallidas if notificacion.intentos < self.max_intentos]
+        if not fallidas:
+            return {}
+
+        # Intentos que ya gastó cada alerta más los reintentos que tiene programados
+        alertas = {notificacion.alerta_id for notificacion in fallidas}
+        usados = Counter(dict(
+            IntentoNotificacion.objects.filter(notificacion__alerta_id__in=alertas)
+            .values_list('notificacion__alerta_id').annotate(Count('id'))
+        ))
+        usados.update(dict(
+            NotificacionContacto.objects.filter(alerta_id__in=alertas, estado='reintento')
+            .values_list('alerta_id').annotate(Count('id'))
+        ))
+
+        ahora = timezone.now()
+        reintentos = {}
+        # Primero los envíos con menos intentos: un canal que aún no se ha
+        # reintentado vale más que el quinto intento de otro
+        for notificacion in sorted(fallidas, key=lambda notificacion: notificacion.intentos):
+            if usados[notificacion.alerta_id] >= self.max_intentos_alerta:
+                self.total_sin_cupo += 1
+                continue
+            usados[notificacion.alerta_id] += 1
+            espera = self.espera(notificacion.intentos)
+            if notificacion.pk in sin_respuesta:
+                espera = max(espera, self.espera_sin_respuesta_s)
+            reintentos[notificacion.pk] = ahora + timedelta(seconds=espera)
+        return reintentos
+
+    def programar(self, reintentos):
+        """
+        Meter reintentos en el heap y despertar al hilo (lo arranca si hace falta)
+
+        Args:
+            reintentos: dict {pk: disponible_en}
+        """
+        if not reintentos:
+            return
+        ahora, ahora_reloj = time.monotonic(), timezone.now()
+        with self._condicion:
+            for pk, disponible_en in reintentos.items():
+                if pk in self._en_heap:
+                    continue
+                self._en_heap.add(pk)
+                vence_en = ahora + max(0.0, (disponible_en - ahora_reloj).total_seconds())
+                heapq.heappush(self._heap, (vence_en, next(self._secuencia), pk))
+                self.total_programados += 1
+            self._iniciar_hilo()
+            self._condicion.notify()
+
+    def iniciar(self):
+        """Arrancar el hilo (y cargar los reintentos de la tabla) sin esperar a un fallo"""
+        with self._condicion:
+            self._iniciar_hilo()
+
+    def _iniciar_hilo(self):
+        # Se llama con self._condicion tomada
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ejecutar, name='reintentos-notificaciones', daemon=True)
+            self._hilo.start()
+
+    def _siguientes(self):
+        """
+        Esperar a que venza el primero del heap y sacar los vencidos (hasta
+        'hilos' por vuelta); None si hay que terminar
+        """
+        with self._condicion:
+            while not self._detener:
+                if self._heap and self._heap[0][0] <= time.monotonic():
+                    vencidos = []
+                    while self._heap and self._heap[0][0] <= time.monotonic() and len(vencidos) < self.hilos:
+                        _, _, pk = heapq.heappop(self._heap)
+                        self._en_heap.discard(pk)
+                        vencidos.append(pk)
+                    return vencidos
+                # Sin timeout si el heap está vacío: programar() despierta al hilo
+                self._condicion.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+            return None
+
+    def _ejecutar(self):
+        try:
+            self._recuperar()
+        except Exception:
+            logger.exception('Error al recuperar reintentos pendientes')
+        finally:
+            close_old_connections()
+
+        while True:
+            vencidos = self._siguientes()
+            if vencidos is None:
+                return
+            try:
+                self.reintentar(vencidos)
+            except Exception:
+                self.total_errores += 1
+                logger.exception('Error al reintentar notificaciones')
+            finally:
+                close_old_connections()
+
+    def _recuperar(self):
+        """Cargar una vez los reintentos que quedaron en la tabla (p. ej. tras un reinicio)"""
+        from .models import NotificacionContacto
+
+        self.programar(dict(NotificacionContacto.objects.filter(estado='reintento').values_list('pk', 'disponible_en')))
+
+    def reintentar(self, pks):
+        """
+        Tomar las notificaciones vencidas que sigan en 'reintento' y enviarlas
+
+        Returns:
+            int: envíos que salieron
+        """
+        from .models import NotificacionContacto
+        from .notificaciones import despachador_notificaciones, enviar_en_paralelo, guardar_resultados
+
+        ahora = timezone.now()
+        # Quedan 'pendiente' y tomadas por este proceso: si se cae a mitad del
+        # envío, la bandeja las recupera al vencer el arrendamiento
+        tomadas = NotificacionContacto.objects.filter(pk__in=pks, estado='reintento').update(
+            estado='pendiente',
+            tomado_por=self.identificador,
+            tomado_en=ahora,
+            intentos=F('intentos') + 1,
+        )
+        if not tomadas:
+            return 0
+        notificaciones = list(
+            NotificacionContacto.objects
+            .filter(pk__in=pks, estado='pendiente', tomado_por=self.identificador, tomado_en=ahora)
+            .select_related('contacto', 'alerta')
+        )
+        resultados = enviar_en_paralelo(
+            [(notificacion.metodo, notificacion.contacto, notificacion.mensaje) for notificacion in notificaciones],
+            self.plazo_s,
+            pool=self._obtener_pool(),
+        )
+        enviados, _, sin_intentar = guardar_resultados(notificaciones, resultados, self.identificador)
+        if sin_intentar:
+            # Volvieron a la bandeja; que el despachador las tome
+            despachador_notificaciones.avisar()
+        self.total_reintentados += len(notificaciones) - sin_intentar
+        self.total_enviados += enviados
+        return enviados
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='reintentos')
+        return self._pool
+
+    def cerrar(self):
+        """Detener el hilo; los reintentos que falten siguen en la tabla como 'reintento'"""
+        with self._condicion:
+            self._detener = True
+            self._condicion.notify()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+    def estadisticas(self):
+        return {
+            'en_espera': len(self._heap),
+            'proximo_en_s': round(self._heap[0][0] - time.monotonic(), 1) if self._heap else None,
+            'programados': self.total_programados,
+            'reintentados': self.total_reintentados,
+            'enviados': self.total_enviados,
+            'sin_cupo': self.total_sin_cupo,
+            'errores': self.total_errores,
+        }
+
+
+def _crear_programador():
+    configuracion = getattr(settings, 'NOTIFICACIONES', {})
+    return ProgramadorReintentos(
+        espera_base_s=configuracion.get('REINTENTO_BASE_S', 5.0),
+        espera_maxima_s=configuracion.get('REINTENTO_MAXIMO_S', 300.0),
+        max_intentos=configuracion.get('MAX_INTENTOS', 5),
+        max_intentos_alerta=configuracion.get('MAX_INTENTOS_ALERTA', 30),
+        plazo_s=configuracion.get('PLAZO_S', 8.0),
+        espera_sin_respuesta_s=configuracion.get('ESPERA_SIN_RESPUESTA_S', 60.0),
+    )
+
+
+# Programador único por proceso
+programador_reintentos = _crear_programador()
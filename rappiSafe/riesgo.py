@@ -0,0 +1,522 @@
+"""
+Puntuación de riesgo de rutas con un raster precalculado.
+
+Las zonas de EstadisticaRiesgo se rasterizan sobre una rejilla de
+RIESGO_CELDA_M metros que cubre la ciudad: cada zona suma un núcleo gaussiano
+de radio RIESGO_RADIO_ZONA_M centrado en la zona y con altura igual a su
+puntuacion_riesgo (escala 0-100 del modelo). Para puntuar una ruta se
+remuestrea la polilínea cada RIESGO_PASO_MUESTREO_M metros y se leen las
+celdas de todas las muestras de una vez:
+
+- exposicion: riesgo integrado sobre la distancia (riesgo x km)
+- puntuacion_riesgo: riesgo medio por metro recorrido (0-100)
+- riesgo_maximo: peor celda que cruza la ruta
+
+Para puntuar muchas rutas a la vez (evaluar_lote) las polilíneas se
+concatenan en un solo arreglo y se remuestrean, leen y resumen en una sola
+pasada vectorizada; cada resultado indica también el tramo de la polilínea
+donde está el riesgo máximo.
+
+Cuando una zona cambia, su núcleo anterior se resta y el nuevo se suma, sin
+reconstruir toda la rejilla (señales en signals.py). Si la zona queda fuera
+de la rejilla, esta se reconstruye completa en la siguiente consulta.
+"""
+import math
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import accumulate
+
+from django.conf import settings
+
+from .geo import METROS_POR_GRADO, distancia_equirectangular_m
+from .indice_zonas import centro_zona
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy el riesgo se calcula directo desde las zonas
+    np = None
+
+RIESGO_MAXIMO = 100.0
+SIGMAS_NUCLEO = 3  # El núcleo se trunca a 3 desviaciones estándar
+MARGEN_RASTER_M = 2000
+
+# Copia de la rejilla que se puede leer sin el raster (p. ej. en otro proceso)
+InstantaneaRejilla = namedtuple('InstantaneaRejilla', ['rejilla', 'lat0', 'lon0', 'delta_lat', 'delta_lon'])
+
+# Muestras de varias polilíneas concatenadas (ver remuestrear_lote)
+MuestrasLote = namedtuple('MuestrasLote', ['lats', 'lons', 'pesos', 'inicios', 'totales', 'distancias', 'acumulada'])
+
+
+class RasterRiesgo:
+    """
+    Rejilla de riesgo acumulado por zonas
+    """
+
+    def __init__(self, celda_m=100.0, radio_zona_m=500.0, paso_muestreo_m=25.0, ttl=300):
+        self.celda_m = celda_m
+        self.radio_zona_m = radio_zona_m
+        self.paso_muestreo_m = paso_muestreo_m
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._rejilla = None
+        self._zonas = {}  # zona_id -> (lat, lon, puntuacion) incluida en la rejilla
+        self._construido_en = 0.0
+        self.version = 0  # Cambia con cada modificación de la rejilla
+        self.total_construcciones = 0
+        self.total_actualizaciones = 0
+
+    # ----- Construcción -----
+
+    @staticmethod
+    def _leer_zonas(zonas=None):
+        from .models import EstadisticaRiesgo
+
+        if zonas is None:
+            zonas = EstadisticaRiesgo.objects.only('id', 'coordenadas_zona', 'puntuacion_riesgo')
+        resultado = {}
+        for zona in zonas:
+            centro = centro_zona(zona.coordenadas_zona)
+            if centro is not None:
+                resultado[zona.pk] = (centro[0], centro[1], float(zona.puntuacion_riesgo))
+        return resultado
+
+    def construir(self, zonas=None):
+        """
+        Rasterizar todas las zonas (o las indicadas) desde cero
+        """
+        datos = self._leer_zonas(zonas)
+        with self._lock:
+            self._zonas = datos
+            self._rejilla = None
+            if datos and np is not None:
+                self._crear_rejilla(datos.values())
+                for lat, lon, puntuacion in datos.values():
+                    self._sumar_nucleo(lat, lon, puntuacion, 1.0)
+            self._construido_en = time.monotonic()
+            self.version += 1
+            self.total_construcciones += 1
+
+    def _crear_rejilla(self, zonas):
+        lats = [zona[0] for zona in zonas]
+        lons = [zona[1] for zona in zonas]
+        margen = MARGEN_RASTER_M + SIGMAS_NUCLEO * self.radio_zona_m
+
+        self._coseno = math.cos(math.radians((min(lats) + max(lats)) / 2))
+        self._delta_lat = self.celda_m / METROS_POR_GRADO
+        self._delta_lon = self.celda_m / (METROS_POR_GRADO * self._coseno)
+        self._lat0 = min(lats) - margen / METROS_POR_GRADO
+        self._lon0 = min(lons) - margen / (METROS_POR_GRADO * self._coseno)
+        filas = int(math.ceil((max(lats) - self._lat0) / self._delta_lat + margen / self.celda_m)) + 1
+        columnas = int(math.ceil((max(lons) - self._lon0) / self._delta_lon + margen / self.celda_m)) + 1
+        self._rejilla = np.zeros((filas, columnas), dtype=np.float64)
+
+    def _sumar_nucleo(self, lat, lon, puntuacion, signo):
+        """
+        Sumar (signo=1) o restar (signo=-1) el núcleo de una zona.
+
+        Returns:
+            bool: False si el núcleo no cabe en la rejilla actual
+        """
+        alcance = int(math.ceil(SIGMAS_NUCLEO * self.radio_zona_m / self.celda_m))
+        fila = int((lat - self._lat0) / self._delta_lat)
+        columna = int((lon - self._lon0) / self._delta_lon)
+        filas, columnas = self._rejilla.shape
+        if not (alcance <= fila < filas - alcance and alcance <= columna < columnas - alcance):
+            return False
+
+        desplazamientos = np.arange(-alcance, alcance + 1) * self.celda_m
+        # Distancia de cada celda al centro exacto de la zona (no al de su celda)
+        dy = desplazamientos[:, None] - ((lat - self._lat0) / self._delta_lat - fila - 0.5) * self.celda_m
+        dx = desplazamientos[None, :] - ((lon - self._lon0) / self._delta_lon - columna - 0.5) * self.celda_m
+        nucleo = puntuacion * np.exp(-(dx * dx + dy * dy) / (2 * self.radio_zona_m ** 2))
+        self._rejilla[fila - alcance:fila + alcance + 1, columna - alcance:columna + alcance + 1] += signo * nucleo
+        return True
+
+    def _asegurar(self):
+        if self._construido_en and time.monotonic() - self._construido_en < self.ttl:
+            return
+        self.construir()
+
+    # ----- Actualización incremental -----
+
+    def actualizar_zona(self, zona):
+        """
+        Reemplazar el aporte de una zona que se creó o modificó
+        """
+        if not self._construido_en:
+            return  # Aún no se usa en este proceso: se construirá completo
+        nuevo = self._leer_zonas([zona]).get(zona.pk)
+        with self._lock:
+            anterior = self._zonas.pop(zona.pk, None)
+            if self._rejilla is None:
+                if nuevo is not None:
+                    self._zonas[zona.pk] = nuevo
+                    self._construido_en = 0.0  # Primera zona con rejilla: reconstruir
+                return
+            if anterior is not None:
+                self._sumar_nucleo(*anterior, -1.0)
+            if nuevo is not None:
+                if not self._sumar_nucleo(*nuevo, 1.0):
+                    self._construido_en = 0.0  # Fuera de la rejilla: reconstruir
+                    return
+                self._zonas[zona.pk] = nuevo
+            self.version += 1
+            self.total_actualizaciones += 1
+
+    def eliminar_zona(self, zona_id):
+        """
+        Quitar el aporte de una zona borrada
+        """
+        with self._lock:
+            anterior = self._zonas.pop(zona_id, None)
+            if anterior is not None and self._rejilla is not None:
+                self._sumar_nucleo(*anterior, -1.0)
+                self.version += 1
+                self.total_actualizaciones += 1
+
+    # ----- Consultas -----
+
+    def version_vigente(self):
+        """
+        Versión de la rejilla tras reconstruirla si expiró; sirve para saber
+        si los valores derivados (p. ej. riesgo por arista) siguen vigentes
+        """
+        self._asegurar()
+        return self.version
+
+    def riesgo_en(self, latitudes, longitudes):
+        """
+        Riesgo (0-100) en cada punto; 0 fuera de la rejilla
+        """
+        self._asegurar()
+        with self._lock:
+            if np is None:
+                return [self._riesgo_python(lat, lon) for lat, lon in zip(latitudes, longitudes)]
+            if self._rejilla is None:
+                return np.zeros(len(latitudes))
+            return leer_rejilla(self._instantanea(), latitudes, longitudes)
+
+    def _instantanea(self):
+        return InstantaneaRejilla(self._rejilla, self._lat0, self._lon0, self._delta_lat, self._delta_lon)
+
+    def instantanea(self):
+        """
+        Copia de la rejilla vigente y su versión; (None, version) si no hay rejilla
+        """
+        self._asegurar()
+        with self._lock:
+            if self._rejilla is None:
+                return None, self.version
+            return self._instantanea()._replace(rejilla=self._rejilla.copy()), self.version
+
+    def _riesgo_python(self, lat, lon):
+        total = 0.0
+        for zona_lat, zona_lon, puntuacion in self._zonas.values():
+            distancia = distancia_equirectangular_m(lat, lon, zona_lat, zona_lon)
+            if distancia <= SIGMAS_NUCLEO * self.radio_zona_m:
+                total += puntuacion * math.exp(-distancia ** 2 / (2 * self.radio_zona_m ** 2))
+        return min(total, RIESGO_MAXIMO)
+
+    def evaluar_ruta(self, coordenadas):
+        """
+        Exposición al riesgo de una polilínea [[lat, lon], ...]
+
+        Returns:
+            dict con 'puntuacion_riesgo' (0-100), 'exposicion' (riesgo x km),
+            'riesgo_maximo' y 'muestras'
+        """
+        if not coordenadas:
+            return {'puntuacion_riesgo': 0.0, 'exposicion': 0.0, 'riesgo_maximo': 0.0, 'muestras': 0}
+
+        lats, lons, pesos = remuestrear(coordenadas, self.paso_muestreo_m)
+        riesgos = self.riesgo_en(lats, lons)
+
+        if np is not None:
+            exposicion_m = float(np.dot(riesgos, pesos))
+            longitud_m = float(np.sum(pesos))
+            maximo = float(riesgos.max())
+        else:
+            exposicion_m = sum(r * p for r, p in zip(riesgos, pesos))
+            longitud_m = sum(pesos)
+            maximo = max(riesgos)
+
+        if longitud_m == 0:
+            # Origen y destino iguales: el riesgo del único punto
+            media = maximo
+        else:
+            media = exposicion_m / longitud_m
+
+        return {
+            'puntuacion_riesgo': round(media, 1),
+            'exposicion': round(exposicion_m / 1000, 2),
+            'riesgo_maximo': round(maximo, 1),
+            'muestras': len(lats),
+        }
+
+    def evaluar_rutas(self, rutas):
+        """
+        Exposición al riesgo de varias polilíneas [[lat, lon], ...] a la vez
+        """
+        con_puntos = [coordenadas for coordenadas in rutas if len(coordenadas)]
+        if not con_puntos:
+            resultados = []
+        elif np is None:
+            resultados = [self._evaluar_ruta_python(coordenadas) for coordenadas in con_puntos]
+        else:
+            resultados = self.evaluar_lote(*concatenar_rutas(con_puntos))
+
+        resultados = iter(resultados)
+        return [next(resultados) if len(coordenadas) else _resultado_vacio() for coordenadas in rutas]
+
+    def evaluar_lote(self, lats, lons, inicios):
+        """
+        Exposición al riesgo de polilíneas concatenadas en una sola pasada.
+
+        Args:
+            lats, lons: coordenadas de todas las rutas, una tras otra
+            inicios: índice del primer punto de cada ruta (ninguna vacía)
+
+        Returns:
+            lista con un dict por ruta: los campos de evaluar_ruta() más
+            'distancia' (km) y 'tramo_maximo' (índice del tramo de la
+            polilínea con el riesgo máximo y sus extremos)
+        """
+        if np is None:
+            fines = list(inicios[1:]) + [len(lats)]
+            return [
+                self._evaluar_ruta_python(list(zip(lats[inicio:fin], lons[inicio:fin])))
+                for inicio, fin in zip(inicios, fines)
+            ]
+        muestras = remuestrear_lote(lats, lons, inicios, self.paso_muestreo_m)
+        return resumir_lote(self.riesgo_en(muestras.lats, muestras.lons), muestras, lats, lons, inicios)
+
+    def _evaluar_ruta_python(self, coordenadas):
+        puntos = [(float(lat), float(lon)) for lat, lon in coordenadas]
+        lats, lons, pesos = _remuestrear_python(puntos, self.paso_muestreo_m)
+        riesgos = self.riesgo_en(lats, lons)
+        maximo = max(riesgos)
+
+        # Tramo de la polilínea que contiene la primera muestra con el riesgo máximo
+        acumulada = list(accumulate(
+            (distancia_equirectangular_m(*a, *b) for a, b in zip(puntos, puntos[1:])), initial=0.0
+        ))
+        distancia = riesgos.index(maximo) * self.paso_muestreo_m
+        tramo = min(max(bisect_right(acumulada, distancia) - 1, 0), max(len(puntos) - 2, 0))
+        return _resumen_ruta(
+            sum(r * p for r, p in zip(riesgos, pesos)), sum(pesos), maximo, len(lats),
+            acumulada[-1], tramo, puntos[tramo], puntos[min(tramo + 1, len(puntos) - 1)],
+        )
+
+    def estadisticas(self):
+        return {
+            'zonas': len(self._zonas),
+            'celdas': int(self._rejilla.size) if self._rejilla is not None else 0,
+            'celda_m': self.celda_m,
+            'construcciones': self.total_construcciones,
+            'actualizaciones': self.total_actualizaciones,
+            'version': self.version,
+        }
+
+
+def remuestrear(coordenadas, paso_m):
+    """
+    Remuestrear una polilínea cada paso_m metros.
+
+    Returns:
+        (latitudes, longitudes, pesos): cada muestra representa el tramo de
+        pesos[i] metros que le sigue (el último puede ser más corto)
+    """
+    if np is None:
+        return _remuestrear_python(coordenadas, paso_m)
+
+    puntos = np.asarray(coordenadas, dtype=np.float64).reshape(-1, 2)
+    lats, lons = puntos[:, 0], puntos[:, 1]
+    if len(puntos) == 1:
+        return lats, lons, np.zeros(1)
+
+    tramos = distancia_equirectangular_m(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    acumulada = np.concatenate(([0.0], np.cumsum(tramos)))
+    total = acumulada[-1]
+    if total == 0:
+        return lats[:1], lons[:1], np.zeros(1)
+
+    distancias = np.arange(0.0, total, paso_m)
+    pesos = np.minimum(paso_m, total - distancias)
+    return np.interp(distancias, acumulada, lats), np.interp(distancias, acumulada, lons), pesos
+
+
+def _remuestrear_python(coordenadas, paso_m):
+    puntos = [(float(lat), float(lon)) for lat, lon in coordenadas]
+    tramos = [distancia_equirectangular_m(*a, *b) for a, b in zip(puntos, puntos[1:])]
+    total = sum(tramos)
+    if total == 0:
+        return [puntos[0][0]], [puntos[0][1]], [0.0]
+
+    lats, lons, pesos = [], [], []
+    indice, inicio_tramo, distancia = 0, 0.0, 0.0
+    while distancia < total:
+        while indice < len(tramos) - 1 and inicio_tramo + tramos[indice] < distancia:
+            inicio_tramo += tramos[indice]
+            indice += 1
+        t = (distancia - inicio_tramo) / tramos[indice] if tramos[indice] else 0.0
+        (lat1, lon1), (lat2, lon2) = puntos[indice], puntos[indice + 1]
+        lats.append(lat1 + (lat2 - lat1) * t)
+        lons.append(lon1 + (lon2 - lon1) * t)
+        pesos.append(min(paso_m, total - distancia))
+        distancia += paso_m
+    return lats, lons, pesos
+
+
+def leer_rejilla(instantanea, latitudes, longitudes):
+    """
+    Riesgo (0-100) de cada punto en una rejilla; 0 fuera de ella
+    """
+    rejilla = instantanea.rejilla
+    filas = np.floor((np.asarray(latitudes, dtype=np.float64) - instantanea.lat0) / instantanea.delta_lat).astype(np.int64)
+    columnas = np.floor((np.asarray(longitudes, dtype=np.float64) - instantanea.lon0) / instantanea.delta_lon).astype(np.int64)
+    dentro = (filas >= 0) & (filas < rejilla.shape[0]) & (columnas >= 0) & (columnas < rejilla.shape[1])
+    valores = np.zeros(len(filas))
+    valores[dentro] = rejilla[filas[dentro], columnas[dentro]]
+    # Las restas incrementales pueden dejar residuos negativos minúsculos
+    return np.clip(valores, 0.0, RIESGO_MAXIMO)
+
+
+def concatenar_rutas(rutas):
+    """
+    Unir varias polilíneas [[lat, lon], ...] en arreglos planos
+
+    Returns:
+        (lats, lons, inicios)
+    """
+    tamanos = np.fromiter((len(coordenadas) for coordenadas in rutas), dtype=np.int64, count=len(rutas))
+    if (tamanos == 0).any():
+        raise ValueError('Hay rutas sin coordenadas')
+    puntos = np.asarray([punto for coordenadas in rutas for punto in coordenadas], dtype=np.float64).reshape(-1, 2)
+    inicios = np.concatenate(([0], np.cumsum(tamanos)[:-1])).astype(np.int64)
+    return puntos[:, 0], puntos[:, 1], inicios
+
+
+def remuestrear_lote(lats, lons, inicios, paso_m):
+    """
+    Remuestrear polilíneas concatenadas cada paso_m metros, igual que
+    remuestrear() con cada una, pero con una sola llamada a np.interp.
+
+    Las rutas se colocan una tras otra sobre un mismo eje de distancia
+    acumulada, separadas por un hueco de paso_m para que ninguna muestra
+    interpole entre el final de una ruta y el inicio de la siguiente.
+
+    Returns:
+        MuestrasLote: muestras y pesos de todas las rutas, índice de la
+        primera muestra de cada ruta, longitud de cada ruta (m) y posición
+        de cada muestra y de cada punto sobre el eje de distancia
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    inicios = np.asarray(inicios, dtype=np.int64)
+    fines = np.append(inicios[1:], len(lats))
+
+    tramos = distancia_equirectangular_m(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    tramos = np.atleast_1d(np.asarray(tramos, dtype=np.float64))
+    tramos[inicios[1:] - 1] = paso_m  # Hueco entre el final de una ruta y la siguiente
+    acumulada = np.concatenate(([0.0], np.cumsum(tramos)))
+
+    base = acumulada[inicios]
+    totales = acumulada[fines - 1] - base
+    # Mismo número de muestras que np.arange(0, total, paso_m); 1 si la ruta mide 0
+    por_ruta = np.maximum(1, np.ceil(totales / paso_m)).astype(np.int64)
+    inicios_muestras = np.concatenate(([0], np.cumsum(por_ruta)[:-1]))
+
+    locales = (np.arange(por_ruta.sum()) - np.repeat(inicios_muestras, por_ruta)) * paso_m
+    distancias = np.repeat(base, por_ruta) + locales
+    pesos = np.minimum(paso_m, np.repeat(totales, por_ruta) - locales)
+
+    return MuestrasLote(
+        np.interp(distancias, acumulada, lats), np.interp(distancias, acumulada, lons),
+        pesos, inicios_muestras, totales, distancias, acumulada,
+    )
+
+
+def resumir_lote(riesgos, muestras, lats, lons, inicios):
+    """
+    Reducir el riesgo de las muestras de remuestrear_lote() a un resultado por ruta
+    """
+    riesgos = np.asarray(riesgos, dtype=np.float64)
+    lats, lons, inicios = np.asarray(lats), np.asarray(lons), np.asarray(inicios)
+    por_ruta = np.diff(np.append(muestras.inicios, len(riesgos)))
+    exposiciones = np.add.reduceat(riesgos * muestras.pesos, muestras.inicios)
+    longitudes = np.add.reduceat(muestras.pesos, muestras.inicios)
+    maximos = np.maximum.reduceat(riesgos, muestras.inicios)
+
+    # Primera muestra de cada ruta que alcanza su máximo: la primera candidata
+    # a partir del inicio de la ruta siempre cae dentro de ella
+    candidatas = np.flatnonzero(riesgos == np.repeat(maximos, por_ruta))
+    peor = candidatas[np.searchsorted(candidatas, muestras.inicios)]
+
+    # Tramo de la polilínea en que cae esa muestra
+    fines = np.append(inicios[1:], len(lats))
+    punto = np.searchsorted(muestras.acumulada, muestras.distancias[peor], side='right') - 1
+    puntos_inicio = np.clip(punto, inicios, np.maximum(fines - 2, inicios))
+    puntos_fin = np.minimum(puntos_inicio + 1, fines - 1)
+    tramos = puntos_inicio - inicios
+
+    return [
+        _resumen_ruta(*valores[:6], (valores[6], valores[7]), (valores[8], valores[9]))
+        for valores in zip(
+            exposiciones.tolist(), longitudes.tolist(), maximos.tolist(), por_ruta.tolist(),
+            muestras.totales.tolist(), tramos.tolist(),
+            lats[puntos_inicio].tolist(), lons[puntos_inicio].tolist(),
+            lats[puntos_fin].tolist(), lons[puntos_fin].tolist(),
+        )
+    ]
+
+
+def evaluar_lote_instantanea(instantanea, paso_m, lats, lons, inicios):
+    """
+    evaluar_lote() sobre una copia de la rejilla; no necesita Django ni la
+    BD, así que sirve en los procesos de puntuacion_lote
+    """
+    muestras = remuestrear_lote(lats, lons, inicios, paso_m)
+    if instantanea is None:
+        riesgos = np.zeros(len(muestras.lats))
+    else:
+        riesgos = leer_rejilla(instantanea, muestras.lats, muestras.lons)
+    return resumir_lote(riesgos, muestras, lats, lons, inicios)
+
+
+def _resultado_vacio():
+    return {
+        'puntuacion_riesgo': 0.0, 'exposicion': 0.0, 'riesgo_maximo': 0.0, 'muestras': 0,
+        'distancia': 0.0, 'tramo_maximo': None,
+    }
+
+
+def _resumen_ruta(exposicion_m, longitud_m, maximo, muestras, distancia_m, tramo, inicio, fin):
+    # Origen y destino iguales: el riesgo del único punto
+    media = exposicion_m / longitud_m if longitud_m else maximo
+    return {
+        'puntuacion_riesgo': round(media, 1),
+        'exposicion': round(exposicion_m / 1000, 2),
+        'riesgo_maximo': round(maximo, 1),
+        'muestras': muestras,
+        'distancia': round(distancia_m / 1000, 2),
+        'tramo_maximo': {'indice': tramo, 'inicio': list(inicio), 'fin': list(fin)},
+    }
+
+
+# Raster único por proceso
+raster_riesgo = RasterRiesgo(
+    celda_m=getattr(settings, 'RIESGO_CELDA_M', 100.0),
+    radio_zona_m=getattr(settings, 'RIESGO_RADIO_ZONA_M', 500.0),
+    paso_muestreo_m=getattr(settings, 'RIESGO_PASO_MUESTREO_M', 25.0),
+    ttl=getattr(settings, 'INDICE_ZONAS_TTL', 300),
+)
+
+
+def evaluar_ruta(coordenadas):
+    """
+    Atajo a raster_riesgo.evaluar_ruta()
+    """
+    return raster_riesgo.evaluar_ruta(coordenadas)
@@ -0,0 +1,310 @@
+"""
+Backends de ruteo.
+
+Las vistas no hablan directamente con OSRM: piden un backend con
+obtener_backend_ruteo() y llaman a rutas(). Cada backend se configura en
+settings.RUTEO['BACKENDS'] con su propia URL y timeouts, y se crea una sola
+vez por proceso para reutilizar sus conexiones HTTP (keep-alive).
+
+Para pruebas sin internet, `python manage.py servidor_ruteo_local` levanta un
+servidor compatible con la API /route/v1 de OSRM; basta con apuntar el
+backend 'local' a él (RUTEO_BACKEND=local).
+
+matriz() devuelve los costos entre varios puntos para el planificador de
+recorridos con varias paradas (planificador.py).
+
+Cada método tiene su versión asíncrona (arutas, arutas_seguras) para las
+vistas async: OSRM se consulta con httpx sin ocupar un hilo mientras
+responde, y los backends sin E/S de red corren en un hilo aparte.
+
+El backend 'grafo' no usa red: calcula las rutas en el propio proceso sobre el
+grafo vial preparado con `python manage.py preparar_grafo_vial`
+(RUTEO_BACKEND=grafo_local).
+"""
+import asyncio
+import logging
+import math
+import threading
+import weakref
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class BackendRuteo:
+    """
+    Interfaz común de los backends de ruteo
+    """
+    soporta_riesgo = False  # Si puede buscar rutas ponderadas por riesgo (rutas_seguras)
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def rutas(self, origen_lat, origen_lon, destino_lat, destino_lon, perfil='driving', alternativas=True):
+        """
+        Rutas entre dos puntos, la más rápida primero
+
+        Returns:
+            dict con 'success' y 'rutas' (lista de dicts con 'coordenadas'
+            [[lat, lon], ...], 'distancia' en km y 'duracion' en minutos), o
+            'success': False y 'error'
+        """
+        raise NotImplementedError
+
+    def rutas_seguras(self, origen_lat, origen_lon, destino_lat, destino_lon, lambdas):
+        """
+        Una ruta por cada λ minimizando tiempo + λ·exposición al riesgo
+
+        Returns:
+            dict como rutas(), con las rutas en el orden de lambdas
+        """
+        raise NotImplementedError
+
+    def matriz(self, puntos, fuentes=None, lambda_riesgo=0.0):
+        """
+        Matriz de costos entre puntos [(lat, lon), ...] para planificar
+        recorridos con varias paradas.
+
+        Por defecto pide la ruta de cada par (lento); los backends con un
+        servicio de matriz lo sobrescriben.
+
+        Args:
+            fuentes: índices de los puntos cuyas filas se calculan (todos por defecto)
+            lambda_riesgo: solo lo usan los backends con soporta_riesgo
+
+        Returns:
+            dict con 'success' y 'costos' (una fila por fuente, en segundos,
+            math.inf sin camino): tiempo + λ·exposición si el backend soporta
+            riesgo y solo el tiempo si no
+        """
+        fuentes = range(len(puntos)) if fuentes is None else fuentes
+        filas = []
+        for fuente in fuentes:
+            fila = []
+            for destino, punto in enumerate(puntos):
+                if destino == fuente:
+                    fila.append(0.0)
+                    continue
+                resultado = self.rutas(*puntos[fuente], *punto, alternativas=False)
+                fila.append(resultado['rutas'][0]['duracion'] * 60 if resultado.get('success') else math.inf)
+            filas.append(fila)
+        return {'success': True, 'costos': filas}
+
+    async def arutas(self, origen_lat, origen_lon, destino_lat, destino_lon, perfil='driving', alternativas=True):
+        """
+        Versión asíncrona de rutas(); por defecto la ejecuta en un hilo
+        """
+        return await sync_to_async(self.rutas, thread_sensitive=False)(
+            origen_lat, origen_lon, destino_lat, destino_lon, perfil, alternativas
+        )
+
+    async def arutas_seguras(self, origen_lat, origen_lon, destino_lat, destino_lon, lambdas):
+        """
+        Versión asíncrona de rutas_seguras(); por defecto la ejecuta en un hilo
+        """
+        return await sync_to_async(self.rutas_seguras, thread_sensitive=False)(
+            origen_lat, origen_lon, destino_lat, destino_lon, lambdas
+        )
+
+    def cerrar(self):
+        pass
+
+    async def acerrar(self):
+        pass
+
+
+class BackendOSRM(BackendRuteo):
+    """
+    Servidor OSRM (público, propio o el servidor local de pruebas)
+    """
+
+    def __init__(self, nombre, url_base='https://router.project-osrm.org', timeout=10,
+                 timeout_conexion=3, conexiones=10):
+        super().__init__(nombre)
+        self.url_base = url_base.rstrip('/')
+        self.timeout = (timeout_conexion, timeout)
+        self.conexiones = conexiones
+
+        # Una sesión por backend: las conexiones quedan abiertas entre consultas
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=conexiones)
+        self.sesion.mount('http://', adaptador)
+        self.sesion.mount('https://', adaptador)
+
+        # Un cliente async por event loop (httpx no permite compartirlo entre loops)
+        self._clientes_async = weakref.WeakKeyDictionary()
+
+    def _consulta(self, origen_lat, origen_lon, destino_lat, destino_lon, perfil, alternativas):
+        url = f'{self.url_base}/route/v1/{perfil}/{origen_lon},{origen_lat};{destino_lon},{destino_lat}'
+        params = {
+            'overview': 'full',
+            'geometries': 'geojson',
+            'steps': 'false',
+        }
+        if alternativas:
+            params['alternatives'] = 'true'
+            params['continue_straight'] = 'false'  # Permitir giros en U para más alternativas
+        return url, params
+
+    def rutas(self, origen_lat, origen_lon, destino_lat, destino_lon, perfil='driving', alternativas=True):
+        url, params = self._consulta(origen_lat, origen_lon, destino_lat, destino_lon, perfil, alternativas)
+        try:
+            response = self.sesion.get(url, params=params, timeout=self.timeout)
+            return self._procesar(response.status_code, response.json() if response.status_code == 200 else None)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning('Error de red con el backend de ruteo %s: %s', self.nombre, e)
+            return {'success': False, 'error': str(e)}
+
+    def matriz(self, puntos, fuentes=None, lambda_riesgo=0.0):
+        """
+        Matriz de tiempos con el servicio /table de OSRM (una sola consulta)
+        """
+        coordenadas = ';'.join(f'{lon},{lat}' for lat, lon in puntos)
+        params = {'annotations': 'duration'}
+        if fuentes is not None:
+            params['sources'] = ';'.join(str(fuente) for fuente in fuentes)
+        try:
+            response = self.sesion.get(
+                f'{self.url_base}/table/v1/driving/{coordenadas}', params=params, timeout=self.timeout
+            )
+            if response.status_code != 200:
+                return {'success': False, 'error': f'El servidor de rutas respondió {response.status_code}'}
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning('Error de red con el backend de ruteo %s: %s', self.nombre, e)
+            return {'success': False, 'error': str(e)}
+
+        if data.get('code') != 'Ok' or not data.get('durations'):
+            return {'success': False, 'error': 'No se pudo calcular la matriz de tiempos'}
+        return {
+            'success': True,
+            'costos': [[math.inf if valor is None else float(valor) for valor in fila] for fila in data['durations']],
+        }
+
+    def _cliente_async(self):
+        loop = asyncio.get_running_loop()
+        cliente = self._clientes_async.get(loop)
+        if cliente is None:
+            cliente = self._clientes_async[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.conexiones, max_keepalive_connections=self.conexiones),
+            )
+        return cliente
+
+    async def arutas(self, origen_lat, origen_lon, destino_lat, destino_lon, perfil='driving', alternativas=True):
+        url, params = self._consulta(origen_lat, origen_lon, destino_lat, destino_lon, perfil, alternativas)
+        try:
+            response = await self._cliente_async().get(url, params=params)
+            return self._procesar(response.status_code, response.json() if response.status_code == 200 else None)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning('Error de red con el backend de ruteo %s: %s', self.nombre, e)
+            return {'success': False, 'error': str(e) or type(e).__name__}
+
+    def _procesar(self, codigo, data):
+        if codigo != 200:
+            return {'success': False, 'error': f'El servidor de rutas respondió {codigo}'}
+
+        if data.get('code') != 'Ok' or not data.get('routes'):
+            return {'success': False, 'error': 'No se pudieron calcular las rutas'}
+
+        return {
+            'success': True,
+            'rutas': [
+                {
+                    # Convertir coordenadas de [lon, lat] a [lat, lon]
+                    'coordenadas': [[coord[1], coord[0]] for coord in route['geometry']['coordinates']],
+                    'distancia': round(route['distance'] / 1000, 2),  # metros a km
+                    'duracion': round(route['duration'] / 60),  # segundos a minutos
+                }
+                for route in data['routes']
+            ]
+        }
+
+    def cerrar(self):
+        self.sesion.close()
+
+    async def acerrar(self):
+        cliente = self._clientes_async.pop(asyncio.get_running_loop(), None)
+        if cliente is not None:
+            await cliente.aclose()
+
+
+class BackendGrafoLocal(BackendRuteo):
+    """
+    Ruteo en el proceso sobre el grafo vial compacto (ver grafo_vial.py)
+    """
+    soporta_riesgo = True
+
+    def __init__(self, nombre, directorio=None, alternativas=2):
+        super().__init__(nombre)
+        self.directorio = directorio or getattr(settings, 'GRAFO_VIAL_DIR', 'grafo_vial')
+        self.alternativas = alternativas
+
+    def _consultar(self, consulta):
+        from .grafo_vial import SinRuta, cargar_grafo
+
+        try:
+            grafo = cargar_grafo(self.directorio)  # Se abre una vez; luego es un dict lookup
+        except FileNotFoundError:
+            logger.error('No existe el grafo vial en %s; ejecutar preparar_grafo_vial', self.directorio)
+            return {'success': False, 'error': 'El grafo vial no está disponible'}
+
+        try:
+            return {'success': True, 'rutas': consulta(grafo)}
+        except SinRuta:
+            return {'success': False, 'error': 'No se pudieron calcular las rutas'}
+
+    def rutas(self, origen_lat, origen_lon, destino_lat, destino_lon, perfil='driving', alternativas=True):
+        return self._consultar(lambda grafo: grafo.rutas(
+            origen_lat, origen_lon, destino_lat, destino_lon,
+            alternativas=self.alternativas if alternativas else 0,
+        ))
+
+    def rutas_seguras(self, origen_lat, origen_lon, destino_lat, destino_lon, lambdas):
+        from .riesgo import raster_riesgo
+
+        return self._consultar(lambda grafo: grafo.rutas_pareto(
+            origen_lat, origen_lon, destino_lat, destino_lon, raster_riesgo, lambdas,
+        ))
+
+    def matriz(self, puntos, fuentes=None, lambda_riesgo=0.0):
+        from .riesgo import raster_riesgo
+
+        resultado = self._consultar(lambda grafo: grafo.matriz(puntos, fuentes, raster_riesgo, lambda_riesgo))
+        if not resultado['success']:
+            return resultado
+        return {'success': True, 'costos': resultado['rutas']}
+
+
+TIPOS_BACKEND = {
+    'osrm': BackendOSRM,
+    'grafo': BackendGrafoLocal,
+}
+
+_backends = {}
+_lock = threading.Lock()
+
+
+def obtener_backend_ruteo(nombre=None):
+    """
+    Backend de ruteo configurado (o el indicado), creado una vez por proceso
+    """
+    configuracion = getattr(settings, 'RUTEO', {})
+    nombre = nombre or configuracion.get('BACKEND', 'osrm_publico')
+
+    backend = _backends.get(nombre)
+    if backend is not None:
+        return backend
+
+    with _lock:
+        if nombre not in _backends:
+            opciones = dict(configuracion.get('BACKENDS', {}).get(nombre, {}))
+            tipo = opciones.pop('TIPO', 'osrm')
+            opciones = {clave.lower(): valor for clave, valor in opciones.items()}
+            _backends[nombre] = TIPOS_BACKEND[tipo](nombre, **opciones)
+        return _backends[nombre]
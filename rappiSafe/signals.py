@@ -1,6 +1,9 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import User, RepartidorProfile
+from .models import User, RepartidorProfile, Alerta, EstadisticaRiesgo
+from .filtro_ubicacion import filtro_ubicacion
+from .indice_zonas import indice_zonas
+from .riesgo import raster_riesgo
 
 
 @receiver(post_save, sender=User)
@@ -18,3 +21,37 @@ def crear_perfil_repartidor(sender, instance, created, **kwargs):
                 user=instance,
                 numero_identificacion=numero_id
             )
+
+
+@receiver(post_save, sender=Alerta)
+def reiniciar_filtro_ubicacion(sender, instance, **kwargs):
+    """
+    Cualquier cambio en una alerta hace que la siguiente posición del
+    repartidor se acepte sin filtrar
+    """
+    filtro_ubicacion.reiniciar(instance.repartidor_id)
+
+
+@receiver(post_save, sender=EstadisticaRiesgo)
+@receiver(post_delete, sender=EstadisticaRiesgo)
+def invalidar_indice_zonas(sender, **kwargs):
+    """
+    Reconstruir el índice espacial de zonas en la siguiente búsqueda
+    """
+    indice_zonas.invalidar()
+
+
+@receiver(post_save, sender=EstadisticaRiesgo)
+def actualizar_raster_riesgo(sender, instance, **kwargs):
+    """
+    Reemplazar el aporte de la zona en el raster de riesgo
+    """
+    raster_riesgo.actualizar_zona(instance)
+
+
+@receiver(post_delete, sender=EstadisticaRiesgo)
+def quitar_zona_raster_riesgo(sender, instance, **kwargs):
+    """
+    Quitar el aporte de la zona borrada del raster de riesgo
+    """
+    raster_riesgo.eliminar_zona(instance.pk)
@@ -0,0 +1,350 @@
+"""
+Simplificación de trayectorias por nivel de detalle (LOD) para el mapa del operador.
+
+Cada alerta mantiene en memoria sus puntos y, por cada nivel de zoom de
+Leaflet, los índices que sobreviven a Douglas–Peucker con una tolerancia
+equivalente a ~1.5 píxeles en ese zoom. La simplificación es incremental:
+cuando llegan BLOQUE_SIMPLIFICACION puntos nuevos se simplifica solo ese
+tramo (anclado en el último punto ya procesado), de modo que una alerta de
+varias horas no se recalcula completa con cada punto nuevo. Los puntos que
+todavía no forman un bloque se devuelven sin simplificar como "cola".
+
+Cada bloque deja al menos un punto, así que en zooms lejanos los niveles
+acumulan puntos de más; cuando un nivel duplica su tamaño se rehace con
+Douglas–Peucker sobre todos los puntos originales. Cada tramo del nivel sale
+de una simplificación sobre los puntos originales que cubre, así que ningún
+punto queda a más de la tolerancia (~1.5 px) de la línea dibujada.
+
+La caché es de cada proceso y la BD es la que manda: antes de responder,
+nivel() lee las filas de Trayectoria más nuevas (por id) que la última que
+vio, las haya guardado este proceso u otro. Si alguna trae un timestamp
+anterior al último punto (lotes con la hora del cliente, buffers que se
+vacían tarde), la alerta se reconstruye desde la BD para dejarla en su lugar.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # Mismo resultado en Python puro, solo más lento
+    np = None
+
+from .geo import METROS_POR_GRADO
+
+ZOOM_MINIMO = 8
+ZOOM_MAXIMO = 18  # En este zoom y superiores se envían todos los puntos
+PIXELES_TOLERANCIA = 1.5
+BLOQUE_SIMPLIFICACION = 50
+MAX_ALERTAS_EN_MEMORIA = 256
+
+METROS_POR_PIXEL_ECUADOR = 156_543.03392  # Zoom 0 de Web Mercator
+MIN_TRAMO_NUMPY = 256  # En tramos más cortos el bucle de Python sale más barato que crear arreglos
+
+
+def tolerancia_para_zoom(zoom, latitud):
+    """
+    Tolerancia en metros equivalente a PIXELES_TOLERANCIA en el zoom dado
+    """
+    if zoom >= ZOOM_MAXIMO:
+        return 0.0
+    metros_por_pixel = METROS_POR_PIXEL_ECUADOR * math.cos(math.radians(latitud)) / (2 ** zoom)
+    return PIXELES_TOLERANCIA * metros_por_pixel
+
+
+def _mas_lejano(puntos, inicio, fin):
+    """Índice y distancia al cuadrado del punto entre inicio y fin más lejano al segmento"""
+    x1, y1 = puntos[inicio]
+    x2, y2 = puntos[fin]
+    dx, dy = x2 - x1, y2 - y1
+    largo_cuadrado = dx * dx + dy * dy
+
+    distancia_maxima = -1.0
+    indice_maximo = inicio
+    for i in range(inicio + 1, fin):
+        px, py = puntos[i]
+        if largo_cuadrado == 0:
+            distancia = (px - x1) ** 2 + (py - y1) ** 2
+        else:
+            t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / largo_cuadrado))
+            distancia = (px - x1 - t * dx) ** 2 + (py - y1 - t * dy) ** 2
+        if distancia > distancia_maxima:
+            distancia_maxima = distancia
+            indice_maximo = i
+    return indice_maximo, distancia_maxima
+
+
+def _mas_lejano_np(arreglo, inicio, fin):
+    """_mas_lejano() vectorizado sobre un arreglo (n, 2)"""
+    x1, y1 = arreglo[inicio]
+    x2, y2 = arreglo[fin]
+    dx, dy = x2 - x1, y2 - y1
+    largo_cuadrado = dx * dx + dy * dy
+
+    px = arreglo[inicio + 1:fin, 0] - x1
+    py = arreglo[inicio + 1:fin, 1] - y1
+    if largo_cuadrado == 0:
+        distancias = px * px + py * py
+    else:
+        t = np.clip((px * dx + py * dy) / largo_cuadrado, 0.0, 1.0)
+        distancias = (px - t * dx) ** 2 + (py - t * dy) ** 2
+    i = int(np.argmax(distancias))
+    return inicio + 1 + i, float(distancias[i])
+
+
+def douglas_peucker(puntos, tolerancia):
+    """
+    Índices de los puntos que conserva Douglas–Peucker (versión iterativa).
+
+    Con NumPy, los tramos largos buscan su punto más lejano de forma
+    vectorizada; es lo que abarata rehacer un nivel sobre todos los puntos.
+
+    Args:
+        puntos: lista de (x, y) en metros
+        tolerancia: distancia máxima permitida en metros
+
+    Returns:
+        list[int] ordenada, siempre incluye el primer y el último índice
+    """
+    n = len(puntos)
+    if n <= 2 or tolerancia <= 0:
+        return list(range(n))
+
+    arreglo = np.asarray(puntos, dtype=float) if np is not None and n > MIN_TRAMO_NUMPY else None
+    conservar = [False] * n
+    conservar[0] = conservar[-1] = True
+    pila = [(0, n - 1)]
+    tolerancia_cuadrada = tolerancia * tolerancia
+
+    while pila:
+        inicio, fin = pila.pop()
+        if fin - inicio < 2:
+            continue
+        if arreglo is not None and fin - inicio > MIN_TRAMO_NUMPY:
+            indice_maximo, distancia_maxima = _mas_lejano_np(arreglo, inicio, fin)
+        else:
+            indice_maximo, distancia_maxima = _mas_lejano(puntos, inicio, fin)
+
+        if distancia_maxima > tolerancia_cuadrada:
+            conservar[indice_maximo] = True
+            pila.append((inicio, indice_maximo))
+            pila.append((indice_maximo, fin))
+
+    return [i for i, conservado in enumerate(conservar) if conservado]
+
+
+class TrayectoriaSimplificada:
+    """
+    Estado incremental de simplificación de una alerta
+    """
+
+    def __init__(self, latitud_referencia):
+        self.latitud_referencia = latitud_referencia
+        self._coseno = math.cos(math.radians(latitud_referencia))
+        self.puntos = []  # (lat, lon) en grados
+        self._proyectados = []  # (x, y) en metros
+        self.ultimo_timestamp = None
+        self.ultimo_id = 0  # Fila de Trayectoria más nueva ya incorporada
+        self.lock = threading.Lock()  # Lo toma el almacén al leer o agregar puntos
+        self.procesados = 1  # El primer punto siempre queda como ancla
+        self.niveles = {zoom: [0] for zoom in range(ZOOM_MINIMO, ZOOM_MAXIMO)}
+        self._tamano_consolidado = {zoom: 1 for zoom in self.niveles}
+        self._bloques_sin_consolidar = {zoom: 0 for zoom in self.niveles}
+
+    def agregar(self, latitud, longitud, timestamp=None):
+        """
+        Agregar un punto al final de la trayectoria
+
+        Returns:
+            bool: False si el punto es anterior al último (llegó tarde y no se
+            agregó: hay que reconstruir la trayectoria para incluirlo)
+        """
+        if timestamp is not None and self.ultimo_timestamp is not None:
+            if timestamp < self.ultimo_timestamp:
+                return False
+            if timestamp == self.ultimo_timestamp:
+                return True  # Punto repetido
+        if timestamp is not None:
+            self.ultimo_timestamp = timestamp
+
+        self.puntos.append((latitud, longitud))
+        self._proyectados.append((
+            longitud * METROS_POR_GRADO * self._coseno,
+            latitud * METROS_POR_GRADO,
+        ))
+
+        if len(self.puntos) - self.procesados >= BLOQUE_SIMPLIFICACION:
+            self._simplificar_bloque()
+        return True
+
+    def _simplificar_bloque(self):
+        ancla = self.procesados - 1
+        tramo = self._proyectados[ancla:]
+        for zoom, indices in self.niveles.items():
+            tolerancia = tolerancia_para_zoom(zoom, self.latitud_referencia)
+            # El índice 0 del tramo es el ancla, que ya está en el nivel
+            indices.extend(ancla + i for i in douglas_peucker(tramo, tolerancia)[1:])
+
+            # Cada bloque deja al menos un punto; en zooms lejanos eso acumula
+            # puntos innecesarios, así que el nivel se rehace cuando duplica su
+            # tamaño y esos puntos forzados pueden ser una parte apreciable de
+            # él (en zooms cercanos casi todos los puntos se quedan y no vale
+            # la pena). Se rehace desde los puntos originales: simplificar lo
+            # ya simplificado sumaría error en cada pasada
+            self._bloques_sin_consolidar[zoom] += 1
+            if (len(indices) >= 2 * self._tamano_consolidado[zoom]
+                    and 4 * self._bloques_sin_consolidar[zoom] >= len(indices)):
+                indices[:] = douglas_peucker(self._proyectados, tolerancia)
+                self._tamano_consolidado[zoom] = len(indices)
+                self._bloques_sin_consolidar[zoom] = 0
+        self.procesados = len(self.puntos)
+
+    def nivel(self, zoom):
+        """
+        Puntos simplificados para el zoom y cola cruda desde la última simplificación
+        """
+        if not self.puntos:
+            return [], []
+
+        zoom = max(ZOOM_MINIMO, min(ZOOM_MAXIMO, zoom))
+        if zoom >= ZOOM_MAXIMO:
+            simplificados = self.puntos[:self.procesados]
+        else:
+            simplificados = [self.puntos[i] for i in self.niveles[zoom]]
+        return simplificados, self.puntos[self.procesados:]
+
+
+class _Construccion:
+    """
+    Alerta que se está leyendo de la BD fuera del lock del almacén
+    """
+    __slots__ = ('lista', 'descartada')
+
+    def __init__(self):
+        self.lista = threading.Event()
+        self.descartada = False
+
+
+class AlmacenSimplificaciones:
+    """
+    Caché LRU por proceso de trayectorias simplificadas
+    """
+
+    def __init__(self, max_alertas=MAX_ALERTAS_EN_MEMORIA):
+        self.max_alertas = max_alertas
+        self._trayectorias = OrderedDict()
+        self._en_construccion = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, alerta):
+        """
+        Estado simplificado de una alerta; se construye desde la BD la primera vez.
+
+        La lectura de la BD y la simplificación se hacen fuera del lock: mientras
+        tanto solo esperan las peticiones de esa misma alerta, no las del resto
+        de alertas del mapa.
+        """
+        clave = str(alerta.pk)
+        while True:
+            with self._lock:
+                trayectoria = self._trayectorias.get(clave)
+                if trayectoria is not None:
+                    self._trayectorias.move_to_end(clave)
+                    return trayectoria
+                construccion = self._en_construccion.get(clave)
+                if construccion is None:
+                    construccion = self._en_construccion[clave] = _Construccion()
+                    break
+            # Otra petición ya la está construyendo: esperar y volver a buscar
+            construccion.lista.wait()
+
+        try:
+            trayectoria = self._construir(alerta)
+        except Exception:
+            with self._lock:
+                del self._en_construccion[clave]
+            construccion.lista.set()
+            raise
+
+        with self._lock:
+            del self._en_construccion[clave]
+            if not construccion.descartada:
+                self._trayectorias[clave] = trayectoria
+                if len(self._trayectorias) > self.max_alertas:
+                    self._trayectorias.popitem(last=False)
+        construccion.lista.set()
+        return trayectoria
+
+    @staticmethod
+    def _construir(alerta):
+        from django.db.models import Max
+        from .models import Trayectoria
+        from .trayectorias import obtener_puntos_trayectoria
+
+        trayectoria = TrayectoriaSimplificada(float(alerta.latitud))
+        # El id se toma antes de leer: una fila que llegue entre medias se
+        # vuelve a leer en ponerse_al_dia() en lugar de perderse
+        trayectoria.ultimo_id = Trayectoria.objects.filter(alerta=alerta).aggregate(Max('id'))['id__max'] or 0
+        for punto in obtener_puntos_trayectoria(alerta):
+            trayectoria.agregar(float(punto.latitud), float(punto.longitud), punto.timestamp)
+        return trayectoria
+
+    def ponerse_al_dia(self, alerta, trayectoria):
+        """
+        Agregar las filas de Trayectoria guardadas después de la última que vio
+        la caché, por cualquier proceso
+
+        Returns:
+            bool: False si alguna llegó con un timestamp anterior al último
+            punto y hay que reconstruir la trayectoria
+        """
+        from .models import Trayectoria
+
+        nuevas = list(
+            Trayectoria.objects.filter(alerta=alerta, id__gt=trayectoria.ultimo_id)
+            .order_by('timestamp', 'id')
+            .values_list('id', 'latitud', 'longitud', 'timestamp')
+        )
+        if not nuevas:
+            return True
+        with trayectoria.lock:
+            en_orden = True
+            for id_fila, latitud, longitud, timestamp in nuevas:
+                if id_fila > trayectoria.ultimo_id:
+                    en_orden = trayectoria.agregar(float(latitud), float(longitud), timestamp) and en_orden
+            trayectoria.ultimo_id = max(trayectoria.ultimo_id, max(fila[0] for fila in nuevas))
+        return en_orden
+
+    def nivel(self, alerta, zoom):
+        """
+        Puntos simplificados y cola cruda de una alerta para un zoom
+
+        Returns:
+            dict con 'puntos', 'cola', 'total_puntos' y 'tolerancia_m'
+        """
+        trayectoria = self.obtener(alerta)
+        if not self.ponerse_al_dia(alerta, trayectoria):
+            # Llegaron puntos atrasados (lotes con hora del cliente, buffers de
+            # otros procesos): solo reconstruyendo quedan en su lugar
+            self.descartar(alerta.pk)
+            trayectoria = self.obtener(alerta)
+
+        with trayectoria.lock:
+            puntos, cola = trayectoria.nivel(zoom)
+            return {
+                'puntos': puntos,
+                'cola': cola,
+                'total_puntos': len(trayectoria.puntos),
+                'tolerancia_m': round(tolerancia_para_zoom(zoom, trayectoria.latitud_referencia), 2),
+            }
+
+    def descartar(self, alerta_id):
+        clave = str(alerta_id)
+        with self._lock:
+            self._trayectorias.pop(clave, None)
+            construccion = self._en_construccion.get(clave)
+            if construccion is not None:
+                construccion.descartada = True
+
+
+simplificaciones = AlmacenSimplificaciones()
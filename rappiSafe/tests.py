@@ -1,3 +1,314 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import geometrias, trayectorias
+from .estado_vivo import coordenada
+from .geometrias import codificar_geometria, codificar_polilinea, decodificar_geometria, decodificar_polilineas
+from .models import Alerta, ContactoConfianza, IntentoNotificacion, NotificacionContacto, User
+from .notificaciones import DespachadorNotificaciones, enviar_en_paralelo, guardar_resultados
+from .reintentos import ProgramadorReintentos, programador_reintentos
+from .trayectorias import PuntoTrayectoria, codificar_puntos, decodificar_puntos
+
+
+# ==================== CODECS ====================
+
+class CodecTrayectoriasTests(SimpleTestCase):
+    """Segmentos zigzag-varint de trayectorias.py, con y sin numpy"""
+
+    def setUp(self):
+        inicio = datetime(2025, 3, 1, 12, 0, tzinfo=dt_timezone.utc)
+        # Deltas negativos en latitud, longitud y tiempo, y opcionales sin dato
+        self.puntos = [
+            PuntoTrayectoria(Decimal('19.432608'), Decimal('-99.133209'), 5.2, 3.45, inicio),
+            PuntoTrayectoria(Decimal('19.432001'), Decimal('-99.140000'), None, 0.0, inicio + timedelta(seconds=2)),
+            PuntoTrayectoria(Decimal('-0.000001'), Decimal('0.000000'), 0.0, None, inicio + timedelta(seconds=1)),
+            PuntoTrayectoria(Decimal('-33.456789'), Decimal('179.999999'), 1500.0, -1.25, inicio),
+        ]
+
+    def comprobar_ida_y_vuelta(self):
+        decodificados = list(decodificar_puntos(codificar_puntos(self.puntos)))
+        self.assertEqual(decodificados, self.puntos)
+        self.assertTrue(all(punto.timestamp.tzinfo is not None for punto in decodificados))
+
+    def test_ida_y_vuelta(self):
+        self.comprobar_ida_y_vuelta()
+
+    def test_ida_y_vuelta_sin_numpy(self):
+        with mock.patch.object(trayectorias, 'np', None):
+            self.comprobar_ida_y_vuelta()
+
+    def test_vacio(self):
+        self.assertEqual(list(decodificar_puntos(codificar_puntos([]))), [])
+        with mock.patch.object(trayectorias, 'np', None):
+            self.assertEqual(list(decodificar_puntos(codificar_puntos([]))), [])
+
+    def test_formato_desconocido_o_truncado(self):
+        datos = codificar_puntos(self.puntos)
+        with self.assertRaises(ValueError):
+            list(decodificar_puntos(b'XX' + datos[2:]))
+        with self.assertRaises(ValueError):
+            list(decodificar_puntos(datos[:-1]))
+
+
+class CodecGeometriasTests(SimpleTestCase):
+    """Blobs de geometría y polilíneas de Google de geometrias.py, con y sin numpy"""
+
+    coordenadas = [
+        [19.432608, -99.133209],
+        [19.4, -99.2],
+        [-0.000001, 0.0],
+        [-33.456789, 179.999999],
+    ]
+
+    def test_geometria_ida_y_vuelta(self):
+        for numpy in (geometrias.np, None):
+            with self.subTest(numpy=numpy is not None), mock.patch.object(geometrias, 'np', numpy):
+                decodificadas = decodificar_geometria(codificar_geometria(self.coordenadas))
+                self.assertEqual(len(decodificadas), len(self.coordenadas))
+                for (lat, lon), (esperada_lat, esperada_lon) in zip(decodificadas, self.coordenadas):
+                    self.assertAlmostEqual(lat, esperada_lat, places=6)
+                    self.assertAlmostEqual(lon, esperada_lon, places=6)
+                self.assertEqual(decodificar_geometria(codificar_geometria([])), [])
+
+    def test_geometria_truncada(self):
+        with self.assertRaises(ValueError):
+            decodificar_geometria(codificar_geometria(self.coordenadas)[:-1])
+
+    def test_polilineas_ida_y_vuelta(self):
+        # La polilínea de ejemplo de la documentación de Google
+        ejemplo = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+        self.assertEqual(codificar_polilinea(ejemplo), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+        textos = [codificar_polilinea(ejemplo), codificar_polilinea(self.coordenadas)]
+        esperadas = ejemplo + [[round(lat, 5), round(lon, 5)] for lat, lon in self.coordenadas]
+        for numpy in (geometrias.np, None):
+            with self.subTest(numpy=numpy is not None), mock.patch.object(geometrias, 'np', numpy):
+                lats, lons, inicios = decodificar_polilineas(textos)
+                self.assertEqual(list(inicios), [0, len(ejemplo)])
+                self.assertEqual(len(lats), len(esperadas))
+                for lat, lon, (esperada_lat, esperada_lon) in zip(lats, lons, esperadas):
+                    self.assertAlmostEqual(lat, esperada_lat, places=5)
+                    self.assertAlmostEqual(lon, esperada_lon, places=5)
+
+    def test_polilineas_precision_6(self):
+        texto = codificar_polilinea(self.coordenadas, precision=6)
+        lats, lons, _ = decodificar_polilineas([texto], precision=6)
+        for lat, lon, (esperada_lat, esperada_lon) in zip(lats, lons, self.coordenadas):
+            self.assertAlmostEqual(lat, esperada_lat, places=6)
+            self.assertAlmostEqual(lon, esperada_lon, places=6)
+
+    def test_polilineas_vacias_o_invalidas(self):
+        texto = codificar_polilinea(self.coordenadas)
+        for numpy in (geometrias.np, None):
+            with self.subTest(numpy=numpy is not None), mock.patch.object(geometrias, 'np', numpy):
+                lats, lons, inicios = decodificar_polilineas([])
+                self.assertEqual((len(lats), len(lons), len(inicios)), (0, 0, 0))
+                for invalida in ('', texto[:-1], texto + ' ', 'ñ'):
+                    with self.assertRaises(ValueError):
+                        decodificar_polilineas([texto, invalida])
+
+
+# ==================== BANDEJA DE NOTIFICACIONES ====================
+
+class BandejaNotificacionesTests(TestCase):
+    """Cómo los despachadores toman filas de la bandeja y guardan los resultados"""
+
+    def setUp(self):
+        repartidor = User.objects.create_user(username='repartidor', password='clave-segura-123', rol='repartidor')
+        self.alerta = Alerta.objects.create(
+            repartidor=repartidor, tipo='panico', latitud=Decimal('19.432608'), longitud=Decimal('-99.133209')
+        )
+        self.contacto = ContactoConfianza.objects.create(
+            repartidor=repartidor, nombre='Ana', telefono='+5215512345678', validado=True
+        )
+
+    def crear_envios(self, cantidad, **campos):
+        return NotificacionContacto.objects.bulk_create([
+            NotificacionContacto(alerta=self.alerta, contacto=self.contacto, mensaje='Alerta', **campos)
+            for _ in range(cantidad)
+        ])
+
+    def despachador(self, **opciones):
+        return DespachadorNotificaciones(en_proceso=False, **opciones)
+
+    def test_dos_despachadores_no_toman_la_misma_fila(self):
+        envios = self.crear_envios(6)
+        primero, segundo = self.despachador(hilos=4), self.despachador(hilos=4)
+
+        tomadas_primero = {notificacion.pk for notificacion in primero.tomar()}
+        tomadas_segundo = {notificacion.pk for notificacion in segundo.tomar()}
+
+        self.assertEqual(len(tomadas_primero), 4)
+        self.assertEqual(len(tomadas_segundo), 2)
+        self.assertFalse(tomadas_primero & tomadas_segundo)
+        self.assertEqual(tomadas_primero | tomadas_segundo, {envio.pk for envio in envios})
+        # Mientras dure el arrendamiento nadie las vuelve a tomar
+        self.assertEqual(primero.tomar(), [])
+        self.assertEqual(segundo.tomar(), [])
+        self.assertEqual(
+            set(NotificacionContacto.objects.filter(tomado_por=segundo.identificador).values_list('pk', flat=True)),
+            tomadas_segundo,
+        )
+
+    def test_arrendamiento_vencido_se_vuelve_a_tomar(self):
+        envio, = self.crear_envios(1)
+        caido, relevo = self.despachador(arrendamiento_s=60), self.despachador(arrendamiento_s=60)
+        self.assertEqual(len(caido.tomar()), 1)
+        self.assertEqual(relevo.tomar(), [])
+
+        # El primero se cayó a mitad del envío y su arrendamiento venció
+        NotificacionContacto.objects.filter(pk=envio.pk).update(tomado_en=timezone.now() - timedelta(seconds=61))
+        tomadas = relevo.tomar()
+
+        self.assertEqual([notificacion.pk for notificacion in tomadas], [envio.pk])
+        envio.refresh_from_db()
+        self.assertEqual(envio.tomado_por, relevo.identificador)
+        self.assertEqual(envio.intentos, 2)
+        self.assertEqual(envio.estado, 'pendiente')
+
+    def test_arrendamiento_vencido_sin_intentos_queda_fallido(self):
+        envio, = self.crear_envios(
+            1, intentos=5, tomado_por='otro', tomado_en=timezone.now() - timedelta(seconds=61)
+        )
+        despachador = self.despachador(arrendamiento_s=60, max_intentos=5)
+
+        self.assertEqual(despachador.tomar(), [])
+        envio.refresh_from_db()
+        self.assertEqual(envio.estado, 'fallido')
+        self.assertEqual(despachador.total_agotadas, 1)
+
+    def test_guardar_resultados(self):
+        self.crear_envios(3)
+        despachador = self.despachador()
+        enviada, fallida, sin_intentar = despachador.tomar()
+        resultados = [{'success': True, 'respuesta': {'id': 1}}, {'success': False, 'error': 'Timeout'}, None]
+
+        with mock.patch.object(programador_reintentos, 'programar') as programar, \
+                self.captureOnCommitCallbacks(execute=True):
+            conteos = guardar_resultados([enviada, fallida, sin_intentar], resultados, despachador.identificador)
+
+        self.assertEqual(conteos, (1, 1, 1))
+        estados = dict(NotificacionContacto.objects.values_list('pk', 'estado'))
+        self.assertEqual(estados, {enviada.pk: 'enviado', fallida.pk: 'reintento', sin_intentar.pk: 'pendiente'})
+        self.assertEqual(list(programar.call_args.args[0]), [fallida.pk])
+        # La que no alcanzó hilo vuelve a la bandeja sin gastar un intento
+        sin_intentar.refresh_from_db()
+        self.assertEqual((sin_intentar.intentos, sin_intentar.tomado_por), (0, ''))
+        self.assertEqual(
+            sorted(IntentoNotificacion.objects.values_list('notificacion_id', 'numero', 'exitoso')),
+            sorted([(enviada.pk, 1, True), (fallida.pk, 1, False)]),
+        )
+
+    def test_envio_sin_respuesta_no_se_reintenta_antes_del_timeout(self):
+        self.crear_envios(1, metodo='email')
+        despachador = self.despachador()
+        notificacion, = despachador.tomar()
+        liberar = threading.Event()
+
+        def envio_lento(canal, contacto, mensaje, plazo_s):
+            liberar.wait(5)
+            return {'success': True}
+
+        with mock.patch('rappiSafe.notificaciones.enviar_por_canal', envio_lento):
+            resultados = enviar_en_paralelo([('email', notificacion.contacto, notificacion.mensaje)], 0.05)
+        liberar.set()
+        self.assertEqual(resultados[0]['success'], False)
+        self.assertTrue(resultados[0]['sin_respuesta'])
+
+        with mock.patch.object(programador_reintentos, 'espera_sin_respuesta_s', 90), \
+                mock.patch.object(programador_reintentos, 'programar'), \
+                self.captureOnCommitCallbacks(execute=True):
+            guardar_resultados([notificacion], resultados, despachador.identificador)
+
+        # El hilo aún puede entregarlo: el reintento espera al timeout del proveedor
+        notificacion.refresh_from_db()
+        self.assertEqual(notificacion.estado, 'reintento')
+        self.assertGreater(notificacion.disponible_en, timezone.now() + timedelta(seconds=85))
+
+    def test_guardar_resultados_sin_cupo_de_la_alerta(self):
+        self.crear_envios(2)
+        despachador = self.despachador()
+        notificaciones = despachador.tomar()
+
+        with mock.patch.object(programador_reintentos, 'max_intentos_alerta', 2), \
+                mock.patch.object(programador_reintentos, 'programar') as programar, \
+                self.captureOnCommitCallbacks(execute=True):
+            guardar_resultados(notificaciones, [{'success': False, 'error': 'Error'}] * 2, despachador.identificador)
+
+        # Los dos primeros intentos ya agotaron el cupo de la alerta
+        self.assertEqual(set(NotificacionContacto.objects.values_list('estado', flat=True)), {'fallido'})
+        programar.assert_not_called()
+
+    def test_planificar_respeta_los_limites(self):
+        programador = ProgramadorReintentos(max_intentos=3, max_intentos_alerta=4)
+        envios = self.crear_envios(4, intentos=1)
+        IntentoNotificacion.objects.bulk_create([
+            IntentoNotificacion(notificacion=envio, numero=1) for envio in envios[:2]
+        ])
+        self.crear_envios(1, estado='reintento')
+        agotado, = self.crear_envios(1, intentos=3)
+
+        reintentos = programador.planificar(envios + [agotado])
+
+        # 2 intentos hechos + 1 reintento programado: la alerta solo tiene cupo para uno más
+        self.assertEqual(len(reintentos), 1)
+        self.assertIn(next(iter(reintentos)), {envio.pk for envio in envios})
+        self.assertEqual(programador.total_sin_cupo, 3)
+        self.assertNotIn(agotado.pk, reintentos)
+        self.assertTrue(all(disponible_en > timezone.now() for disponible_en in reintentos.values()))
+
+    def test_espera_exponencial_con_tope(self):
+        programador = ProgramadorReintentos(espera_base_s=5, espera_maxima_s=60)
+        for intentos, tope in ((1, 5), (2, 10), (3, 20), (10, 60)):
+            espera = programador.espera(intentos)
+            self.assertTrue(tope / 2 <= espera <= tope, (intentos, espera))
+
+
+# ==================== UBICACIÓN DE LAS ALERTAS ====================
+
+class UbicacionAlertaTests(TestCase):
+    """Las coordenadas fuera de rango no llegan a la alerta ni al perfil"""
+
+    def setUp(self):
+        self.repartidor = User.objects.create_user(username='repartidor', password='clave-segura-123', rol='repartidor')
+        self.client.force_login(self.repartidor)
+
+    def test_coordenada(self):
+        self.assertEqual(coordenada('19.4326081'), Decimal('19.432608'))
+        self.assertEqual(coordenada(-179.5), Decimal('-179.5'))
+        self.assertIsNone(coordenada(''))
+        for valor, limite in ((120, 90), (-90.5, 90), (180.1, 180), ('nan', 180), ('inf', 90)):
+            with self.subTest(valor=valor, limite=limite), self.assertRaises(ValueError):
+                coordenada(valor, limite=limite)
+
+    def test_latitud_fuera_de_rango(self):
+        for nombre in ('crear_alerta_panico', 'crear_alerta_accidente'):
+            with self.subTest(vista=nombre):
+                respuesta = self.client.post(
+                    reverse(nombre), json.dumps({'latitud': 120, 'longitud': -99.1}), content_type='application/json'
+                )
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertFalse(respuesta.json()['success'])
+        self.assertFalse(Alerta.objects.exists())
+        self.repartidor.perfil_repartidor.refresh_from_db()
+        self.assertIsNone(self.repartidor.perfil_repartidor.ultima_latitud)
+
+    def test_alerta_guarda_la_ubicacion_en_el_perfil(self):
+        with mock.patch('rappiSafe.views.encolar_notificaciones', return_value={'contactos_notificados': 0}):
+            respuesta = self.client.post(
+                reverse('crear_alerta_panico'),
+                json.dumps({'latitud': 19.4326081, 'longitud': -99.1332089}),
+                content_type='application/json',
+            )
+        self.assertTrue(respuesta.json()['success'])
+        perfil = self.repartidor.perfil_repartidor
+        perfil.refresh_from_db()
+        self.assertEqual((perfil.ultima_latitud, perfil.ultima_longitud), (Decimal('19.432608'), Decimal('-99.133209')))
+        self.assertEqual(perfil.estado, 'emergencia')
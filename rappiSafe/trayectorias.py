@@ -0,0 +1,246 @@
+"""
+Almacenamiento compacto de trayectorias.
+
+Las trayectorias de alertas cerradas se empaquetan en segmentos binarios
+(SegmentoTrayectoria) en lugar de una fila por punto:
+
+- Coordenadas en punto fijo (micro-grados, igual que los DecimalField de 6
+  decimales) guardadas como deltas zigzag-varint respecto al punto anterior.
+- Tiempo en milisegundos como deltas varint.
+- Precisión cuantizada a decímetros y velocidad a cm/s (0 = sin dato).
+
+La lectura siempre pasa por obtener_puntos_trayectoria(), que devuelve los
+mismos campos que Trayectoria tanto para segmentos como para filas sin compactar.
+"""
+import heapq
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate, repeat
+
+try:
+    import numpy as np
+except ImportError:  # La decodificación funciona igual sin NumPy, solo más lenta
+    np = None
+
+MAGIC = b'RT'
+VERSION = 1
+DECIMALES_COORDENADAS = 6  # micro-grados, igual que los DecimalField
+ESCALA_PRECISION = 10  # decímetros
+ESCALA_VELOCIDAD = 100  # cm/s
+TAMANO_SEGMENTO = 1024  # puntos por segmento
+
+ESTADOS_CERRADOS = ['atendida', 'cerrada', 'falsa_alarma']
+
+PuntoTrayectoria = namedtuple(
+    'PuntoTrayectoria',
+    ['latitud', 'longitud', 'precision', 'velocidad', 'timestamp']
+)
+
+
+# ==================== CODIFICACIÓN ====================
+
+def _escribir_varint(buffer, valor):
+    while valor > 0x7F:
+        buffer.append((valor & 0x7F) | 0x80)
+        valor >>= 7
+    buffer.append(valor)
+
+
+def _zigzag(valor):
+    return (valor << 1) if valor >= 0 else ((-valor << 1) - 1)
+
+
+def _deszigzag(valor):
+    return (valor >> 1) ^ -(valor & 1)
+
+
+def _cuantizar_opcional(valor, escala):
+    """0 representa 'sin dato'; el resto es zigzag(valor cuantizado) + 1"""
+    if valor is None:
+        return 0
+    return _zigzag(int(round(valor * escala))) + 1
+
+
+def _a_milisegundos(fecha):
+    return int(round(fecha.timestamp() * 1000))
+
+
+def codificar_puntos(puntos):
+    """
+    Codificar una secuencia de puntos (ordenados por timestamp) en un blob.
+
+    Cada punto debe tener los atributos latitud, longitud, precision,
+    velocidad y timestamp (instancias de Trayectoria o PuntoTrayectoria).
+    """
+    buffer = bytearray(MAGIC)
+    buffer.append(VERSION)
+    _escribir_varint(buffer, len(puntos))
+
+    lat_anterior = lon_anterior = ms_anterior = 0
+    for punto in puntos:
+        lat = int(Decimal(punto.latitud).scaleb(DECIMALES_COORDENADAS).to_integral_value())
+        lon = int(Decimal(punto.longitud).scaleb(DECIMALES_COORDENADAS).to_integral_value())
+        ms = _a_milisegundos(punto.timestamp)
+
+        _escribir_varint(buffer, _zigzag(lat - lat_anterior))
+        _escribir_varint(buffer, _zigzag(lon - lon_anterior))
+        _escribir_varint(buffer, _zigzag(ms - ms_anterior))
+        _escribir_varint(buffer, _cuantizar_opcional(punto.precision, ESCALA_PRECISION))
+        _escribir_varint(buffer, _cuantizar_opcional(punto.velocidad, ESCALA_VELOCIDAD))
+
+        lat_anterior, lon_anterior, ms_anterior = lat, lon, ms
+
+    return bytes(buffer)
+
+
+def decodificar_puntos(datos):
+    """
+    Decodificar un blob generado por codificar_puntos()
+
+    Yields:
+        PuntoTrayectoria con latitud/longitud Decimal y timestamp aware (UTC)
+    """
+    datos = bytes(datos)
+    if datos[:2] != MAGIC or datos[2] != VERSION:
+        raise ValueError('Formato de segmento de trayectoria no reconocido')
+
+    valores = _leer_varints(datos[3:])
+    total = int(valores[0])
+    if len(valores) != 1 + total * 5:
+        raise ValueError('Segmento de trayectoria truncado o corrupto')
+
+    columnas = [valores[1 + i::5] for i in range(5)]
+    if np is not None:
+        # Reconstruir las columnas absolutas de forma vectorizada
+        lats, lons, tiempos = (np.cumsum(_deszigzag_np(columna)) for columna in columnas[:3])
+        lats, lons = lats.tolist(), lons.tolist()
+        segundos = (tiempos / 1000).tolist()
+        precisiones = _descuantizar_np(columnas[3], ESCALA_PRECISION)
+        velocidades = _descuantizar_np(columnas[4], ESCALA_VELOCIDAD)
+    else:
+        lats, lons, tiempos = (list(accumulate(map(_deszigzag, columna))) for columna in columnas[:3])
+        segundos = [ms / 1000 for ms in tiempos]
+        precisiones = [_deszigzag(v - 1) / ESCALA_PRECISION if v else None for v in columnas[3]]
+        velocidades = [_deszigzag(v - 1) / ESCALA_VELOCIDAD if v else None for v in columnas[4]]
+
+    # map() sobre métodos de C evita el costo de un bucle de Python por punto
+    escala = repeat(-DECIMALES_COORDENADAS)
+    yield from map(
+        PuntoTrayectoria,
+        map(Decimal.scaleb, map(Decimal, lats), escala),
+        map(Decimal.scaleb, map(Decimal, lons), escala),
+        precisiones,
+        velocidades,
+        map(datetime.fromtimestamp, segundos, repeat(dt_timezone.utc)),
+    )
+
+
+def _leer_varints(datos):
+    """
+    Leer todos los varints de un buffer de una sola pasada
+    """
+    if np is not None:
+        octetos = np.frombuffer(datos, dtype=np.uint8)
+        finales = np.flatnonzero(octetos < 0x80)
+        if len(finales) == 0:
+            return np.zeros(0, dtype=np.int64)
+        if finales[-1] != len(octetos) - 1:
+            raise ValueError('Segmento de trayectoria truncado o corrupto')
+        inicios = np.concatenate(([0], finales[:-1] + 1))
+        # Posición de cada byte dentro de su varint (0, 1, 2...)
+        posiciones = np.arange(len(octetos)) - np.repeat(inicios, finales - inicios + 1)
+        partes = (octetos & 0x7F).astype(np.int64) << (7 * posiciones)
+        return np.add.reduceat(partes, inicios)
+
+    valores = []
+    agregar = valores.append
+    resultado = desplazamiento = 0
+    for byte in datos:
+        resultado |= (byte & 0x7F) << desplazamiento
+        if byte < 0x80:
+            agregar(resultado)
+            resultado = desplazamiento = 0
+        else:
+            desplazamiento += 7
+    return valores
+
+
+def _deszigzag_np(valores):
+    return (valores >> 1) ^ -(valores & 1)
+
+
+def _descuantizar_np(valores, escala):
+    """Inverso de _cuantizar_opcional para un arreglo (0 -> None)"""
+    return np.where(valores == 0, None, _deszigzag_np(valores - 1) / escala).tolist()
+
+
+# ==================== LECTURA Y COMPACTACIÓN ====================
+
+def obtener_puntos_trayectoria(alerta):
+    """
+    Obtener todos los puntos de una alerta ordenados por timestamp.
+
+    Combina los segmentos compactados con las filas de Trayectoria que aún no
+    se han compactado, de modo que quien llama no necesita saber cómo se guardaron.
+    """
+    from .models import SegmentoTrayectoria, Trayectoria
+
+    segmentos = SegmentoTrayectoria.objects.filter(alerta=alerta).order_by('secuencia')
+    compactados = (
+        punto
+        for datos in segmentos.values_list('datos', flat=True).iterator()
+        for punto in decodificar_puntos(datos)
+    )
+    filas = (
+        PuntoTrayectoria(*fila)
+        for fila in Trayectoria.objects.filter(alerta=alerta).order_by('timestamp').values_list(
+            'latitud', 'longitud', 'precision', 'velocidad', 'timestamp'
+        ).iterator()
+    )
+    return list(heapq.merge(compactados, filas, key=lambda punto: punto.timestamp))
+
+
+def compactar_alerta(alerta, tamano_segmento=TAMANO_SEGMENTO):
+    """
+    Empaquetar las filas de Trayectoria de una alerta en segmentos binarios
+    y eliminar las filas originales.
+
+    Returns:
+        int: número de puntos compactados
+    """
+    from django.db import transaction
+    from django.db.models import Max
+    from .models import SegmentoTrayectoria, Trayectoria
+
+    with transaction.atomic():
+        filas = list(Trayectoria.objects.select_for_update().filter(alerta=alerta).order_by('timestamp'))
+        if not filas:
+            return 0
+
+        ultima = SegmentoTrayectoria.objects.filter(alerta=alerta).aggregate(
+            ultima=Max('secuencia')
+        )['ultima']
+        secuencia = 0 if ultima is None else ultima + 1
+
+        segmentos = []
+        for inicio in range(0, len(filas), tamano_segmento):
+            bloque = filas[inicio:inicio + tamano_segmento]
+            segmentos.append(SegmentoTrayectoria(
+                alerta=alerta,
+                secuencia=secuencia,
+                inicio=bloque[0].timestamp,
+                fin=bloque[-1].timestamp,
+                num_puntos=len(bloque),
+                datos=codificar_puntos(bloque),
+            ))
+            secuencia += 1
+
+        SegmentoTrayectoria.objects.bulk_create(segmentos)
+
+        # Borrar por bloques para no exceder el límite de parámetros de SQLite
+        ids = [fila.id for fila in filas]
+        for inicio in range(0, len(ids), 500):
+            Trayectoria.objects.filter(id__in=ids[inicio:inicio + 500]).delete()
+
+    return len(filas)
@@ -16,6 +16,7 @@ urlpatterns = [
     path('repartidor/alerta/accidente/', views.crear_alerta_accidente, name='crear_alerta_accidente'),
     path('repartidor/alerta/<uuid:alerta_id>/cancelar/', views.cancelar_alerta, name='cancelar_alerta'),
     path('repartidor/ubicacion/', views.actualizar_ubicacion, name='actualizar_ubicacion'),
+    path('repartidor/ubicacion/lote/', views.actualizar_ubicacion_lote, name='actualizar_ubicacion_lote'),
     path('repartidor/bateria/', views.actualizar_bateria, name='actualizar_bateria'),
     path('repartidor/contactos/', views.contactos_confianza_view, name='contactos_confianza'),
     path('repartidor/contactos/agregar/', views.agregar_contacto, name='agregar_contacto'),
@@ -25,12 +26,19 @@ urlpatterns = [
     path('repartidor/mi-perfil/', views.mi_perfil_view, name='mi_perfil'),
     path('repartidor/rutas/', views.rutas_view, name='rutas'),
     path('repartidor/rutas/calcular/', views.calcular_rutas, name='calcular_rutas'),
+    path('repartidor/rutas/planificar/', views.planificar_entrega, name='planificar_entrega'),
+    path('repartidor/rutas/<int:ruta_id>/seleccionar/', views.seleccionar_ruta, name='seleccionar_ruta'),
+    path('repartidor/rutas/<int:ruta_id>/finalizar/', views.finalizar_navegacion, name='finalizar_navegacion'),
     path('repartidor/historial/', views.historial_view, name='historial'),
 
+    # Rutas (repartidores y operadores)
+    path('rutas/puntuar/', views.puntuar_rutas, name='puntuar_rutas'),
+
     # Operador
     path('operador/', views.operador_dashboard, name='operador_dashboard'),
     path('operador/perfil/', views.operador_perfil_view, name='operador_perfil'),
     path('operador/alerta/<uuid:alerta_id>/', views.ver_alerta, name='ver_alerta'),
+    path('operador/alerta/<uuid:alerta_id>/trayectoria/', views.trayectoria_alerta, name='trayectoria_alerta'),
     path('operador/alerta/<uuid:alerta_id>/emergencias/', views.contactar_emergencias, name='contactar_emergencias'),
     path('operador/alerta/<uuid:alerta_id>/atender/', views.atender_alerta, name='atender_alerta'),
     path('operador/alerta/<uuid:alerta_id>/cerrar/', views.cerrar_alerta, name='cerrar_alerta'),
@@ -1,7 +1,6 @@
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 import json
-import requests
 from decimal import Decimal
 import math
 from django.utils import timezone
@@ -61,6 +60,97 @@ def enviar_actualizacion_ubicacion(alerta_id, latitud, longitud, precision=None,
     )
 
 
+def enviar_lote_ubicacion(alerta_id, puntos):
+    """
+    Enviar un lote de posiciones de una alerta en un solo mensaje por WebSocket
+    """
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        f'ubicacion_{alerta_id}',
+        {
+            'type': 'actualizar_ubicacion_lote',
+            'puntos': [
+                {
+                    'latitud': str(punto['latitud']),
+                    'longitud': str(punto['longitud']),
+                    'precision': punto.get('precision'),
+                    'velocidad': punto.get('velocidad'),
+                    'timestamp': punto['timestamp'].isoformat(),
+                }
+                for punto in puntos
+            ]
+        }
+    )
+
+
+def _parsear_timestamp_cliente(valor):
+    """
+    Convertir la marca de tiempo del cliente (epoch en ms o ISO 8601) a datetime aware
+    """
+    from datetime import datetime, timezone as dt_timezone
+
+    if valor is None:
+        return timezone.now()
+    if isinstance(valor, (int, float)):
+        return datetime.fromtimestamp(valor / 1000, tz=dt_timezone.utc)
+
+    fecha = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
+
+
+def normalizar_ubicacion(latitud, longitud, precision=None, velocidad=None):
+    """
+    Validar y convertir una posición GPS enviada por el cliente
+
+    Lanza ValueError o TypeError si la latitud o la longitud no son números
+    dentro de rango; una precisión o velocidad que no sea un número finito
+    queda en None.
+    """
+    latitud = round(float(latitud), 6)
+    longitud = round(float(longitud), 6)
+    if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+        raise ValueError('Coordenadas fuera de rango')
+
+    def opcional(valor):
+        try:
+            valor = float(valor)
+        except (TypeError, ValueError):
+            return None
+        return valor if math.isfinite(valor) else None
+
+    return {
+        'latitud': Decimal(str(latitud)),
+        'longitud': Decimal(str(longitud)),
+        'precision': opcional(precision),
+        'velocidad': opcional(velocidad),
+    }
+
+
+def normalizar_lote_ubicaciones(puntos):
+    """
+    Validar y ordenar un lote de posiciones GPS enviado por el cliente.
+
+    Cada punto debe traer latitud y longitud; precision, velocidad y timestamp
+    son opcionales. Los puntos inválidos se descartan y el resultado queda
+    ordenado por timestamp (el más reciente al final).
+    """
+    normalizados = []
+    for punto in puntos:
+        try:
+            normalizado = normalizar_ubicacion(
+                punto['latitud'], punto['longitud'], punto.get('precision'), punto.get('velocidad')
+            )
+            normalizado['timestamp'] = _parsear_timestamp_cliente(punto.get('timestamp'))
+            normalizados.append(normalizado)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            continue
+
+    normalizados.sort(key=lambda p: p['timestamp'])
+    return normalizados
+
+
 def enviar_notificacion(mensaje, nivel='info'):
     """
     Enviar notificación general al dashboard de monitoreo
@@ -93,6 +183,20 @@ def enviar_estado_repartidor(repartidor_id, estado, latitud=None, longitud=None)
     )
 
 
+def enviar_evento_corredor(evento):
+    """
+    Enviar un desvío, regreso o llegada de la ruta seleccionada al monitoreo
+    """
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        'monitoreo',
+        {
+            'type': 'evento_corredor',
+            'evento': evento
+        }
+    )
+
+
 def serializar_alerta(alerta):
     """
     Serializar una alerta para envío por WebSocket
@@ -119,144 +223,246 @@ def obtener_ruta_osrm(origen_lat, origen_lon, destino_lat, destino_lon, profile=
     Obtener ruta usando OSRM (Open Source Routing Machine)
     Profile: driving, walking, cycling
     """
-    try:
-        url = f"https://router.project-osrm.org/route/v1/{profile}/{origen_lon},{origen_lat};{destino_lon},{destino_lat}"
-        params = {
-            'overview': 'full',
-            'geometries': 'geojson',
-            'steps': 'false'
-        }
+    from .ruteo import obtener_backend_ruteo
 
-        response = requests.get(url, params=params, timeout=10)
+    resultado = obtener_backend_ruteo().rutas(
+        origen_lat, origen_lon, destino_lat, destino_lon, perfil=profile, alternativas=False
+    )
+    if not resultado.get('success'):
+        return {'success': False, 'error': 'No se pudo calcular la ruta'}
 
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('code') == 'Ok' and data.get('routes'):
-                route = data['routes'][0]
+    return {**resultado['rutas'][0], 'success': True}
 
-                # Convertir coordenadas de [lon, lat] a [lat, lon]
-                coordinates = [[coord[1], coord[0]] for coord in route['geometry']['coordinates']]
 
-                return {
-                    'coordenadas': coordinates,
-                    'distancia': round(route['distance'] / 1000, 2),  # metros a km
-                    'duracion': round(route['duration'] / 60),  # segundos a minutos
-                    'success': True
-                }
-
-        return {'success': False, 'error': 'No se pudo calcular la ruta'}
+def calcular_puntuacion_riesgo(coordenadas, zonas_riesgo=None):
+    """
+    Calcular puntuación de riesgo (0-100) de una ruta según las zonas de riesgo.
+    Es el riesgo medio por metro recorrido, leído del raster de zonas.
 
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+    Args:
+        coordenadas: lista de [lat, lon]
+        zonas_riesgo: zonas a usar en lugar de todas las de la BD (opcional)
+    """
+    return evaluar_riesgo_ruta(coordenadas, zonas_riesgo)['puntuacion_riesgo']
 
 
-def calcular_puntuacion_riesgo(coordenadas, zonas_riesgo=None):
+def evaluar_riesgo_ruta(coordenadas, zonas_riesgo=None):
     """
-    Calcular puntuación de riesgo de una ruta basándose en zonas de riesgo
-    Si no hay zonas de riesgo, calcula un valor aleatorio simulado
+    Puntuación, exposición (riesgo x km) y riesgo máximo de una ruta
     """
-    if not zonas_riesgo:
-        # Simulación basada en la longitud de la ruta
-        num_puntos = len(coordenadas)
-        # Rutas más largas tienden a ser más riesgosas
-        riesgo_base = min(30 + (num_puntos * 0.5), 70)
-        return round(riesgo_base, 1)
+    from .riesgo import RasterRiesgo, raster_riesgo
 
-    # Lógica real: verificar intersección con zonas de riesgo
-    # Por ahora retornamos un valor simulado
-    return round(35.0 + (len(coordenadas) * 0.3), 1)
+    if zonas_riesgo is None:
+        return raster_riesgo.evaluar_ruta(coordenadas)
 
+    raster = RasterRiesgo(
+        celda_m=raster_riesgo.celda_m,
+        radio_zona_m=raster_riesgo.radio_zona_m,
+        paso_muestreo_m=raster_riesgo.paso_muestreo_m,
+    )
+    raster.construir(zonas_riesgo)
+    return raster.evaluar_ruta(coordenadas)
 
-def obtener_rutas_alternativas(origen_lat, origen_lon, destino_lat, destino_lon):
+
+def consultar_rutas_osrm(origen_lat, origen_lon, destino_lat, destino_lon):
     """
-    Obtener múltiples rutas alternativas usando OSRM con el parámetro alternatives
-    OSRM calcula automáticamente rutas alternativas inteligentes
-    Retorna: ruta rápida, y 2 rutas alternativas más seguras
+    Consultar al backend de ruteo la ruta más rápida y sus alternativas (hasta 3)
+
+    Returns:
+        dict con 'success' y 'rutas' (coordenadas [lat, lon], distancia en km
+        y duración en minutos), en el orden que devuelve OSRM
     """
+    from .ruteo import obtener_backend_ruteo
+
     try:
-        # Usar OSRM con alternatives=true para obtener hasta 3 rutas diferentes
-        url = f"https://router.project-osrm.org/route/v1/driving/{origen_lon},{origen_lat};{destino_lon},{destino_lat}"
-        params = {
-            'overview': 'full',
-            'geometries': 'geojson',
-            'alternatives': 'true',  # Solicitar rutas alternativas
-            'steps': 'false',
-            'continue_straight': 'false'  # Permitir giros en U para más alternativas
-        }
+        return obtener_backend_ruteo().rutas(origen_lat, origen_lon, destino_lat, destino_lon)
+    except Exception as e:
+        print(f"Error al obtener rutas alternativas: {str(e)}")
+        return {'success': False, 'error': str(e)}
 
-        response = requests.get(url, params=params, timeout=10)
-
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('code') == 'Ok' and data.get('routes'):
-                routes = data['routes']
-
-                # Procesar todas las rutas disponibles (OSRM retorna hasta 3)
-                rutas_procesadas = []
-                for route in routes:
-                    # Convertir coordenadas de [lon, lat] a [lat, lon]
-                    coordinates = [[coord[1], coord[0]] for coord in route['geometry']['coordinates']]
-
-                    ruta_procesada = {
-                        'coordenadas': coordinates,
-                        'distancia': round(route['distance'] / 1000, 2),  # metros a km
-                        'duracion': round(route['duration'] / 60),  # segundos a minutos
-                        'puntuacion_riesgo': calcular_puntuacion_riesgo(coordinates),
-                        'success': True
-                    }
-                    rutas_procesadas.append(ruta_procesada)
-
-                # Si OSRM devolvió al menos una ruta
-                if len(rutas_procesadas) >= 1:
-                    ruta_rapida = rutas_procesadas[0]
-
-                    # Ajustar puntuaciones de riesgo para las alternativas
-                    # Las rutas alternativas son más largas pero más seguras
-                    if len(rutas_procesadas) >= 2:
-                        rutas_procesadas[1]['puntuacion_riesgo'] = rutas_procesadas[1]['puntuacion_riesgo'] * 0.75
-                    if len(rutas_procesadas) >= 3:
-                        rutas_procesadas[2]['puntuacion_riesgo'] = rutas_procesadas[2]['puntuacion_riesgo'] * 0.65
-
-                    # Si OSRM solo devolvió 1 o 2 rutas, crear variantes adicionales
-                    rutas_seguras = []
-
-                    if len(rutas_procesadas) >= 2:
-                        rutas_seguras.append(rutas_procesadas[1])
-                    else:
-                        # Crear variante simulada basada en la ruta principal
-                        rutas_seguras.append({
-                            'coordenadas': ruta_rapida['coordenadas'],
-                            'distancia': round(ruta_rapida['distancia'] * 1.15, 2),
-                            'duracion': int(ruta_rapida['duracion'] * 1.15),
-                            'puntuacion_riesgo': round(ruta_rapida['puntuacion_riesgo'] * 0.75, 1),
-                            'success': True
-                        })
-
-                    if len(rutas_procesadas) >= 3:
-                        rutas_seguras.append(rutas_procesadas[2])
-                    else:
-                        # Crear segunda variante simulada
-                        rutas_seguras.append({
-                            'coordenadas': ruta_rapida['coordenadas'],
-                            'distancia': round(ruta_rapida['distancia'] * 1.25, 2),
-                            'duracion': int(ruta_rapida['duracion'] * 1.25),
-                            'puntuacion_riesgo': round(ruta_rapida['puntuacion_riesgo'] * 0.65, 1),
-                            'success': True
-                        })
-
-                    return {
-                        'success': True,
-                        'rapida': ruta_rapida,
-                        'seguras': rutas_seguras
-                    }
-
-        return {'success': False, 'error': 'No se pudieron calcular las rutas'}
 
+async def aconsultar_rutas_osrm(origen_lat, origen_lon, destino_lat, destino_lon):
+    """
+    Versión asíncrona de consultar_rutas_osrm()
+    """
+    from .ruteo import obtener_backend_ruteo
+
+    try:
+        return await obtener_backend_ruteo().arutas(origen_lat, origen_lon, destino_lat, destino_lon)
     except Exception as e:
         print(f"Error al obtener rutas alternativas: {str(e)}")
         return {'success': False, 'error': str(e)}
 
 
+def _lambdas_riesgo():
+    from django.conf import settings
+    return tuple(getattr(settings, 'RIESGO_LAMBDAS', (0.0, 5.0, 20.0)))
+
+
+def _perfil_cache_rutas(backend, version_riesgo=None):
+    """
+    Perfil de la clave de caché; las rutas seguras dependen de las zonas,
+    así que la versión del raster forma parte de la clave
+    """
+    if backend.soporta_riesgo:
+        return f'{backend.nombre}/riesgo/{version_riesgo}/{",".join(f"{l:g}" for l in _lambdas_riesgo())}'
+    return f'{backend.nombre}/driving'
+
+
+def _clasificar_rutas(resultado, soporta_riesgo):
+    """
+    Puntuar las rutas del backend y separar la rápida de las 2 seguras
+    """
+    from .puntuacion_lote import puntuar_rutas_lote
+
+    # Todas las rutas de la respuesta en una sola pasada sobre el raster
+    riesgos = puntuar_rutas_lote([ruta['coordenadas'] for ruta in resultado['rutas']])
+    rutas_procesadas = [
+        {
+            **ruta,
+            'puntuacion_riesgo': riesgo['puntuacion_riesgo'],
+            'exposicion_riesgo': riesgo['exposicion'],
+            'success': True
+        }
+        for ruta, riesgo in zip(resultado['rutas'], riesgos)
+    ]
+
+    # La primera es siempre la más rápida (λ=0 o la principal de OSRM)
+    ruta_rapida = rutas_procesadas[0]
+    rutas_seguras = rutas_procesadas[1:]
+    if not soporta_riesgo:
+        rutas_seguras.sort(key=lambda ruta: ruta['exposicion_riesgo'])
+
+    # La interfaz muestra siempre dos rutas seguras: si OSRM no dio
+    # suficientes alternativas se repite la ruta real de menor exposición
+    while len(rutas_seguras) < 2:
+        rutas_seguras.append(min(rutas_procesadas, key=lambda ruta: ruta['exposicion_riesgo']))
+
+    return {
+        'success': True,
+        'rapida': ruta_rapida,
+        'seguras': rutas_seguras[:2]
+    }
+
+
+def obtener_rutas_alternativas(origen_lat, origen_lon, destino_lat, destino_lon):
+    """
+    Obtener la ruta rápida y 2 rutas más seguras.
+
+    Si el backend de ruteo lo permite (grafo vial local), las rutas seguras
+    salen de buscar el camino que minimiza tiempo + λ·exposición al riesgo
+    para cada λ de settings.RIESGO_LAMBDAS: rápida, balanceada y más segura.
+    Con OSRM se usan sus alternativas ordenadas por exposición real.
+
+    La respuesta del backend pasa por la caché de rutas; el riesgo se calcula
+    siempre con las zonas actuales.
+    """
+    from .cache_rutas import cache_rutas
+    from .precalculo_rutas import programador_precalculo
+    from .ruteo import obtener_backend_ruteo
+
+    programador_precalculo.iniciar()  # Solo arranca si PRECALCULO_RUTAS['ACTIVO']
+
+    backend = obtener_backend_ruteo()
+    calcular, perfil = _consulta_rutas(backend, origen_lat, origen_lon, destino_lat, destino_lon)
+    resultado = cache_rutas.obtener_o_calcular(
+        origen_lat, origen_lon, destino_lat, destino_lon, calcular, perfil=perfil
+    )
+    if not resultado.get('success'):
+        return resultado
+
+    return _clasificar_rutas(resultado, backend.soporta_riesgo)
+
+
+def _consulta_rutas(backend, origen_lat, origen_lon, destino_lat, destino_lon):
+    """
+    Función que consulta al backend y perfil de caché con que se guarda su resultado
+    """
+    from .riesgo import raster_riesgo
+
+    if backend.soporta_riesgo:
+        return (
+            lambda: backend.rutas_seguras(origen_lat, origen_lon, destino_lat, destino_lon, _lambdas_riesgo()),
+            _perfil_cache_rutas(backend, raster_riesgo.version_vigente()),
+        )
+    return (
+        lambda: consultar_rutas_osrm(origen_lat, origen_lon, destino_lat, destino_lon),
+        _perfil_cache_rutas(backend),
+    )
+
+
+def precalcular_rutas(origen_lat, origen_lon, destino_lat, destino_lon, ttl=None):
+    """
+    Calcular las rutas de un par origen-destino y dejarlas en la caché de
+    rutas con la misma clave que usará obtener_rutas_alternativas()
+
+    Returns:
+        bool: si se pudieron calcular
+    """
+    from .cache_rutas import cache_rutas
+    from .ruteo import obtener_backend_ruteo
+
+    calcular, perfil = _consulta_rutas(obtener_backend_ruteo(), origen_lat, origen_lon, destino_lat, destino_lon)
+    return cache_rutas.precalentar(
+        origen_lat, origen_lon, destino_lat, destino_lon, calcular, perfil=perfil, ttl=ttl
+    )
+
+
+async def aobtener_rutas_alternativas(origen_lat, origen_lon, destino_lat, destino_lon):
+    """
+    Versión asíncrona de obtener_rutas_alternativas() para vistas async.
+
+    La consulta al backend de ruteo se espera sin ocupar un hilo; solo la
+    lectura de zonas y la puntuación (rápidas, usan el ORM) pasan por
+    sync_to_async.
+    """
+    from .cache_rutas import cache_rutas
+    from .precalculo_rutas import programador_precalculo
+    from .riesgo import raster_riesgo
+    from .ruteo import obtener_backend_ruteo
+
+    programador_precalculo.iniciar()
+
+    backend = obtener_backend_ruteo()
+    if backend.soporta_riesgo:
+        version = await sync_to_async(raster_riesgo.version_vigente)()
+        resultado = await cache_rutas.aobtener_o_calcular(
+            origen_lat, origen_lon, destino_lat, destino_lon,
+            lambda: backend.arutas_seguras(origen_lat, origen_lon, destino_lat, destino_lon, _lambdas_riesgo()),
+            perfil=_perfil_cache_rutas(backend, version)
+        )
+    else:
+        resultado = await cache_rutas.aobtener_o_calcular(
+            origen_lat, origen_lon, destino_lat, destino_lon,
+            lambda: aconsultar_rutas_osrm(origen_lat, origen_lon, destino_lat, destino_lon),
+            perfil=_perfil_cache_rutas(backend)
+        )
+    if not resultado.get('success'):
+        return resultado
+
+    return await sync_to_async(_clasificar_rutas)(resultado, backend.soporta_riesgo)
+
+
+def mensaje_alerta_contactos(alerta):
+    """
+    Texto que reciben los contactos de emergencia por cualquier canal
+    """
+    tipo_alerta = 'PÁNICO' if alerta.tipo == 'panico' else 'ACCIDENTE'
+    repartidor_nombre = alerta.repartidor.get_full_name()
+
+    return f"""
+🚨 ALERTA DE {tipo_alerta} - RAPPI SAFE
+
+{repartidor_nombre} ha activado una alerta de emergencia.
+
+📍 Ubicación: https://www.google.com/maps?q={alerta.latitud},{alerta.longitud}
+
+Hora: {timezone.now().strftime('%d/%m/%Y %H:%M')}
+
+Este mensaje es automático. Por favor, contacte inmediatamente con {repartidor_nombre} o las autoridades.
+    """.strip()
+
+
 def notificar_contactos_emergencia(alerta):
     """
     Enviar notificaciones a los contactos de emergencia del repartidor
@@ -265,8 +471,11 @@ def notificar_contactos_emergencia(alerta):
     Esta función:
     1. Obtiene todos los contactos de emergencia del repartidor
     2. Genera un mensaje personalizado con la información de la alerta
-    3. Envía notificación SMS a cada contacto
-    4. Registra cada intento de notificación en la base de datos
+    3. Registra un envío por contacto y canal con un solo bulk_create
+    4. Envía por todos los canales de todos los contactos a la vez (SMS,
+       Telegram y email), cada envío con su tiempo límite
+    5. Guarda los resultados; los envíos que fallaron se reintentan solos
+       con espera exponencial (ver reintentos.py)
 
     Args:
         alerta: Objeto Alerta que se acaba de crear
@@ -279,17 +488,18 @@ def notificar_contactos_emergencia(alerta):
             'detalles': []
         }
     """
+    import uuid
     from .models import ContactoConfianza, NotificacionContacto
-    from django.utils import timezone
+    from .notificaciones import canales_contacto, enviar_en_paralelo, guardar_resultados, plazo_envio
 
     try:
         # Obtener contactos de emergencia del repartidor (solo validados)
-        contactos = ContactoConfianza.objects.filter(
+        contactos = list(ContactoConfianza.objects.filter(
             repartidor=alerta.repartidor,
             validado=True  # Solo notificar contactos validados
-        )
+        ))
 
-        if not contactos.exists():
+        if not contactos:
             print(f"⚠️ Alerta {alerta.id}: No hay contactos de emergencia validados")
             return {
                 'success': False,
@@ -299,70 +509,58 @@ def notificar_contactos_emergencia(alerta):
             }
 
         # Generar mensaje personalizado
-        tipo_alerta = 'PÁNICO' if alerta.tipo == 'panico' else 'ACCIDENTE'
-        repartidor_nombre = alerta.repartidor.get_full_name()
-
-        # Mensaje base
-        mensaje = f"""
-🚨 ALERTA DE {tipo_alerta} - RAPPI SAFE
-
-{repartidor_nombre} ha activado una alerta de emergencia.
-
-📍 Ubicación: https://www.google.com/maps?q={alerta.latitud},{alerta.longitud}
-
-Hora: {timezone.now().strftime('%d/%m/%Y %H:%M')}
-
-Este mensaje es automático. Por favor, contacte inmediatamente con {repartidor_nombre} o las autoridades.
-        """.strip()
+        mensaje = mensaje_alerta_contactos(alerta)
+
+        # Un envío por contacto y canal, ya tomado por esta petición (si el
+        # proceso se cae a mitad, la bandeja lo recupera al vencer el plazo)
+        envios = [(canal, contacto, mensaje) for contacto in contactos for canal in canales_contacto(contacto)]
+        tomado_por = uuid.uuid4().hex
+        ahora = timezone.now()
+        notificaciones = NotificacionContacto.objects.bulk_create([
+            NotificacionContacto(
+                alerta=alerta,
+                contacto=contacto,
+                metodo=canal,
+                estado='pendiente',
+                mensaje=mensaje,
+                intentos=1,
+                disponible_en=ahora,
+                tomado_por=tomado_por,
+                tomado_en=ahora
+            )
+            for canal, contacto, _ in envios
+        ])
+
+        # Todos a la vez: el total tarda lo que el envío más lento (como mucho
+        # el plazo), no la suma de todos
+        resultados = enviar_en_paralelo(envios, plazo_envio())
+        guardar_resultados(notificaciones, resultados, tomado_por)
 
         contactos_notificados = 0
         notificaciones_fallidas = 0
         detalles = []
-
         for contacto in contactos:
-            try:
-                # Enviar notificación (Telegram > Email > Simulado)
-                resultado_envio = enviar_notificacion_contacto(contacto, mensaje)
-                metodo = resultado_envio.get('metodo', 'desconocido')
-
-                # Registrar notificación en base de datos
-                notificacion = NotificacionContacto.objects.create(
-                    alerta=alerta,
-                    contacto=contacto,
-                    metodo=metodo if metodo in ['telegram', 'email', 'sms', 'whatsapp', 'llamada'] else 'sms',
-                    estado='enviado' if resultado_envio['success'] else 'fallido',
-                    mensaje=mensaje,
-                    respuesta_api=resultado_envio.get('respuesta'),
-                    error_mensaje=resultado_envio.get('error', '')
-                )
-
-                if resultado_envio['success']:
-                    contactos_notificados += 1
-                    metodo_str = metodo.upper() if metodo != 'simulado' else 'SIMULADO'
-                    print(f"✅ Notificación enviada a {contacto.nombre} via {metodo_str}")
-                    detalles.append({
-                        'contacto': contacto.nombre,
-                        'metodo': metodo,
-                        'estado': 'enviado'
-                    })
-                else:
-                    notificaciones_fallidas += 1
-                    print(f"❌ Error al notificar a {contacto.nombre}: {resultado_envio.get('error')}")
-                    detalles.append({
-                        'contacto': contacto.nombre,
-                        'metodo': metodo,
-                        'estado': 'fallido',
-                        'error': resultado_envio.get('error')
-                    })
-
-            except Exception as e:
+            propios = [
+                (canal, resultado) for (canal, otro, _), resultado in zip(envios, resultados) if otro is contacto
+            ]
+            enviados = [canal for canal, resultado in propios if resultado['success']]
+            if enviados:
+                contactos_notificados += 1
+                print(f"✅ Notificación enviada a {contacto.nombre} via {'+'.join(enviados).upper()}")
+                detalles.append({
+                    'contacto': contacto.nombre,
+                    'metodo': '+'.join(enviados),
+                    'estado': 'enviado'
+                })
+            else:
                 notificaciones_fallidas += 1
-                print(f"❌ Excepción al notificar a {contacto.nombre}: {str(e)}")
+                errores = '; '.join(resultado.get('error', '') for _, resultado in propios)
+                print(f"❌ Error al notificar a {contacto.nombre}: {errores}")
                 detalles.append({
                     'contacto': contacto.nombre,
-                    'telefono': contacto.telefono,
-                    'estado': 'error',
-                    'error': str(e)
+                    'metodo': '+'.join(canal for canal, _ in propios),
+                    'estado': 'fallido',
+                    'error': errores
                 })
 
         resultado = {
@@ -388,105 +586,61 @@ Este mensaje es automático. Por favor, contacte inmediatamente con {repartidor_
         }
 
 
-def enviar_telegram(telegram_id, mensaje):
+def enviar_telegram(telegram_id, mensaje, timeout=None):
     """
-    Enviar mensaje por Telegram Bot (GRATIS, sin restricciones)
+    Enviar mensaje por Telegram Bot (GRATIS, sin restricciones), por el
+    cliente de Telegram del proceso (ver cliente_telegram.py)
 
     Args:
         telegram_id: ID de Telegram del contacto
         mensaje: Texto del mensaje a enviar
+        timeout: segundos máximos de espera, incluida la espera por el límite de envío
 
     Returns:
         dict: {'success': bool, 'respuesta': dict, 'error': str}
     """
     import os
+    from .cliente_telegram import enviador_telegram
 
-    telegram_token = os.environ.get('TELEGRAM_BOT_TOKEN')
-
-    if not telegram_token:
+    if not os.environ.get('TELEGRAM_BOT_TOKEN'):
         return {
             'success': False,
             'error': 'No hay token de Telegram configurado'
         }
 
-    try:
-        import asyncio
-        from telegram import Bot
+    print(f"📱 Enviando mensaje por TELEGRAM a {telegram_id}")
+    print(f"   Mensaje: {mensaje[:50]}...")
 
-        print(f"📱 Enviando mensaje por TELEGRAM a {telegram_id}")
-        print(f"   Mensaje: {mensaje[:50]}...")
-
-        # Crear bot y enviar mensaje
-        bot = Bot(token=telegram_token)
-
-        # Ejecutar envío de forma síncrona
-        async def send():
-            return await bot.send_message(chat_id=telegram_id, text=mensaje, parse_mode='HTML')
-
-        message = asyncio.run(send())
+    resultado = enviador_telegram.enviar(telegram_id, mensaje, timeout=timeout)
 
-        print(f"✅ Mensaje de Telegram enviado exitosamente! ID: {message.message_id}")
-
-        return {
-            'success': True,
-            'respuesta': {
-                'message_id': message.message_id,
-                'chat_id': message.chat_id,
-                'proveedor': 'telegram',
-                'real': True
-            }
-        }
-    except Exception as e:
-        print(f"❌ Error al enviar por Telegram: {str(e)}")
-        return {
-            'success': False,
-            'error': f"Error Telegram: {str(e)}"
-        }
+    if resultado['success']:
+        print(f"✅ Mensaje de Telegram enviado exitosamente! ID: {resultado['respuesta']['message_id']}")
+    else:
+        print(f"❌ Error al enviar por Telegram: {resultado['error']}")
+    return resultado
 
 
-def enviar_email(email, asunto, mensaje):
+def enviar_email(email, asunto, mensaje, timeout=10):
     """
-    Enviar email como alternativa a SMS
+    Enviar email como alternativa a SMS, por una sesión SMTP del pool del
+    proceso (ya autenticada; ver pool_smtp.py)
 
     Args:
         email: Email del contacto
         asunto: Asunto del email
         mensaje: Cuerpo del mensaje
+        timeout: segundos máximos de espera por el servidor SMTP
 
     Returns:
         dict: {'success': bool, 'respuesta': dict, 'error': str}
     """
-    import os
-    import smtplib
-    import ssl
-    from email.mime.text import MIMEText
-    from email.mime.multipart import MIMEMultipart
-    from django.conf import settings
+    from .pool_smtp import pool_smtp
 
     try:
         print(f"📧 Enviando EMAIL a {email}")
         print(f"   Asunto: {asunto}")
 
-        # Crear mensaje
-        msg = MIMEMultipart()
-        msg['From'] = settings.EMAIL_HOST_USER
-        msg['To'] = email
-        msg['Subject'] = asunto
-        msg.attach(MIMEText(mensaje, 'plain', 'utf-8'))
-
-        # Crear contexto SSL sin verificar certificados (para desarrollo)
-        context = ssl.create_default_context()
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-
-        # Conectar y enviar
-        server = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=10)
-        server.ehlo()
-        server.starttls(context=context)
-        server.ehlo()
-        server.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-        server.send_message(msg)
-        server.quit()
+        pool_smtp.enviar(email, asunto, mensaje, timeout=timeout)
 
         print(f"✅ Email enviado exitosamente!")
 
@@ -506,108 +660,62 @@ def enviar_email(email, asunto, mensaje):
         }
 
 
-def enviar_sms_mocean(telefono, mensaje):
+def enviar_sms_mocean(telefono, mensaje, timeout=None):
     """
-    Enviar SMS usando MoceanAPI (SDK oficial)
+    Enviar SMS usando MoceanAPI, por el cliente del proceso (ver cliente_sms.py)
 
     Args:
         telefono: Número de teléfono del contacto (formato internacional, ej: +521234567890)
         mensaje: Texto del mensaje a enviar
+        timeout: segundos máximos de espera por Mocean
 
     Returns:
         dict: {'success': bool, 'respuesta': dict, 'error': str}
     """
-    import os
+    return enviar_sms_mocean_lote([telefono], mensaje, timeout=timeout)[0]
 
-    # Obtener el token de API desde variables de entorno
-    api_token = os.environ.get('MOCEAN_API_TOKEN')
 
-    if not api_token:
-        return {
-            'success': False,
-            'error': 'No hay token de MoceanAPI configurado (MOCEAN_API_TOKEN)'
-        }
+def enviar_sms_mocean_lote(telefonos, mensaje, timeout=None):
+    """
+    Enviar el mismo SMS a varios teléfonos en una sola petición a MoceanAPI
 
-    try:
-        from moceansdk import Client, Basic
+    Args:
+        telefonos: lista de números en formato internacional
+        mensaje: Texto del mensaje a enviar
+        timeout: segundos máximos de espera por Mocean
 
-        print(f"📱 Enviando SMS REAL via MOCEAN a {telefono}")
-        print(f"   Mensaje: {mensaje[:50]}...")
+    Returns:
+        lista de dicts {'success': bool, 'respuesta': dict, 'error': str}, en
+        el orden de telefonos
+    """
+    import os
+    from .cliente_sms import cliente_mocean
 
-        # Limpiar el número de teléfono (remover espacios, guiones, etc.)
-        telefono_limpio = ''.join(filter(str.isdigit, str(telefono)))
-
-        # Si el número empieza con +, hay que removerlo para Mocean
-        if str(telefono).startswith('+'):
-            telefono_limpio = ''.join(filter(str.isdigit, str(telefono)))
-
-        # Inicializar cliente de Mocean
-        mocean = Client(Basic(api_token=api_token))
-
-        # Enviar SMS
-        res = mocean.sms.create({
-            "mocean-from": "RAPPI SAFE",
-            "mocean-to": telefono_limpio,
-            "mocean-text": mensaje
-        }).send()
-
-        # Verificar respuesta
-        if res and 'messages' in res:
-            messages = res['messages']
-            if messages and len(messages) > 0:
-                status = messages[0].get('status')
-
-                # Status 0 = éxito
-                if status == 0:
-                    print(f"✅ SMS enviado exitosamente!")
-                    print(f"   Message ID: {messages[0].get('msgid')}")
-                    print(f"   Receptor: {messages[0].get('receiver')}")
-
-                    return {
-                        'success': True,
-                        'respuesta': {
-                            'telefono': telefono_limpio,
-                            'msgid': messages[0].get('msgid'),
-                            'receiver': messages[0].get('receiver'),
-                            'proveedor': 'mocean',
-                            'real': True
-                        }
-                    }
-                else:
-                    error_msg = messages[0].get('err_msg', 'Error desconocido')
-                    print(f"❌ Error al enviar SMS: {error_msg}")
-                    return {
-                        'success': False,
-                        'error': f"Error Mocean: {error_msg}"
-                    }
-
-        # Si no hay respuesta válida
-        print(f"❌ Respuesta inválida de MoceanAPI")
-        return {
+    if not os.environ.get('MOCEAN_API_TOKEN'):
+        return [{
             'success': False,
-            'error': 'Respuesta inválida de MoceanAPI'
-        }
+            'error': 'No hay token de MoceanAPI configurado (MOCEAN_API_TOKEN)'
+        } for _ in telefonos]
 
-    except ImportError:
-        print(f"❌ SDK de Mocean no instalado")
-        return {
-            'success': False,
-            'error': 'SDK de Mocean no instalado. Ejecuta: pip install moceansdk'
-        }
-    except Exception as e:
-        print(f"❌ Error al enviar SMS via Mocean: {str(e)}")
-        return {
-            'success': False,
-            'error': f"Error Mocean: {str(e)}"
-        }
+    print(f"📱 Enviando SMS REAL via MOCEAN a {', '.join(str(telefono) for telefono in telefonos)}")
+    print(f"   Mensaje: {mensaje[:50]}...")
+
+    resultados = cliente_mocean.enviar_lote(telefonos, mensaje, timeout=timeout)
+
+    for telefono, resultado in zip(telefonos, resultados):
+        if resultado['success']:
+            print(f"✅ SMS enviado exitosamente a {telefono}! Message ID: {resultado['respuesta']['msgid']}")
+        else:
+            print(f"❌ Error al enviar SMS a {telefono}: {resultado['error']}")
+    return resultados
 
 
 def enviar_notificacion_contacto(contacto, mensaje):
     """
-    Enviar notificación a un contacto por SMS (Mocean API REAL)
+    Enviar notificación a un contacto por todos sus canales a la vez
 
-    Prioridad:
-    1. SMS via Mocean (SIEMPRE se intenta primero)
+    Canales:
+    1. SMS via Mocean (siempre, el teléfono es obligatorio)
     2. Telegram (si está configurado)
     3. Email (si está configurado)
     4. Simulado (solo si todo lo demás falla)
@@ -624,44 +732,23 @@ def enviar_notificacion_contacto(contacto, mensaje):
             'respuestas': dict
         }
     """
+    from .notificaciones import canales_contacto, enviar_en_paralelo, plazo_envio
+
     metodos_enviados = []
     metodos_fallidos = []
     respuestas = {}
 
-    # SIEMPRE intentar SMS primero (método principal)
-    if contacto.telefono:
-        resultado = enviar_sms_mocean(contacto.telefono, mensaje)
-        if resultado['success']:
-            metodos_enviados.append('sms')
-            respuestas['sms'] = resultado.get('respuesta')
-            print(f"✅ SMS enviado a {contacto.nombre} ({contacto.telefono})")
-        else:
-            metodos_fallidos.append('sms')
-            respuestas['sms_error'] = resultado.get('error')
-            print(f"❌ SMS falló para {contacto.nombre}: {resultado.get('error')}")
-
-    # Intentar Telegram como respaldo
-    if hasattr(contacto, 'telegram_id') and contacto.telegram_id:
-        resultado = enviar_telegram(contacto.telegram_id, mensaje)
-        if resultado['success']:
-            metodos_enviados.append('telegram')
-            respuestas['telegram'] = resultado.get('respuesta')
-            print(f"✅ Telegram enviado a {contacto.nombre}")
-        else:
-            metodos_fallidos.append('telegram')
-            respuestas['telegram_error'] = resultado.get('error')
-
-    # Intentar Email como respaldo
-    if hasattr(contacto, 'email') and contacto.email:
-        asunto = "🚨 ALERTA DE EMERGENCIA - RAPPI SAFE"
-        resultado = enviar_email(contacto.email, asunto, mensaje)
+    canales = canales_contacto(contacto)
+    resultados = enviar_en_paralelo([(canal, contacto, mensaje) for canal in canales], plazo_envio())
+    for canal, resultado in zip(canales, resultados):
         if resultado['success']:
-            metodos_enviados.append('email')
-            respuestas['email'] = resultado.get('respuesta')
-            print(f"✅ Email enviado a {contacto.nombre}")
+            metodos_enviados.append(canal)
+            respuestas[canal] = resultado.get('respuesta')
+            print(f"✅ {canal.upper()} enviado a {contacto.nombre}")
         else:
-            metodos_fallidos.append('email')
-            respuestas['email_error'] = resultado.get('error')
+            metodos_fallidos.append(canal)
+            respuestas[f'{canal}_error'] = resultado.get('error')
+            print(f"❌ {canal.upper()} falló para {contacto.nombre}: {resultado.get('error')}")
 
     # Si no se envió por ningún método real
     if not metodos_enviados:
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
@@ -14,12 +15,19 @@ import uuid
 
 from .models import (
     User, RepartidorProfile, Alerta, Trayectoria, ContactoConfianza,
-    Incidente, Bitacora, EstadisticaRiesgo, SolicitudAyudaPsicologica, RutaSegura
+    Incidente, Bitacora, SolicitudAyudaPsicologica, RutaSegura
 )
 from .utils import (
     enviar_nueva_alerta, enviar_actualizacion_alerta,
-    enviar_actualizacion_ubicacion, serializar_alerta, enviar_notificacion
+    enviar_actualizacion_ubicacion, serializar_alerta, enviar_notificacion,
+    enviar_lote_ubicacion, normalizar_lote_ubicaciones, normalizar_ubicacion, enviar_evento_corredor
 )
+from .simplificacion import simplificaciones, ZOOM_MAXIMO
+from .estado_vivo import estado_vivo, coordenada, nivel_bateria
+from .filtro_ubicacion import filtro_ubicacion
+from .indice_zonas import zonas_cercanas
+from .corredor import monitor_corredor
+from .notificaciones import encolar_notificaciones, reencolar_fallidas
 
 
 # ==================== AUTENTICACIÓN ====================
@@ -94,59 +102,19 @@ def test_sensores(request):
 @user_passes_test(es_repartidor, login_url='login')
 def repartidor_home(request):
     """Página principal del repartidor con botón de pánico"""
-    from math import radians, sin, cos, sqrt, atan2
-
-    perfil = request.user.perfil_repartidor
+    perfil = estado_vivo.aplicar(request.user.perfil_repartidor)
     alertas_activas = Alerta.objects.filter(
         repartidor=request.user,
         estado__in=['pendiente', 'en_atencion']
     ).order_by('-creado_en')
 
-    # Calcular zonas de riesgo cercanas basadas en la ubicación del repartidor
+    # Las 5 zonas de riesgo más cercanas dentro de 10 km (sin importar su puntuación)
     zonas_riesgo_cercanas = []
     if perfil.ultima_latitud and perfil.ultima_longitud:
-        # Obtener todas las zonas de riesgo
-        zonas_riesgo = EstadisticaRiesgo.objects.all().order_by('-puntuacion_riesgo')[:10]
-
-        # Calcular distancia a cada zona
-        for zona in zonas_riesgo:
-            try:
-                # Las coordenadas están en formato GeoJSON
-                coords = zona.coordenadas_zona
-                # Asumiendo que coords tiene 'center' con lat y lng
-                if isinstance(coords, dict) and 'center' in coords:
-                    zona_lat = float(coords['center']['lat'])
-                    zona_lng = float(coords['center']['lng'])
-
-                    # Fórmula de Haversine para calcular distancia
-                    R = 6371  # Radio de la Tierra en km
-
-                    lat1 = radians(float(perfil.ultima_latitud))
-                    lon1 = radians(float(perfil.ultima_longitud))
-                    lat2 = radians(zona_lat)
-                    lon2 = radians(zona_lng)
-
-                    dlat = lat2 - lat1
-                    dlon = lon2 - lon1
-
-                    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                    c = 2 * atan2(sqrt(a), sqrt(1-a))
-                    distancia = R * c
-
-                    # Solo mostrar zonas dentro de 10 km
-                    if distancia <= 10:
-                        zonas_riesgo_cercanas.append({
-                            'zona': zona,
-                            'distancia': round(distancia, 1)
-                        })
-            except (KeyError, ValueError, TypeError) as e:
-                # Si hay error con las coordenadas, ignorar esta zona
-                continue
-
-        # Ordenar por distancia
-        zonas_riesgo_cercanas.sort(key=lambda x: x['distancia'])
-        # Limitar a las 5 zonas más cercanas
-        zonas_riesgo_cercanas = zonas_riesgo_cercanas[:5]
+        zonas_riesgo_cercanas = [
+            {'zona': zona, 'distancia': round(distancia, 1)}
+            for zona, distancia in zonas_cercanas(perfil.ultima_latitud, perfil.ultima_longitud, radio_km=10, k=5)
+        ]
 
     context = {
         'perfil': perfil,
@@ -176,39 +144,44 @@ def crear_alerta_panico(request):
 
         data = json.loads(request.body)
 
+        # Validar la posición antes de crear la alerta (la latitud solo llega a ±90)
+        latitud = coordenada(data.get('latitud'), limite=90)
+        longitud = coordenada(data.get('longitud'))
+
         # Crear la alerta
         alerta = Alerta.objects.create(
             repartidor=request.user,
             tipo='panico',
             estado='pendiente',
-            latitud=data.get('latitud'),
-            longitud=data.get('longitud'),
+            latitud=latitud,
+            longitud=longitud,
             nivel_bateria=data.get('bateria'),
             datos_sensores=data.get('datos_sensores', {}),
         )
 
-        # Actualizar el perfil del repartidor
-        perfil = request.user.perfil_repartidor
-        perfil.estado = 'emergencia'
-        perfil.ultima_latitud = data.get('latitud')
-        perfil.ultima_longitud = data.get('longitud')
-        perfil.nivel_bateria = data.get('bateria')
-        perfil.ultima_actualizacion_ubicacion = timezone.now()
-        perfil.save()
+        # Actualizar el perfil del repartidor (el cambio de estado se guarda de inmediato)
+        estado_vivo.registrar(
+            request.user.id,
+            persistir_ahora=True,
+            estado='emergencia',
+            ultima_latitud=latitud,
+            ultima_longitud=longitud,
+            nivel_bateria=alerta.nivel_bateria,
+            ultima_actualizacion_ubicacion=timezone.now(),
+        )
 
         # Enviar notificación por WebSocket
         enviar_nueva_alerta(serializar_alerta(alerta))
 
-        # Notificar a contactos de emergencia
-        from .utils import notificar_contactos_emergencia
-        resultado_notificaciones = notificar_contactos_emergencia(alerta)
+        # Encolar las notificaciones a contactos; se envían fuera de la petición
+        resultado_notificaciones = encolar_notificaciones(alerta)
 
         return JsonResponse({
             'success': True,
             'alerta_id': str(alerta.id),
             'mensaje': 'Alerta de pánico activada',
             'contactos_notificados': resultado_notificaciones.get('contactos_notificados', 0),
-            'notificaciones_info': f"{resultado_notificaciones.get('contactos_notificados', 0)} contacto(s) notificado(s)"
+            'notificaciones_info': f"{resultado_notificaciones.get('contactos_notificados', 0)} contacto(s) en proceso de notificación"
         })
     except Exception as e:
         return JsonResponse({
@@ -225,39 +198,44 @@ def crear_alerta_accidente(request):
     try:
         data = json.loads(request.body)
 
+        # Validar la posición antes de crear la alerta (la latitud solo llega a ±90)
+        latitud = coordenada(data.get('latitud'), limite=90)
+        longitud = coordenada(data.get('longitud'))
+
         # Crear la alerta
         alerta = Alerta.objects.create(
             repartidor=request.user,
             tipo='accidente',
             estado='pendiente',
-            latitud=data.get('latitud'),
-            longitud=data.get('longitud'),
+            latitud=latitud,
+            longitud=longitud,
             nivel_bateria=data.get('bateria'),
             datos_sensores=data.get('datos_sensores', {}),
         )
 
-        # Actualizar el perfil del repartidor
-        perfil = request.user.perfil_repartidor
-        perfil.estado = 'emergencia'
-        perfil.ultima_latitud = data.get('latitud')
-        perfil.ultima_longitud = data.get('longitud')
-        perfil.nivel_bateria = data.get('bateria')
-        perfil.ultima_actualizacion_ubicacion = timezone.now()
-        perfil.save()
+        # Actualizar el perfil del repartidor (el cambio de estado se guarda de inmediato)
+        estado_vivo.registrar(
+            request.user.id,
+            persistir_ahora=True,
+            estado='emergencia',
+            ultima_latitud=latitud,
+            ultima_longitud=longitud,
+            nivel_bateria=alerta.nivel_bateria,
+            ultima_actualizacion_ubicacion=timezone.now(),
+        )
 
         # Enviar notificación por WebSocket
         enviar_nueva_alerta(serializar_alerta(alerta))
 
-        # Notificar a contactos de emergencia
-        from .utils import notificar_contactos_emergencia
-        resultado_notificaciones = notificar_contactos_emergencia(alerta)
+        # Encolar las notificaciones a contactos; se envían fuera de la petición
+        resultado_notificaciones = encolar_notificaciones(alerta)
 
         return JsonResponse({
             'success': True,
             'alerta_id': str(alerta.id),
             'mensaje': 'Alerta de accidente creada',
             'contactos_notificados': resultado_notificaciones.get('contactos_notificados', 0),
-            'notificaciones_info': f"{resultado_notificaciones.get('contactos_notificados', 0)} contacto(s) notificado(s)"
+            'notificaciones_info': f"{resultado_notificaciones.get('contactos_notificados', 0)} contacto(s) en proceso de notificación"
         })
     except Exception as e:
         return JsonResponse({
@@ -279,9 +257,7 @@ def cancelar_alerta(request, alerta_id):
             alerta.save()
 
             # Actualizar perfil del repartidor
-            perfil = request.user.perfil_repartidor
-            perfil.estado = 'disponible'
-            perfil.save()
+            estado_vivo.registrar(request.user.id, persistir_ahora=True, estado='disponible')
 
             # Notificar actualización
             enviar_actualizacion_alerta(serializar_alerta(alerta))
@@ -310,29 +286,118 @@ def actualizar_ubicacion(request):
     try:
         data = json.loads(request.body)
         alerta_id = data.get('alerta_id')
+        try:
+            punto = normalizar_ubicacion(
+                data.get('latitud'), data.get('longitud'), data.get('precision'), data.get('velocidad')
+            )
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'error': 'Ubicación inválida'}, status=400)
+        latitud, longitud = float(punto['latitud']), float(punto['longitud'])
+
+        # Descartar posiciones sin movimiento o demasiado seguidas
+        if not filtro_ubicacion.aceptar(request.user.id, latitud, longitud, alerta_id):
+            return JsonResponse({'success': True, 'descartada': True})
 
         if alerta_id:
             # Enviar actualización por WebSocket
             enviar_actualizacion_ubicacion(
                 alerta_id,
-                data.get('latitud'),
-                data.get('longitud'),
-                data.get('precision'),
-                data.get('velocidad')
+                latitud,
+                longitud,
+                punto['precision'],
+                punto['velocidad']
             )
 
-        # Actualizar perfil del repartidor
-        perfil = request.user.perfil_repartidor
-        perfil.ultima_latitud = data.get('latitud')
-        perfil.ultima_longitud = data.get('longitud')
-        perfil.ultima_actualizacion_ubicacion = timezone.now()
-        perfil.save()
+        # Actualizar el estado en caliente; el persistidor lo guarda por lotes
+        estado_vivo.registrar(
+            request.user.id,
+            ultima_latitud=punto['latitud'],
+            ultima_longitud=punto['longitud'],
+            ultima_actualizacion_ubicacion=timezone.now(),
+        )
+
+        # Vigilar el corredor de la ruta que esté navegando
+        for evento in monitor_corredor.verificar(
+            request.user.id, latitud, longitud, precision=punto['precision']
+        ):
+            enviar_evento_corredor(evento)
 
         return JsonResponse({'success': True})
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
 
+@login_required
+@user_passes_test(es_repartidor)
+@require_POST
+def actualizar_ubicacion_lote(request):
+    """
+    Recibir un lote ordenado de posiciones GPS con marca de tiempo del cliente.
+
+    Si hay una alerta activa, todos los puntos se guardan con un solo bulk insert
+    y se publica un único mensaje por WebSocket. El perfil solo se actualiza con
+    la posición más reciente.
+    """
+    try:
+        data = json.loads(request.body)
+        puntos = normalizar_lote_ubicaciones(data.get('puntos') or [])
+
+        if not puntos:
+            return JsonResponse({
+                'success': False,
+                'error': 'El lote no contiene posiciones válidas'
+            }, status=400)
+
+        alertas = Alerta.objects.filter(
+            repartidor=request.user,
+            estado__in=['pendiente', 'en_atencion']
+        )
+        if data.get('alerta_id'):
+            alertas = alertas.filter(id=data.get('alerta_id'))
+        alerta = alertas.only('id').first()
+
+        guardados = 0
+        if alerta:
+            nuevos = Trayectoria.objects.bulk_create([
+                Trayectoria(
+                    alerta=alerta,
+                    latitud=punto['latitud'],
+                    longitud=punto['longitud'],
+                    precision=punto['precision'],
+                    velocidad=punto['velocidad'],
+                    timestamp=punto['timestamp']
+                )
+                for punto in puntos
+            ])
+            guardados = len(nuevos)
+            enviar_lote_ubicacion(alerta.id, puntos)
+
+        # Actualizar perfil solo con la posición más reciente
+        ultimo = puntos[-1]
+        estado_vivo.registrar(
+            request.user.id,
+            ultima_latitud=ultimo['latitud'],
+            ultima_longitud=ultimo['longitud'],
+            ultima_actualizacion_ubicacion=ultimo['timestamp'],
+        )
+
+        # Vigilar el corredor con cada punto, en el orden en que se tomaron
+        for punto in puntos:
+            for evento in monitor_corredor.verificar(
+                request.user.id, punto['latitud'], punto['longitud'],
+                instante=punto['timestamp'].timestamp(), precision=punto['precision']
+            ):
+                enviar_evento_corredor(evento)
+
+        return JsonResponse({
+            'success': True,
+            'recibidos': len(puntos),
+            'guardados': guardados
+        })
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
 @login_required
 @user_passes_test(es_repartidor)
 @require_POST
@@ -340,10 +405,16 @@ def actualizar_bateria(request):
     """Actualizar nivel de batería del dispositivo"""
     try:
         data = json.loads(request.body)
-        perfil = request.user.perfil_repartidor
-        perfil.nivel_bateria = data.get('bateria')
-        perfil.ultima_actualizacion_bateria = timezone.now()
-        perfil.save()
+        try:
+            bateria = nivel_bateria(data.get('bateria'))
+        except (TypeError, ValueError, OverflowError):
+            return JsonResponse({'success': False, 'error': 'Nivel de batería inválido'}, status=400)
+
+        estado_vivo.registrar(
+            request.user.id,
+            nivel_bateria=bateria,
+            ultima_actualizacion_bateria=timezone.now(),
+        )
 
         return JsonResponse({'success': True})
     except Exception as e:
@@ -516,7 +587,11 @@ def mi_perfil_view(request):
         if 'foto' in request.FILES:
             perfil.foto = request.FILES['foto']
 
-        perfil.save()
+        # Solo los campos del formulario, para no pisar la telemetría en caliente
+        perfil.save(update_fields=[
+            'tiene_seguro', 'nombre_aseguradora', 'numero_poliza', 'telefono_aseguradora',
+            'vigencia_seguro', 'agitacion_habilitada', 'sensibilidad_agitacion', 'foto',
+        ])
 
         messages.success(request, 'Perfil actualizado correctamente')
         return redirect('mi_perfil')
@@ -532,7 +607,7 @@ def mi_perfil_view(request):
 @user_passes_test(es_repartidor)
 def rutas_view(request):
     """Vista de rutas seguras"""
-    perfil = request.user.perfil_repartidor
+    perfil = estado_vivo.aplicar(request.user.perfil_repartidor)
 
     context = {
         'perfil': perfil,
@@ -543,8 +618,13 @@ def rutas_view(request):
 @login_required
 @user_passes_test(es_repartidor)
 @require_POST
-def calcular_rutas(request):
-    """Calcular rutas (rápida y seguras) usando API de routing real"""
+async def calcular_rutas(request):
+    """
+    Calcular rutas (rápida y seguras) usando API de routing real.
+
+    Es una vista async: mientras el servidor de rutas responde no se ocupa
+    ningún hilo, así que las alertas de pánico no esperan detrás de ella.
+    """
     try:
         data = json.loads(request.body)
         origen_lat = float(data.get('origen_lat'))
@@ -553,9 +633,9 @@ def calcular_rutas(request):
         destino_lon = float(data.get('destino_lon'))
 
         # Obtener rutas reales usando OSRM
-        from .utils import obtener_rutas_alternativas
+        from .utils import aobtener_rutas_alternativas
 
-        resultado = obtener_rutas_alternativas(origen_lat, origen_lon, destino_lat, destino_lon)
+        resultado = await aobtener_rutas_alternativas(origen_lat, origen_lon, destino_lat, destino_lon)
 
         if not resultado.get('success'):
             return JsonResponse({
@@ -572,6 +652,7 @@ def calcular_rutas(request):
             'distancia': ruta_rapida['distancia'],
             'duracion': ruta_rapida['duracion'],
             'puntuacion_riesgo': round(ruta_rapida['puntuacion_riesgo'], 1),
+            'exposicion_riesgo': ruta_rapida['exposicion_riesgo'],
             'coordenadas': ruta_rapida['coordenadas']
         }
 
@@ -581,20 +662,27 @@ def calcular_rutas(request):
                 'distancia': ruta['distancia'],
                 'duracion': ruta['duracion'],
                 'puntuacion_riesgo': round(ruta['puntuacion_riesgo'], 1),
+                'exposicion_riesgo': ruta['exposicion_riesgo'],
                 'coordenadas': ruta['coordenadas']
             }
             for ruta in rutas_seguras
         ]
 
-        # Guardar en base de datos
-        RutaSegura.objects.create(
-            repartidor=request.user,
+        # Guardar en base de datos: cada geometría una sola vez, referenciada por su huella
+        from .geometrias import aguardar_geometrias, ruta_con_huella
+
+        rutas_response = [ruta_rapida_response, *rutas_seguras_response]
+        huellas = await aguardar_geometrias([ruta['coordenadas'] for ruta in rutas_response])
+        ruta_rapida_guardada, *rutas_seguras_guardadas = map(ruta_con_huella, rutas_response, huellas)
+
+        ruta = await RutaSegura.objects.acreate(
+            repartidor=await request.auser(),
             origen_lat=origen_lat,
             origen_lon=origen_lon,
             destino_lat=destino_lat,
             destino_lon=destino_lon,
-            ruta_rapida=ruta_rapida_response,
-            ruta_segura={'rutas': rutas_seguras_response},
+            ruta_rapida=ruta_rapida_guardada,
+            ruta_segura={'rutas': rutas_seguras_guardadas},
             puntuacion_riesgo_rapida=ruta_rapida_response['puntuacion_riesgo'],
             puntuacion_riesgo_segura=rutas_seguras_response[0]['puntuacion_riesgo'],
             seleccionada='rapida'
@@ -602,6 +690,7 @@ def calcular_rutas(request):
 
         return JsonResponse({
             'success': True,
+            'ruta_id': ruta.id,
             'rutas': {
                 'rapida': ruta_rapida_response,
                 'seguras': rutas_seguras_response
@@ -618,6 +707,159 @@ def calcular_rutas(request):
         }, status=400)
 
 
+@login_required
+@user_passes_test(es_repartidor)
+@require_POST
+def seleccionar_ruta(request, ruta_id):
+    """
+    Elegir una de las rutas calculadas e iniciar su navegación.
+
+    Recibe {'ruta': 'rapida' | 'segura' | 'segura2'}. Desde ese momento las
+    posiciones del repartidor se comparan con el corredor de la ruta y el
+    monitoreo recibe un aviso si se desvía.
+    """
+    ruta = get_object_or_404(RutaSegura, id=ruta_id, repartidor=request.user)
+    try:
+        data = json.loads(request.body)
+        seleccionada = data.get('ruta', 'rapida')
+        if seleccionada not in dict(RutaSegura.SELECCIONES):
+            return JsonResponse({'success': False, 'error': 'Ruta no válida'}, status=400)
+
+        ahora = timezone.now()
+        # Solo se navega una ruta a la vez
+        RutaSegura.objects.filter(
+            repartidor=request.user,
+            navegacion_iniciada_en__isnull=False,
+            navegacion_finalizada_en__isnull=True
+        ).exclude(id=ruta.id).update(navegacion_finalizada_en=ahora)
+
+        ruta.seleccionada = seleccionada
+        ruta.navegacion_iniciada_en = ahora
+        ruta.navegacion_finalizada_en = None
+        ruta.save(update_fields=['seleccionada', 'navegacion_iniciada_en', 'navegacion_finalizada_en'])
+
+        monitor_corredor.activar(
+            request.user.id, ruta.id, ruta.coordenadas_seleccionada(), ruta.seleccionada,
+            request.user.get_full_name(), ahora.timestamp()
+        )
+        # La primera posición de la navegación no debe descartarse por el filtro
+        filtro_ubicacion.reiniciar(request.user.id)
+
+        return JsonResponse({
+            'success': True,
+            'ruta_id': ruta.id,
+            'seleccionada': ruta.seleccionada,
+            'ancho_corredor_m': monitor_corredor.ancho_m,
+            'umbral_s': monitor_corredor.umbral_s
+        })
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
+@login_required
+@user_passes_test(es_repartidor)
+@require_POST
+def finalizar_navegacion(request, ruta_id):
+    """Terminar la navegación de una ruta y dejar de vigilar su corredor"""
+    ruta = get_object_or_404(RutaSegura, id=ruta_id, repartidor=request.user)
+    if ruta.navegacion_iniciada_en and not ruta.navegacion_finalizada_en:
+        ruta.navegacion_finalizada_en = timezone.now()
+        ruta.save(update_fields=['navegacion_finalizada_en'])
+
+    navegacion = monitor_corredor.activa(request.user.id)
+    if navegacion is not None and navegacion.ruta_id == ruta.id:
+        monitor_corredor.desactivar(request.user.id)
+    return JsonResponse({'success': True})
+
+
+@login_required
+@user_passes_test(es_repartidor)
+@require_POST
+def planificar_entrega(request):
+    """
+    Ordenar varias paradas de entrega y devolver la ruta completa.
+
+    Recibe {'origen_lat', 'origen_lon', 'paradas': [{'lat', 'lon'}, ...],
+    'criterio': 'rapida' | 'balanceada' | 'segura', 'regresar': bool} y
+    devuelve el orden de visita (índices de 'paradas'), la ruta cosida y
+    cada tramo con su distancia, duración y riesgo.
+    """
+    try:
+        data = json.loads(request.body)
+        origen = (float(data.get('origen_lat')), float(data.get('origen_lon')))
+        paradas = data.get('paradas')
+        criterio = data.get('criterio', 'balanceada')
+        regresar = bool(data.get('regresar', False))
+
+        if not isinstance(paradas, list) or not paradas:
+            return JsonResponse({'success': False, 'error': 'Se requiere una lista de paradas'}, status=400)
+        maximo = getattr(settings, 'PLANIFICADOR', {}).get('MAX_PARADAS', 40)
+        if len(paradas) > maximo:
+            return JsonResponse({
+                'success': False,
+                'error': f'Se permiten como máximo {maximo} paradas'
+            }, status=400)
+
+        from .planificador import CRITERIOS, planificar_entrega as planificar
+
+        if criterio not in CRITERIOS:
+            return JsonResponse({'success': False, 'error': 'Criterio no válido'}, status=400)
+        if not all(isinstance(parada, dict) and 'lat' in parada and 'lon' in parada for parada in paradas):
+            return JsonResponse({'success': False, 'error': 'Cada parada necesita lat y lon'}, status=400)
+        paradas = [(float(parada['lat']), float(parada['lon'])) for parada in paradas]
+
+        resultado = planificar(origen, paradas, criterio=criterio, regresar=regresar)
+        if not resultado.get('success'):
+            return JsonResponse({
+                'success': False,
+                'error': resultado.get('error', 'Error al planificar la entrega')
+            }, status=400)
+        return JsonResponse(resultado)
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
+@login_required
+@require_POST
+def puntuar_rutas(request):
+    """
+    Puntuar el riesgo de muchas rutas en una sola petición.
+
+    Recibe {'polilineas': [...], 'precision': 5} con polilíneas codificadas
+    (formato de Google, como las de OSRM) y devuelve, en el mismo orden,
+    la exposición, el riesgo máximo con su tramo y la distancia de cada una.
+    Lo usan tanto repartidores como operadores.
+    """
+    try:
+        data = json.loads(request.body)
+        polilineas = data.get('polilineas')
+        precision = int(data.get('precision', 5))
+
+        if not isinstance(polilineas, list) or not polilineas or not all(isinstance(p, str) for p in polilineas):
+            return JsonResponse({
+                'success': False,
+                'error': 'Se requiere una lista de polilíneas codificadas'
+            }, status=400)
+        if precision not in (5, 6):
+            return JsonResponse({'success': False, 'error': 'La precisión debe ser 5 o 6'}, status=400)
+
+        maximo = getattr(settings, 'RIESGO_LOTE', {}).get('MAX_RUTAS', 2000)
+        if len(polilineas) > maximo:
+            return JsonResponse({
+                'success': False,
+                'error': f'Se permiten como máximo {maximo} rutas por petición'
+            }, status=400)
+
+        from .puntuacion_lote import puntuar_rutas_lote
+
+        return JsonResponse({
+            'success': True,
+            'rutas': puntuar_rutas_lote(polilineas, precision=precision)
+        })
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+
 # ==================== VISTAS OPERADOR ====================
 
 @login_required
@@ -646,7 +888,6 @@ def operador_dashboard(request):
 def ver_alerta(request, alerta_id):
     """Ver detalles de una alerta específica"""
     alerta = get_object_or_404(Alerta, id=alerta_id)
-    trayectorias = Trayectoria.objects.filter(alerta=alerta).order_by('timestamp')
     contactos = ContactoConfianza.objects.filter(repartidor=alerta.repartidor)
 
     # Intentar obtener el incidente asociado
@@ -657,20 +898,55 @@ def ver_alerta(request, alerta_id):
         incidente = None
         bitacoras = []
 
+    # Envíos a contactos con su historial de intentos (los fallidos se reintentan solos)
+    notificaciones = (
+        alerta.notificaciones_contactos
+        .select_related('contacto')
+        .prefetch_related('historial')
+        .order_by('contacto__nombre', 'metodo', 'enviado_en')
+    )
+
+    notificaciones = list(notificaciones)
+    por_reenviar = sum(1 for notificacion in notificaciones if notificacion.estado in ('fallido', 'reintento'))
+
     # Total de solicitudes pendientes para el badge de navegación
     total_solicitudes_pendientes = SolicitudAyudaPsicologica.objects.filter(estado='pendiente').count()
 
     context = {
         'alerta': alerta,
-        'trayectorias': trayectorias,
         'contactos': contactos,
         'incidente': incidente,
         'bitacoras': bitacoras,
+        'notificaciones': notificaciones,
+        'por_reenviar': por_reenviar,
         'total_solicitudes_pendientes': total_solicitudes_pendientes,
     }
     return render(request, 'rappiSafe/operador/ver_alerta.html', context)
 
 
+@login_required
+@user_passes_test(es_operador)
+def trayectoria_alerta(request, alerta_id):
+    """
+    Trayectoria de una alerta simplificada para el zoom del mapa.
+
+    Devuelve los puntos simplificados del nivel pedido más la cola de puntos
+    crudos que llegaron desde la última simplificación.
+    """
+    alerta = get_object_or_404(Alerta, id=alerta_id)
+
+    try:
+        zoom = int(request.GET.get('zoom', ZOOM_MAXIMO))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Zoom inválido'}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'zoom': zoom,
+        **simplificaciones.nivel(alerta, zoom)
+    })
+
+
 @login_required
 @user_passes_test(es_operador)
 def contactar_emergencias(request, alerta_id):
@@ -754,9 +1030,7 @@ def cerrar_alerta(request, alerta_id):
             )
 
         # Actualizar perfil del repartidor
-        perfil = alerta.repartidor.perfil_repartidor
-        perfil.estado = 'disponible'
-        perfil.save()
+        estado_vivo.registrar(alerta.repartidor_id, persistir_ahora=True, estado='disponible')
 
         # Notificar actualización
         enviar_actualizacion_alerta(serializar_alerta(alerta))
@@ -974,9 +1248,10 @@ def reportes_operador(request):
 @user_passes_test(es_operador)
 @require_POST
 def notificar_contactos_operador(request, alerta_id):
-    """Endpoint para notificar contactos de confianza desde el operador"""
-    from rappiSafe.utils import notificar_contactos_emergencia
-
+    """
+    Endpoint para que el operador reenvíe las notificaciones a contactos que
+    fallaron; las que ya se enviaron no se repiten
+    """
     try:
         alerta = Alerta.objects.select_related('repartidor').get(id=alerta_id)
 
@@ -987,8 +1262,10 @@ def notificar_contactos_operador(request, alerta_id):
                 'error': 'El usuario no tiene perfil de repartidor'
             })
 
-        # Llamar a la función de notificaciones
-        resultado = notificar_contactos_emergencia(alerta)
+        # Solo los envíos fallidos o en espera de reintento vuelven a la bandeja
+        resultado = reencolar_fallidas(alerta)
+        if not resultado['success']:
+            return JsonResponse({'success': False, 'error': resultado['mensaje']})
 
         # Actualizar el incidente si existe
         try:
@@ -1001,7 +1278,8 @@ def notificar_contactos_operador(request, alerta_id):
         return JsonResponse({
             'success': resultado['success'],
             'contactos_notificados': resultado.get('contactos_notificados', 0),
-            'notificaciones_fallidas': resultado.get('notificaciones_fallidas', 0),
+            'notificaciones_reencoladas': resultado.get('notificaciones_reencoladas', 0),
+            'mensaje': resultado.get('mensaje', ''),
             'detalles': resultado.get('detalles', [])
         })
     except Alerta.DoesNotExist:
@@ -1168,6 +1446,9 @@ def lista_repartidores(request):
         is_active=True
     ).select_related('perfil_repartidor').order_by('first_name', 'last_name')
 
+    # Posición, batería y estado en caliente (más recientes que la BD)
+    estados_vivos = estado_vivo.obtener_varios([repartidor.id for repartidor in repartidores])
+
     # Estadísticas por repartidor
     repartidores_data = []
     for repartidor in repartidores:
@@ -1182,6 +1463,8 @@ def lista_repartidores(request):
         # Obtener perfil
         try:
             perfil = repartidor.perfil_repartidor
+            for campo, valor in estados_vivos.get(repartidor.id, {}).items():
+                setattr(perfil, campo, valor)
             estado = perfil.estado
             ultima_ubicacion = {
                 'lat': perfil.ultima_latitud,